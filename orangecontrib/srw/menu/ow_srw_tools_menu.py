@@ -1,5 +1,8 @@
 __author__ = 'labx'
 
+from PyQt5.QtCore import QSettings
+from PyQt5.QtWidgets import QInputDialog, QMessageBox, QFileDialog
+
 from orangecanvas.scheme.link import SchemeLink
 from oasys.menus.menu import OMenu
 
@@ -8,6 +11,11 @@ from wofrysrw.propagator.propagators2D.srw_fresnel_native import SRW_APPLICATION
 from wofrysrw.propagator.propagators2D.srw_propagation_mode import SRWPropagationMode
 
 from orangecontrib.srw.util.srw_util import showWarningMessage, showCriticalMessage
+from orangecontrib.srw.util.srw_cache import SRWPropagationCache, SRWCheckpointStore, SRWSourceWavefrontDiskCache, SRWResultCache
+from orangecontrib.srw.util.srw_estimator import get_physical_memory, get_default_memory_budget
+from orangecontrib.srw.util.srw_profiler import SRWProfiler
+from orangecontrib.srw.util import srw_precision, srw_magnetic_field, srw_trajectory
+from orangecontrib.srw.widgets.gui.ow_srw_optical_element import OWSRWOpticalElement
 from orangecontrib.srw.widgets.optical_elements.ow_srw_screen import OWSRWScreen
 from orangecontrib.srw.widgets.native.ow_srw_intensity_plotter import OWSRWIntensityPlotter
 from orangecontrib.srw.widgets.native.ow_srw_me_degcoh_plotter import OWSRWDegCohPlotter
@@ -36,6 +44,55 @@ class SRWToolsMenu(OMenu):
         self.addContainer("Cumulative Loops")
         self.addSubMenu("Reload Saved Data on the all the Accumulation Points")
         self.closeContainer()
+        self.openContainer()
+        self.addContainer("Propagation Cache")
+        self.addSubMenu("Clear Propagation Cache")
+        self.closeContainer()
+        self.openContainer()
+        self.addContainer("Memory Budget")
+        self.addSubMenu("Set Memory Budget")
+        self.addSubMenu("Warn when the Memory Budget is exceeded")
+        self.addSubMenu("Refuse Propagation when the Memory Budget is exceeded")
+        self.addSeparator()
+        self.addSubMenu("Memory Estimate of the Beamline")
+        self.closeContainer()
+        self.openContainer()
+        self.addContainer("Profiling")
+        self.addSubMenu("Enable Profiling")
+        self.addSubMenu("Disable Profiling")
+        self.addSeparator()
+        self.addSubMenu("Show Profiling Summary")
+        self.addSubMenu("Export Profiling Timeline (Chrome Trace)")
+        self.addSubMenu("Clear Profiling Data")
+        self.closeContainer()
+        self.openContainer()
+        self.addContainer("Precision")
+        self.addSubMenu("Double Precision (float64)")
+        self.addSubMenu("Single Precision (float32)")
+        self.addSeparator()
+        self.addSubMenu("Enable Accuracy Check of Single Precision")
+        self.addSubMenu("Disable Accuracy Check of Single Precision")
+        self.closeContainer()
+        self.openContainer()
+        self.addContainer("Source Wavefront Cache")
+        self.addSubMenu("Enable Source Wavefront Cache")
+        self.addSubMenu("Disable Source Wavefront Cache")
+        self.addSeparator()
+        self.addSubMenu("Set Source Wavefront Cache Directory")
+        self.addSubMenu("Set Source Wavefront Cache Size")
+        self.addSubMenu("Clear Source Wavefront Cache")
+        self.closeContainer()
+        self.openContainer()
+        self.addContainer("Electron Trajectory Cache")
+        self.addSubMenu("Enable Trajectory Cache")
+        self.addSubMenu("Disable Trajectory Cache")
+        self.addSeparator()
+        self.addSubMenu("Enable Linear Corrections of the Cached Trajectories")
+        self.addSubMenu("Disable Linear Corrections of the Cached Trajectories")
+        self.addSubMenu("Clear Trajectory Cache")
+        self.closeContainer()
+
+        srw_precision.set_precision(QSettings().value("srw/precision", srw_precision.SRWPrecision.DOUBLE, int))
 
     def executeAction_1(self, action):
         try:
@@ -165,6 +222,232 @@ class SRWToolsMenu(OMenu):
         except Exception as exception:
             showCriticalMessage(exception.args[0])
 
+    def executeAction_8(self, action):
+        try:
+            memory_used = 0
+            entries = 0
+
+            for wavefront_cache in [SRWPropagationCache.Instance(), SRWCheckpointStore.Instance()]:
+                memory_used += wavefront_cache.get_memory_used()
+                entries += len(wavefront_cache)
+
+                wavefront_cache.clear()
+
+            results = len(SRWResultCache.Instance())
+            SRWResultCache.Instance().clear()
+            srw_magnetic_field.clear_magnetic_fields()
+
+            showWarningMessage("Propagation Cache cleared: " + str(entries) + " wavefronts, " + str(round(memory_used/1024**2, 1)) + " MB released, " + str(results) + " calculated results")
+        except Exception as exception:
+            showCriticalMessage(exception.args[0])
+
+    def executeAction_9(self, action):
+        try:
+            memory_budget, ok = QInputDialog.getInt(None, "Memory Budget",
+                                                    "Memory Budget for a propagation [MB]\n(physical memory: " + str(get_physical_memory()//1024**2) + " MB)",
+                                                    QSettings().value("srw/memory-budget", get_default_memory_budget()//1024**2, int),
+                                                    1, 2**31 - 1)
+            if ok:
+                QSettings().setValue("srw/memory-budget", memory_budget)
+
+                showWarningMessage("Memory Budget: " + str(memory_budget) + " MB")
+        except Exception as exception:
+            showCriticalMessage(exception.args[0])
+
+    def executeAction_10(self, action):
+        QSettings().setValue("srw/memory-budget-action", 0)
+
+        showWarningMessage("Propagations exceeding the Memory Budget will ask for confirmation")
+
+    def executeAction_11(self, action):
+        QSettings().setValue("srw/memory-budget-action", 1)
+
+        showWarningMessage("Propagations exceeding the Memory Budget will be refused")
+
+    def executeAction_12(self, action):
+        try:
+            report = ""
+
+            for node in self.canvas_main_window.current_document().scheme().nodes:
+                widget = self.getWidgetFromNode(node)
+
+                if isinstance(widget, OWSRWOpticalElement) and not widget.input_srw_data is None:
+                    report += "-- " + node.title + " " + "-"*max(0, 80 - len(node.title)) + "\n" + widget.get_memory_estimate_report() + "\n\n"
+
+            if report == "":
+                showWarningMessage("No optical element with input data in the workspace")
+            else:
+                msgBox = QMessageBox()
+                msgBox.setIcon(QMessageBox.Information)
+                msgBox.setText("Estimated mesh and memory after each element (budget: " +
+                               str(QSettings().value("srw/memory-budget", get_default_memory_budget()//1024**2, int)) + " MB)")
+                msgBox.setDetailedText(report)
+                msgBox.setStandardButtons(QMessageBox.Ok)
+                msgBox.exec_()
+        except Exception as exception:
+            showCriticalMessage(exception.args[0])
+
+    def executeAction_13(self, action):
+        SRWProfiler.Instance().set_enabled(True)
+
+        showWarningMessage("Profiling enabled: sources, propagations and plots will be timed")
+
+    def executeAction_14(self, action):
+        SRWProfiler.Instance().set_enabled(False)
+
+        showWarningMessage("Profiling disabled")
+
+    def executeAction_15(self, action):
+        try:
+            if len(SRWProfiler.Instance().get_events()) == 0:
+                showWarningMessage("No profiling data: enable profiling and run the workspace")
+            else:
+                msgBox = QMessageBox()
+                msgBox.setIcon(QMessageBox.Information)
+                msgBox.setText("Wall time, CPU time and peak memory of each stage")
+                msgBox.setDetailedText(SRWProfiler.Instance().get_summary_text())
+                msgBox.setStandardButtons(QMessageBox.Ok)
+                msgBox.exec_()
+        except Exception as exception:
+            showCriticalMessage(exception.args[0])
+
+    def executeAction_16(self, action):
+        try:
+            if len(SRWProfiler.Instance().get_events()) == 0:
+                showWarningMessage("No profiling data: enable profiling and run the workspace")
+            else:
+                file_name, _ = QFileDialog.getSaveFileName(None, "Export Profiling Timeline", "srw_profile.json", "Chrome Trace (*.json)")
+
+                if file_name:
+                    SRWProfiler.Instance().save(file_name)
+
+                    showWarningMessage("Profiling timeline saved in " + file_name + "\n(open it with chrome://tracing or ui.perfetto.dev)")
+        except Exception as exception:
+            showCriticalMessage(exception.args[0])
+
+    def executeAction_17(self, action):
+        SRWProfiler.Instance().clear()
+
+        showWarningMessage("Profiling data cleared")
+
+    def executeAction_18(self, action):
+        self.set_precision(srw_precision.SRWPrecision.DOUBLE)
+
+        showWarningMessage("Precision: Double (float64) intensities and phases")
+
+    def executeAction_19(self, action):
+        self.set_precision(srw_precision.SRWPrecision.SINGLE)
+
+        showWarningMessage("Precision: Single (float32) intensities and phases")
+
+    def executeAction_20(self, action):
+        QSettings().setValue("srw/precision-accuracy-check", 1)
+
+        showWarningMessage("In Single Precision, the intensities, plots and accumulations of each calculated wavefront will be compared with Double Precision (relative error tolerance: " +
+                           str(QSettings().value("srw/precision-accuracy-tolerance", srw_precision.ACCURACY_TOLERANCE, float)) + ")")
+
+    def executeAction_21(self, action):
+        QSettings().setValue("srw/precision-accuracy-check", 0)
+
+        showWarningMessage("Accuracy Check of Single Precision disabled")
+
+    def executeAction_22(self, action):
+        QSettings().setValue("srw/source-cache-enabled", 1)
+
+        showWarningMessage("Source Wavefront Cache enabled: source wavefronts will be stored in " + self.get_source_wavefront_cache().get_directory())
+
+    def executeAction_23(self, action):
+        QSettings().setValue("srw/source-cache-enabled", 0)
+
+        showWarningMessage("Source Wavefront Cache disabled")
+
+    def executeAction_24(self, action):
+        try:
+            directory = QFileDialog.getExistingDirectory(None, "Source Wavefront Cache Directory", self.get_source_wavefront_cache().get_directory())
+
+            if directory:
+                QSettings().setValue("srw/source-cache-directory", directory)
+
+                showWarningMessage("Source Wavefront Cache Directory: " + directory)
+        except Exception as exception:
+            showCriticalMessage(exception.args[0])
+
+    def executeAction_25(self, action):
+        try:
+            source_cache = self.get_source_wavefront_cache()
+
+            cache_size, ok = QInputDialog.getInt(None, "Source Wavefront Cache Size",
+                                                 "Maximum size of the Source Wavefront Cache [MB]\n(used: " + str(round(source_cache.get_size_used()/1024**2, 1)) + " MB)",
+                                                 source_cache.get_size_budget()//1024**2,
+                                                 1, 2**31 - 1)
+            if ok:
+                QSettings().setValue("srw/source-cache-size", cache_size)
+
+                self.get_source_wavefront_cache() # evicts the exceeding wavefronts
+
+                showWarningMessage("Source Wavefront Cache Size: " + str(cache_size) + " MB")
+        except Exception as exception:
+            showCriticalMessage(exception.args[0])
+
+    def executeAction_26(self, action):
+        try:
+            source_cache = self.get_source_wavefront_cache()
+
+            size_used = source_cache.get_size_used()
+            entries = source_cache.clear()
+
+            showWarningMessage("Source Wavefront Cache cleared: " + str(entries) + " wavefronts, " + str(round(size_used/1024**2, 1)) + " MB released")
+        except Exception as exception:
+            showCriticalMessage(exception.args[0])
+
+    def executeAction_27(self, action):
+        QSettings().setValue("srw/trajectory-cache-enabled", 1)
+
+        showWarningMessage("Trajectory Cache enabled: the electron trajectory will be calculated once for each source")
+
+    def executeAction_28(self, action):
+        QSettings().setValue("srw/trajectory-cache-enabled", 0)
+        srw_trajectory.SRWTrajectoryCache.Instance().clear()
+
+        showWarningMessage("Trajectory Cache disabled")
+
+    def executeAction_29(self, action):
+        QSettings().setValue("srw/trajectory-linear-corrections", 1)
+
+        showWarningMessage("Linear Corrections enabled: trajectories of electrons with small offsets (up to " +
+                           str(srw_trajectory.SRWTrajectoryCache.MAXIMUM_POSITION_OFFSET*1e6) + " μm, " +
+                           str(srw_trajectory.SRWTrajectoryCache.MAXIMUM_ANGLE_OFFSET*1e6) + " μrad, " +
+                           str(srw_trajectory.SRWTrajectoryCache.MAXIMUM_ENERGY_OFFSET*100) + "% in energy) will be derived from the cached ones, if the Trajectory Cache is enabled")
+
+    def executeAction_30(self, action):
+        QSettings().setValue("srw/trajectory-linear-corrections", 0)
+
+        showWarningMessage("Linear Corrections of the cached trajectories disabled")
+
+    def executeAction_31(self, action):
+        try:
+            trajectory_cache = srw_trajectory.SRWTrajectoryCache.Instance()
+
+            entries = len(trajectory_cache)
+            trajectory_cache.clear()
+
+            showWarningMessage("Trajectory Cache cleared: " + str(entries) + " trajectories released")
+        except Exception as exception:
+            showCriticalMessage(exception.args[0])
+
+    # the precision is a preference of the GUI, passed to the calculations of the session
+    def set_precision(self, precision):
+        QSettings().setValue("srw/precision", precision)
+
+        srw_precision.set_precision(precision)
+
+    def get_source_wavefront_cache(self):
+        source_cache = SRWSourceWavefrontDiskCache.Instance()
+        source_cache.set_directory(QSettings().value("srw/source-cache-directory", SRWSourceWavefrontDiskCache.DEFAULT_DIRECTORY, str))
+        source_cache.set_size_budget(QSettings().value("srw/source-cache-size", SRWSourceWavefrontDiskCache.DEFAULT_SIZE_BUDGET//1024**2, int)*1024**2) # MB
+
+        return source_cache
+
    #################################################################
 
     def set_srw_live_propagation_mode(self):
@@ -0,0 +1,68 @@
+from wofrysrw.storage_ring.srw_electron_beam import SRWElectronBeam
+from wofrysrw.storage_ring.light_sources.srw_gaussian_light_source import SRWGaussianLightSource
+from wofrysrw.storage_ring.light_sources.srw_bending_magnet_light_source import SRWBendingMagnetLightSource
+from wofrysrw.storage_ring.magnetic_structures.srw_bending_magnet import SRWBendingMagnet
+from wofrysrw.propagator.wavefront2D.srw_wavefront import WavefrontParameters, WavefrontPropagationParameters, WavefrontPrecisionParameters
+from wofrysrw.beamline.srw_beamline import Where
+from wofrysrw.beamline.optical_elements.ideal_elements.srw_ideal_lens import SRWIdealLens
+
+from syned.beamline.beamline_element import BeamlineElement
+from syned.beamline.element_coordinates import ElementCoordinates
+
+from orangecontrib.srw.util.srw_objects import SRWPersistentBeamline, create_srw_beamline
+
+#########################################################################################
+#
+# SMALL BEAMLINES FOR THE TESTS: a Gaussian source and ideal lenses, propagated by SRW in
+# a few milliseconds, and a short bending magnet for the source calculations
+#
+#########################################################################################
+
+def get_gaussian_wavefront(photon_energy=1000.0, sigma=20e-6, points=64, photon_energy_points=1):
+    light_source = SRWGaussianLightSource(photon_energy=photon_energy,
+                                          horizontal_sigma_at_waist=sigma,
+                                          vertical_sigma_at_waist=sigma)
+
+    return light_source.get_SRW_Wavefront(WavefrontParameters(photon_energy_min=photon_energy,
+                                                              photon_energy_max=photon_energy*(1.0 + 0.01*(photon_energy_points - 1)),
+                                                              photon_energy_points=photon_energy_points,
+                                                              h_slit_gap=20*sigma,
+                                                              v_slit_gap=20*sigma,
+                                                              h_slit_points=points,
+                                                              v_slit_points=points,
+                                                              distance=1.0))
+
+# a lens at distance p from the previous element, with the propagation parameters recorded as the widgets do
+def get_lens(p=1.0, focal_length=2.0, name="Lens", resolution_factor=1.0):
+    wavefront_propagation_parameters = SRWPersistentBeamline.ParametersRecorder()
+
+    for where in Where.tuple():
+        wavefront_propagation_parameters.append_wavefront_propagation_parameters(WavefrontPropagationParameters(horizontal_resolution_modification_factor_at_resizing=resolution_factor,
+                                                                                                               vertical_resolution_modification_factor_at_resizing=resolution_factor),
+                                                                                 None, where)
+
+    return BeamlineElement(optical_element=SRWIdealLens(name=name, focal_x=focal_length, focal_y=focal_length),
+                           coordinates=ElementCoordinates(p=p, q=0.0)), wavefront_propagation_parameters
+
+def get_lenses_beamline(lenses=((1.0, 2.0), (1.0, 5.0), (0.5, 3.0))):
+    srw_beamline = SRWPersistentBeamline(create_srw_beamline())
+
+    for index, (p, focal_length) in enumerate(lenses): srw_beamline = srw_beamline.append(*get_lens(p, focal_length, "Lens " + str(index + 1)))
+
+    return srw_beamline
+
+def get_bending_magnet_source():
+    return SRWBendingMagnetLightSource(electron_beam=SRWElectronBeam(energy_in_GeV=2.0, current=0.5,
+                                                                     moment_xx=1e-10, moment_xpxp=1e-10, moment_yy=1e-11, moment_ypyp=1e-11),
+                                       bending_magnet_magnetic_structure=SRWBendingMagnet(0.0, 1.0, 0.5))
+
+def get_bending_magnet_wavefront_parameters(gap=1e-3, points=5, photon_energy_points=11):
+    return WavefrontParameters(photon_energy_min=100.0,
+                               photon_energy_max=1000.0,
+                               photon_energy_points=photon_energy_points,
+                               h_slit_gap=gap,
+                               v_slit_gap=gap,
+                               h_slit_points=points,
+                               v_slit_points=points,
+                               distance=10.0,
+                               wavefront_precision_parameters=WavefrontPrecisionParameters(sr_method=2, relative_precision=0.01))
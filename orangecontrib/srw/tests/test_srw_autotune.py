@@ -0,0 +1,43 @@
+import unittest
+
+try:
+    from orangecontrib.srw.util import srw_autotune
+except ImportError: # OASYS not installed
+    srw_autotune = None
+
+# statistics converging as 1/value², as the sampling errors of a calculation refined by value
+def get_statistics(value, scale=1.0):
+    error = 0.001/value**2
+
+    return {"fwhm_h"  : scale*(10.0 + error),
+            "fwhm_v"  : scale*(5.0 - error),
+            "sigma_h" : scale*(4.0 + 2*error),
+            "sigma_v" : scale*2.0,
+            "flux"    : scale*(1e12*(1 - error))}
+
+@unittest.skipIf(srw_autotune is None, "OASYS is not installed")
+class SRWAutoTuneTest(unittest.TestCase):
+
+    def test_converges_below_the_nominal_value(self):
+        result = srw_autotune.search(get_statistics, "Resolution Factor", initial_value=0.25, tolerance=0.01)
+
+        self.assertTrue(result.is_converged())
+        self.assertEqual(result.values, [0.25, 0.5, 1.0])
+        self.assertEqual(result.tuned_value, 0.5)
+
+    def test_tuned_value_is_the_coarser_of_the_converged_pair(self):
+        for tolerance in [1e-2, 1e-3, 1e-4]:
+            result = srw_autotune.search(get_statistics, "Resolution Factor", initial_value=0.25, tolerance=tolerance, max_steps=10)
+
+            self.assertTrue(result.is_converged())
+            self.assertLessEqual(max(srw_autotune.get_relative_changes(get_statistics(result.tuned_value), get_statistics(2*result.tuned_value)).values()), tolerance)
+            self.assertGreater(max(srw_autotune.get_relative_changes(get_statistics(0.5*result.tuned_value), get_statistics(result.tuned_value)).values()), tolerance)
+
+    def test_not_converged(self):
+        result = srw_autotune.search(get_statistics, "Resolution Factor", initial_value=0.25, tolerance=1e-6, max_steps=3)
+
+        self.assertFalse(result.is_converged())
+        self.assertEqual(result.values, [0.25, 0.5, 1.0, 2.0])
+
+if __name__ == "__main__":
+    unittest.main()
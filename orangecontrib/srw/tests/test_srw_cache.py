@@ -0,0 +1,110 @@
+import os, shutil, tempfile, unittest
+
+import numpy
+
+from wofrysrw.beamline.optical_elements.mirrors.srw_plane_mirror import SRWPlaneMirror
+from wofrysrw.storage_ring.light_sources.srw_gaussian_light_source import SRWGaussianLightSource
+from wofrysrw.propagator.wavefront2D.srw_wavefront import WavefrontParameters
+
+from orangecontrib.srw.util.srw_cache import SRWPropagationCache, SRWResultCache, SRWSourceWavefrontDiskCache, get_fingerprint
+from orangecontrib.srw.tests.fixtures import get_gaussian_wavefront
+
+def write_height_profile(file_name, amplitude, modification_time=None):
+    numpy.savetxt(file_name, numpy.array([numpy.linspace(-0.1, 0.1, 11), amplitude*numpy.sin(numpy.linspace(0, numpy.pi, 11))]).T)
+
+    # same size, different content: the modification time is what tells the two versions apart
+    if not modification_time is None: os.utime(file_name, ns=(modification_time, modification_time))
+
+class SRWPropagationCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_data_files_are_part_of_the_key(self):
+        file_name = os.path.join(self.directory, "mirror.dat")
+        write_height_profile(file_name, 1e-9, 1_000_000_000)
+
+        mirror = SRWPlaneMirror(height_profile_data_file=file_name)
+        wavefront = get_gaussian_wavefront(points=16)
+        cache = SRWPropagationCache()
+
+        key = cache.get_key(wavefront, "handler", mirror)
+
+        self.assertEqual(key, cache.get_key(wavefront, "handler", mirror))
+
+        write_height_profile(file_name, 2e-9, 2_000_000_000) # edited in place
+
+        self.assertNotEqual(key, cache.get_key(wavefront, "handler", mirror))
+
+        write_height_profile(file_name, 1e-9, 3_000_000_000) # same content again
+
+        self.assertEqual(key, cache.get_key(wavefront, "handler", mirror))
+
+    def test_objects_without_data_files(self):
+        mirror = SRWPlaneMirror(height_profile_data_file=None)
+
+        self.assertEqual(get_fingerprint(mirror), get_fingerprint(SRWPlaneMirror(height_profile_data_file=None)))
+        self.assertNotEqual(get_fingerprint(mirror), get_fingerprint(SRWPlaneMirror(height_profile_data_file=None, grazing_angle=0.002)))
+
+    def test_cached_wavefronts_are_private_copies(self):
+        wavefront = get_gaussian_wavefront(points=16)
+        field = numpy.array(wavefront.arEx)
+
+        cache = SRWPropagationCache()
+        cache.put("key", wavefront)
+
+        wavefront.arEx[0] += 1.0 # the producer keeps modifying its wavefront
+
+        cached_wavefront = cache.get("key")
+        numpy.testing.assert_array_equal(numpy.array(cached_wavefront.arEx), field)
+
+        cached_wavefront.arEx[0] += 1.0 # a consumer modifies its copy
+
+        numpy.testing.assert_array_equal(numpy.array(cache.get("key").arEx), field)
+        self.assertIsNot(cache.get("key"), cache.get("key"))
+
+class SRWSourceWavefrontDiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stored_wavefront_is_identical(self):
+        wavefront = get_gaussian_wavefront(points=16, photon_energy_points=2)
+        cache = SRWSourceWavefrontDiskCache(directory=self.directory)
+
+        cache.put("key", wavefront)
+
+        with numpy.load(os.path.join(self.directory, "key" + cache.FILE_EXTENSION), allow_pickle=False) as data:
+            self.assertEqual(set(data.files), {"header", "typecode_x", "typecode_y", "arEx", "arEy"})
+
+        cached_wavefront = cache.get("key")
+
+        numpy.testing.assert_array_equal(numpy.array(cached_wavefront.arEx), numpy.array(wavefront.arEx))
+        numpy.testing.assert_array_equal(numpy.array(cached_wavefront.arEy), numpy.array(wavefront.arEy))
+        self.assertEqual(vars(cached_wavefront.mesh), vars(wavefront.mesh))
+        self.assertEqual(vars(cached_wavefront.partBeam.partStatMom1), vars(wavefront.partBeam.partStatMom1))
+
+        for attribute in ["Rx", "Ry", "dRx", "dRy", "xc", "yc", "avgPhotEn", "presCA", "presFT", "numTypeElFld", "unitElFld",
+                          "arMomX", "arMomY", "arElecPropMatr", "arWfrAuxData"]:
+            self.assertEqual(getattr(cached_wavefront, attribute), getattr(wavefront, attribute), attribute)
+
+        self.assertIsNone(cache.get("missing"))
+
+    def test_source_keys(self):
+        parameters = WavefrontParameters(photon_energy_min=1000.0, photon_energy_max=1000.0, photon_energy_points=1)
+        cache = SRWSourceWavefrontDiskCache(directory=self.directory)
+
+        key = cache.get_key(SRWGaussianLightSource(name="Source 1", photon_energy=1000.0), parameters)
+
+        self.assertEqual(key, cache.get_key(SRWGaussianLightSource(name="Source 2", photon_energy=1000.0), parameters))
+        self.assertNotEqual(key, cache.get_key(SRWGaussianLightSource(name="Source 1", photon_energy=2000.0), parameters))
+        self.assertNotEqual(key, SRWResultCache().get_key(SRWGaussianLightSource(name="Source 1", photon_energy=1000.0), parameters))
+
+if __name__ == "__main__":
+    unittest.main()
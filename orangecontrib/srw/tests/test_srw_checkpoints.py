@@ -0,0 +1,98 @@
+import os, shutil, tempfile, unittest
+
+import numpy
+
+from wofrysrw.propagator.propagators2D.srw_propagation_mode import SRWPropagationMode
+from wofrysrw.beamline.optical_elements.mirrors.srw_plane_mirror import SRWPlaneMirror
+
+from syned.beamline.beamline_element import BeamlineElement
+from syned.beamline.element_coordinates import ElementCoordinates
+
+from orangecontrib.srw.util import srw_engine
+from orangecontrib.srw.util.srw_cache import SRWCheckpointStore
+from orangecontrib.srw.tests.fixtures import get_gaussian_wavefront, get_lenses_beamline, get_lens
+from orangecontrib.srw.tests.test_srw_cache import write_height_profile
+
+def propagate_monolithic(source_wavefront, srw_beamline):
+    return srw_engine.run_job(srw_engine.SRWEngineJob(srw_beamline=srw_beamline,
+                                                      source_wavefront=source_wavefront,
+                                                      propagation_mode=SRWPropagationMode.WHOLE_BEAMLINE)).wavefront
+
+def get_keys(checkpoint_store, source_wavefront, srw_beamline):
+    return checkpoint_store.get_prefix_keys(source_wavefront, [node.to_stage_srw_beamline() for node in srw_beamline.get_nodes()],
+                                            srw_engine.get_handler_name(SRWPropagationMode.WHOLE_BEAMLINE))
+
+class SRWCheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source_wavefront = get_gaussian_wavefront()
+
+    def assertSameWavefront(self, wavefront_1, wavefront_2):
+        self.assertEqual((wavefront_1.mesh.nx, wavefront_1.mesh.ny, wavefront_1.mesh.xStart, wavefront_1.mesh.xFin),
+                         (wavefront_2.mesh.nx, wavefront_2.mesh.ny, wavefront_2.mesh.xStart, wavefront_2.mesh.xFin))
+        numpy.testing.assert_array_equal(numpy.array(wavefront_1.arEx), numpy.array(wavefront_2.arEx))
+        numpy.testing.assert_array_equal(numpy.array(wavefront_1.arEy), numpy.array(wavefront_2.arEy))
+
+    def test_checkpointed_propagation_is_identical_to_monolithic(self):
+        srw_beamline = get_lenses_beamline()
+        checkpoint_store = SRWCheckpointStore()
+
+        monolithic_wavefront = propagate_monolithic(self.source_wavefront, srw_beamline)
+
+        self.assertSameWavefront(srw_engine.propagate_from_checkpoints(self.source_wavefront, srw_beamline, checkpoint_store), monolithic_wavefront)
+        self.assertEqual(len(checkpoint_store), 3)
+
+        # retrieved from the last checkpoint
+        self.assertSameWavefront(srw_engine.propagate_from_checkpoints(self.source_wavefront, srw_beamline, checkpoint_store), monolithic_wavefront)
+        self.assertEqual(len(checkpoint_store), 3)
+
+    def test_edited_stage_invalidates_the_later_checkpoints(self):
+        srw_beamline = get_lenses_beamline(((1.0, 2.0), (1.0, 5.0), (0.5, 3.0)))
+        edited_srw_beamline = get_lenses_beamline(((1.0, 2.0), (1.0, 7.0), (0.5, 3.0)))
+        checkpoint_store = SRWCheckpointStore()
+
+        srw_engine.propagate_from_checkpoints(self.source_wavefront, srw_beamline, checkpoint_store)
+
+        keys = get_keys(checkpoint_store, self.source_wavefront, srw_beamline)
+        edited_keys = get_keys(checkpoint_store, self.source_wavefront, edited_srw_beamline)
+
+        self.assertEqual(keys[0], edited_keys[0])
+        self.assertTrue(all([key != edited_key for key, edited_key in zip(keys[1:], edited_keys[1:])]))
+        self.assertEqual(checkpoint_store.get_last_checkpoint(edited_keys)[0], 0)
+
+        first_checkpoint = numpy.array(checkpoint_store.get(keys[0]).arEx)
+
+        # resumed after the first element
+        self.assertSameWavefront(srw_engine.propagate_from_checkpoints(self.source_wavefront, edited_srw_beamline, checkpoint_store),
+                                 propagate_monolithic(self.source_wavefront, edited_srw_beamline))
+
+        numpy.testing.assert_array_equal(numpy.array(checkpoint_store.get(keys[0]).arEx), first_checkpoint)
+
+    def test_edited_data_file_invalidates_the_later_checkpoints(self):
+        directory = tempfile.mkdtemp()
+
+        try:
+            file_name = os.path.join(directory, "mirror.dat")
+            write_height_profile(file_name, 1e-9, 1_000_000_000)
+
+            srw_beamline = get_lenses_beamline(((1.0, 2.0),))
+            srw_beamline = srw_beamline.append(BeamlineElement(optical_element=SRWPlaneMirror(height_profile_data_file=file_name),
+                                                               coordinates=ElementCoordinates(p=1.0, q=0.0)))
+            srw_beamline = srw_beamline.append(*get_lens(0.5, 3.0))
+
+            checkpoint_store = SRWCheckpointStore()
+
+            keys = get_keys(checkpoint_store, self.source_wavefront, srw_beamline)
+
+            write_height_profile(file_name, 2e-9, 2_000_000_000)
+
+            edited_keys = get_keys(checkpoint_store, self.source_wavefront, srw_beamline)
+
+            self.assertEqual(keys[0], edited_keys[0])
+            self.assertNotEqual(keys[1], edited_keys[1])
+            self.assertNotEqual(keys[2], edited_keys[2])
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    unittest.main()
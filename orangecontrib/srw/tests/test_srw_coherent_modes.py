@@ -0,0 +1,140 @@
+import os, shutil, tempfile, unittest
+
+import numpy
+
+from orangecontrib.srw.util import srw_coherent_modes, srw_engine
+from orangecontrib.srw.tests.fixtures import get_gaussian_wavefront
+
+class SRWGaussianSchellModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sigma = 10e-6
+        self.coherence_length = 5e-6
+        self.x = numpy.linspace(-8*self.sigma, 8*self.sigma, 401)
+        self.dx = self.x[1] - self.x[0]
+
+    def test_hermite_gaussian_functions_are_orthonormal(self):
+        for distance in [0.0, 1.0]:
+            functions, radius = srw_coherent_modes.get_hermite_gaussian_functions(self.x, self.sigma, self.coherence_length, 1e-10, distance, 10)
+
+            numpy.testing.assert_allclose(functions.conj() @ functions.T*self.dx, numpy.eye(11), atol=1e-6)
+            self.assertEqual(numpy.isinf(radius), distance == 0.0)
+
+    def test_modes_reproduce_the_cross_spectral_density(self):
+        number_of_modes = 80
+
+        functions, _ = srw_coherent_modes.get_hermite_gaussian_functions(self.x, self.sigma, self.coherence_length, 1e-10, 0.0, number_of_modes - 1)
+        _, q = srw_coherent_modes.get_mode_parameters(self.sigma, self.coherence_length)
+
+        occupations = (1 - q)*q**numpy.arange(number_of_modes)
+
+        x1, x2 = numpy.meshgrid(self.x, self.x, indexing="ij")
+        cross_spectral_density = numpy.exp(-(x1**2 + x2**2)/(4*self.sigma**2))*numpy.exp(-(x1 - x2)**2/(2*self.coherence_length**2))
+
+        # normalized to its trace, as the occupations
+        cross_spectral_density /= self.sigma*numpy.sqrt(2*numpy.pi)
+
+        numpy.testing.assert_allclose((functions.T*occupations) @ functions.conj(), cross_spectral_density, atol=1e-4*numpy.max(cross_spectral_density))
+
+    def test_coherence_length(self):
+        wavelength = 1e-10
+        sigma_prime = 10*wavelength/(4*numpy.pi*self.sigma)
+
+        coherence_length = srw_coherent_modes.get_coherence_length(self.sigma, sigma_prime, wavelength)
+
+        # divergence of the Gaussian Schell-model source
+        k = 2*numpy.pi/wavelength
+        numpy.testing.assert_allclose(numpy.sqrt(1/(4*self.sigma**2) + 1/coherence_length**2)/k, sigma_prime)
+
+        self.assertTrue(numpy.isinf(srw_coherent_modes.get_coherence_length(self.sigma, 0.5*wavelength/(4*numpy.pi*self.sigma), wavelength)))
+        self.assertEqual(srw_coherent_modes.get_coherent_fraction(self.sigma, numpy.inf), 1.0)
+
+    def test_ordered_modes(self):
+        modes = srw_coherent_modes.get_ordered_modes((self.sigma, self.coherence_length), (self.sigma, 4*self.coherence_length), 20)
+
+        occupations = [occupation for _, _, occupation in modes]
+
+        self.assertEqual(len(modes), 20)
+        self.assertEqual(modes[0][:2], (0, 0))
+        self.assertEqual(occupations, sorted(occupations, reverse=True))
+        self.assertLess(sum(occupations), 1.0)
+        self.assertEqual(modes[1][:2], (1, 0)) # less coherent horizontally: the second mode is horizontal
+
+    def test_coherent_mode_wavefronts(self):
+        wavefront = get_gaussian_wavefront(points=32)
+
+        wavefronts, weights, occupation = srw_coherent_modes.get_coherent_modes(wavefront, (20e-6, 20e-6), (20e-6, 80e-6), 0.0, 10)
+
+        self.assertEqual(len(wavefronts), 10)
+        self.assertAlmostEqual(sum(weights), 1.0)
+        self.assertLess(occupation, 1.0)
+
+        total_intensity = numpy.sum(srw_coherent_modes._get_field_intensity(wavefront))
+
+        # each mode carries the flux of the single electron wavefront, apart from the part beyond the mesh
+        for mode_wavefront in wavefronts:
+            self.assertEqual((mode_wavefront.mesh.nx, mode_wavefront.mesh.ny), (wavefront.mesh.nx, wavefront.mesh.ny))
+            numpy.testing.assert_allclose(numpy.sum(srw_coherent_modes._get_field_intensity(mode_wavefront)), total_intensity, rtol=0.05)
+
+class SRWNumericalCoherentModesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.field_archive = srw_coherent_modes.SRWFieldArchive(os.path.join(self.directory, "fields.h5"), "w")
+
+        template = get_gaussian_wavefront(points=16)
+        random_generator = numpy.random.default_rng(0)
+
+        # fields of rank 5: random combinations of orthonormal modes, with decreasing amplitudes
+        modes, _ = numpy.linalg.qr(random_generator.standard_normal((2*16*16, 5)) + 1j*random_generator.standard_normal((2*16*16, 5)))
+        amplitudes = numpy.array([1.0, 0.6, 0.3, 0.1, 0.05])
+
+        for _ in range(60):
+            field = (modes @ (amplitudes*(random_generator.standard_normal(5) + 1j*random_generator.standard_normal(5)))).reshape(2, 16, 16, 1)
+
+            self.field_archive.append(srw_engine.create_wavefront(template,
+                                                                  numpy.stack([field[0].real, field[0].imag], axis=-1).astype(numpy.float32),
+                                                                  numpy.stack([field[1].real, field[1].imag], axis=-1).astype(numpy.float32),
+                                                                  template.mesh.eStart, template.mesh.eFin,
+                                                                  template.mesh.xStart, template.mesh.xFin, template.mesh.yStart, template.mesh.yFin))
+
+    def tearDown(self):
+        self.field_archive.close()
+        shutil.rmtree(self.directory)
+
+    def test_randomized_svd_is_identical_to_the_exact_decomposition(self):
+        fields = self.field_archive.get_fields(0, self.field_archive.get_number_of_fields()).astype(numpy.complex128)
+
+        exact_modes, singular_values, _ = numpy.linalg.svd(fields, full_matrices=False)
+        exact_occupations = singular_values**2/fields.shape[1]
+
+        modes, occupations, trace = srw_coherent_modes.get_numerical_coherent_modes(self.field_archive, 4, chunk_size=7)
+
+        numpy.testing.assert_allclose(occupations, exact_occupations[:4], rtol=1e-6)
+        numpy.testing.assert_allclose(numpy.abs(exact_modes[:, :4].conj().T @ modes), numpy.eye(4), atol=1e-6)
+        numpy.testing.assert_allclose(trace, numpy.sum(exact_occupations), rtol=1e-6)
+
+    def test_mode_wavefronts_reproduce_the_intensity(self):
+        fields = self.field_archive.get_fields(0, self.field_archive.get_number_of_fields()).astype(numpy.complex128)
+
+        modes, occupations, _ = srw_coherent_modes.get_numerical_coherent_modes(self.field_archive, 5)
+        wavefronts, weights = srw_coherent_modes.get_archive_coherent_modes(self.field_archive, modes, occupations)
+
+        self.assertAlmostEqual(sum(weights), 1.0)
+
+        intensity = sum([weight*numpy.sum(srw_coherent_modes._get_field_intensity(wavefront), axis=2) for wavefront, weight in zip(wavefronts, weights)])
+
+        # diagonal of W, Ex and Ey
+        numpy.testing.assert_allclose(intensity, numpy.sum(numpy.mean(numpy.abs(fields)**2, axis=1).reshape(2, 16, 16), axis=0), rtol=1e-4, atol=1e-6*numpy.max(intensity))
+
+    def test_fields_on_another_mesh_are_rejected(self):
+        resized_wavefront = get_gaussian_wavefront(points=16)
+        resized_wavefront.mesh.xFin *= 2
+
+        with self.assertRaises(ValueError):
+            self.field_archive.append(resized_wavefront)
+
+        self.assertEqual(self.field_archive.get_number_of_fields(), 60)
+
+if __name__ == "__main__":
+    unittest.main()
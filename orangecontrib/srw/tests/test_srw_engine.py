@@ -0,0 +1,106 @@
+import time, pickle, unittest
+from unittest import mock
+
+import numpy
+
+from wofrysrw.propagator.wavefront2D.srw_wavefront import SRWWavefront
+from wofrysrw.propagator.propagators2D.srw_propagation_mode import SRWPropagationMode
+
+from orangecontrib.srw.util import srw_engine
+from orangecontrib.srw.tests.fixtures import get_gaussian_wavefront, get_lenses_beamline
+
+class SRWProcessPoolTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        srw_engine.shutdown_process_pool()
+
+    def test_map_in_pool(self):
+        completed = []
+
+        self.assertEqual(srw_engine.map_in_pool(pow, [2, 3, 4], [2, 2, 2], max_workers=2, callback=lambda index, result: completed.append((index, result))), [4, 9, 16])
+        self.assertEqual(completed, [(0, 4), (1, 9), (2, 16)])
+
+    def test_cancelled_calculation_terminates_the_workers(self):
+        start = time.time()
+
+        def wait_callback():
+            if time.time() - start > 0.5: raise srw_engine.SRWEngineCancelled()
+
+        with self.assertRaises(srw_engine.SRWEngineCancelled):
+            srw_engine.map_in_pool(time.sleep, [60, 60, 60], max_workers=2, wait_callback=wait_callback)
+
+        self.assertLess(time.time() - start, 30)
+
+        # a new pool is created for the next calculation
+        self.assertEqual(srw_engine.map_in_pool(abs, [-1, -2], max_workers=2, wait_callback=lambda : None), [1, 2])
+
+        with self.assertRaises(srw_engine.SRWEngineCancelled):
+            with srw_engine.process_pool(2) as pool:
+                list(srw_engine.as_completed([pool.submit(time.sleep, 60)], wait_callback=wait_callback))
+
+class SRWEnergySlicesTest(unittest.TestCase):
+
+    def test_energy_sliced_propagation_is_identical_to_monolithic(self):
+        source_wavefront = get_gaussian_wavefront(photon_energy_points=3)
+        job = srw_engine.SRWEngineJob(srw_beamline=get_lenses_beamline(), source_wavefront=source_wavefront, propagation_mode=SRWPropagationMode.WHOLE_BEAMLINE)
+
+        wavefront = srw_engine.run_job(job).wavefront
+        sliced_wavefront = srw_engine.run_energy_sliced_job(job, max_workers=1).wavefront
+
+        self.assertEqual((sliced_wavefront.mesh.ne, sliced_wavefront.mesh.eStart, sliced_wavefront.mesh.eFin), (3, wavefront.mesh.eStart, wavefront.mesh.eFin))
+        numpy.testing.assert_array_equal(numpy.array(sliced_wavefront.arEx), numpy.array(wavefront.arEx))
+        numpy.testing.assert_array_equal(numpy.array(sliced_wavefront.arEy), numpy.array(wavefront.arEy))
+
+    def test_slices_on_different_meshes_are_not_merged(self):
+        slices = srw_engine.split_energy_slices(get_gaussian_wavefront(photon_energy_points=3))
+        slices[2] = srw_engine.split_energy_slices(get_gaussian_wavefront(photon_energy=1020.0, sigma=25e-6))[0]
+
+        with self.assertRaises(ValueError): srw_engine.merge_energy_slices(slices)
+
+class SRWWavefrontCopiesTest(unittest.TestCase):
+    '''
+    The SRW propagators write the field in place: the wavefront shared with the caller is copied once for the whole
+    beamline, a private one never
+    '''
+
+    def run_job(self, job):
+        with mock.patch.object(SRWWavefront, "duplicate", autospec=True, side_effect=SRWWavefront.duplicate) as duplicate:
+            result = srw_engine.run_job(job)
+
+        return result, duplicate.call_count
+
+    def test_shared_wavefront_is_copied_once(self):
+        for propagation_mode in [SRWPropagationMode.STEP_BY_STEP, SRWPropagationMode.WHOLE_BEAMLINE]:
+            source_wavefront = get_gaussian_wavefront()
+            source_field = numpy.array(source_wavefront.arEx)
+
+            job = srw_engine.SRWEngineJob(srw_beamline=get_lenses_beamline(), source_wavefront=source_wavefront, propagation_mode=propagation_mode)
+
+            result, copies = self.run_job(job)
+
+            self.assertEqual(copies, 1) # not one for each element
+            numpy.testing.assert_array_equal(numpy.array(source_wavefront.arEx), source_field)
+
+            # as the worker receives it
+            private_result, copies = self.run_job(pickle.loads(pickle.dumps(job)))
+
+            self.assertEqual(copies, 0)
+            numpy.testing.assert_array_equal(numpy.array(private_result.wavefront.arEx), numpy.array(result.wavefront.arEx))
+
+    def test_intermediate_wavefronts_are_not_propagated_in_place(self):
+        job = srw_engine.SRWEngineJob(srw_beamline=get_lenses_beamline(), source_wavefront=get_gaussian_wavefront(), keep_intermediate_wavefronts=True)
+
+        result, copies = self.run_job(job)
+
+        self.assertEqual(copies, 3)
+        self.assertEqual(len(set([id(wavefront) for wavefront in result.intermediate_wavefronts])), 3)
+
+        # each intermediate wavefront is the input of the next element
+        for index, node in enumerate(job.srw_beamline.get_nodes()[1:]):
+            wavefront = srw_engine.propagate_beamline_element(result.intermediate_wavefronts[index], node.get_beamline_element(), node.get_wavefront_propagation_parameters())
+
+            numpy.testing.assert_array_equal(numpy.array(wavefront.arEx), numpy.array(result.intermediate_wavefronts[index + 1].arEx))
+
+if __name__ == "__main__":
+    unittest.main()
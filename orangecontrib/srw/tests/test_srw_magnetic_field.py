@@ -0,0 +1,88 @@
+import os, shutil, tempfile, unittest
+from unittest import mock
+
+import numpy
+
+from orangecontrib.srw.util import srw_magnetic_field
+
+def get_magnetic_field(amplitude=1.0):
+    z = numpy.linspace(-0.5, 0.5, 101)
+
+    return srw_magnetic_field.SRWMagneticField3D(bx=numpy.zeros(len(z)), by=amplitude*numpy.sin(2*numpy.pi*z/0.1), bz=numpy.zeros(len(z)),
+                                                 x_start=0.0, x_step=0.0, x_points=1, y_start=0.0, y_step=0.0, y_points=1,
+                                                 z_start=z[0], z_step=z[1] - z[0], z_points=len(z))
+
+class SRWMagneticFieldCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_directory = os.path.join(self.directory, "cache")
+        self.field_directory = os.path.join(self.directory, "fields")
+        os.makedirs(self.field_directory)
+
+        srw_magnetic_field.set_cache_directory(self.cache_directory)
+        srw_magnetic_field.clear_magnetic_fields()
+
+    def tearDown(self):
+        srw_magnetic_field.set_cache_directory(srw_magnetic_field.DEFAULT_CACHE_DIRECTORY)
+        srw_magnetic_field.clear_magnetic_fields()
+
+        shutil.rmtree(self.directory)
+
+    def write_field(self, name, amplitude=1.0):
+        file_name = os.path.join(self.field_directory, name)
+        get_magnetic_field(amplitude).save(file_name)
+
+        return file_name
+
+    def assertSameField(self, field_1, field_2):
+        for attribute in ["bx", "by", "bz"]: numpy.testing.assert_array_equal(getattr(field_1, attribute), getattr(field_2, attribute))
+
+        self.assertEqual(field_1.get_ranges(), field_2.get_ranges())
+        self.assertEqual(field_1.z_start, field_2.z_start)
+
+    def test_parsed_field_is_stored_in_the_cache_directory(self):
+        file_name = self.write_field("undulator.txt")
+
+        magnetic_field = srw_magnetic_field.get_magnetic_field(file_name)
+
+        self.assertSameField(magnetic_field, srw_magnetic_field.read_magnetic_field(file_name))
+        self.assertEqual(os.listdir(self.field_directory), ["undulator.txt"]) # nothing written next to the table
+        self.assertEqual(os.listdir(self.cache_directory), [os.path.basename(srw_magnetic_field.get_cache_file_name(file_name))])
+
+        # a later session reads the cache file, not the table
+        srw_magnetic_field.clear_magnetic_fields()
+
+        with mock.patch.object(srw_magnetic_field, "read_magnetic_field", side_effect=AssertionError("parsed again")):
+            self.assertSameField(srw_magnetic_field.get_magnetic_field(file_name), magnetic_field)
+
+    def test_cache_is_keyed_by_content(self):
+        file_name = self.write_field("undulator.txt")
+        copy_file_name = self.write_field("copy.txt")
+
+        self.assertEqual(srw_magnetic_field.get_cache_file_name(file_name), srw_magnetic_field.get_cache_file_name(copy_file_name))
+        self.assertNotEqual(srw_magnetic_field.get_cache_file_name(file_name), srw_magnetic_field.get_cache_file_name(file_name, "!"))
+
+        srw_magnetic_field.get_magnetic_field(file_name)
+        srw_magnetic_field.get_magnetic_field(copy_file_name)
+
+        self.assertEqual(len(os.listdir(self.cache_directory)), 1)
+
+        # edited in place
+        self.write_field("undulator.txt", amplitude=2.0)
+        os.utime(file_name, ns=(1_000_000_000, 1_000_000_000))
+
+        self.assertNotEqual(srw_magnetic_field.get_cache_file_name(file_name), srw_magnetic_field.get_cache_file_name(copy_file_name))
+        self.assertSameField(srw_magnetic_field.get_magnetic_field(file_name), srw_magnetic_field.read_magnetic_field(file_name))
+        self.assertEqual(len(os.listdir(self.cache_directory)), 2)
+
+    def test_registered_field_is_not_parsed(self):
+        file_name = self.write_field("xoppy.txt")
+
+        srw_magnetic_field.register_magnetic_field(file_name, get_magnetic_field())
+
+        with mock.patch.object(srw_magnetic_field, "read_magnetic_field", side_effect=AssertionError("parsed")):
+            self.assertSameField(srw_magnetic_field.get_magnetic_field(file_name), get_magnetic_field())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+
+import numpy
+
+from wofrysrw.propagator.propagators2D.srw_propagation_mode import SRWPropagationMode
+
+from orangecontrib.srw.util import srw_engine, srw_multi_electron
+from orangecontrib.srw.tests.fixtures import get_gaussian_wavefront, get_lenses_beamline
+
+class SRWSamplingTest(unittest.TestCase):
+
+    def test_quasi_random_points_are_taken_in_order(self):
+        for sampling_method in [srw_multi_electron.SamplingMethod.SOBOL, srw_multi_electron.SamplingMethod.HALTON]:
+            normals = srw_multi_electron.get_quasi_random_normals(sampling_method, 12345, 0, 16)
+
+            self.assertEqual(normals.shape, (16, srw_multi_electron.PHASE_SPACE_DIMENSIONS))
+
+            for index in [1, 7, 15]:
+                numpy.testing.assert_allclose(srw_multi_electron.get_quasi_random_normals(sampling_method, 12345, index)[0], normals[index])
+
+            self.assertFalse(numpy.allclose(srw_multi_electron.get_quasi_random_normals(sampling_method, 54321, 0, 16), normals))
+
+        with self.assertRaises(ValueError):
+            srw_multi_electron.get_quasi_random_normals(srw_multi_electron.SamplingMethod.PSEUDO_RANDOM, 12345, 0)
+
+    def test_quasi_random_moments_converge_faster(self):
+        number_of_points = 1024
+
+        pseudo_random_errors = [numpy.max(numpy.abs(numpy.mean(numpy.random.default_rng(seed).standard_normal((number_of_points, 5)), axis=0))) for seed in range(20)]
+
+        for sampling_method in [srw_multi_electron.SamplingMethod.SOBOL, srw_multi_electron.SamplingMethod.HALTON]:
+            normals = srw_multi_electron.get_quasi_random_normals(sampling_method, 12345, 0, number_of_points)
+
+            self.assertLess(numpy.max(numpy.abs(numpy.mean(normals, axis=0))), numpy.median(pseudo_random_errors))
+            numpy.testing.assert_allclose(numpy.std(normals, axis=0), 1.0, rtol=0.05)
+
+    def test_correlated_sample(self):
+        normals = numpy.random.default_rng(0).standard_normal((2, 200000))
+        moment_uu, moment_uup, moment_upup = 4e-10, -1e-11, 9e-12
+
+        u, up = srw_multi_electron.get_correlated_sample(normals[0], normals[1], moment_uu, moment_uup, moment_upup)
+
+        numpy.testing.assert_allclose(numpy.cov(u, up), [[moment_uu, moment_uup], [moment_uup, moment_upup]], rtol=0.02, atol=2e-13)
+
+        u, up = srw_multi_electron.get_correlated_sample(1.0, 2.0, 0.0, 0.0, 9e-12)
+
+        self.assertEqual((u, up), (0.0, 2*3e-6))
+
+    def test_random_generators(self):
+        def get_batches(seed):
+            seed_sequence = numpy.random.SeedSequence(seed)
+
+            return [[generator.standard_normal() for generator in srw_multi_electron.get_random_generators(seed_sequence, 4)] for _ in range(2)]
+
+        batches = get_batches(12345)
+
+        self.assertEqual(batches, get_batches(12345))
+        self.assertEqual(len(set(batches[0] + batches[1])), 8)
+
+class SRWMacroElectronJobsTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        srw_engine.shutdown_process_pool()
+
+    def setUp(self):
+        self.jobs = [srw_engine.SRWEngineJob(srw_beamline=get_lenses_beamline(),
+                                             source_wavefront=get_gaussian_wavefront(sigma=sigma),
+                                             propagation_mode=SRWPropagationMode.WHOLE_BEAMLINE) for sigma in [18e-6, 20e-6, 22e-6]]
+
+    def test_pool_accumulation_is_identical_to_serial(self):
+        completed = []
+
+        serial_accumulator = srw_multi_electron.run_macro_electron_jobs(self.jobs, max_workers=1, weights=[1.0, 2.0, 3.0])
+        pool_accumulator = srw_multi_electron.run_macro_electron_jobs(self.jobs, max_workers=2, weights=[1.0, 2.0, 3.0],
+                                                                      callback=lambda index, accumulator: completed.append(index),
+                                                                      wait_callback=lambda : None)
+
+        self.assertEqual(completed, [0, 1, 2])
+        self.assertEqual(pool_accumulator.number_of_electrons, 3)
+        numpy.testing.assert_array_equal(pool_accumulator.get_average_intensity()[3], serial_accumulator.get_average_intensity()[3])
+
+    def test_cancelled_accumulation(self):
+        def wait_callback(): raise srw_engine.SRWEngineCancelled()
+
+        srw_engine.shutdown_process_pool() # the workers are still starting when the results are first waited for
+
+        for max_workers in [1, 2]:
+            with self.assertRaises(srw_engine.SRWEngineCancelled):
+                srw_multi_electron.run_macro_electron_jobs(self.jobs, max_workers=max_workers, wait_callback=wait_callback)
+
+if __name__ == "__main__":
+    unittest.main()
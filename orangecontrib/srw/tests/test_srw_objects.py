@@ -0,0 +1,54 @@
+import unittest
+
+from orangecontrib.srw.util.srw_objects import SRWPersistentBeamline, SRWData, SRWScanData, create_srw_beamline
+from orangecontrib.srw.tests.fixtures import get_lens, get_lenses_beamline
+
+class SRWPersistentBeamlineTest(unittest.TestCase):
+
+    def test_branches_share_the_upstream_elements(self):
+        upstream = get_lenses_beamline()
+        branch_1 = upstream.append(*get_lens(1.0, 4.0, "Branch 1"))
+        branch_2 = upstream.append(*get_lens(2.0, 6.0, "Branch 2"))
+
+        self.assertEqual(upstream.get_beamline_elements_number(), 3)
+        self.assertEqual(branch_1.get_beamline_elements_number(), 4)
+        self.assertEqual(branch_2.get_beamline_elements_number(), 4)
+        self.assertIs(branch_1.get_nodes()[2], branch_2.get_nodes()[2])
+
+        self.assertEqual([element.get_optical_element().get_name() for element in branch_1.to_srw_beamline().get_beamline_elements()],
+                         ["Lens 1", "Lens 2", "Lens 3", "Branch 1"])
+        self.assertEqual([element.get_optical_element().get_name() for element in branch_2.to_srw_beamline().get_beamline_elements()],
+                         ["Lens 1", "Lens 2", "Lens 3", "Branch 2"])
+        self.assertEqual(upstream.to_srw_beamline().get_beamline_elements_number(), 3)
+
+    def test_stages_and_empty_beamlines_are_independent(self):
+        srw_beamline = get_lenses_beamline()
+
+        for node in srw_beamline.get_nodes():
+            self.assertEqual(node.to_stage_srw_beamline().get_beamline_elements_number(), 1)
+
+        self.assertEqual(create_srw_beamline().get_beamline_elements_number(), 0)
+        self.assertEqual(SRWPersistentBeamline().get_base_srw_beamline().get_beamline_elements_number(), 0)
+
+        srw_data = SRWData()
+        srw_data.reset_working_srw_beamline()
+
+        self.assertEqual(srw_data.get_srw_beamline().get_beamline_elements_number(), 0)
+        self.assertEqual(srw_data.get_working_srw_beamline().get_beamline_elements_number(), 0)
+
+class SRWScanDataTest(unittest.TestCase):
+
+    def test_scan_is_seen_as_its_last_result(self):
+        srw_data_list = [SRWData(srw_beamline=get_lenses_beamline()), SRWData(srw_beamline=get_lenses_beamline(((1.0, 2.0),)))]
+
+        scan_data = SRWScanData(srw_data_list, number_of_workers=2)
+
+        self.assertIs(scan_data.get_srw_data_list(), srw_data_list)
+        self.assertIs(scan_data.get_srw_wavefront(), srw_data_list[-1].get_srw_wavefront())
+        self.assertEqual(scan_data.get_srw_beamline().get_beamline_elements_number(), 1)
+
+        with self.assertRaises(ValueError):
+            SRWScanData([])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from unittest import mock
+
+import numpy
+
+from wofrysrw.storage_ring.srw_light_source import PowerDensityPrecisionParameters
+
+from orangecontrib.srw.util import srw_engine, srw_power_density, srw_trajectory
+from orangecontrib.srw.tests.fixtures import get_bending_magnet_source
+
+SIGMA_H = 2e-3
+SIGMA_V = 0.5e-3
+PEAK    = 10.0 # W/mm^2
+
+def get_gaussian_power_density(srw_source, source_wavefront_parameters, power_density_precision_parameters=None, trajectory=None):
+    h = numpy.linspace(source_wavefront_parameters._h_position - 0.5*source_wavefront_parameters._h_slit_gap,
+                       source_wavefront_parameters._h_position + 0.5*source_wavefront_parameters._h_slit_gap,
+                       source_wavefront_parameters._h_slit_points)
+    v = numpy.linspace(source_wavefront_parameters._v_position - 0.5*source_wavefront_parameters._v_slit_gap,
+                       source_wavefront_parameters._v_position + 0.5*source_wavefront_parameters._v_slit_gap,
+                       source_wavefront_parameters._v_slit_points)
+
+    return h, v, gaussian(*numpy.meshgrid(h, v, indexing="ij"))
+
+def gaussian(h, v):
+    return PEAK*numpy.exp(-0.5*(h/SIGMA_H)**2 - 0.5*(v/SIGMA_V)**2)
+
+class SRWPowerDensityQuadtreeTest(unittest.TestCase):
+    '''
+    The quadtree on an analytic power density: a Gaussian, calculated on any mesh as SRW would
+    '''
+
+    def calculate(self, **parameters):
+        with mock.patch.object(srw_trajectory, "get_power_density", wraps=get_gaussian_power_density) as get_power_density:
+            quadtree = srw_power_density.calculate_adaptive_power_density(None, 20e-3, 5e-3, 10.0, None, max_workers=1, **parameters)
+
+        return quadtree, [call.kwargs["source_wavefront_parameters"] for call in get_power_density.call_args_list]
+
+    def test_total_power_and_error_estimate(self):
+        quadtree, _ = self.calculate(tolerance=1e-5, maximum_depth=4)
+
+        total_power = 2*numpy.pi*SIGMA_H*SIGMA_V*PEAK*1e6 # the tails beyond the slit are negligible
+
+        # the sum of the cell estimates ignores their cancellation: larger than the error on a smooth power density
+        self.assertLess(abs(quadtree.get_total_power() - total_power), 1e-5*total_power)
+        self.assertLess(abs(quadtree.get_total_power() - total_power), quadtree.get_error_estimate())
+        self.assertLess(quadtree.get_error_estimate(), 1e-3*total_power)
+        self.assertGreater(quadtree.get_maximum_depth(), 0)
+
+        for leaf in quadtree.get_leaves():
+            numpy.testing.assert_allclose(leaf.power_density, gaussian(*numpy.meshgrid(leaf.h, leaf.v, indexing="ij")), rtol=1e-12)
+
+        # refined on the peak, coarse on the tails
+        def get_depth(h, v):
+            return [leaf.depth for leaf in quadtree.get_leaves() if leaf.h_min <= h <= leaf.h_max and leaf.v_min <= v <= leaf.v_max][0]
+
+        self.assertEqual(get_depth(0.0, 0.0), 4)
+        self.assertLess(get_depth(-10e-3, -2.5e-3), 2)
+
+    def test_nodes_are_calculated_once(self):
+        quadtree, calculated_meshes = self.calculate(maximum_depth=3)
+
+        lattice = quadtree.get_leaves()[0].lattice
+        number_of_leaf_nodes = sum([leaf.power_density.size for leaf in quadtree.get_leaves()])
+
+        self.assertEqual(quadtree.get_number_of_evaluations(), sum([mesh._h_slit_points*mesh._v_slit_points for mesh in calculated_meshes]))
+        self.assertEqual(quadtree.get_number_of_evaluations(), lattice.get_number_of_nodes())
+        self.assertLess(quadtree.get_number_of_evaluations(), number_of_leaf_nodes)
+
+        # the meshes cover the whole initial grid, then the new nodes of each level: far fewer than the cells
+        self.assertLess(len(calculated_meshes), quadtree.get_number_of_cells()//4)
+
+    def test_resampled_power_density(self):
+        quadtree, _ = self.calculate(maximum_depth=3)
+
+        h = numpy.linspace(-10e-3, 10e-3, 101)
+        v = numpy.linspace(-2.5e-3, 2.5e-3, 51)
+
+        power_density = quadtree.resample(h, v)
+
+        self.assertAlmostEqual(srw_power_density.get_grid_power(h, v, power_density), quadtree.get_total_power())
+        numpy.testing.assert_allclose(quadtree.resample(h, v, conserve_power=False), gaussian(*numpy.meshgrid(h, v, indexing="ij")), atol=1e-2*PEAK)
+
+    def test_regular_runs(self):
+        self.assertEqual(srw_power_density._get_regular_runs([0, 1, 2, 3], 2, 16), [[0, 1, 2, 3]])
+        self.assertEqual(srw_power_density._get_regular_runs([0, 2, 4, 5, 6], 2, 16), [[0, 2, 4], [5, 6]])
+        self.assertEqual(srw_power_density._get_regular_runs([4], 2, 16), [[4, 6]])
+        self.assertEqual(srw_power_density._get_regular_runs([16], 2, 16), [[14, 16]])
+
+class SRWAdaptivePowerDensityTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        srw_engine.shutdown_process_pool()
+
+    def test_process_pool_is_identical_to_serial(self):
+        srw_source = get_bending_magnet_source()
+
+        quadtrees = [srw_power_density.calculate_adaptive_power_density(srw_source, 20e-3, 4e-3, 10.0, PowerDensityPrecisionParameters(),
+                                                                        maximum_depth=2, max_workers=max_workers) for max_workers in [1, 2]]
+
+        self.assertEqual(quadtrees[0].get_number_of_cells(), quadtrees[1].get_number_of_cells())
+        self.assertEqual(quadtrees[0].get_total_power(), quadtrees[1].get_total_power())
+
+        for leaf_1, leaf_2 in zip(quadtrees[0].get_leaves(), quadtrees[1].get_leaves()):
+            numpy.testing.assert_array_equal(leaf_1.power_density, leaf_2.power_density)
+
+if __name__ == "__main__":
+    unittest.main()
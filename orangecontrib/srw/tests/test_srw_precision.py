@@ -0,0 +1,55 @@
+import unittest
+from unittest import mock
+
+import numpy
+
+from orangecontrib.srw.util import srw_precision
+from orangecontrib.srw.tests.fixtures import get_gaussian_wavefront
+
+class SRWPrecisionTest(unittest.TestCase):
+    '''
+    The single precision pipeline (intensity, plots, accumulation) against the double precision one
+    '''
+
+    def test_intensity_is_the_one_of_srw(self):
+        wavefront = get_gaussian_wavefront(photon_energy_points=2)
+
+        _, _, _, reference_intensity = wavefront.get_intensity(multi_electron=False)
+
+        for precision in [srw_precision.SRWPrecision.DOUBLE, srw_precision.SRWPrecision.SINGLE]:
+            _, _, _, intensity = srw_precision.get_intensity(wavefront, multi_electron=False, precision=precision)
+
+            self.assertEqual(intensity.dtype, srw_precision.get_float_type(precision))
+            numpy.testing.assert_array_equal(intensity, reference_intensity)
+
+    def test_single_precision_error_is_small(self):
+        wavefront = get_gaussian_wavefront(photon_energy_points=2)
+
+        distribution_error, projections_error, average_error, total_error = srw_precision.get_relative_error(wavefront, number_of_wavefronts=100)
+
+        # SRW calculates the intensity in single precision: the error is in the sums of the plots and of the accumulation
+        self.assertEqual(distribution_error, 0.0)
+
+        for error in [projections_error, average_error, total_error]:
+            self.assertGreater(error, numpy.finfo(numpy.float64).eps)
+            self.assertLess(error, srw_precision.ACCURACY_TOLERANCE)
+
+    def test_double_precision_has_no_error(self):
+        wavefront = get_gaussian_wavefront()
+
+        run_pipeline = srw_precision._run_pipeline
+
+        with mock.patch.object(srw_precision, "_run_pipeline", side_effect=lambda wavefront, multi_electron, number_of_wavefronts, precision: \
+                run_pipeline(wavefront, multi_electron, number_of_wavefronts, srw_precision.SRWPrecision.DOUBLE)):
+            self.assertEqual(srw_precision.get_relative_error(wavefront), (0.0, 0.0, 0.0, 0.0))
+
+    def test_accumulation_error_grows_with_the_number_of_wavefronts(self):
+        wavefront = get_gaussian_wavefront()
+
+        _, _, few_wavefronts, _  = srw_precision.get_relative_error(wavefront, number_of_wavefronts=2)
+        _, _, many_wavefronts, _ = srw_precision.get_relative_error(wavefront, number_of_wavefronts=1000)
+
+        self.assertGreater(many_wavefronts, few_wavefronts)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+
+import numpy
+
+from wofrysrw.propagator.propagators2D.srw_propagation_mode import SRWPropagationMode
+
+from orangecontrib.srw.util import srw_engine
+from orangecontrib.srw.util.srw_objects import SRWData, SRWPersistentBeamline, create_srw_beamline
+from orangecontrib.srw.tests.fixtures import get_gaussian_wavefront, get_lenses_beamline, get_lens
+
+def get_intensity(wavefront):
+    field = numpy.array(wavefront.arEx)
+
+    return field[0::2]**2 + field[1::2]**2
+
+class SRWScanTest(unittest.TestCase):
+    '''
+    A scan propagates each value of the scanned variable by a job built as the plain propagation of the element
+    '''
+
+    @classmethod
+    def tearDownClass(cls):
+        srw_engine.shutdown_process_pool()
+
+    def setUp(self):
+        self.source_wavefront = get_gaussian_wavefront()
+        self.upstream_srw_beamline = get_lenses_beamline(((1.0, 2.0), (1.0, 5.0)))
+        self.beamline_element, self.wavefront_propagation_parameters = get_lens(0.5, 3.0, "Scanned Lens")
+
+    def run_scan(self, input_srw_data, propagation_mode, max_workers):
+        job = srw_engine.get_element_propagation_job(input_srw_data, self.beamline_element, self.wavefront_propagation_parameters, propagation_mode)
+
+        return srw_engine.run_jobs([job], max_workers=max_workers)[0].wavefront
+
+    def assertSameWavefront(self, wavefront_1, wavefront_2):
+        self.assertEqual((wavefront_1.mesh.nx, wavefront_1.mesh.ny), (wavefront_2.mesh.nx, wavefront_2.mesh.ny))
+        numpy.testing.assert_array_equal(numpy.array(wavefront_1.arEx), numpy.array(wavefront_2.arEx))
+
+    def test_whole_beamline_scan_includes_the_upstream_elements(self):
+        # upstream elements appended to the working beamline, not propagated yet: the input wavefront is the source one
+        input_srw_data = SRWData(srw_beamline=self.upstream_srw_beamline, srw_wavefront=self.source_wavefront)
+        input_srw_data.set_working_srw_beamline(self.upstream_srw_beamline)
+
+        # as the final screen propagates the working beamline
+        plain_wavefront = srw_engine.run_job(srw_engine.SRWEngineJob(srw_beamline=self.upstream_srw_beamline.append(self.beamline_element, self.wavefront_propagation_parameters),
+                                                                     source_wavefront=self.source_wavefront,
+                                                                     propagation_mode=SRWPropagationMode.WHOLE_BEAMLINE)).wavefront
+
+        for max_workers in [1, 2]:
+            self.assertSameWavefront(self.run_scan(input_srw_data, SRWPropagationMode.WHOLE_BEAMLINE, max_workers), plain_wavefront)
+
+        # the element alone, from the source wavefront, is a different beamline
+        element_only_wavefront = srw_engine.run_job(srw_engine.SRWEngineJob(srw_beamline=SRWPersistentBeamline(create_srw_beamline()).append(self.beamline_element, self.wavefront_propagation_parameters),
+                                                                            source_wavefront=self.source_wavefront,
+                                                                            propagation_mode=SRWPropagationMode.WHOLE_BEAMLINE)).wavefront
+
+        self.assertFalse(numpy.allclose(get_intensity(element_only_wavefront), get_intensity(plain_wavefront)))
+
+    def test_element_by_element_scan(self):
+        input_wavefront = srw_engine.run_job(srw_engine.SRWEngineJob(srw_beamline=self.upstream_srw_beamline,
+                                                                     source_wavefront=self.source_wavefront,
+                                                                     propagation_mode=SRWPropagationMode.STEP_BY_STEP)).wavefront
+
+        input_srw_data = SRWData(srw_beamline=self.upstream_srw_beamline, srw_wavefront=input_wavefront)
+        input_srw_data.reset_working_srw_beamline()
+
+        plain_wavefront = srw_engine.run_job(srw_engine.SRWEngineJob(srw_beamline=SRWPersistentBeamline(create_srw_beamline()).append(self.beamline_element, self.wavefront_propagation_parameters),
+                                                                     source_wavefront=input_wavefront,
+                                                                     propagation_mode=SRWPropagationMode.STEP_BY_STEP)).wavefront
+
+        for max_workers in [1, 2]:
+            self.assertSameWavefront(self.run_scan(input_srw_data, SRWPropagationMode.STEP_BY_STEP, max_workers), plain_wavefront)
+
+if __name__ == "__main__":
+    unittest.main()
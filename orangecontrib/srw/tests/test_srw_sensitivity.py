@@ -0,0 +1,48 @@
+import unittest
+
+try:
+    from orangecontrib.srw.util import srw_sensitivity
+except ImportError: # OASYS not installed
+    srw_sensitivity = None
+
+class Element:
+    def __init__(self):
+        self.shift_x = 0.0
+        self.rotation_y = 0.0
+        self.has_displacement = 0
+
+    # as the optical element widgets do
+    def set_scanned_variable(self, variable_name, variable_value):
+        setattr(self, variable_name, variable_value)
+        if variable_name in ["shift_x", "rotation_y"]: self.has_displacement = 1
+
+@unittest.skipIf(srw_sensitivity is None, "OASYS is not installed")
+class SRWSensitivityTest(unittest.TestCase):
+
+    def test_nominal_values_are_restored(self):
+        element = Element()
+
+        with srw_sensitivity.nominal_values_restored(element, ["shift_x", "rotation_y"]):
+            element.set_scanned_variable("shift_x", 1e-6)
+            element.set_scanned_variable("rotation_y", 1e-3)
+
+        self.assertEqual((element.shift_x, element.rotation_y, element.has_displacement), (0.0, 0.0, 0))
+
+    def test_nominal_values_are_restored_on_errors(self):
+        element = Element()
+
+        with self.assertRaises(ValueError):
+            with srw_sensitivity.nominal_values_restored(element, ["shift_x"]):
+                element.set_scanned_variable("shift_x", 1e-6)
+                raise ValueError()
+
+        self.assertEqual((element.shift_x, element.has_displacement), (0.0, 0))
+
+    def test_scanning_data_list(self):
+        scanning_data_list = srw_sensitivity.get_sensitivity_scanning_data_list([("shift_x", "Shift X", "m", 1e-6)], [2e-6])
+
+        self.assertEqual([scanning_data.get_scanned_variable_value() for scanning_data in scanning_data_list[:-1]], [1e-6, 3e-6])
+        self.assertEqual(scanning_data_list[-1].get_scanned_variable_display_name(), srw_sensitivity.NOMINAL)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import copy, unittest
+
+import numpy
+
+from orangecontrib.srw.util import srw_engine, srw_spectrum, srw_trajectory
+from orangecontrib.srw.tests.fixtures import get_bending_magnet_source, get_bending_magnet_wavefront_parameters as get_wavefront_parameters
+
+class SRWSpectrumChunksTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        srw_engine.shutdown_process_pool()
+
+    def setUp(self):
+        self.srw_source = get_bending_magnet_source()
+        self.flux_wavefront_parameters = get_wavefront_parameters()
+        self.on_axis_wavefront_parameters = get_wavefront_parameters(gap=0.0, points=1)
+        self.energies = srw_spectrum.get_energy_grid(self.flux_wavefront_parameters)
+
+    def get_spectrum(self, points_per_chunk, max_workers):
+        chunks = srw_spectrum.get_spectrum_chunks(self.flux_wavefront_parameters, self.on_axis_wavefront_parameters, points_per_chunk)
+
+        return srw_spectrum.run_spectrum_chunks(self.srw_source, self.energies, chunks, 0, max_workers=max_workers).get_spectrum()
+
+    def test_chunks_cover_the_energy_grid(self):
+        chunks = srw_spectrum.get_spectrum_chunks(self.flux_wavefront_parameters, self.on_axis_wavefront_parameters, 3)
+
+        # the last chunk, of a single point, is merged with the previous one
+        self.assertEqual([(chunk.start, chunk.stop) for chunk in chunks], [(0, 3), (3, 6), (6, 9), (9, 11)])
+
+        for chunk in chunks:
+            numpy.testing.assert_array_equal(srw_spectrum.get_energy_grid(chunk.flux_wavefront_parameters), self.energies[chunk.start:chunk.stop])
+            numpy.testing.assert_array_equal(srw_spectrum.get_energy_grid(chunk.on_axis_wavefront_parameters), self.energies[chunk.start:chunk.stop])
+
+    def test_chunked_spectrum_is_identical_to_monolithic(self):
+        monolithic_spectrum = self.get_spectrum(len(self.energies), 1)
+
+        for max_workers in [1, 2]:
+            for monolithic_array, chunked_array in zip(monolithic_spectrum, self.get_spectrum(3, max_workers)):
+                numpy.testing.assert_array_equal(chunked_array, monolithic_array)
+
+    def test_partial_spectrum_is_contiguous(self):
+        chunks = srw_spectrum.get_spectrum_chunks(self.flux_wavefront_parameters, self.on_axis_wavefront_parameters, 3)
+        assembler = srw_spectrum.SRWSpectrumAssembler(self.energies)
+
+        assembler.add(chunks[1], numpy.ones(3), numpy.ones(3))
+        self.assertEqual(assembler.get_number_of_contiguous_points(), 0)
+
+        assembler.add(chunks[0], numpy.ones(3), numpy.ones(3))
+        self.assertEqual(assembler.get_number_of_contiguous_points(), 6)
+        self.assertFalse(assembler.is_completed())
+
+        e, flux, _, power, cumulated_power = assembler.get_spectrum(6)
+
+        numpy.testing.assert_array_equal(e, self.energies[:6])
+        numpy.testing.assert_allclose(cumulated_power, numpy.cumsum(power))
+
+        for chunk in chunks[2:]: assembler.add(chunk, numpy.ones(chunk.stop - chunk.start), numpy.ones(chunk.stop - chunk.start))
+
+        self.assertTrue(assembler.is_completed())
+        self.assertEqual(assembler.get_number_of_contiguous_points(), len(self.energies))
+
+class SRWOnAxisFluxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.srw_source = get_bending_magnet_source()
+        self.on_axis_wavefront_parameters = get_wavefront_parameters(gap=0.0, points=1)
+
+    def test_on_axis_node_of_the_calculated_mesh(self):
+        srw_wavefront = srw_trajectory.get_SRW_Wavefront(self.srw_source, get_wavefront_parameters(points=5, photon_energy_points=1))
+
+        self.assertTrue(srw_spectrum.is_on_axis_node(srw_wavefront, get_wavefront_parameters(points=5)))
+        self.assertTrue(srw_spectrum.is_on_axis_node(srw_trajectory.get_SRW_Wavefront(self.srw_source, get_wavefront_parameters(gap=0.0, points=1, photon_energy_points=1)),
+                                                     self.on_axis_wavefront_parameters))
+
+        # the mesh, not the requested number of points, decides
+        self.assertTrue(srw_spectrum.is_on_axis_node(srw_wavefront, get_wavefront_parameters(points=4)))
+
+        srw_wavefront.mesh = copy.copy(srw_wavefront.mesh)
+        srw_wavefront.mesh.nx = 4
+
+        self.assertFalse(srw_spectrum.is_on_axis_node(srw_wavefront, get_wavefront_parameters(points=5)))
+
+        srw_wavefront.mesh.nx = 5
+        srw_wavefront.mesh.xStart += 1e-4
+
+        self.assertFalse(srw_spectrum.is_on_axis_node(srw_wavefront, get_wavefront_parameters(points=5)))
+
+    def test_on_axis_flux_from_the_slit_wavefront(self):
+        _, _, separate_on_axis_flux = srw_spectrum.calculate_flux(self.srw_source, get_wavefront_parameters(points=4), self.on_axis_wavefront_parameters, 0)
+        _, _, extracted_on_axis_flux = srw_spectrum.calculate_flux(self.srw_source, get_wavefront_parameters(points=5), self.on_axis_wavefront_parameters, 0)
+
+        numpy.testing.assert_allclose(extracted_on_axis_flux, separate_on_axis_flux, rtol=1e-5)
+
+if __name__ == "__main__":
+    unittest.main()
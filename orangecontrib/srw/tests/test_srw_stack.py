@@ -0,0 +1,79 @@
+import os, shutil, tempfile, unittest
+
+import numpy
+
+from orangecontrib.srw.util import srw_precision, srw_stack, srw_symmetry, srw_trajectory
+from orangecontrib.srw.tests.fixtures import get_bending_magnet_source, get_bending_magnet_wavefront_parameters
+
+class SRWSliceStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stack_is_identical_to_the_array(self):
+        stack = numpy.random.default_rng(0).random((5, 8, 6)).astype(numpy.float32)
+        slice_store = srw_stack.SRWSliceStore(stack.shape, self.directory)
+
+        try:
+            for index in range(stack.shape[0]): slice_store.set_slice(index, stack[index])
+
+            slice_store.flush()
+
+            self.assertEqual(os.path.dirname(slice_store.get_file_name()), self.directory)
+            self.assertEqual(os.path.getsize(slice_store.get_file_name()), srw_stack.get_stack_size(stack.shape))
+            self.assertEqual(slice_store.get_slice_size(), stack[0].nbytes)
+            self.assertTrue(srw_stack.is_slice_store_data(slice_store.get_data()))
+            self.assertFalse(srw_stack.is_slice_store_data(stack))
+
+            numpy.testing.assert_array_equal(slice_store.get_data(), stack)
+            numpy.testing.assert_array_equal(slice_store.get_slice(2), stack[2])
+            numpy.testing.assert_allclose(slice_store.get_sum_over_energy(), numpy.sum(stack.astype(numpy.float64), axis=0))
+
+            # as written to the file
+            numpy.testing.assert_array_equal(numpy.fromfile(slice_store.get_file_name(), dtype=numpy.float32).reshape(stack.shape), stack)
+        finally:
+            slice_store.close()
+
+    def test_closed_store_removes_its_file(self):
+        slice_store = srw_stack.SRWSliceStore((2, 4, 4), self.directory)
+        slice_store.set_slice(0, numpy.ones((4, 4)))
+
+        view = slice_store.get_slice(0) # e.g. in a plot
+
+        slice_store.close()
+        slice_store.close()
+
+        self.assertEqual(os.listdir(self.directory), [])
+        numpy.testing.assert_array_equal(view, numpy.ones((4, 4)))
+
+    def test_reduced_intensity_is_unfolded_slice_by_slice(self):
+        wavefront_parameters = get_bending_magnet_wavefront_parameters(points=9, photon_energy_points=3)
+        symmetric_mesh = srw_symmetry.SRWSymmetricMesh(wavefront_parameters, False, True)
+
+        srw_wavefront = srw_trajectory.get_SRW_Wavefront(get_bending_magnet_source(), symmetric_mesh.get_reduced_wavefront_parameters())
+
+        e, _, _, reduced_intensity = srw_precision.get_intensity(srw_wavefront, precision=srw_precision.SRWPrecision.SINGLE)
+
+        h, v = symmetric_mesh.get_coordinates()
+        slice_store = srw_stack.SRWSliceStore((len(e), len(h), len(v)), self.directory)
+
+        try:
+            energies = []
+
+            for index, (photon_energy, intensity_slice) in enumerate(srw_precision.get_intensity_slices(srw_wavefront, precision=srw_precision.SRWPrecision.SINGLE)):
+                self.assertEqual(intensity_slice.dtype, numpy.float32)
+                numpy.testing.assert_array_equal(intensity_slice, reduced_intensity[index])
+
+                slice_store.set_slice(index, symmetric_mesh.unfold(intensity_slice))
+                energies.append(photon_energy)
+
+            numpy.testing.assert_array_equal(energies, e)
+            numpy.testing.assert_array_equal(slice_store.get_data(), symmetric_mesh.unfold(reduced_intensity))
+        finally:
+            slice_store.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+import numpy
+
+from wofrysrw.storage_ring.srw_electron_beam import SRWElectronBeam
+from wofrysrw.storage_ring.light_sources.srw_bending_magnet_light_source import SRWBendingMagnetLightSource
+from wofrysrw.storage_ring.magnetic_structures.srw_bending_magnet import SRWBendingMagnet
+from wofrysrw.propagator.wavefront2D.srw_wavefront import WavefrontParameters
+
+from orangecontrib.srw.util import srw_symmetry, srw_trajectory
+from orangecontrib.srw.tests.fixtures import get_bending_magnet_source, get_bending_magnet_wavefront_parameters as get_wavefront_parameters
+
+def get_symmetric_distribution(h, v):
+    h_mesh, v_mesh = numpy.meshgrid(h, v, indexing="ij")
+
+    return numpy.exp(-(h_mesh/1e-3)**2)*(1 + (v_mesh/1e-3)**2)
+
+class SRWSymmetricMeshTest(unittest.TestCase):
+
+    def test_unfolded_distribution_is_identical_to_the_whole_mesh(self):
+        for h_points, v_points in [(11, 7), (10, 8)]:
+            for mirror_h, mirror_v in [(True, False), (False, True), (True, True)]:
+                for h_margin, v_margin in [(0.0, 0.0), (0.5e-3, 1e-3)]:
+                    symmetric_mesh = srw_symmetry.SRWSymmetricMesh(WavefrontParameters(h_slit_gap=4e-3, v_slit_gap=2e-3, h_slit_points=h_points, v_slit_points=v_points),
+                                                                   mirror_h, mirror_v, h_margin, v_margin)
+
+                    h, v = symmetric_mesh.get_coordinates()
+                    reduced_h, reduced_v = symmetric_mesh.get_reduced_coordinates()
+
+                    # the reduced mesh is a part of the whole mesh, starting before the axis by the margin
+                    numpy.testing.assert_allclose(reduced_h, h[len(h) - len(reduced_h):], atol=1e-12)
+                    numpy.testing.assert_allclose(reduced_v, v[len(v) - len(reduced_v):], atol=1e-12)
+
+                    if mirror_h: # the first node >= 0 is within half a step of the axis
+                        self.assertLessEqual(reduced_h[0], -h_margin + 0.5*(h[1] - h[0]) + 1e-12)
+                        self.assertGreater(reduced_h[0], -h_margin - (h[1] - h[0]))
+                    else:
+                        self.assertEqual(len(reduced_h), len(h))
+
+                    unfolded = symmetric_mesh.unfold(get_symmetric_distribution(reduced_h, reduced_v))
+
+                    numpy.testing.assert_allclose(unfolded, get_symmetric_distribution(h, v), rtol=1e-12)
+
+                    # slice by slice, in a stack
+                    stack = numpy.array([get_symmetric_distribution(reduced_h, reduced_v)]*3)
+
+                    numpy.testing.assert_array_equal(symmetric_mesh.unfold(stack, output=numpy.zeros((3, len(h), len(v)))), numpy.array([unfolded]*3))
+
+    def test_irreducible_region(self):
+        wavefront_parameters = WavefrontParameters(h_slit_gap=4e-3, v_slit_gap=2e-3, h_slit_points=11, v_slit_points=7, v_position=1e-3)
+
+        self.assertEqual(srw_symmetry.SRWSymmetricMesh(wavefront_parameters, True, False).get_irreducible_region(), (2e-3, 1e-3, 2e-3, 1e-3))
+
+        symmetric_mesh = srw_symmetry.SRWSymmetricMesh(WavefrontParameters(h_slit_gap=4e-3, v_slit_gap=2e-3, h_slit_points=11, v_slit_points=7), True, True)
+
+        self.assertEqual(symmetric_mesh.get_irreducible_region(), (2e-3, 1e-3, 1e-3, 0.5e-3))
+        self.assertEqual(symmetric_mesh.get_multiplicity(), 4)
+        self.assertAlmostEqual(symmetric_mesh.get_reduction(), (11*7)/(6*4))
+
+    def test_relative_deviation(self):
+        full = numpy.array([[1.0, 2.0], [3.0, 4.0]])
+
+        self.assertEqual(srw_symmetry.get_relative_deviation(full, full), 0.0)
+        self.assertAlmostEqual(srw_symmetry.get_relative_deviation(full + numpy.array([[0.0, 0.0], [0.0, 0.4]]), full), 0.1)
+        self.assertEqual(srw_symmetry.get_relative_deviation(numpy.zeros((2, 2)), numpy.zeros((2, 2))), 0.0)
+
+class SRWSourceSymmetryTest(unittest.TestCase):
+
+    def test_bending_magnet_mirrors(self):
+        srw_source = get_bending_magnet_source()
+        wavefront_parameters = get_wavefront_parameters(points=7)
+
+        # the orbit plane only
+        self.assertEqual(srw_symmetry.get_mirrors(srw_symmetry.SRWSymmetry.AUTOMATIC, srw_source, wavefront_parameters), (False, True))
+        self.assertEqual(srw_symmetry.get_mirrors(srw_symmetry.SRWSymmetry.NONE, srw_source, wavefront_parameters), (False, False))
+
+        off_axis_source = SRWBendingMagnetLightSource(electron_beam=SRWElectronBeam(energy_in_GeV=2.0, current=0.5, moment_y=1e-5),
+                                                      bending_magnet_magnetic_structure=SRWBendingMagnet(0.0, 1.0, 0.5))
+
+        self.assertEqual(srw_symmetry.detect_mirrors(off_axis_source), (False, False))
+
+        with self.assertRaises(ValueError):
+            srw_symmetry.get_mirrors(srw_symmetry.SRWSymmetry.VERTICAL, srw_source, get_wavefront_parameters(points=2))
+
+    def test_unfolded_electric_field_is_identical_to_the_whole_mesh(self):
+        srw_source = get_bending_magnet_source()
+        wavefront_parameters = get_wavefront_parameters(points=9, photon_energy_points=2)
+
+        symmetric_mesh = srw_symmetry.SRWSymmetricMesh(wavefront_parameters, *srw_symmetry.get_mirrors(srw_symmetry.SRWSymmetry.AUTOMATIC, srw_source,
+                                                                                                        wavefront_parameters, electric_field=True))
+
+        full_wavefront = srw_trajectory.get_SRW_Wavefront(srw_source, wavefront_parameters)
+        unfolded_wavefront = symmetric_mesh.unfold_wavefront(srw_trajectory.get_SRW_Wavefront(srw_source, symmetric_mesh.get_reduced_wavefront_parameters()))
+
+        self.assertEqual((unfolded_wavefront.mesh.nx, unfolded_wavefront.mesh.ny), (full_wavefront.mesh.nx, full_wavefront.mesh.ny))
+        self.assertLess(srw_symmetry.get_field_deviation(unfolded_wavefront, full_wavefront), srw_symmetry.VERIFICATION_TOLERANCE)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+from unittest import mock
+
+import numpy
+
+from wofrysrw.storage_ring.srw_light_source import PowerDensityPrecisionParameters
+
+from orangecontrib.srw.util import srw_trajectory
+from orangecontrib.srw.tests.fixtures import get_bending_magnet_source, get_bending_magnet_wavefront_parameters as get_wavefront_parameters
+
+class SRWTrajectoryTest(unittest.TestCase):
+    '''
+    The calculations on a cached trajectory against SRWLightSource, which calculates the trajectory again
+    '''
+
+    def setUp(self):
+        srw_trajectory.SRWTrajectoryCache.Instance().clear()
+
+    def tearDown(self):
+        srw_trajectory.SRWTrajectoryCache.Instance().clear()
+
+    def test_module_has_no_gui_settings(self):
+        # the callers pass the settings, the workers have none
+        self.assertFalse(hasattr(srw_trajectory, "QSettings"))
+
+    def test_wavefront_is_identical_to_the_light_source(self):
+        wavefront_parameters = get_wavefront_parameters(points=21, photon_energy_points=11)
+
+        srw_source = get_bending_magnet_source()
+        trajectory = srw_trajectory.get_trajectory(srw_source, srw_trajectory.SRWTrajectoryParameters.from_wavefront_parameters(wavefront_parameters))
+
+        self.assertIsNotNone(trajectory)
+
+        wavefront = srw_trajectory.get_SRW_Wavefront(srw_source, wavefront_parameters, trajectory)
+
+        reference_source = get_bending_magnet_source()
+        reference_wavefront = reference_source.get_SRW_Wavefront(source_wavefront_parameters=wavefront_parameters)
+
+        # the range of the trajectory is recovered by integration: the same, to the rounding of the single precision field
+        for name in ["arEx", "arEy"]:
+            reference_field = numpy.array(getattr(reference_wavefront, name))
+
+            numpy.testing.assert_allclose(numpy.array(getattr(wavefront, name)), reference_field, rtol=0, atol=1e-6*numpy.max(numpy.abs(reference_field)))
+
+        for attribute in ["eStart", "eFin", "ne", "xStart", "xFin", "nx", "yStart", "yFin", "ny", "zStart"]:
+            self.assertEqual(getattr(wavefront.mesh, attribute), getattr(reference_wavefront.mesh, attribute))
+
+        self.assertEqual(wavefront.unitElFld, reference_wavefront.unitElFld)
+
+        # recorded for the python code of the source, as SRWLightSource does
+        self.assertIs(srw_source.get_source_wavefront_parameters(), reference_source.get_source_wavefront_parameters())
+        self.assertEqual(srw_source.to_python_code(), reference_source.to_python_code())
+
+    def test_source_wavefront_parameters_of_another_wofrysrw_version(self):
+        srw_source = get_bending_magnet_source()
+        delattr(srw_source, srw_trajectory.SOURCE_WAVEFRONT_PARAMETERS_ATTRIBUTE)
+
+        with self.assertRaises(AttributeError):
+            srw_trajectory.set_source_wavefront_parameters(srw_source, get_wavefront_parameters())
+
+        with mock.patch.object(type(srw_source), "get_source_wavefront_parameters", return_value=None):
+            with self.assertRaises(AttributeError):
+                srw_trajectory.set_source_wavefront_parameters(get_bending_magnet_source(), get_wavefront_parameters())
+
+    def test_power_density_is_identical_to_the_light_source(self):
+        wavefront_parameters = get_wavefront_parameters(gap=4e-3, points=9)
+        power_density_precision_parameters = PowerDensityPrecisionParameters()
+
+        srw_source = get_bending_magnet_source()
+        trajectory = srw_trajectory.get_trajectory(srw_source,
+                                                   srw_trajectory.SRWTrajectoryParameters.from_power_density_precision_parameters(power_density_precision_parameters))
+
+        h, v, power_density = srw_trajectory.get_power_density(srw_source, wavefront_parameters, power_density_precision_parameters, trajectory)
+        reference_h, reference_v, reference_power_density = srw_source.get_power_density(source_wavefront_parameters=wavefront_parameters,
+                                                                                         power_density_precision_parameters=power_density_precision_parameters)
+
+        numpy.testing.assert_array_equal(h, reference_h)
+        numpy.testing.assert_array_equal(v, reference_v)
+        numpy.testing.assert_array_equal(power_density, reference_power_density)
+
+    def test_linear_corrections_without_offsets(self):
+        wavefront_parameters = get_wavefront_parameters(points=5, photon_energy_points=2)
+        trajectory_parameters = srw_trajectory.SRWTrajectoryParameters.from_wavefront_parameters(wavefront_parameters)
+
+        srw_source = get_bending_magnet_source()
+        trajectory = srw_trajectory.calculate_trajectory(srw_source, trajectory_parameters)
+        particle = trajectory.partInitCond
+
+        corrected_trajectory = srw_trajectory.get_corrected_trajectory(trajectory, particle.x, particle.xp, particle.y, particle.yp, particle.gamma)
+
+        for name in srw_trajectory.TRAJECTORY_ARRAYS:
+            numpy.testing.assert_allclose(numpy.array(getattr(corrected_trajectory, name)), numpy.array(getattr(trajectory, name)), rtol=1e-12, atol=1e-18)
+
+        # only if asked
+        self.assertIsNone(srw_trajectory.get_cached_trajectory(srw_source, trajectory_parameters))
+
+        srw_trajectory.SRWTrajectoryCache.Instance().put(srw_trajectory.SRWTrajectoryCache.Instance().get_key(srw_source, trajectory_parameters), trajectory)
+
+        offset_source = get_bending_magnet_source()
+        offset_source.get_electron_beam()._moment_x = 1e-6
+
+        self.assertIsNone(srw_trajectory.get_cached_trajectory(offset_source, trajectory_parameters))
+        self.assertIsNotNone(srw_trajectory.get_cached_trajectory(offset_source, trajectory_parameters, linear_corrections=True))
+
+    def test_field_fingerprint_is_calculated_once_for_each_source(self):
+        trajectory_parameters = srw_trajectory.SRWTrajectoryParameters()
+        trajectory_cache = srw_trajectory.SRWTrajectoryCache()
+
+        srw_source = get_bending_magnet_source()
+
+        with mock.patch.object(srw_trajectory, "get_fingerprint", wraps=srw_trajectory.get_fingerprint) as get_fingerprint:
+            key = trajectory_cache.get_key(srw_source, trajectory_parameters)
+
+            self.assertEqual(trajectory_cache.get_key(srw_source, trajectory_parameters), key)
+            self.assertEqual(trajectory_cache.get_key(srw_source, srw_trajectory.SRWTrajectoryParameters(number_of_points=1000))[1], key[1])
+
+            # the field, then the key of each lookup
+            self.assertEqual(get_fingerprint.call_count, 4)
+
+        # same field, another source
+        self.assertEqual(trajectory_cache.get_key(get_bending_magnet_source(), trajectory_parameters), key)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import numpy
+
+from orangecontrib.srw.util import srw_sensitivity
+
+#########################################################################################
+#
+# AUTO-TUNING OF THE SAMPLING: a quick coarse calculation is repeated doubling the
+# sampling parameter, until the beam statistics at the output of two consecutive steps
+# agree within the tolerance. The cheapest value meeting the tolerance is the coarser
+# one of the converged pair.
+#
+#########################################################################################
+
+CONVERGENCE_STATISTICS = [
+    ["fwhm_h",  "FWHM H"],
+    ["fwhm_v",  "FWHM V"],
+    ["sigma_h", "Sigma H"],
+    ["sigma_v", "Sigma V"],
+    ["flux",    "Flux"],
+]
+
+class AutoTuneResult(object):
+    def __init__(self, parameter_name, tolerance):
+        self.parameter_name = parameter_name
+        self.tolerance = tolerance
+        self.values = []
+        self.statistics = []
+        self.relative_changes = []
+        self.tuned_value = None
+
+    def is_converged(self):
+        return not self.tuned_value is None
+
+    def get_report_text(self):
+        text = "Auto-tune of " + self.parameter_name + ", tolerance = " + "{:.2e}".format(self.tolerance) + "\n\n"
+        text += self.parameter_name.ljust(30) + "".join([statistic_display_name.rjust(14) for _, statistic_display_name in CONVERGENCE_STATISTICS]) + "\n"
+
+        for index, (value, statistics) in enumerate(zip(self.values, self.statistics)):
+            text += "{:.4g}".format(value).ljust(30) + "".join([_format(statistics[statistic]).rjust(14) for statistic, _ in CONVERGENCE_STATISTICS]) + "\n"
+
+            if index > 0:
+                text += "  relative change".ljust(30) + "".join([("{:.2e}".format(self.relative_changes[index-1][statistic])).rjust(14) for statistic, _ in CONVERGENCE_STATISTICS]) + "\n"
+
+        if self.is_converged():
+            text += "\nConverged: cheapest " + self.parameter_name + " meeting the tolerance = " + "{:.4g}".format(self.tuned_value) + "\n"
+        else:
+            text += "\nNot converged within " + str(len(self.values)) + " steps\n"
+
+        return text
+
+def get_convergence_statistics(wavefront, multi_electron=False):
+    statistics = srw_sensitivity.get_beam_statistics(wavefront, multi_electron)
+
+    return {statistic: statistics[statistic] for statistic, _ in CONVERGENCE_STATISTICS}
+
+def get_relative_changes(statistics, reference_statistics):
+    relative_changes = {}
+
+    for statistic, _ in CONVERGENCE_STATISTICS:
+        value           = statistics[statistic]
+        reference_value = reference_statistics[statistic]
+
+        if value is None and reference_value is None:   relative_changes[statistic] = 0.0
+        elif value is None or reference_value is None: relative_changes[statistic] = numpy.inf
+        elif reference_value == 0.0:                    relative_changes[statistic] = 0.0 if value == 0.0 else numpy.inf
+        else:                                           relative_changes[statistic] = abs(value - reference_value)/abs(reference_value)
+
+    return relative_changes
+
+def autotune(calculate, parameter_name, initial_value, tolerance, max_steps=5, multi_electron=False, status_callback=None):
+    '''
+    calculate(value) returns the output wavefront obtained with the sampling parameter = value: the value is doubled
+    at each step, at most max_steps times
+    '''
+    return search(lambda value: get_convergence_statistics(calculate(value), multi_electron), parameter_name, initial_value, tolerance, max_steps, status_callback)
+
+def search(calculate_statistics, parameter_name, initial_value, tolerance, max_steps=5, status_callback=None):
+    '''
+    As autotune, with calculate_statistics(value) returning the convergence statistics
+    '''
+    result = AutoTuneResult(parameter_name, tolerance)
+
+    value = initial_value
+
+    for step in range(max_steps + 1):
+        if not status_callback is None: status_callback("Auto-tune: step " + str(step + 1) + ", " + parameter_name + " = " + "{:.4g}".format(value))
+
+        statistics = calculate_statistics(value)
+
+        if len(result.statistics) > 0:
+            relative_changes = get_relative_changes(result.statistics[-1], statistics)
+
+            result.relative_changes.append(relative_changes)
+
+            if max(relative_changes.values()) <= tolerance: result.tuned_value = result.values[-1]
+
+        result.values.append(value)
+        result.statistics.append(statistics)
+
+        if result.is_converged(): break
+
+        value *= 2
+
+    return result
+
+def _format(value):
+    return "n.a." if value is None else "{:.4e}".format(value)
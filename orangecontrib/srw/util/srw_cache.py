@@ -0,0 +1,490 @@
+import os, json, tempfile, hashlib, threading, array
+from collections import OrderedDict
+
+import numpy
+
+from wofrysrw.propagator.wavefront2D.srw_wavefront import SRWWavefront
+
+#########################################################################################
+#
+# FINGERPRINTS
+#
+#########################################################################################
+
+def get_fingerprint(*objects):
+    hasher = hashlib.blake2b(digest_size=20)
+
+    for obj in objects: _update_hash(hasher, obj, set())
+
+    return hasher.hexdigest()
+
+def get_wavefront_fingerprint(wavefront):
+    if wavefront is None: return None
+
+    hasher = hashlib.blake2b(digest_size=20)
+
+    mesh = wavefront.mesh
+    _update_hash(hasher, [mesh.eStart, mesh.eFin, mesh.ne,
+                          mesh.xStart, mesh.xFin, mesh.nx,
+                          mesh.yStart, mesh.yFin, mesh.ny,
+                          mesh.zStart], set())
+    _update_hash(hasher, [getattr(wavefront, attribute, None) for attribute in ["Rx", "Ry", "dRx", "dRy", "xc", "yc", "avgPhotEn",
+                                                                                "presCA", "presFT", "numTypeElFld", "unitElFld"]], set())
+    _update_hash(hasher, wavefront.arEx, set())
+    _update_hash(hasher, wavefront.arEy, set())
+
+    return hasher.hexdigest()
+
+# the fingerprint of a file is read again only when its modification time or size change
+_file_fingerprints = {}
+
+# fingerprint of a calculation from a light source: the name of the source doesn't change the result
+def get_source_fingerprint(srw_source, *parameters, input_files=[]):
+    source = {attribute: value for attribute, value in vars(srw_source).items() if attribute != "_name"}
+
+    return get_fingerprint(type(srw_source).__module__ + "." + type(srw_source).__qualname__,
+                           source,
+                           list(parameters),
+                           [get_file_fingerprint(input_file) for input_file in input_files])
+
+def get_file_fingerprint(file_name):
+    file_stat = os.stat(file_name)
+    file_signature = (os.path.abspath(file_name), file_stat.st_mtime_ns, file_stat.st_size)
+
+    if not file_signature in _file_fingerprints:
+        hasher = hashlib.blake2b(digest_size=20)
+
+        with open(file_name, "rb") as file:
+            for chunk in iter(lambda: file.read(1024**2), b""): hasher.update(chunk)
+
+        _file_fingerprints[file_signature] = hasher.hexdigest()
+
+    return _file_fingerprints[file_signature]
+
+# some optical elements keep their data files by name (e.g. the height profile of mirrors and gratings), read only
+# when propagating: the content of the files referenced by the attributes *_file and *_files is part of the fingerprint
+# of the object, so a file edited in place is not mistaken for the old one
+def _get_data_file_fingerprints(attributes):
+    data_file_fingerprints = []
+
+    for name in sorted(attributes.keys(), key=str):
+        if isinstance(name, str) and (name.endswith("_file") or name.endswith("_files")):
+            file_names = attributes[name] if isinstance(attributes[name], (list, tuple)) else [attributes[name]]
+
+            for file_name in file_names:
+                if isinstance(file_name, str) and os.path.isfile(file_name): data_file_fingerprints.append(get_file_fingerprint(file_name))
+
+    return data_file_fingerprints
+
+def get_wavefront_size(wavefront):
+    if wavefront is None: return 0
+
+    return _get_buffer_size(wavefront.arEx) + _get_buffer_size(wavefront.arEy)
+
+def _get_buffer_size(buffer):
+    if buffer is None: return 0
+    elif isinstance(buffer, array.array): return buffer.buffer_info()[1]*buffer.itemsize
+    elif isinstance(buffer, numpy.ndarray): return buffer.nbytes
+    else: return numpy.asarray(buffer).nbytes
+
+def _update_hash(hasher, obj, visited):
+    if obj is None:
+        hasher.update(b"N")
+    elif isinstance(obj, (bool, int, float, complex, numpy.number, numpy.bool_)):
+        hasher.update(type(obj).__name__.encode())
+        hasher.update(repr(obj).encode())
+    elif isinstance(obj, str):
+        hasher.update(b"S")
+        hasher.update(obj.encode())
+    elif isinstance(obj, bytes):
+        hasher.update(b"B")
+        hasher.update(obj)
+    elif isinstance(obj, array.array):
+        hasher.update(b"A" + obj.typecode.encode())
+        hasher.update(memoryview(obj).cast("B"))
+    elif isinstance(obj, numpy.ndarray):
+        hasher.update(b"D" + str(obj.dtype).encode() + str(obj.shape).encode())
+        hasher.update(numpy.ascontiguousarray(obj).data if obj.dtype != object else repr(obj.tolist()).encode())
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(b"L" + str(len(obj)).encode())
+        for item in obj: _update_hash(hasher, item, visited)
+    elif isinstance(obj, dict):
+        hasher.update(b"M" + str(len(obj)).encode())
+        for key in sorted(obj.keys(), key=str):
+            _update_hash(hasher, str(key), visited)
+            _update_hash(hasher, obj[key], visited)
+    elif callable(obj) and not hasattr(obj, "__dict__"):
+        hasher.update(b"F" + getattr(obj, "__qualname__", repr(obj)).encode())
+    else:
+        if id(obj) in visited:
+            hasher.update(b"R")
+            return
+
+        visited.add(id(obj))
+
+        hasher.update(b"O" + type(obj).__module__.encode() + b"." + type(obj).__qualname__.encode())
+
+        if hasattr(obj, "__dict__"):
+            _update_hash(hasher, vars(obj), visited)
+
+            data_file_fingerprints = _get_data_file_fingerprints(vars(obj))
+            if len(data_file_fingerprints) > 0: _update_hash(hasher, data_file_fingerprints, visited)
+        elif hasattr(obj, "__slots__"):
+            _update_hash(hasher, {slot: getattr(obj, slot, None) for slot in obj.__slots__}, visited)
+        else:
+            hasher.update(repr(obj).encode())
+
+#########################################################################################
+#
+# IN-MEMORY WAVEFRONT CACHES
+#
+#########################################################################################
+
+class SRWWavefrontCache(object):
+    '''
+    The wavefronts are stored and returned as private copies: the consumers of a cached wavefront (e.g. a propagation
+    resumed from it, or a downstream widget) can modify it without changing the cached one.
+    '''
+    DEFAULT_MEMORY_BUDGET = 2*1024**3 # bytes
+
+    @classmethod
+    def Instance(cls):
+        if not "_instance" in cls.__dict__: cls._instance = cls()
+
+        return cls._instance
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.__memory_budget = memory_budget
+        self.__memory_used = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_memory_budget(self):
+        return self.__memory_budget
+
+    def set_memory_budget(self, memory_budget):
+        with self.__lock:
+            self.__memory_budget = memory_budget
+            self.__evict()
+
+    def get_memory_used(self):
+        return self.__memory_used
+
+    def get(self, key):
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+
+                wavefront = self.__entries[key][0]
+            else:
+                self.misses += 1
+
+                return None
+
+        return wavefront.duplicate()
+
+    def put(self, key, wavefront):
+        size = get_wavefront_size(wavefront)
+
+        if size <= self.__memory_budget: wavefront = wavefront.duplicate()
+
+        with self.__lock:
+            if key in self.__entries: self.__memory_used -= self.__entries.pop(key)[1]
+
+            if size <= self.__memory_budget:
+                self.__entries[key] = (wavefront, size)
+                self.__memory_used += size
+
+                self.__evict()
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__memory_used = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def __evict(self):
+        while self.__memory_used > self.__memory_budget and len(self.__entries) > 0:
+            _, (_, size) = self.__entries.popitem(last=False)
+            self.__memory_used -= size
+
+class SRWPropagationCache(SRWWavefrontCache):
+
+    def get_key(self, input_wavefront, *parameters):
+        return get_wavefront_fingerprint(input_wavefront) + "-" + get_fingerprint(*parameters)
+
+class SRWCheckpointStore(SRWWavefrontCache):
+    '''
+    Wavefronts after each stage of a whole beamline propagation: the key of a checkpoint is chained on the
+    keys of all the previous stages, so it identifies the whole prefix of the beamline up to that element.
+    '''
+
+    def get_prefix_keys(self, source_wavefront, stages, *parameters):
+        keys = []
+        key = get_wavefront_fingerprint(source_wavefront) + "-" + get_fingerprint(*parameters)
+
+        for stage in stages:
+            key = get_fingerprint(key, stage)
+            keys.append(key)
+
+        return keys
+
+    def get_last_checkpoint(self, keys):
+        for index in reversed(range(len(keys))):
+            wavefront = self.get(keys[index])
+
+            if not wavefront is None: return index, wavefront
+
+        return -1, None
+
+#########################################################################################
+#
+# IN-MEMORY RESULT CACHE: small calculated results (e.g. spectra), the key is a hash of
+# everything the calculation depends on. The least recently used results are evicted
+# when the maximum number of entries is exceeded.
+#
+#########################################################################################
+
+class SRWResultCache(object):
+    DEFAULT_MAXIMUM_ENTRIES = 32
+
+    @classmethod
+    def Instance(cls):
+        if not "_instance" in cls.__dict__: cls._instance = cls()
+
+        return cls._instance
+
+    def __init__(self, maximum_entries=DEFAULT_MAXIMUM_ENTRIES):
+        self.__maximum_entries = maximum_entries
+        self.__entries = OrderedDict()
+        self.__lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, srw_source, *parameters, input_files=[]):
+        return get_source_fingerprint(srw_source, *parameters, input_files=input_files)
+
+    def get(self, key):
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+
+                return self.__entries[key]
+            else:
+                self.misses += 1
+
+                return None
+
+    def put(self, key, result):
+        with self.__lock:
+            self.__entries[key] = result
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.__maximum_entries: self.__entries.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+#########################################################################################
+#
+# ON-DISK SOURCE WAVEFRONT CACHE: content-addressed .npz files, the key is a hash of the
+# light source (electron beam and magnetic structure), of the wavefront parameters and
+# of the content of any input file. The least recently used files are evicted when the
+# size budget is exceeded; the access time is recorded as modification time of the file,
+# so the cache is shared by concurrent processes and sessions. The files contain plain
+# arrays and a JSON header, nothing is unpickled. Disabled by default (SRW Tools menu).
+#
+#########################################################################################
+
+class SRWSourceWavefrontDiskCache(object):
+    DEFAULT_DIRECTORY   = os.path.join(os.path.expanduser("~"), ".cache", "oasys-srw", "source-wavefronts")
+    DEFAULT_SIZE_BUDGET = 4*1024**3 # bytes
+    FORMAT_VERSION      = 2
+    FILE_EXTENSION      = ".npz"
+
+    @classmethod
+    def Instance(cls):
+        if not "_instance" in cls.__dict__: cls._instance = cls()
+
+        return cls._instance
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, size_budget=DEFAULT_SIZE_BUDGET):
+        self.__directory = directory
+        self.__size_budget = size_budget
+        self.__lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_directory(self):
+        return self.__directory
+
+    def set_directory(self, directory):
+        self.__directory = directory
+
+    def get_size_budget(self):
+        return self.__size_budget
+
+    def set_size_budget(self, size_budget):
+        with self.__lock:
+            self.__size_budget = size_budget
+            self.__evict()
+
+    def get_size_used(self):
+        return sum([size for _, size, _ in self.__get_files()])
+
+    def get_key(self, srw_source, source_wavefront_parameters, input_files=[]):
+        return get_source_fingerprint(srw_source, self.FORMAT_VERSION, source_wavefront_parameters, input_files=input_files)
+
+    def get(self, key):
+        file_name = self.__get_file_name(key)
+
+        with self.__lock:
+            try:
+                with numpy.load(file_name, allow_pickle=False) as data:
+                    wavefront = SRWWavefront()
+                    _set_attributes(wavefront, json.loads(str(data["header"])))
+                    wavefront.arEx = array.array(str(data["typecode_x"]), data["arEx"].tobytes())
+                    wavefront.arEy = array.array(str(data["typecode_y"]), data["arEy"].tobytes())
+
+                os.utime(file_name)
+
+                self.hits += 1
+
+                return wavefront
+            except Exception: # missing, evicted or incomplete
+                self.misses += 1
+
+                return None
+
+    def put(self, key, wavefront):
+        if get_wavefront_size(wavefront) > self.__size_budget: return
+
+        # the electric field is stored as raw arrays, the rest of the wavefront (mesh, radii, moments, ...) as JSON
+        header = json.dumps(_get_attributes(wavefront, exclude=["arEx", "arEy"]))
+
+        with self.__lock:
+            os.makedirs(self.__directory, exist_ok=True)
+
+            file_descriptor, temporary_file_name = tempfile.mkstemp(suffix=".tmp", dir=self.__directory)
+
+            try:
+                with os.fdopen(file_descriptor, "wb") as file:
+                    numpy.savez(file,
+                                header=numpy.array(header),
+                                typecode_x=wavefront.arEx.typecode,
+                                typecode_y=wavefront.arEy.typecode,
+                                arEx=numpy.frombuffer(wavefront.arEx, dtype=wavefront.arEx.typecode),
+                                arEy=numpy.frombuffer(wavefront.arEy, dtype=wavefront.arEy.typecode))
+
+                os.replace(temporary_file_name, self.__get_file_name(key)) # atomic: readers never see a partial file
+            except:
+                if os.path.exists(temporary_file_name): os.remove(temporary_file_name)
+
+                raise
+
+            self.__evict()
+
+    def clear(self):
+        with self.__lock:
+            entries = 0
+
+            for file_name, _, _ in self.__get_files():
+                try:
+                    os.remove(file_name)
+                    entries += 1
+                except OSError:
+                    pass
+
+            self.hits = 0
+            self.misses = 0
+
+            return entries
+
+    def __len__(self):
+        return len(self.__get_files())
+
+    def __contains__(self, key):
+        return os.path.exists(self.__get_file_name(key))
+
+    def __get_file_name(self, key):
+        return os.path.join(self.__directory, key + self.FILE_EXTENSION)
+
+    def __get_files(self):
+        files = []
+
+        if os.path.isdir(self.__directory):
+            for entry in os.scandir(self.__directory):
+                if entry.is_file() and entry.name.endswith(self.FILE_EXTENSION):
+                    try:
+                        stat = entry.stat()
+                        files.append((entry.path, stat.st_size, stat.st_mtime))
+                    except OSError:
+                        pass
+
+        return files
+
+    def __evict(self):
+        files = sorted(self.__get_files(), key=lambda file: file[2])
+        size_used = sum([size for _, size, _ in files])
+
+        for file_name, size, _ in files:
+            if size_used <= self.__size_budget: break
+
+            try:
+                os.remove(file_name)
+                size_used -= size
+            except OSError:
+                pass
+
+# plain values, arrays and the objects created by the SRWWavefront constructor (mesh, particle beam)
+def _get_attributes(obj, exclude=[]):
+    return {attribute: _to_json(value) for attribute, value in vars(obj).items() if not attribute in exclude}
+
+def _to_json(value):
+    if value is None or isinstance(value, (bool, int, float, str)): return value
+    elif isinstance(value, numpy.generic): return value.item()
+    elif isinstance(value, bytes):       return {"bytes": value.decode("latin-1")}
+    elif isinstance(value, array.array): return {"array": value.typecode, "values": value.tolist()}
+    elif isinstance(value, (list, tuple)): return [_to_json(item) for item in value]
+    elif hasattr(value, "__dict__"):     return {"attributes": _get_attributes(value)}
+    else: raise ValueError("Wavefront attribute of type " + type(value).__name__ + " can't be stored")
+
+def _set_attributes(obj, attributes):
+    for attribute, value in attributes.items():
+        if isinstance(value, dict) and "attributes" in value:
+            if not hasattr(getattr(obj, attribute, None), "__dict__"): raise ValueError("Unexpected wavefront attribute: " + attribute)
+
+            _set_attributes(getattr(obj, attribute), value["attributes"])
+        else:
+            setattr(obj, attribute, _from_json(value))
+
+def _from_json(value):
+    if isinstance(value, list): return [_from_json(item) for item in value]
+    elif isinstance(value, dict):
+        if "array" in value:   return array.array(value["array"], value["values"])
+        elif "bytes" in value: return value["bytes"].encode("latin-1")
+        else: raise ValueError("Unexpected wavefront attribute")
+    else: return value
@@ -0,0 +1,437 @@
+import copy, array
+import numpy, h5py
+import scipy.constants as codata
+
+from wofrysrw.propagator.wavefront2D.srw_wavefront import SRWWavefront
+
+from orangecontrib.srw.util import srw_engine
+
+m2ev = codata.c * codata.h / codata.e
+
+#########################################################################################
+#
+# COHERENT MODES OF A GAUSSIAN SCHELL-MODEL SOURCE: the cross-spectral density of a
+# partially coherent source with rms size S and coherence length xi, in each direction
+#
+#    W(x1, x2) = exp(-(x1^2 + x2^2)/(4 S^2)) exp(-(x1 - x2)^2/(2 xi^2))
+#
+# is a sum of Hermite-Gaussian modes exp(-c x^2) H_n(sqrt(2c) x), c = sqrt(a^2 + 2ab),
+# a = 1/(4 S^2), b = 1/(2 xi^2), with occupations decreasing as q^n, q = b/(a + b + c).
+# Each mode propagates in free space as a Hermite-Gaussian beam: the modes are built
+# directly on the mesh of the single electron wavefront, and the intensity of the source
+# is the sum of the mode intensities, weighted by their occupations.
+#
+#########################################################################################
+
+def get_coherence_length(sigma, sigma_prime, wavelength):
+    '''
+    Coherence length of the Gaussian Schell-model source with rms size sigma and rms divergence sigma_prime:
+    numpy.inf if the source is fully coherent (sigma*sigma_prime <= wavelength/4pi)
+    '''
+    k = 2*numpy.pi/wavelength
+
+    inverse_square = (k*sigma_prime)**2 - 1/(4*sigma**2)
+
+    return numpy.inf if inverse_square <= 0.0 else 1/numpy.sqrt(inverse_square)
+
+def get_mode_parameters(sigma, coherence_length):
+    '''
+    c (width of the modes, exp(-c x^2)) and q (ratio of the occupations of two consecutive modes)
+    '''
+    a = 1/(4*sigma**2)
+    b = 0.0 if numpy.isinf(coherence_length) else 1/(2*coherence_length**2)
+    c = numpy.sqrt(a**2 + 2*a*b)
+
+    return c, b/(a + b + c)
+
+def get_coherent_fraction(sigma, coherence_length):
+    return 1 - get_mode_parameters(sigma, coherence_length)[1]
+
+def get_ordered_modes(gsm_parameters_h, gsm_parameters_v, number_of_modes):
+    '''
+    The number_of_modes most occupied modes (n, m, occupation), sorted by decreasing occupation: gsm_parameters
+    are (sigma, coherence_length) of each direction. The occupations of all the modes add up to 1.
+    '''
+    _, q_h = get_mode_parameters(*gsm_parameters_h)
+    _, q_v = get_mode_parameters(*gsm_parameters_v)
+
+    orders = numpy.arange(number_of_modes)
+
+    occupations_h = (1 - q_h)*q_h**orders
+    occupations_v = (1 - q_v)*q_v**orders
+
+    modes = [(n, m, occupations_h[n]*occupations_v[m]) for n in orders for m in orders]
+    modes.sort(key=lambda mode: -mode[2])
+
+    return [(int(n), int(m), float(occupation)) for n, m, occupation in modes[:number_of_modes]]
+
+def get_hermite_gaussian_functions(coordinates, sigma, coherence_length, wavelength, distance, max_order):
+    '''
+    Modes 0, ..., max_order of one direction at distance from the waist [order, coordinate], normalized to
+    1 (integral of the squared modulus), with the curvature of the wavefront. Returns the modes and the radius of
+    curvature (numpy.inf at the waist).
+    '''
+    c, _ = get_mode_parameters(sigma, coherence_length)
+
+    k = 2*numpy.pi/wavelength
+    rayleigh_length = k/(2*c)
+
+    expansion = numpy.sqrt(1 + (distance/rayleigh_length)**2)
+    scale = expansion/numpy.sqrt(2*c)
+    radius = numpy.inf if distance == 0.0 else distance*(1 + (rayleigh_length/distance)**2)
+
+    u = coordinates/scale
+
+    # normalized Hermite functions, by the stable three-terms recurrence
+    functions = numpy.zeros((max_order + 1, len(coordinates)))
+    functions[0] = numpy.pi**-0.25*numpy.exp(-0.5*u**2)
+    if max_order > 0: functions[1] = numpy.sqrt(2)*u*functions[0]
+    for n in range(1, max_order): functions[n + 1] = numpy.sqrt(2/(n + 1))*u*functions[n] - numpy.sqrt(n/(n + 1))*functions[n - 1]
+
+    phase = numpy.zeros(len(coordinates)) if numpy.isinf(radius) else k*coordinates**2/(2*radius)
+
+    return functions/numpy.sqrt(scale)*numpy.exp(1j*phase), radius
+
+def get_undulator_gsm_parameters(single_electron_wavefront, electron_beam, distance):
+    '''
+    (sigma, coherence_length) of the horizontal and vertical directions: the rms divergence of the radiation of a
+    single electron is taken from its wavefront, at distance from the center of the undulator, as a diffraction
+    limited Gaussian beam; size and divergence of the source are its convolution with the electron beam.
+    '''
+    mesh = single_electron_wavefront.mesh
+    wavelength = m2ev/(0.5*(mesh.eStart + mesh.eFin))
+
+    intensity = numpy.sum(_get_field_intensity(single_electron_wavefront), axis=2) # [y, x]
+
+    x = numpy.linspace(mesh.xStart, mesh.xFin, mesh.nx)
+    y = numpy.linspace(mesh.yStart, mesh.yFin, mesh.ny)
+
+    gsm_parameters = []
+
+    for coordinates, profile, moment_uu, moment_upup in [(x, numpy.sum(intensity, axis=0), electron_beam._moment_xx, electron_beam._moment_xpxp),
+                                                         (y, numpy.sum(intensity, axis=1), electron_beam._moment_yy, electron_beam._moment_ypyp)]:
+        sigma_radiation, sigma_prime_radiation = _get_diffraction_limited_sigmas(_get_sigma_from_fwhm(coordinates, profile), wavelength, distance)
+
+        sigma       = numpy.sqrt(max(moment_uu, 0.0) + sigma_radiation**2)
+        sigma_prime = numpy.sqrt(max(moment_upup, 0.0) + sigma_prime_radiation**2)
+
+        gsm_parameters.append((sigma, get_coherence_length(sigma, sigma_prime, wavelength)))
+
+    return gsm_parameters[0], gsm_parameters[1]
+
+def get_coherent_modes(single_electron_wavefront, gsm_parameters_h, gsm_parameters_v, distance, number_of_modes):
+    '''
+    Wavefronts of the most occupied number_of_modes modes, on the mesh of the single electron wavefront, at distance
+    from the waist, with their occupations (normalized to 1). Each mode carries the flux and the polarization of the
+    single electron wavefront, centered on its intensity centroid. Returns the wavefronts, the weights and the sum of
+    the occupations of the modes before the normalization.
+    '''
+    mesh = single_electron_wavefront.mesh
+
+    modes = get_ordered_modes(gsm_parameters_h, gsm_parameters_v, number_of_modes)
+
+    field_x = srw_engine.get_field(single_electron_wavefront.arEx, mesh.ne, mesh.nx, mesh.ny)
+    field_y = srw_engine.get_field(single_electron_wavefront.arEy, mesh.ne, mesh.nx, mesh.ny)
+
+    complex_field_x = field_x[..., 0] + 1j*field_x[..., 1] # [y, x, e]
+    complex_field_y = field_y[..., 0] + 1j*field_y[..., 1]
+
+    x = numpy.linspace(mesh.xStart, mesh.xFin, mesh.nx)
+    y = numpy.linspace(mesh.yStart, mesh.yFin, mesh.ny)
+    dx = (mesh.xFin - mesh.xStart)/(mesh.nx - 1) if mesh.nx > 1 else 1.0
+    dy = (mesh.yFin - mesh.yStart)/(mesh.ny - 1) if mesh.ny > 1 else 1.0
+
+    mode_fields_x = [numpy.zeros(field_x.shape, dtype=field_x.dtype) for _ in modes]
+    mode_fields_y = [numpy.zeros(field_y.shape, dtype=field_y.dtype) for _ in modes]
+    radii = None
+
+    for index, energy in enumerate(srw_engine.get_slice_energies(mesh).tolist()):
+        wavelength = m2ev/energy
+
+        intensity_x = numpy.abs(complex_field_x[:, :, index])**2
+        intensity_y = numpy.abs(complex_field_y[:, :, index])**2
+        intensity   = intensity_x + intensity_y
+
+        total = numpy.sum(intensity)
+        if total == 0.0: continue
+
+        amplitude = numpy.sqrt(total*dx*dy)
+        polarization_x = numpy.sqrt(numpy.sum(intensity_x)/total)
+        polarization_y = numpy.sqrt(numpy.sum(intensity_y)/total)*numpy.exp(1j*numpy.angle(numpy.sum(complex_field_y[:, :, index]*numpy.conj(complex_field_x[:, :, index]))))
+
+        x_center = numpy.sum(x*numpy.sum(intensity, axis=0))/total
+        y_center = numpy.sum(y*numpy.sum(intensity, axis=1))/total
+
+        functions_h, radius_h = get_hermite_gaussian_functions(x - x_center, *gsm_parameters_h, wavelength, distance, max([n for n, _, _ in modes]))
+        functions_v, radius_v = get_hermite_gaussian_functions(y - y_center, *gsm_parameters_v, wavelength, distance, max([m for _, m, _ in modes]))
+
+        if radii is None or index == mesh.ne//2: radii = (radius_h, radius_v)
+
+        for mode_index, (n, m, _) in enumerate(modes):
+            mode = amplitude*numpy.outer(functions_v[m], functions_h[n]) # [y, x]
+
+            for mode_fields, polarization in [(mode_fields_x, polarization_x), (mode_fields_y, polarization_y)]:
+                mode_fields[mode_index][:, :, index, 0] = (polarization*mode).real
+                mode_fields[mode_index][:, :, index, 1] = (polarization*mode).imag
+
+    if radii is None: raise ValueError("The single electron wavefront has no intensity")
+
+    wavefronts = []
+
+    for mode_field_x, mode_field_y in zip(mode_fields_x, mode_fields_y):
+        wavefront = srw_engine.create_wavefront(single_electron_wavefront, mode_field_x, mode_field_y,
+                                                mesh.eStart, mesh.eFin, mesh.xStart, mesh.xFin, mesh.yStart, mesh.yFin)
+        wavefront.arMomX = copy.deepcopy(single_electron_wavefront.arMomX)
+        wavefront.arMomY = copy.deepcopy(single_electron_wavefront.arMomY)
+        if not numpy.isinf(radii[0]): wavefront.Rx = radii[0]
+        if not numpy.isinf(radii[1]): wavefront.Ry = radii[1]
+
+        wavefronts.append(wavefront)
+
+    occupations = numpy.array([occupation for _, _, occupation in modes])
+
+    return wavefronts, (occupations/numpy.sum(occupations)).tolist(), float(numpy.sum(occupations))
+
+def get_coherent_mode_jobs(srw_beamline, propagation_mode):
+    '''
+    srw_beamline is an SRWPersistentBeamline, from the source to the last element, carrying a batch of coherent modes
+    '''
+    coherent_modes = srw_beamline.get_coherent_modes()
+
+    return [srw_engine.SRWEngineJob(srw_beamline=srw_beamline,
+                                    source_wavefront=wavefront,
+                                    propagation_mode=propagation_mode,
+                                    name="Coherent mode " + str(index))
+            for index, wavefront in enumerate(coherent_modes.get_wavefronts())]
+
+#########################################################################################
+#
+# NUMERICAL COHERENT-MODE DECOMPOSITION: the single electron fields of a Monte Carlo run
+# are the columns of A [pixel, electron] (Ex and Ey, stacked), the cross-spectral density
+# is W = A A^H / N and its modes are the left singular vectors of A. They are found with a
+# randomized truncated SVD: the range of A is sampled with random vectors (and refined by
+# power iterations), then A is projected on it. A is read in chunks of fields from the
+# archive at each pass, so the memory is bounded by the pixels times the number of modes.
+#
+#########################################################################################
+
+class SRWFieldArchive(object):
+    '''
+    HDF5 archive of single electron fields, all on the mesh of the first one: fields propagated on different meshes
+    (e.g. by automatic resizing) can't be archived, interpolating them would lose the phase that the decomposition
+    needs. Only single energy fields can be archived.
+    '''
+
+    FIELDS = "fields"
+    HEADER = ["Rx", "Ry", "dRx", "dRy", "xc", "yc", "avgPhotEn", "presCA", "presFT", "unitElFld", "numTypeElFld"]
+    MESH   = ["eStart", "eFin", "ne", "xStart", "xFin", "nx", "yStart", "yFin", "ny", "zStart"]
+
+    def __init__(self, file_name, mode="r"):
+        self.__file = h5py.File(file_name, mode)
+        self.__mesh = None
+
+        if self.FIELDS in self.__file: self.__mesh = _ArchiveMesh(self.__file[self.FIELDS].attrs)
+
+    def get_file_name(self):
+        return self.__file.filename
+
+    def get_number_of_fields(self):
+        return self.__file[self.FIELDS].shape[0] if self.FIELDS in self.__file else 0
+
+    def get_number_of_pixels(self):
+        return 2*self.__mesh.nx*self.__mesh.ny
+
+    def get_mesh(self):
+        return self.__mesh
+
+    def append(self, wavefront):
+        mesh = wavefront.mesh
+
+        if mesh.ne != 1: raise ValueError("Only single energy fields can be archived")
+
+        if self.__mesh is None:
+            dataset = self.__file.create_dataset(self.FIELDS, shape=(0, 2, mesh.ny, mesh.nx), maxshape=(None, 2, mesh.ny, mesh.nx),
+                                                 chunks=(1, 2, mesh.ny, mesh.nx), dtype=numpy.complex64)
+
+            for attribute in self.HEADER: dataset.attrs[attribute] = getattr(wavefront, attribute)
+            for attribute in self.MESH:   dataset.attrs[attribute] = getattr(mesh, attribute)
+
+            self.__mesh = _ArchiveMesh(dataset.attrs)
+        elif not srw_engine.is_same_transverse_mesh(mesh, self.__mesh):
+            raise ValueError("The fields have been propagated on different meshes (e.g. by automatic resizing) and can't be archived together: " +
+                             "disable the automatic resizing of the propagation")
+
+        field_x = srw_engine.get_field(wavefront.arEx, 1, mesh.nx, mesh.ny)[:, :, 0, :]
+        field_y = srw_engine.get_field(wavefront.arEy, 1, mesh.nx, mesh.ny)[:, :, 0, :]
+
+        dataset = self.__file[self.FIELDS]
+        dataset.resize(dataset.shape[0] + 1, axis=0)
+        dataset[-1] = numpy.array([field_x[..., 0] + 1j*field_x[..., 1], field_y[..., 0] + 1j*field_y[..., 1]], dtype=numpy.complex64)
+
+    def get_fields(self, start, stop):
+        '''
+        fields start, ..., stop - 1 as the columns of a matrix [pixel, field]
+        '''
+        fields = self.__file[self.FIELDS][start:stop]
+
+        return fields.reshape(fields.shape[0], -1).T
+
+    def get_template_wavefront(self):
+        attributes = self.__file[self.FIELDS].attrs
+        mesh = self.__mesh
+
+        empty_field = array.array("f", bytes(8*mesh.nx*mesh.ny))
+
+        wavefront = SRWWavefront(_arEx=empty_field,
+                                 _arEy=array.array("f", empty_field),
+                                 _typeE=str(attributes["numTypeElFld"]),
+                                 _eStart=mesh.eStart,
+                                 _eFin=mesh.eFin,
+                                 _ne=1,
+                                 _xStart=mesh.xStart,
+                                 _xFin=mesh.xFin,
+                                 _nx=mesh.nx,
+                                 _yStart=mesh.yStart,
+                                 _yFin=mesh.yFin,
+                                 _ny=mesh.ny,
+                                 _zStart=mesh.zStart)
+
+        for attribute in self.HEADER:
+            if attribute != "numTypeElFld": setattr(wavefront, attribute, attributes[attribute].item())
+
+        return wavefront
+
+    def flush(self):
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+class _ArchiveMesh(object):
+    def __init__(self, attributes):
+        for attribute in SRWFieldArchive.MESH: setattr(self, attribute, attributes[attribute].item())
+
+def get_numerical_coherent_modes(field_archive, number_of_modes, oversampling=10, power_iterations=2, chunk_size=100, seed=0, status_callback=None):
+    '''
+    Randomized truncated SVD of the fields of the archive: returns the modes [pixel, mode] with the occupations
+    (eigenvalues of W), by decreasing occupation, and the trace of W (total occupation of all the modes)
+    '''
+    number_of_fields = field_archive.get_number_of_fields()
+
+    if number_of_fields == 0: raise ValueError("The archive has no fields")
+
+    rank = min(number_of_modes + oversampling, number_of_fields)
+    random_generator = numpy.random.default_rng(seed)
+
+    chunks = [(start, min(start + chunk_size, number_of_fields)) for start in range(0, number_of_fields, chunk_size)]
+
+    def get_chunks(step):
+        for index, (start, stop) in enumerate(chunks):
+            if not status_callback is None: status_callback(step, index, len(chunks))
+
+            yield start, stop, field_archive.get_fields(start, stop)
+
+    # range finder: Y = A Omega
+    range_basis = numpy.zeros((field_archive.get_number_of_pixels(), rank), dtype=numpy.complex128)
+    trace = 0.0
+
+    for start, stop, fields in get_chunks("Sampling"):
+        omega = random_generator.standard_normal((stop - start, rank)) + 1j*random_generator.standard_normal((stop - start, rank))
+
+        range_basis += fields @ omega
+        trace += float(numpy.sum(numpy.abs(fields)**2))
+
+    range_basis, _ = numpy.linalg.qr(range_basis)
+
+    # power iterations: Y = A A^H Q, sharpening the decay of the singular values
+    for iteration in range(power_iterations):
+        projection = numpy.zeros((number_of_fields, rank), dtype=numpy.complex128)
+
+        for start, stop, fields in get_chunks("Power iteration " + str(iteration + 1)): projection[start:stop] = fields.conj().T @ range_basis
+
+        projection, _ = numpy.linalg.qr(projection)
+        range_basis = numpy.zeros_like(range_basis)
+
+        for start, stop, fields in get_chunks("Power iteration " + str(iteration + 1)): range_basis += fields @ projection[start:stop]
+
+        range_basis, _ = numpy.linalg.qr(range_basis)
+
+    # B = Q^H A, small: its SVD gives the modes
+    small_matrix = numpy.zeros((rank, number_of_fields), dtype=numpy.complex128)
+
+    for start, stop, fields in get_chunks("Projection"): small_matrix[:, start:stop] = range_basis.conj().T @ fields
+
+    small_left_vectors, singular_values, _ = numpy.linalg.svd(small_matrix, full_matrices=False)
+
+    number_of_modes = min(number_of_modes, rank)
+
+    modes = range_basis @ small_left_vectors[:, :number_of_modes]
+    occupations = singular_values[:number_of_modes]**2/number_of_fields
+
+    return modes, occupations, trace/number_of_fields
+
+def get_archive_coherent_modes(field_archive, modes, occupations):
+    '''
+    Wavefronts of the modes on the mesh of the archive, with their weights (adding up to 1): each mode carries the
+    intensity of its share of the occupation, so the weighted sum of the mode intensities is the intensity of W
+    '''
+    template = field_archive.get_template_wavefront()
+    mesh = field_archive.get_mesh()
+
+    total_occupation = numpy.sum(occupations)
+
+    wavefronts = []
+
+    for mode in (modes*numpy.sqrt(total_occupation)).T:
+        mode = mode.reshape(2, mesh.ny, mesh.nx, 1)
+
+        wavefronts.append(srw_engine.create_wavefront(template,
+                                                      numpy.stack([mode[0].real, mode[0].imag], axis=-1).astype(numpy.float32),
+                                                      numpy.stack([mode[1].real, mode[1].imag], axis=-1).astype(numpy.float32),
+                                                      mesh.eStart, mesh.eFin, mesh.xStart, mesh.xFin, mesh.yStart, mesh.yFin))
+
+    return wavefronts, (occupations/total_occupation).tolist()
+
+def get_occupations_text(occupations, total_occupation):
+    text = "Mode".ljust(10) + "Occupation".rjust(16) + "Fraction".rjust(16) + "Cumulative".rjust(16) + "\n"
+
+    cumulative = 0.0
+
+    for index, occupation in enumerate(occupations):
+        cumulative += occupation
+
+        text += str(index).ljust(10) + "{:.6e}".format(occupation).rjust(16) + "{:.6f}".format(occupation/total_occupation).rjust(16) + "{:.6f}".format(cumulative/total_occupation).rjust(16) + "\n"
+
+    return text
+
+def _get_field_intensity(wavefront):
+    mesh = wavefront.mesh
+
+    field_x = srw_engine.get_field(wavefront.arEx, mesh.ne, mesh.nx, mesh.ny)
+    field_y = srw_engine.get_field(wavefront.arEy, mesh.ne, mesh.nx, mesh.ny)
+
+    return numpy.sum(field_x.astype(float)**2, axis=3) + numpy.sum(field_y.astype(float)**2, axis=3) # [y, x, e]
+
+def _get_sigma_from_fwhm(coordinates, profile):
+    peak = numpy.argmax(profile)
+    half_maximum = 0.5*profile[peak]
+
+    above = numpy.where(profile >= half_maximum)[0]
+    left, right = above[0], above[-1]
+
+    # linear interpolation of the half maximum crossings, at the border of the mesh if the profile is truncated
+    x_left  = coordinates[left]  if left == 0 else numpy.interp(half_maximum, [profile[left - 1], profile[left]], [coordinates[left - 1], coordinates[left]])
+    x_right = coordinates[right] if right == len(profile) - 1 else numpy.interp(half_maximum, [profile[right + 1], profile[right]], [coordinates[right + 1], coordinates[right]])
+
+    return max(x_right - x_left, coordinates[1] - coordinates[0] if len(coordinates) > 1 else 0.0)/(2*numpy.sqrt(2*numpy.log(2)))
+
+def _get_diffraction_limited_sigmas(sigma_at_distance, wavelength, distance):
+    # sigma(z)^2 = sigma^2 + (sigma' z)^2, with sigma*sigma' = wavelength/4pi: far field root of the quadratic in sigma'^2
+    emittance = wavelength/(4*numpy.pi)
+
+    discriminant = sigma_at_distance**4 - 4*(distance*emittance)**2
+    sigma_prime_square = (sigma_at_distance**2 + numpy.sqrt(max(discriminant, 0.0)))/(2*distance**2)
+
+    sigma_prime = numpy.sqrt(sigma_prime_square)
+
+    return emittance/sigma_prime, sigma_prime
@@ -0,0 +1,695 @@
+import os, sys, copy, multiprocessing
+from contextlib import contextmanager
+from array import array
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy
+
+from wofry.propagator.propagator import PropagationManager, PropagationElements, PropagationParameters, WavefrontDimension
+from wofrysrw.propagator.wavefront2D.srw_wavefront import SRWWavefront
+from wofrysrw.propagator.propagators2D.srw_fresnel_native import FresnelSRWNative, SRW_APPLICATION
+from wofrysrw.propagator.propagators2D.srw_fresnel_wofry import FresnelSRWWofry
+from wofrysrw.propagator.propagators2D.srw_propagation_mode import SRWPropagationMode
+from wofrysrw.beamline.srw_beamline import Where
+from wofrysrw.util.srw import srwl, SRWLOptC
+
+from orangecontrib.srw.util.srw_objects import SRWPersistentBeamline, SRWCopyOnWritePropagationParameters, create_srw_beamline
+from orangecontrib.srw.util.srw_cache import SRWCheckpointStore
+from orangecontrib.srw.util.srw_profiler import SRWProfiler
+from orangecontrib.srw.util import srw_trajectory
+
+#########################################################################################
+#
+# HEADLESS BEAMLINE EXECUTION ENGINE: no Qt objects are involved, so the same code runs
+# inside the widgets and in batch scripts/worker processes on machines without X server
+#
+#########################################################################################
+
+def initialize_propagation_manager(propagation_mode=SRWPropagationMode.STEP_BY_STEP):
+    propagation_manager = PropagationManager.Instance()
+
+    if not propagation_manager.is_initialized(SRW_APPLICATION):
+        if not propagation_manager.has_propagator(FresnelSRWNative.HANDLER_NAME, WavefrontDimension.TWO): propagation_manager.add_propagator(FresnelSRWNative())
+        if not propagation_manager.has_propagator(FresnelSRWWofry.HANDLER_NAME, WavefrontDimension.TWO): propagation_manager.add_propagator(FresnelSRWWofry())
+        if not propagation_manager.has_propagator(FresnelSRWNativeProfiled.HANDLER_NAME, WavefrontDimension.TWO): propagation_manager.add_propagator(FresnelSRWNativeProfiled())
+
+        propagation_manager.set_propagation_mode(SRW_APPLICATION, propagation_mode)
+        propagation_manager.set_initialized(True)
+
+    return propagation_manager
+
+def get_propagation_mode():
+    return PropagationManager.Instance().get_propagation_mode(SRW_APPLICATION)
+
+def get_handler_name(propagation_mode):
+    return FresnelSRWNative.HANDLER_NAME if propagation_mode == SRWPropagationMode.STEP_BY_STEP or \
+                                            propagation_mode == SRWPropagationMode.WHOLE_BEAMLINE else \
+           FresnelSRWWofry.HANDLER_NAME
+
+# when profiling, the native propagations are split in the single drifts/optical elements
+def get_profiled_handler_name(handler_name):
+    return FresnelSRWNativeProfiled.HANDLER_NAME if handler_name == FresnelSRWNative.HANDLER_NAME and SRWProfiler.Instance().is_enabled() else handler_name
+
+# trajectory: the electron trajectory (see srw_trajectory), calculated by SRW if None
+def calculate_source_wavefront(srw_source, source_wavefront_parameters, trajectory=None, progress_callback=None):
+    if not progress_callback is None: progress_callback(0, "Calculating Source Wavefront")
+
+    with SRWProfiler.Instance().stage("Source Wavefront", "engine") as arguments:
+        wavefront = srw_trajectory.get_SRW_Wavefront(srw_source, source_wavefront_parameters, trajectory)
+
+        arguments.update(get_mesh_arguments(wavefront))
+
+    return wavefront
+
+def get_mesh_arguments(wavefront):
+    if not isinstance(wavefront, SRWWavefront): return {}
+
+    return {"ne" : wavefront.mesh.ne, "nx" : wavefront.mesh.nx, "ny" : wavefront.mesh.ny}
+
+WAVEFRONT_PROPAGATION_PARAMETERS = {Where.DRIFT_BEFORE : ("srw_drift_before_wavefront_propagation_parameters", "srw_drift_before_wavefront_propagation_optional_parameters"),
+                                    Where.OE           : ("srw_oe_wavefront_propagation_parameters",           "srw_oe_wavefront_propagation_optional_parameters"),
+                                    Where.DRIFT_AFTER  : ("srw_drift_after_wavefront_propagation_parameters",  "srw_drift_after_wavefront_propagation_optional_parameters")}
+
+def propagate_beamline_element(wavefront, beamline_element, wavefront_propagation_parameters, handler_name=FresnelSRWNative.HANDLER_NAME, copy_wavefront=True):
+    '''
+    Step-by-step propagation through one element: wavefront_propagation_parameters is the list of
+    (parameters, optional parameters, where) recorded for the element (see SRWPersistentBeamline). Without
+    copy_wavefront, the wavefront is private to the caller and propagated in place.
+    '''
+    propagation_elements = PropagationElements()
+    propagation_elements.add_beamline_element(beamline_element)
+
+    propagation_parameters = SRWCopyOnWritePropagationParameters(wavefront=wavefront,
+                                                                 propagation_elements = propagation_elements,
+                                                                 copy_wavefront=copy_wavefront)
+
+    for srw_wavefront_propagation_parameters, srw_wavefront_propagation_optional_parameters, where in wavefront_propagation_parameters:
+        parameters_name, optional_parameters_name = WAVEFRONT_PROPAGATION_PARAMETERS[where]
+
+        if not srw_wavefront_propagation_parameters is None: propagation_parameters.set_additional_parameters(parameters_name, srw_wavefront_propagation_parameters)
+        if not srw_wavefront_propagation_optional_parameters is None: propagation_parameters.set_additional_parameters(optional_parameters_name, srw_wavefront_propagation_optional_parameters)
+
+    with SRWProfiler.Instance().stage("Propagation: " + str(beamline_element.get_optical_element().get_name()), "engine") as arguments:
+        wavefront = PropagationManager.Instance().do_propagation(propagation_parameters=propagation_parameters,
+                                                                 handler_name=get_profiled_handler_name(handler_name))
+        arguments.update(get_mesh_arguments(wavefront))
+
+    return wavefront
+
+def propagate_whole_beamline(wavefront, srw_beamline, handler_name=FresnelSRWNative.HANDLER_NAME, copy_wavefront=True):
+    propagation_parameters = SRWCopyOnWritePropagationParameters(wavefront=wavefront,
+                                                                 propagation_elements = None,
+                                                                 copy_wavefront=copy_wavefront)
+    propagation_parameters.set_additional_parameters("working_beamline", srw_beamline)
+
+    with SRWProfiler.Instance().stage("Propagation: " + str(srw_beamline.get_beamline_elements_number()) + " elements", "engine") as arguments:
+        wavefront = PropagationManager.Instance().do_propagation(propagation_parameters=propagation_parameters,
+                                                                 handler_name=get_profiled_handler_name(handler_name))
+        arguments.update(get_mesh_arguments(wavefront))
+
+    return wavefront
+
+class FresnelSRWNativeProfiled(FresnelSRWNative):
+    '''
+    The propagation of FresnelSRWNative, with each drift/optical element of the SRW container propagated by a
+    separate native call, recorded as a stage of the profiler.
+    '''
+
+    HANDLER_NAME = "FRESNEL_SRW_NATIVE_PROFILED"
+
+    def get_handler_name(self):
+        return self.HANDLER_NAME
+
+    def do_propagation(self, parameters=PropagationParameters()):
+        wavefront = parameters.get_wavefront()
+
+        if not isinstance(wavefront, SRWWavefront): return super().do_propagation(parameters)
+
+        srw_oe_array = []
+        srw_pp_array = []
+        stage_names = []
+
+        propagation_mode = get_propagation_mode()
+
+        if propagation_mode == SRWPropagationMode.STEP_BY_STEP:
+            self.add_optical_element(parameters, 0, srw_oe_array, srw_pp_array, wavefront)
+            self.__add_stage_names(parameters.get_PropagationElements().get_propagation_element(0), len(srw_oe_array), stage_names)
+        elif propagation_mode == SRWPropagationMode.WHOLE_BEAMLINE:
+            srw_beamline = parameters.get_additional_parameter("working_beamline")
+
+            for index in range(srw_beamline.get_beamline_elements_number()):
+                self.add_optical_element_from_beamline(srw_beamline, index, srw_oe_array, srw_pp_array, wavefront)
+                self.__add_stage_names(srw_beamline.get_beamline_element_at(index), len(srw_oe_array) - len(stage_names), stage_names)
+        else:
+            raise ValueError("Propagation Mode not supported by this Propagator")
+
+        profiler = SRWProfiler.Instance()
+
+        for srw_oe, srw_pp, stage_name in zip(srw_oe_array, srw_pp_array, stage_names):
+            with profiler.stage(stage_name, "srw native") as arguments:
+                srwl.PropagElecField(wavefront, SRWLOptC([srw_oe], [srw_pp]))
+
+                arguments.update(get_mesh_arguments(wavefront))
+
+        return wavefront
+
+    def __add_stage_names(self, beamline_element, number_of_stages, stage_names):
+        coordinates = beamline_element.get_coordinates()
+        name = str(beamline_element.get_optical_element().get_name())
+
+        element_stage_names = [name + ": O.E."]*number_of_stages
+
+        if coordinates.p() != 0.0: element_stage_names[0] = name + ": Drift Before"
+        if coordinates.q() != 0.0: element_stage_names[-1] = name + ": Drift After"
+
+        stage_names.extend(element_stage_names)
+
+def propagate_from_checkpoints(source_wavefront, working_srw_beamline, checkpoint_store=None, status_callback=None, job_runner=None):
+    '''
+    Whole beamline propagation of the elements of working_srw_beamline (an SRWPersistentBeamline), resumed from
+    the wavefront after the longest prefix already in the checkpoint store. The remaining elements are propagated
+    one at a time by a single job, run by job_runner (run_job, if None).
+    '''
+    if checkpoint_store is None: checkpoint_store = SRWCheckpointStore.Instance()
+    if job_runner is None: job_runner = run_job
+
+    nodes = working_srw_beamline.get_nodes()
+
+    keys = checkpoint_store.get_prefix_keys(source_wavefront,
+                                            [node.to_stage_srw_beamline() for node in nodes],
+                                            get_handler_name(SRWPropagationMode.WHOLE_BEAMLINE))
+
+    last_index, wavefront = checkpoint_store.get_last_checkpoint(keys)
+
+    if last_index == len(keys) - 1:
+        if not status_callback is None: status_callback("Propagation retrieved from Checkpoint")
+
+        return wavefront
+
+    if wavefront is None: wavefront = source_wavefront
+
+    remaining_srw_beamline = SRWPersistentBeamline(create_srw_beamline())
+    for node in nodes[last_index + 1:]: remaining_srw_beamline = remaining_srw_beamline.append(node.get_beamline_element(), node.get_wavefront_propagation_parameters())
+
+    if not status_callback is None: status_callback("Propagation through elements " + str(last_index + 2) + " to " + str(len(nodes)))
+
+    result = job_runner(SRWEngineJob(srw_beamline=remaining_srw_beamline,
+                                     source_wavefront=wavefront,
+                                     propagation_mode=SRWPropagationMode.WHOLE_BEAMLINE,
+                                     keep_intermediate_wavefronts=True))
+
+    for key, intermediate_wavefront in zip(keys[last_index + 1:], result.intermediate_wavefronts): checkpoint_store.put(key, intermediate_wavefront)
+
+    return result.wavefront
+
+#########################################################################################
+#
+# JOBS
+#
+#########################################################################################
+
+class SRWEngineJob(object):
+    '''
+    A complete, picklable beamline variant: the light source and the ordered beamline elements with their
+    propagation parameters (an SRWPersistentBeamline), plus either the source wavefront or the parameters
+    to calculate it. The source wavefront is shared with the caller (and copied before being propagated), unless
+    owns_source_wavefront: a job unpickled in a worker process always owns it.
+    '''
+
+    def __init__(self,
+                 srw_beamline=SRWPersistentBeamline(),
+                 source_wavefront=None,
+                 source_wavefront_parameters=None,
+                 propagation_mode=SRWPropagationMode.STEP_BY_STEP,
+                 keep_intermediate_wavefronts=False,
+                 name=None,
+                 light_source=None,
+                 trajectory=None,
+                 owns_source_wavefront=False):
+        self.srw_beamline = srw_beamline
+        self.source_wavefront = source_wavefront
+        self.source_wavefront_parameters = source_wavefront_parameters
+        self.propagation_mode = propagation_mode
+        self.keep_intermediate_wavefronts = keep_intermediate_wavefronts
+        self.name = name
+        self.light_source = light_source # overrides the light source of the beamline (e.g. a macro-electron)
+        self.trajectory = trajectory # of the electron of the light source, calculated by SRW if None
+        self.owns_source_wavefront = owns_source_wavefront
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.owns_source_wavefront = True
+
+    def get_light_source(self):
+        return self.srw_beamline.get_light_source() if self.light_source is None else self.light_source
+
+    @classmethod
+    def from_beamline_elements(cls, light_source, beamline_elements, wavefront_propagation_parameters, **kwargs):
+        srw_beamline = SRWPersistentBeamline(create_srw_beamline(light_source))
+
+        for beamline_element, element_wavefront_propagation_parameters in zip(beamline_elements, wavefront_propagation_parameters):
+            srw_beamline = srw_beamline.append(beamline_element, element_wavefront_propagation_parameters)
+
+        return cls(srw_beamline=srw_beamline, **kwargs)
+
+def get_element_propagation_job(input_srw_data, beamline_element, wavefront_propagation_parameters, propagation_mode):
+    '''
+    Job propagating the wavefront received by an element through it. In whole beamline mode the wavefront received
+    is still the one of the source (or of the last propagation), so the elements appended to the working beamline
+    since then are propagated too.
+    '''
+    if propagation_mode == SRWPropagationMode.WHOLE_BEAMLINE:
+        srw_beamline = input_srw_data.get_persistent_working_srw_beamline().append(beamline_element, wavefront_propagation_parameters)
+    else:
+        srw_beamline = SRWPersistentBeamline(create_srw_beamline()).append(beamline_element, wavefront_propagation_parameters)
+
+    return SRWEngineJob(srw_beamline=srw_beamline,
+                        source_wavefront=input_srw_data.get_srw_wavefront(),
+                        propagation_mode=propagation_mode)
+
+class SRWEngineResult(object):
+    def __init__(self, job, wavefront=None, intermediate_wavefronts=[]):
+        self.job = job
+        self.wavefront = wavefront
+        self.intermediate_wavefronts = intermediate_wavefronts
+
+def run_job(job, progress_callback=None):
+    with SRWProfiler.Instance().stage("Job" if job.name is None else "Job: " + str(job.name), "engine"):
+        return _run_job(job, progress_callback)
+
+# the job and the events recorded by the profiler of the worker process
+def _run_profiled_job(job):
+    profiler = SRWProfiler.Instance()
+    profiler.set_enabled(True)
+
+    return run_job(job), profiler.pop_events()
+
+def _run_job(job, progress_callback=None):
+    propagation_manager = initialize_propagation_manager(job.propagation_mode)
+
+    if propagation_manager.get_propagation_mode(SRW_APPLICATION) != job.propagation_mode:
+        propagation_manager.set_propagation_mode(SRW_APPLICATION, job.propagation_mode)
+
+    handler_name = get_handler_name(job.propagation_mode)
+
+    # only a wavefront shared with the caller, or kept as an intermediate result, is copied before being propagated
+    if not job.source_wavefront is None:
+        wavefront = job.source_wavefront
+        copy_wavefront = not job.owns_source_wavefront
+    elif not job.source_wavefront_parameters is None:
+        wavefront = calculate_source_wavefront(job.get_light_source(), job.source_wavefront_parameters, trajectory=job.trajectory, progress_callback=progress_callback)
+        copy_wavefront = False
+    else:
+        raise ValueError("Job has neither source wavefront nor source wavefront parameters")
+
+    intermediate_wavefronts = []
+
+    if job.propagation_mode == SRWPropagationMode.WHOLE_BEAMLINE and not job.keep_intermediate_wavefronts:
+        if job.srw_beamline.get_beamline_elements_number() > 0:
+            if not progress_callback is None: progress_callback(0, "Propagation through the whole beamline")
+
+            wavefront = propagate_whole_beamline(wavefront, job.srw_beamline.to_srw_beamline(), handler_name, copy_wavefront)
+    else:
+        nodes = job.srw_beamline.get_nodes()
+
+        for index, node in enumerate(nodes):
+            if not progress_callback is None: progress_callback(100*index/len(nodes), "Propagation through element " + str(index + 1) + " of " + str(len(nodes)))
+
+            if job.propagation_mode == SRWPropagationMode.WHOLE_BEAMLINE:
+                wavefront = propagate_whole_beamline(wavefront, node.to_stage_srw_beamline(), handler_name, copy_wavefront)
+            else:
+                wavefront = propagate_beamline_element(wavefront, node.get_beamline_element(), node.get_wavefront_propagation_parameters(), handler_name, copy_wavefront)
+
+            if job.keep_intermediate_wavefronts: intermediate_wavefronts.append(wavefront)
+
+            copy_wavefront = job.keep_intermediate_wavefronts
+
+    return SRWEngineResult(job, wavefront, intermediate_wavefronts)
+
+# the pool is kept alive between calls: spawning the workers (and importing SRW in them) is paid only once
+_process_pool = None
+
+def get_process_pool(max_workers=None):
+    global _process_pool
+
+    if max_workers is None: max_workers = os.cpu_count() or 1
+
+    if not _process_pool is None and _process_pool[0] != max_workers: shutdown_process_pool()
+
+    if _process_pool is None:
+        _process_pool = (max_workers, ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")))
+
+    return _process_pool[1]
+
+def shutdown_process_pool():
+    global _process_pool
+
+    if not _process_pool is None:
+        _process_pool[1].shutdown(wait=True)
+        _process_pool = None
+
+def terminate_process_pool():
+    global _process_pool
+
+    if not _process_pool is None:
+        pool = _process_pool[1]
+        _process_pool = None
+
+        # the executor can't stop the running tasks: its workers are terminated
+        for process in list((pool._processes or {}).values()): process.terminate()
+
+        pool.shutdown(wait=True, cancel_futures=True)
+
+# while waiting for the workers, wait_callback() is called every POOL_WAIT_INTERVAL seconds (e.g. to keep a GUI
+# responsive): an exception raised by it (e.g. SRWEngineCancelled) terminates the workers
+POOL_WAIT_INTERVAL = 0.1
+
+@contextmanager
+def process_pool(max_workers=None):
+    try:
+        yield get_process_pool(max_workers)
+    except BrokenProcessPool:
+        shutdown_process_pool()
+
+        raise
+    except BaseException:
+        terminate_process_pool()
+
+        raise
+
+def wait_for_result(future, wait_callback=None):
+    if not wait_callback is None:
+        while not future.done():
+            wait([future], timeout=POOL_WAIT_INTERVAL)
+
+            if not future.done(): wait_callback()
+
+    return future.result()
+
+def as_completed(futures, wait_callback=None):
+    pending = set(futures)
+
+    while len(pending) > 0:
+        done, pending = wait(pending, timeout=None if wait_callback is None else POOL_WAIT_INTERVAL, return_when=FIRST_COMPLETED)
+
+        for future in done: yield future
+
+        if len(done) == 0: wait_callback()
+
+def map_in_pool(function, *iterables, max_workers=None, callback=None, wait_callback=None):
+    '''
+    As Executor.map in the process pool, returning the list of the results: callback(index, result) is called after
+    each result, in order of submission.
+    '''
+    results = []
+
+    with process_pool(max_workers) as pool:
+        futures = [pool.submit(function, *arguments) for arguments in zip(*iterables)]
+
+        for index, future in enumerate(futures):
+            results.append(wait_for_result(future, wait_callback))
+
+            if not callback is None: callback(index, results[-1])
+
+    return results
+
+def run_jobs(jobs, max_workers=None, callback=None, wait_callback=None):
+    '''
+    Runs independent beamline variants, returning the results in order of submission. With max_workers=1 the jobs
+    are run in the current process, otherwise in a pool of fresh ("spawn") processes, that don't inherit the state
+    of the calling application (Qt, open files, PropagationManager).
+    '''
+    results = []
+
+    if max_workers == 1:
+        for index, job in enumerate(jobs):
+            if not wait_callback is None: wait_callback()
+
+            results.append(run_job(job))
+
+            if not callback is None: callback(index, results[-1])
+    else:
+        profiler = SRWProfiler.Instance()
+        profile = profiler.is_enabled()
+
+        def job_completed(index, result):
+            if profile:
+                result, events = result
+
+                profiler.add_events(events)
+
+            results.append(result)
+
+            if not callback is None: callback(index, result)
+
+        map_in_pool(_run_profiled_job if profile else run_job, jobs, max_workers=max_workers, callback=job_completed, wait_callback=wait_callback)
+
+    return results
+
+#########################################################################################
+#
+# ENERGY SLICES: the photon energies of a multi-energy wavefront are propagated
+# independently, so they can be split in single-energy wavefronts, propagated in the
+# process pool and reassembled. SRW stores the field as [ny][nx][ne][Re, Im].
+#
+#########################################################################################
+
+def get_slice_energies(mesh):
+    return numpy.linspace(mesh.eStart, mesh.eFin, mesh.ne) if mesh.ne > 1 else numpy.array([mesh.eStart])
+
+def split_energy_slices(wavefront):
+    mesh = wavefront.mesh
+
+    if wavefront.presFT != 0: raise ValueError("Only wavefronts in the frequency domain can be split in energy slices")
+
+    field_x = get_field(wavefront.arEx, mesh.ne, mesh.nx, mesh.ny)
+    field_y = get_field(wavefront.arEy, mesh.ne, mesh.nx, mesh.ny)
+
+    slices = []
+
+    for index, energy in enumerate(get_slice_energies(mesh).tolist()):
+        energy_slice = create_wavefront(wavefront,
+                                  field_x[:, :, index:index+1, :],
+                                  field_y[:, :, index:index+1, :],
+                                  energy, energy,
+                                  mesh.xStart, mesh.xFin, mesh.yStart, mesh.yFin)
+        energy_slice.avgPhotEn = energy
+        energy_slice.arMomX = _get_moments(wavefront.arMomX, index)
+        energy_slice.arMomY = _get_moments(wavefront.arMomY, index)
+
+        slices.append(energy_slice)
+
+    return slices
+
+def merge_energy_slices(slices):
+    '''
+    Multi-energy wavefront from single-energy wavefronts, that must have the same transverse mesh: slices propagated
+    on different meshes (e.g. by automatic resizing) can't be merged without interpolating the field, losing phase
+    and resolution. Radii of curvature and centers are taken from the central slice.
+    '''
+    reference = slices[len(slices)//2]
+    mesh = reference.mesh
+
+    for energy_slice in slices:
+        if not is_same_transverse_mesh(energy_slice.mesh, mesh):
+            raise ValueError("The energy slices have been propagated on different meshes (e.g. by automatic resizing) and can't be merged: " +
+                             "propagate the wavefront without splitting it in energy slices")
+
+    fields_x = [get_field(energy_slice.arEx, 1, mesh.nx, mesh.ny) for energy_slice in slices]
+    fields_y = [get_field(energy_slice.arEy, 1, mesh.nx, mesh.ny) for energy_slice in slices]
+
+    wavefront = create_wavefront(reference,
+                                 numpy.concatenate(fields_x, axis=2),
+                                 numpy.concatenate(fields_y, axis=2),
+                                 slices[0].mesh.eStart, slices[-1].mesh.eFin,
+                                 mesh.xStart, mesh.xFin, mesh.yStart, mesh.yFin)
+    wavefront.avgPhotEn = 0.5*(wavefront.mesh.eStart + wavefront.mesh.eFin)
+    wavefront.arMomX = array('d', [moment for energy_slice in slices for moment in _get_moments(energy_slice.arMomX, 0)])
+    wavefront.arMomY = array('d', [moment for energy_slice in slices for moment in _get_moments(energy_slice.arMomY, 0)])
+
+    return wavefront
+
+def run_energy_sliced_job(job, max_workers=None, callback=None, wait_callback=None):
+    '''
+    Runs job by propagating each photon energy of its source wavefront as an independent job (see run_jobs),
+    then reassembling the propagated slices.
+    '''
+    if job.source_wavefront is None: raise ValueError("The source wavefront is needed to split it in energy slices")
+
+    slices = split_energy_slices(job.source_wavefront)
+
+    results = run_jobs([SRWEngineJob(srw_beamline=job.srw_beamline,
+                                     source_wavefront=energy_slice,
+                                     propagation_mode=job.propagation_mode,
+                                     name="E = " + str(round(energy_slice.mesh.eStart, 3)) + " eV",
+                                     owns_source_wavefront=True) for energy_slice in slices],
+                       max_workers=max_workers,
+                       callback=callback,
+                       wait_callback=wait_callback)
+
+    with SRWProfiler.Instance().stage("Merge Energy Slices", "engine"):
+        return SRWEngineResult(job, merge_energy_slices([result.wavefront for result in results]))
+
+def get_field(buffer, ne, nx, ny):
+    return numpy.frombuffer(buffer, dtype=buffer.typecode).reshape(ny, nx, ne, 2)
+
+def _get_moments(moments, index):
+    return array('d', moments[11*index:11*(index + 1)] if len(moments) >= 11*(index + 1) else [0.0]*11)
+
+def is_same_transverse_mesh(mesh_1, mesh_2):
+    return mesh_1.nx == mesh_2.nx and mesh_1.ny == mesh_2.ny and \
+           numpy.allclose([mesh_1.xStart, mesh_1.xFin, mesh_1.yStart, mesh_1.yFin],
+                          [mesh_2.xStart, mesh_2.xFin, mesh_2.yStart, mesh_2.yFin], rtol=1e-9, atol=0.0)
+
+def create_wavefront(template, field_x, field_y, eStart, eFin, xStart, xFin, yStart, yFin):
+    ny, nx, ne, _ = field_x.shape
+
+    wavefront = SRWWavefront(_arEx=array(template.arEx.typecode, numpy.ascontiguousarray(field_x).tobytes()),
+                             _arEy=array(template.arEy.typecode, numpy.ascontiguousarray(field_y).tobytes()),
+                             _typeE=template.numTypeElFld,
+                             _eStart=eStart,
+                             _eFin=eFin,
+                             _ne=ne,
+                             _xStart=xStart,
+                             _xFin=xFin,
+                             _nx=nx,
+                             _yStart=yStart,
+                             _yFin=yFin,
+                             _ny=ny,
+                             _zStart=template.mesh.zStart,
+                             _partBeam=copy.deepcopy(template.partBeam))
+
+    wavefront.Rx  = template.Rx
+    wavefront.Ry  = template.Ry
+    wavefront.dRx = template.dRx
+    wavefront.dRy = template.dRy
+    wavefront.xc  = template.xc
+    wavefront.yc  = template.yc
+    wavefront.avgPhotEn = template.avgPhotEn
+    wavefront.presCA = template.presCA
+    wavefront.presFT = template.presFT
+    wavefront.unitElFld = template.unitElFld
+    wavefront.arElecPropMatr = copy.deepcopy(template.arElecPropMatr)
+    wavefront.arWfrAuxData = copy.deepcopy(template.arWfrAuxData)
+
+    wavefront.scanned_variable_data = template.scanned_variable_data
+
+    return wavefront
+
+#########################################################################################
+#
+# WORKER PROCESS: a native SRW call can't be interrupted, but the process running it can
+# be terminated. The process is reused by the following tasks, until it is cancelled.
+#
+#########################################################################################
+
+class SRWEngineCancelled(Exception):
+    def __init__(self, message="Calculation cancelled by user"):
+        super().__init__(message)
+
+def _worker_loop(connection):
+    def progress_callback(progress, message):
+        connection.send(("progress", progress, message))
+
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            break
+
+        if task is None: break
+
+        function, args, profile = task
+
+        profiler = SRWProfiler.Instance()
+        profiler.set_enabled(profile)
+
+        try:
+            result = function(*args, progress_callback=progress_callback)
+
+            connection.send(("result", result, profiler.pop_events()))
+        except Exception as exception:
+            try:
+                connection.send(("error", exception, profiler.pop_events()))
+            except Exception: # not picklable
+                connection.send(("error", RuntimeError(str(exception)), []))
+
+        sys.stdout.flush()
+
+class SRWEngineWorker(object):
+
+    def __init__(self):
+        self.__process = None
+        self.__connection = None
+        self.__outcome = None
+        self.__running = False
+
+    def is_running(self):
+        return self.__running
+
+    def submit(self, function, *args):
+        if self.__running: raise RuntimeError("A calculation is already running")
+
+        if self.__process is None or not self.__process.is_alive():
+            context = multiprocessing.get_context("spawn")
+
+            self.__connection, child_connection = context.Pipe()
+            self.__process = context.Process(target=_worker_loop, args=(child_connection,), daemon=True)
+            self.__process.start()
+
+            child_connection.close()
+
+        self.__outcome = None
+        self.__running = True
+        self.__connection.send((function, args, SRWProfiler.Instance().is_enabled()))
+
+    # returns True when the task is over, forwarding the progress messages of the task to progress_callback
+    def poll(self, progress_callback=None):
+        if not self.__running: return True
+
+        try:
+            while self.__outcome is None and self.__connection.poll():
+                message = self.__connection.recv()
+
+                if message[0] == "progress":
+                    if not progress_callback is None: progress_callback(message[1], message[2])
+                else:
+                    self.__outcome = message[:2]
+
+                    SRWProfiler.Instance().add_events(message[2])
+        except (EOFError, OSError):
+            self.__outcome = ("error", RuntimeError("Calculation process terminated unexpectedly"))
+
+        if self.__outcome is None and not self.__process.is_alive():
+            self.__outcome = ("error", RuntimeError("Calculation process terminated unexpectedly (exit code: " + str(self.__process.exitcode) + ")"))
+
+        if not self.__outcome is None: self.__running = False
+
+        return not self.__running
+
+    def get_result(self):
+        if self.__outcome is None: raise RuntimeError("Calculation not completed")
+
+        kind, value = self.__outcome
+
+        if kind == "error": raise value
+        else: return value
+
+    def cancel(self):
+        if self.__running:
+            self.shutdown()
+
+            self.__outcome = ("error", SRWEngineCancelled())
+            self.__running = False
+
+    def shutdown(self):
+        if not self.__process is None:
+            if self.__process.is_alive():
+                self.__process.terminate()
+                self.__process.join()
+
+            self.__connection.close()
+
+            self.__process = None
+            self.__connection = None
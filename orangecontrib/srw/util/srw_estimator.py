@@ -0,0 +1,107 @@
+import os
+
+#########################################################################################
+#
+# PRE-FLIGHT ESTIMATE OF THE WAVEFRONT MESH AND MEMORY FOOTPRINT
+#
+# SRW resizes the wavefront before/after each propagation step by the range and
+# resolution modification factors: nx -> nx * range * resolution (the same for ny),
+# while ne is unchanged. Automatic resizing depends on the field, so in that case
+# the estimate is only a lower bound.
+#
+#########################################################################################
+
+BYTES_PER_POINT = 16 # Ex and Ey, complex single precision
+
+WHERE_LABELS = {"before" : "Drift Before", "oe" : "O.E.", "after" : "Drift After"}
+
+def get_physical_memory():
+    try:
+        return os.sysconf("SC_PAGE_SIZE")*os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 8*1024**3
+
+def get_default_memory_budget():
+    return get_physical_memory()//2
+
+def get_mesh_memory(ne, nx, ny):
+    return BYTES_PER_POINT*ne*nx*ny
+
+class SRWMeshEstimate(object):
+    def __init__(self, ne, nx, ny, auto_resize=False, element_name="", where=None):
+        self.ne = ne
+        self.nx = nx
+        self.ny = ny
+        self.auto_resize = auto_resize
+        self.element_name = element_name
+        self.where = where
+
+    def get_memory(self):
+        return get_mesh_memory(self.ne, self.nx, self.ny)
+
+    def to_text(self):
+        return (self.element_name + " (" + WHERE_LABELS.get(self.where, str(self.where)) + ")").ljust(40) + \
+               ("ne=" + str(self.ne)).ljust(10) + ("nx=" + str(self.nx)).ljust(12) + ("ny=" + str(self.ny)).ljust(12) + \
+               (str(round(self.get_memory()/1024**2, 1)) + " MB").rjust(14) + \
+               (" (auto-resize: lower bound)" if self.auto_resize else "")
+
+def _get_resized_points(points, factor):
+    if factor == 1.0: return points
+
+    points = max(1, int(round(points*factor)))
+
+    return points + points % 2 if points > 1 else points # SRW keeps an even number of points for the FFTs
+
+def estimate_mesh_after_propagation(ne, nx, ny, wavefront_propagation_parameters):
+    parameters = wavefront_propagation_parameters.to_SRW_array()
+
+    return ne, \
+           _get_resized_points(nx, parameters[5]*parameters[6]), \
+           _get_resized_points(ny, parameters[7]*parameters[8]), \
+           parameters[0] == 1 or parameters[1] == 1
+
+def estimate_propagation(wavefront, beamline_elements):
+    '''
+    Mesh after each step of the propagation of the wavefront through beamline_elements, a list of
+    (BeamlineElement, [(parameters, optional parameters, where), ...]), as recorded in SRWPersistentBeamline
+    '''
+    mesh = wavefront.mesh
+    ne, nx, ny, auto_resize = mesh.ne, mesh.nx, mesh.ny, False
+
+    estimates = []
+
+    for beamline_element, wavefront_propagation_parameters in beamline_elements:
+        element_name = str(beamline_element.get_optical_element().get_name())
+
+        for srw_wavefront_propagation_parameters, _, where in wavefront_propagation_parameters:
+            if not srw_wavefront_propagation_parameters is None:
+                ne, nx, ny, element_auto_resize = estimate_mesh_after_propagation(ne, nx, ny, srw_wavefront_propagation_parameters)
+
+                auto_resize = auto_resize or element_auto_resize
+
+                estimates.append(SRWMeshEstimate(ne, nx, ny, auto_resize, element_name, where))
+
+    return estimates
+
+# resizing allocates the new field before releasing the old one: the peak is the largest sum of two consecutive meshes
+def get_peak_memory(wavefront, estimates):
+    memory = get_mesh_memory(wavefront.mesh.ne, wavefront.mesh.nx, wavefront.mesh.ny)
+    peak_memory = memory
+
+    for estimate in estimates:
+        peak_memory = max(peak_memory, memory + estimate.get_memory())
+        memory = estimate.get_memory()
+
+    return peak_memory
+
+def get_report_text(wavefront, estimates):
+    mesh = wavefront.mesh
+
+    text = "Input Wavefront".ljust(40) + ("ne=" + str(mesh.ne)).ljust(10) + ("nx=" + str(mesh.nx)).ljust(12) + ("ny=" + str(mesh.ny)).ljust(12) + \
+           (str(round(get_mesh_memory(mesh.ne, mesh.nx, mesh.ny)/1024**2, 1)) + " MB").rjust(14) + "\n"
+
+    for estimate in estimates: text += estimate.to_text() + "\n"
+
+    text += "\nEstimated peak memory: " + str(round(get_peak_memory(wavefront, estimates)/1024**2, 1)) + " MB"
+
+    return text
@@ -0,0 +1,211 @@
+import os, tempfile, threading
+from collections import OrderedDict
+
+import numpy
+
+from wofrysrw.util.srw import SRWLMagFld3D, array
+from wofrysrw.storage_ring.magnetic_structures.srw_3d_magnetic_structure import SRW3DMagneticStructure
+
+from orangecontrib.srw.util.srw_cache import get_fingerprint, get_file_fingerprint
+
+#########################################################################################
+#
+# 3D MAGNETIC FIELD TABLES: the text file (SRW Example 01 format) is parsed once. The
+# parsed field is kept in memory, keyed by the fingerprint of the file content and the
+# comment character, and stored in a binary file of the cache directory with the same
+# key, so later sessions and the worker processes don't parse it again (a copy of the
+# table, or a table edited back, reuses it). Fields calculated by other programs (e.g.
+# XOPPY) are registered in memory when their file is written.
+#
+#########################################################################################
+
+class SRWMagneticField3D(object):
+    '''
+    Bx, By, Bz [T] on a 3D mesh, as flat arrays: inmost loop vs X, outmost loop vs Z
+    '''
+    def __init__(self, bx, by, bz, x_start, x_step, x_points, y_start, y_step, y_points, z_start, z_step, z_points):
+        self.bx = numpy.asarray(bx, dtype=numpy.float64)
+        self.by = numpy.asarray(by, dtype=numpy.float64)
+        self.bz = numpy.asarray(bz, dtype=numpy.float64)
+
+        self.x_start  = x_start
+        self.x_step   = x_step
+        self.x_points = int(x_points)
+        self.y_start  = y_start
+        self.y_step   = y_step
+        self.y_points = int(y_points)
+        self.z_start  = z_start
+        self.z_step   = z_step
+        self.z_points = int(z_points)
+
+    def get_ranges(self):
+        # as AuxReadInMagFld3D
+        return tuple([step*(points - 1) if points > 1 else step for step, points in [(self.x_step, self.x_points),
+                                                                                    (self.y_step, self.y_points),
+                                                                                    (self.z_step, self.z_points)]])
+
+    def get_length(self):
+        return self.get_ranges()[2]
+
+    def get_default_initial_z(self, longitudinal_central_position=0.0):
+        return longitudinal_central_position - 0.5*self.get_length()
+
+    def to_SRWLMagFld3D(self):
+        x_range, y_range, z_range = self.get_ranges()
+
+        return SRWLMagFld3D(array('d', self.bx), array('d', self.by), array('d', self.bz),
+                            self.x_points, self.y_points, self.z_points, x_range, y_range, z_range, 1)
+
+    def save(self, file_name, comment_character="#"):
+        header = "Bx [T], By [T], Bz [T] on 3D mesh: inmost loop vs X (horizontal transverse position), outmost loop vs Z (longitudinal position)\n"
+        header += str(self.x_start) + " " + comment_character + "initial X position [m]\n"
+        header += str(self.x_step) + " " + comment_character + "step of X [m]\n"
+        header += str(self.x_points) + " " + comment_character + "number of points vs X\n"
+        header += str(self.y_start) + " " + comment_character + "initial Y position [m]\n"
+        header += str(self.y_step) + " " + comment_character + "step of Y [m]\n"
+        header += str(self.y_points) + " " + comment_character + "number of points vs Y\n"
+        header += str(self.z_start) + " " + comment_character + "initial Z position [m]\n"
+        header += str(self.z_step) + " " + comment_character + "step of Z [m]\n"
+        header += str(self.z_points) + " " + comment_character + "number of points vs Z"
+
+        numpy.savetxt(file_name, numpy.array([self.bx, self.by, self.bz]).T, fmt=('%7.6f', '%7.6f', '%7.6f'), header=header, delimiter='\t', comments=comment_character + " ")
+
+class SRW3DCachedMagneticStructure(SRW3DMagneticStructure):
+    '''
+    SRW3DMagneticStructure reading the field through the cache, or from the given SRWMagneticField3D
+    '''
+    def __init__(self, file_name="", comment_character="#", interpolation_method=1, magnetic_field=None):
+        super().__init__(file_name, comment_character, interpolation_method)
+
+        self.__magnetic_field = magnetic_field
+
+    def get_magnetic_field(self):
+        if self.__magnetic_field is None: return get_magnetic_field(self.file_name, self.comment_character)
+        else: return self.__magnetic_field
+
+    def get_SRWMagneticStructure(self):
+        return self.get_magnetic_field().to_SRWLMagFld3D()
+
+#########################################################################################
+
+CACHE_FORMAT_VERSION = 2
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "oasys-srw", "magnetic-fields")
+MAXIMUM_ENTRIES = 8
+
+_magnetic_fields = OrderedDict()
+_lock = threading.RLock()
+_cache_directory = DEFAULT_CACHE_DIRECTORY
+
+def get_magnetic_field(file_name, comment_character="#"):
+    key = _get_key(file_name, comment_character)
+
+    with _lock:
+        if key in _magnetic_fields:
+            _magnetic_fields.move_to_end(key)
+
+            return _magnetic_fields[key]
+
+    magnetic_field = _load_cache_file(key)
+
+    if magnetic_field is None:
+        magnetic_field = read_magnetic_field(file_name, comment_character)
+
+        _save_cache_file(key, magnetic_field)
+
+    _put(key, magnetic_field)
+
+    return magnetic_field
+
+def register_magnetic_field(file_name, magnetic_field, comment_character="#"):
+    '''
+    The field has just been written in file_name: it won't be parsed
+    '''
+    key = _get_key(file_name, comment_character)
+
+    _save_cache_file(key, magnetic_field)
+    _put(key, magnetic_field)
+
+def clear_magnetic_fields():
+    with _lock:
+        _magnetic_fields.clear()
+
+def get_cache_directory():
+    return _cache_directory
+
+def set_cache_directory(directory):
+    global _cache_directory
+
+    _cache_directory = directory
+
+def read_magnetic_field(file_name, comment_character="#"):
+    '''
+    As AuxReadInMagFld3D (SRW Example 01): the lines of the mesh not made of 3 tab separated values are left to 0
+    '''
+    with open(file_name, 'r') as file:
+        file.readline()  # 1st line: just pass
+
+        header = [file.readline().split(comment_character, 2)[1] for _ in range(9)]
+
+        x_start, x_step, x_points = float(header[0]), float(header[1]), int(header[2])
+        y_start, y_step, y_points = float(header[3]), float(header[4]), int(header[5])
+        z_start, z_step, z_points = float(header[6]), float(header[7]), int(header[8])
+
+        total_points = x_points*y_points*z_points
+
+        field = numpy.zeros((total_points, 3))
+
+        for index in range(total_points):
+            line_parts = file.readline().split('\t')
+            if len(line_parts) == 3: field[index, :] = [float(part.strip()) for part in line_parts]
+
+    return SRWMagneticField3D(field[:, 0], field[:, 1], field[:, 2], x_start, x_step, x_points, y_start, y_step, y_points, z_start, z_step, z_points)
+
+def get_cache_file_name(file_name, comment_character="#"):
+    return _get_cache_file_name(_get_key(file_name, comment_character))
+
+# the content, not the path: the same table anywhere is the same field
+def _get_key(file_name, comment_character):
+    return get_file_fingerprint(file_name), comment_character
+
+def _get_cache_file_name(key):
+    return os.path.join(_cache_directory, get_fingerprint(CACHE_FORMAT_VERSION, *key) + ".srw3d.npz")
+
+def _put(key, magnetic_field):
+    with _lock:
+        _magnetic_fields[key] = magnetic_field
+        _magnetic_fields.move_to_end(key)
+
+        while len(_magnetic_fields) > MAXIMUM_ENTRIES: _magnetic_fields.popitem(last=False)
+
+def _load_cache_file(key):
+    try:
+        with numpy.load(_get_cache_file_name(key), allow_pickle=False) as data:
+            mesh = data["mesh"]
+
+            return SRWMagneticField3D(data["bx"], data["by"], data["bz"], mesh[0], mesh[1], int(mesh[2]), mesh[3], mesh[4], int(mesh[5]), mesh[6], mesh[7], int(mesh[8]))
+    except Exception: # missing or unreadable
+        return None
+
+def _save_cache_file(key, magnetic_field):
+    cache_file_name = _get_cache_file_name(key)
+
+    try:
+        os.makedirs(os.path.dirname(cache_file_name), exist_ok=True)
+
+        file_descriptor, temporary_file_name = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(cache_file_name))
+    except OSError: # read-only cache directory: the field is cached in memory only
+        return
+
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            numpy.savez(file,
+                        mesh=numpy.array([magnetic_field.x_start, magnetic_field.x_step, magnetic_field.x_points,
+                                          magnetic_field.y_start, magnetic_field.y_step, magnetic_field.y_points,
+                                          magnetic_field.z_start, magnetic_field.z_step, magnetic_field.z_points], dtype=numpy.float64),
+                        bx=magnetic_field.bx,
+                        by=magnetic_field.by,
+                        bz=magnetic_field.bz)
+
+        os.replace(temporary_file_name, cache_file_name) # atomic: readers never see a partial file
+    except OSError:
+        if os.path.exists(temporary_file_name): os.remove(temporary_file_name)
@@ -0,0 +1,198 @@
+import numpy, warnings
+from scipy.interpolate import RegularGridInterpolator
+from scipy.stats import qmc, norm
+
+from orangecontrib.srw.util import srw_engine, srw_precision, srw_trajectory
+from orangecontrib.srw.util.srw_profiler import SRWProfiler
+
+#########################################################################################
+#
+# SAMPLING OF THE ELECTRON PHASE SPACE: pseudo-random (independent normal draws) or
+# quasi-random, with a scrambled low-discrepancy sequence (Sobol or Halton) mapped
+# through the inverse normal CDF. The points of the sequence are taken in order, so
+# the sampling error decreases faster than 1/sqrt(N).
+#
+#########################################################################################
+
+class SamplingMethod:
+    PSEUDO_RANDOM = 0
+    SOBOL         = 1
+    HALTON        = 2
+
+    @classmethod
+    def tuple(cls):
+        return ["Pseudo-Random", "Quasi-Random (Sobol)", "Quasi-Random (Halton)"]
+
+# energy, x, x', y, y'
+PHASE_SPACE_DIMENSIONS = 5
+
+def get_quasi_random_normals(sampling_method, seed, index, number_of_points=1, dimensions=PHASE_SPACE_DIMENSIONS):
+    '''
+    Points index, ..., index + number_of_points - 1 of the scrambled sequence, as standard normal deviates [point, dimension]
+    '''
+    if sampling_method == SamplingMethod.SOBOL:    engine = qmc.Sobol(d=dimensions, scramble=True, seed=seed)
+    elif sampling_method == SamplingMethod.HALTON: engine = qmc.Halton(d=dimensions, scramble=True, seed=seed)
+    else: raise ValueError("Sampling method is not quasi-random")
+
+    if index > 0: engine.fast_forward(index)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") # balance properties of Sobol points, for a number of points not power of 2
+
+        uniforms = engine.random(number_of_points)
+
+    return norm.ppf(numpy.clip(uniforms, 1e-12, 1.0 - 1e-12))
+
+def get_correlated_sample(normal_1, normal_2, moment_uu, moment_uup, moment_upup):
+    '''
+    (u, u') from two standard normal deviates, with the second moments of the beam: Cholesky factor of the 2x2
+    covariance matrix [[<uu>, <uu'>], [<uu'>, <u'u'>]]
+    '''
+    if moment_uu <= 0.0: return 0.0, numpy.sqrt(max(moment_upup, 0.0))*normal_2
+
+    a = numpy.sqrt(moment_uu)
+    b = moment_uup/a
+    c = numpy.sqrt(max(moment_upup - b**2, 0.0))
+
+    return a*normal_1, b*normal_1 + c*normal_2
+
+#########################################################################################
+#
+# MULTI-ELECTRON MONTE CARLO: each macro-electron of a batch is an independent job (the
+# source wavefront of the electron, propagated through the whole beamline), run in the
+# process pool. The workers send back the single electron intensity only, reduced in
+# the calling process into the accumulated intensity.
+#
+#########################################################################################
+
+def get_random_generators(seed_sequence, number_of_electrons):
+    '''
+    Independent random streams, one for each macro-electron: seed_sequence is a numpy.random.SeedSequence, each
+    call spawns new children, so successive batches from the same seed are independent and reproducible
+    '''
+    return [numpy.random.default_rng(child_seed_sequence) for child_seed_sequence in seed_sequence.spawn(number_of_electrons)]
+
+def get_macro_electron_jobs(srw_beamline, propagation_mode, linear_corrections=False):
+    '''
+    srw_beamline is an SRWPersistentBeamline, from the source to the last element, carrying a batch of macro-electrons;
+    with linear_corrections, the trajectories are derived from the cached ones within the limits of SRWTrajectoryCache
+    '''
+    macro_electrons = srw_beamline.get_macro_electrons()
+    source_wavefront_parameters = macro_electrons.get_source_wavefront_parameters()
+
+    # the exact trajectory of a random electron would never be found in the cache: it is calculated in the workers,
+    # unless it is a linear correction of a cached one (e.g. of the ideal electron)
+    if linear_corrections:
+        trajectory_parameters = srw_trajectory.SRWTrajectoryParameters.from_wavefront_parameters(source_wavefront_parameters)
+        get_trajectory = lambda light_source: srw_trajectory.get_cached_trajectory(light_source, trajectory_parameters, linear_corrections=True)
+    else:
+        get_trajectory = lambda light_source: None
+
+    return [srw_engine.SRWEngineJob(srw_beamline=srw_beamline,
+                                    source_wavefront_parameters=source_wavefront_parameters,
+                                    propagation_mode=propagation_mode,
+                                    name="Macro-electron " + str(index + 1),
+                                    light_source=light_source,
+                                    trajectory=get_trajectory(light_source))
+            for index, light_source in enumerate(macro_electrons.get_light_sources())]
+
+class SRWIntensityAccumulator(object):
+    '''
+    Sum of single electron intensities [energy, horizontal, vertical], on the mesh of the first one: intensities
+    on different meshes (e.g. by automatic resizing) are linearly interpolated on it, zero outside. Each intensity
+    can have a weight (e.g. the occupation of a coherent mode), the average is weighted.
+    '''
+
+    def __init__(self):
+        self.e = None
+        self.h = None
+        self.v = None
+        self.intensity = None
+        self.number_of_electrons = 0
+        self.total_weight = 0.0
+
+    def add(self, e, h, v, intensity, weight=1.0):
+        if self.intensity is None:
+            self.e = e
+            self.h = h
+            self.v = v
+            self.intensity = numpy.array(intensity)*weight
+        elif intensity.shape == self.intensity.shape and numpy.allclose([h[0], h[-1], v[0], v[-1]], [self.h[0], self.h[-1], self.v[0], self.v[-1]], rtol=1e-9, atol=0.0):
+            self.intensity += intensity*weight
+        else:
+            if len(e) != len(self.e): raise ValueError("Macro-electrons with a different number of photon energies")
+
+            h_mesh, v_mesh = numpy.meshgrid(self.h, self.v, indexing="ij")
+
+            for index in range(len(e)):
+                interpolator = RegularGridInterpolator((h, v), intensity[index, :, :], bounds_error=False, fill_value=0.0)
+
+                self.intensity[index, :, :] += (interpolator((h_mesh, v_mesh))*weight).astype(self.intensity.dtype)
+
+        self.number_of_electrons += 1
+        self.total_weight += weight
+
+    def get_average_intensity(self):
+        if self.number_of_electrons == 0: raise ValueError("No macro-electron accumulated")
+
+        return self.e, self.h, self.v, self.intensity/self.total_weight
+
+def run_macro_electron_jobs(jobs, max_workers=None, precision=None, callback=None, weights=None, wavefront_callback=None, wait_callback=None):
+    '''
+    Runs the macro-electrons (see run_jobs), returning an SRWIntensityAccumulator: callback(index, accumulator) is
+    called after each macro-electron. weights are the weights of the intensities of the jobs (1 if None). If
+    wavefront_callback(index, wavefront) is given, the workers send back the wavefronts too (e.g. to archive them).
+    wait_callback is called while waiting for the workers (see srw_engine.map_in_pool).
+    '''
+    if precision is None: precision = srw_precision.get_precision()
+    if weights is None: weights = [1.0]*len(jobs)
+
+    accumulator = SRWIntensityAccumulator()
+
+    if max_workers == 1:
+        for index, job in enumerate(jobs):
+            if not wait_callback is None: wait_callback()
+
+            wavefront = srw_engine.run_job(job).wavefront
+
+            accumulator.add(*_get_intensity(wavefront, precision), weight=weights[index])
+
+            if not wavefront_callback is None: wavefront_callback(index, wavefront)
+
+            if not callback is None: callback(index, accumulator)
+    else:
+        profiler = SRWProfiler.Instance()
+
+        def macro_electron_completed(index, result):
+            e, h, v, intensity, events, wavefront = result
+
+            profiler.add_events(events)
+            accumulator.add(e, h, v, intensity, weight=weights[index])
+
+            if not wavefront_callback is None: wavefront_callback(index, wavefront)
+
+            if not callback is None: callback(index, accumulator)
+
+        srw_engine.map_in_pool(_run_macro_electron_job, jobs,
+                               [precision]*len(jobs),
+                               [profiler.is_enabled()]*len(jobs),
+                               [not wavefront_callback is None]*len(jobs),
+                               max_workers=max_workers,
+                               callback=macro_electron_completed,
+                               wait_callback=wait_callback)
+
+    return accumulator
+
+# runs in the worker process: the wavefront is reduced to its intensity before being sent back, unless requested
+def _run_macro_electron_job(job, precision, profile, return_wavefront=False):
+    profiler = SRWProfiler.Instance()
+    profiler.set_enabled(profile)
+
+    wavefront = srw_engine.run_job(job).wavefront
+
+    e, h, v, intensity = _get_intensity(wavefront, precision)
+
+    return e, h, v, intensity, profiler.pop_events(), wavefront if return_wavefront else None
+
+def _get_intensity(wavefront, precision):
+    return srw_precision.get_intensity(wavefront, multi_electron=False, precision=precision)
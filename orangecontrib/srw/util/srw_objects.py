@@ -1,29 +1,253 @@
 
+from wofry.propagator.propagator import PropagationParameters
 from wofrysrw.beamline.srw_beamline import SRWBeamline
 from wofrysrw.propagator.wavefront2D.srw_wavefront import SRWWavefront
 
+# SRWBeamline shares its default (mutable) list of beamline elements among all the beamlines created without one, so
+# appending an element to one of them would append it to all: every beamline created here has its own list
+def create_srw_beamline(light_source=None):
+    return SRWBeamline(light_source=light_source, beamline_elements_list=[])
+
+class SRWPersistentBeamline(object):
+    '''
+    Immutable description of a beamline: each instance holds the last element and a reference to the beamline it
+    was appended to, so appending is O(1), nothing is deep-copied and branches of a workspace share their common
+    upstream elements. The SRWBeamline needed by the propagators and by the other widgets is built on demand.
+    '''
+
+    class ParametersRecorder(list):
+        def append_wavefront_propagation_parameters(self, wavefront_propagation_parameters, wavefront_propagation_optional_parameters, where):
+            self.append((wavefront_propagation_parameters, wavefront_propagation_optional_parameters, where))
+
+    def __init__(self, srw_beamline=None, parent=None, beamline_element=None, wavefront_propagation_parameters=[], macro_electrons=None, coherent_modes=None):
+        if parent is None:
+            self.__base_srw_beamline = create_srw_beamline() if srw_beamline is None else srw_beamline
+            self.__elements_number   = self.__base_srw_beamline.get_beamline_elements_number()
+            self.__macro_electrons   = macro_electrons
+            self.__coherent_modes    = coherent_modes
+        else:
+            self.__base_srw_beamline = parent.get_base_srw_beamline()
+            self.__elements_number   = parent.get_beamline_elements_number() + 1
+            self.__macro_electrons   = parent.get_macro_electrons()
+            self.__coherent_modes    = parent.get_coherent_modes()
+
+        self.__parent = parent
+        self.__beamline_element = beamline_element
+        self.__wavefront_propagation_parameters = tuple(wavefront_propagation_parameters)
+
+        self.__srw_beamline = self.__base_srw_beamline if parent is None else None
+        self.__stage_srw_beamline = None
+
+    def append(self, beamline_element, wavefront_propagation_parameters=[]):
+        return SRWPersistentBeamline(parent=self,
+                                     beamline_element=beamline_element,
+                                     wavefront_propagation_parameters=wavefront_propagation_parameters)
+
+    def get_parent(self):
+        return self.__parent
+
+    def get_base_srw_beamline(self):
+        return self.__base_srw_beamline
+
+    def get_light_source(self):
+        return self.__base_srw_beamline.get_light_source()
+
+    def get_beamline_elements_number(self):
+        return self.__elements_number
+
+    # the batch of macro-electrons emitted by the source, if any (see SRWMacroElectrons)
+    def get_macro_electrons(self):
+        return self.__macro_electrons
+
+    # the batch of coherent modes emitted by the source, if any (see SRWCoherentModes)
+    def get_coherent_modes(self):
+        return self.__coherent_modes
+
+    def get_beamline_element(self):
+        return self.__beamline_element
+
+    def get_wavefront_propagation_parameters(self):
+        return self.__wavefront_propagation_parameters
+
+    # the elements appended to the base beamline, from the first to this one
+    def get_nodes(self):
+        nodes = []
+        node = self
+
+        while not node.get_parent() is None:
+            nodes.append(node)
+            node = node.get_parent()
+
+        return nodes[::-1]
+
+    def to_srw_beamline(self):
+        if self.__srw_beamline is None:
+            if self.__base_srw_beamline.get_beamline_elements_number() == 0:
+                srw_beamline = create_srw_beamline(self.__base_srw_beamline.get_light_source())
+            else:
+                srw_beamline = self.__base_srw_beamline.duplicate()
+
+            for node in self.get_nodes(): node.__append_to(srw_beamline)
+
+            self.__srw_beamline = srw_beamline
+
+        return self.__srw_beamline
+
+    # single-element beamline, used to propagate the whole beamline one element at a time
+    def to_stage_srw_beamline(self):
+        if self.__stage_srw_beamline is None:
+            stage_srw_beamline = create_srw_beamline()
+
+            self.__append_to(stage_srw_beamline)
+
+            self.__stage_srw_beamline = stage_srw_beamline
+
+        return self.__stage_srw_beamline
+
+    def __append_to(self, srw_beamline):
+        srw_beamline.append_beamline_element(self.__beamline_element)
+
+        for wavefront_propagation_parameters in self.__wavefront_propagation_parameters:
+            srw_beamline.append_wavefront_propagation_parameters(*wavefront_propagation_parameters)
+
+class SRWMacroElectrons(object):
+    '''
+    Batch of a multi-electron Monte Carlo: one light source for each macro-electron, sampled by the source widget
+    from independent random streams, and the parameters of the source wavefront. The downstream elements are
+    appended to the beamline as usual, the batch is propagated and reduced by the accumulation point.
+    '''
+
+    def __init__(self, light_sources=[], source_wavefront_parameters=None, number_of_workers=None, seed=None):
+        self.__light_sources = light_sources
+        self.__source_wavefront_parameters = source_wavefront_parameters
+        self.__number_of_workers = number_of_workers
+        self.__seed = seed
+
+    def get_light_sources(self):
+        return self.__light_sources
+
+    def get_source_wavefront_parameters(self):
+        return self.__source_wavefront_parameters
+
+    def get_number_of_workers(self):
+        return self.__number_of_workers
+
+    def get_seed(self):
+        return self.__seed
+
+    def __len__(self):
+        return len(self.__light_sources)
+
+class SRWCoherentModes(object):
+    '''
+    Batch of coherent modes: the wavefronts of the modes of the source, with their weights (adding up to 1), built
+    by the source widget. The downstream elements are appended to the beamline as usual, each mode is propagated
+    and the accumulation point sums their intensities, weighted.
+    '''
+
+    def __init__(self, wavefronts=[], weights=[], number_of_workers=None, coherent_fraction=None):
+        self.__wavefronts = wavefronts
+        self.__weights = weights
+        self.__number_of_workers = number_of_workers
+        self.__coherent_fraction = coherent_fraction
+
+    def get_wavefronts(self):
+        return self.__wavefronts
+
+    def get_weights(self):
+        return self.__weights
+
+    def get_number_of_workers(self):
+        return self.__number_of_workers
+
+    def get_coherent_fraction(self):
+        return self.__coherent_fraction
+
+    def __len__(self):
+        return len(self.__wavefronts)
+
 class SRWData(object):
-    def __init__(self, srw_beamline=SRWBeamline(), srw_wavefront=SRWWavefront()):
+    def __init__(self, srw_beamline=None, srw_wavefront=SRWWavefront()):
         super().__init__()
 
-        self.__srw_beamline = srw_beamline
+        if srw_beamline is None: srw_beamline = create_srw_beamline()
+
+        self.__srw_beamline = srw_beamline if isinstance(srw_beamline, SRWPersistentBeamline) else SRWPersistentBeamline(srw_beamline)
         self.__srw_wavefront = srw_wavefront
+        self.__working_srw_beamline = None
 
     def get_srw_beamline(self):
+        return self.__srw_beamline.to_srw_beamline()
+
+    def get_persistent_srw_beamline(self):
         return self.__srw_beamline
 
     def get_srw_wavefront(self):
         return self.__srw_wavefront
 
     def reset_working_srw_beamline(self):
-        if hasattr(self, "__working_srw_beamline"): self.__working_srw_beamline = SRWBeamline(light_source=None)
+        self.__working_srw_beamline = SRWPersistentBeamline(create_srw_beamline())
 
     def get_working_srw_beamline(self):
-        if hasattr(self, "__working_srw_beamline"): return self.__working_srw_beamline
-        else: return self.__srw_beamline.duplicate()
+        return self.get_persistent_working_srw_beamline().to_srw_beamline()
+
+    def get_persistent_working_srw_beamline(self):
+        return self.__srw_beamline if self.__working_srw_beamline is None else self.__working_srw_beamline
 
     def set_working_srw_beamline(self, working_srw_beamline):
-        self.__working_srw_beamline = working_srw_beamline
+        self.__working_srw_beamline = working_srw_beamline if isinstance(working_srw_beamline, SRWPersistentBeamline) else SRWPersistentBeamline(working_srw_beamline)
+
+    # single-element beamlines, one for each element appended to the working beamline, used to checkpoint the whole beamline propagation
+    def get_working_srw_stages(self):
+        return [node.to_stage_srw_beamline() for node in self.get_persistent_working_srw_beamline().get_nodes()]
+
+class SRWScanData(SRWData):
+    '''
+    Results of a scan executed in parallel: one SRWData for each value of the scanned variable, in scan order.
+    Widgets unaware of scans see it as the last of them.
+    '''
+
+    def __init__(self, srw_data_list, number_of_workers=None):
+        if len(srw_data_list) == 0: raise ValueError("A scan has at least one result")
+
+        super().__init__(srw_beamline=srw_data_list[-1].get_persistent_srw_beamline(),
+                         srw_wavefront=srw_data_list[-1].get_srw_wavefront())
+
+        self.set_working_srw_beamline(srw_data_list[-1].get_persistent_working_srw_beamline())
+
+        self.__srw_data_list = srw_data_list
+        self.__number_of_workers = number_of_workers
+
+    def get_srw_data_list(self):
+        return self.__srw_data_list
+
+    def get_number_of_workers(self):
+        return self.__number_of_workers
+
+class SRWCopyOnWritePropagationParameters(PropagationParameters):
+    '''
+    The wavefront received from the upstream widget is shared by all the widgets connected to it: since the SRW
+    propagators modify the electric field in place, a private copy is created only when the wavefront is actually
+    requested for the propagation, so cached or skipped propagations never duplicate the field buffers. A wavefront
+    that is already private (e.g. unpickled in a worker, or the output of the previous propagation) is not copied.
+    '''
+    def __init__(self, wavefront=None, propagation_elements=None, copy_wavefront=True):
+        super().__init__(wavefront=None, propagation_elements=propagation_elements)
+
+        self.__shared_wavefront = wavefront
+        self.__writable_wavefront = None if copy_wavefront else wavefront
+
+    def get_wavefront(self):
+        if self.__writable_wavefront is None and not self.__shared_wavefront is None:
+            self.__writable_wavefront = self.__shared_wavefront.duplicate()
+
+        return self.__writable_wavefront
+
+    def get_shared_wavefront(self):
+        return self.__shared_wavefront
+
+    def is_copied(self):
+        return not self.__writable_wavefront is None and not self.__writable_wavefront is self.__shared_wavefront
 
 class SRWErrorProfileData:
        NONE = "None"
@@ -0,0 +1,349 @@
+import numpy
+from scipy.interpolate import RegularGridInterpolator
+from scipy.integrate import trapezoid
+
+from wofrysrw.propagator.wavefront2D.srw_wavefront import WavefrontParameters
+
+from orangecontrib.srw.util import srw_engine, srw_trajectory
+from orangecontrib.srw.util.srw_profiler import SRWProfiler
+
+#########################################################################################
+#
+# ADAPTIVE POWER DENSITY: the screen is split in coarse cells, each one calculated by SRW
+# on a small regular mesh. A cell is subdivided in 4 when the power integrated on its
+# mesh differs from the one integrated on every other point (trapezoidal rule, the
+# Richardson estimate of the integration error) by more than its share of the tolerance,
+# or when the power density changes between two neighbouring points by more than a
+# fraction of the peak. The cells of each refinement level are calculated in the
+# process pool. The leaves of the quadtree cover the screen: the total power is the sum
+# of their integrals, the error estimate the sum of their Richardson estimates (not a
+# bound: it assumes the integrand smooth on the cell mesh).
+#
+# The nodes of all the cells lie on the lattice of the finest refinement level, and the
+# power density is kept by integer lattice coordinates: the nodes a cell shares with
+# its parent or with the neighbouring cells are not calculated again. The missing nodes
+# of a refinement level are calculated in a few regular meshes across the cells (SRW
+# convolves the power density with the electron beam on the mesh it is given: a node
+# differs from the one of another mesh within the accuracy of the convolution).
+#
+#########################################################################################
+
+MINIMUM_CELL_POINTS = 3
+
+class SRWPowerDensityLattice(object):
+    '''
+    Nodes of the finest refinement level, by integer coordinates (i, j) from (0, 0) to (i_last, j_last): position
+    h_start + i*h_step, v_start + j*v_step. The power density is stored for the nodes already calculated.
+    '''
+    def __init__(self, h_start, h_step, i_last, v_start, v_step, j_last):
+        self.h_start = h_start
+        self.h_step = h_step
+        self.i_last = i_last
+        self.v_start = v_start
+        self.v_step = v_step
+        self.j_last = j_last
+
+        self.__power_density = {}
+
+    def get_h(self, i):
+        return self.h_start + numpy.asarray(i)*self.h_step
+
+    def get_v(self, j):
+        return self.v_start + numpy.asarray(j)*self.v_step
+
+    def get_number_of_nodes(self):
+        return len(self.__power_density)
+
+    def __contains__(self, node):
+        return node in self.__power_density
+
+    def get_power_density(self, i_indexes, j_indexes):
+        return numpy.array([[self.__power_density[(i, j)] for j in j_indexes] for i in i_indexes])
+
+    def set_power_density(self, i_indexes, j_indexes, power_density):
+        '''
+        Stores the nodes not calculated yet: the first calculation of a node is kept
+        '''
+        for a, i in enumerate(i_indexes):
+            for b, j in enumerate(j_indexes):
+                self.__power_density.setdefault((i, j), float(power_density[a, b]))
+
+    def get_missing_meshes(self, cells, cell_points):
+        '''
+        Regular meshes (i_indexes, j_indexes), of at least 2 x 2 nodes, covering the nodes of the cells (of the same
+        refinement level) not calculated yet: the columns with the same missing rows are calculated together, across
+        the cells
+        '''
+        missing_rows = {}
+
+        for cell in cells:
+            i_indexes, j_indexes = cell.get_node_indexes(cell_points)
+
+            for i in i_indexes: missing_rows.setdefault(int(i), set()).update([int(j) for j in j_indexes if not (i, j) in self])
+
+        missing_columns = {}
+        for i in sorted(missing_rows.keys()):
+            if len(missing_rows[i]) > 0: missing_columns.setdefault(tuple(sorted(missing_rows[i])), []).append(i)
+
+        step = (cells[0].i_max - cells[0].i_min)//(cell_points - 1), (cells[0].j_max - cells[0].j_min)//(cell_points - 1)
+
+        return [(numpy.array(i_run), numpy.array(j_run)) for rows, columns in missing_columns.items()
+                                                         for i_run in _get_regular_runs(columns, step[0], self.i_last)
+                                                         for j_run in _get_regular_runs(list(rows), step[1], self.j_last)]
+
+class SRWPowerDensityCell(object):
+    '''
+    Cell [i_min, i_max] x [j_min, j_max] of the lattice
+    '''
+    def __init__(self, lattice, i_min, i_max, j_min, j_max, depth=0):
+        self.lattice = lattice
+        self.i_min = i_min
+        self.i_max = i_max
+        self.j_min = j_min
+        self.j_max = j_max
+        self.depth = depth
+
+        self.h_min, self.h_max = float(lattice.get_h(i_min)), float(lattice.get_h(i_max))
+        self.v_min, self.v_max = float(lattice.get_v(j_min)), float(lattice.get_v(j_max))
+
+        self.h = None
+        self.v = None
+        self.power_density = None
+
+    def get_area(self):
+        return (self.h_max - self.h_min)*(self.v_max - self.v_min)
+
+    def get_node_indexes(self, cell_points):
+        return numpy.linspace(self.i_min, self.i_max, cell_points).astype(int), \
+               numpy.linspace(self.j_min, self.j_max, cell_points).astype(int)
+
+    def set_power_density(self, cell_points):
+        i_indexes, j_indexes = self.get_node_indexes(cell_points)
+
+        self.h = self.lattice.get_h(i_indexes)
+        self.v = self.lattice.get_v(j_indexes)
+        self.power_density = self.lattice.get_power_density(i_indexes, j_indexes)
+
+    def get_power(self):
+        return _integrate(self.h, self.v, self.power_density)
+
+    def get_error_estimate(self):
+        '''
+        Richardson estimate of the integration error: the difference with the integral on every other point, over 3
+        '''
+        return abs(self.get_power() - _integrate(self.h[::2], self.v[::2], self.power_density[::2, ::2]))/3
+
+    def get_maximum_variation(self):
+        return max(numpy.max(numpy.abs(numpy.diff(self.power_density, axis=0))),
+                   numpy.max(numpy.abs(numpy.diff(self.power_density, axis=1))))
+
+    def subdivide(self):
+        i_c = (self.i_min + self.i_max)//2
+        j_c = (self.j_min + self.j_max)//2
+
+        return [SRWPowerDensityCell(self.lattice, self.i_min, i_c, self.j_min, j_c, self.depth + 1),
+                SRWPowerDensityCell(self.lattice, i_c, self.i_max, self.j_min, j_c, self.depth + 1),
+                SRWPowerDensityCell(self.lattice, self.i_min, i_c, j_c, self.j_max, self.depth + 1),
+                SRWPowerDensityCell(self.lattice, i_c, self.i_max, j_c, self.j_max, self.depth + 1)]
+
+class SRWPowerDensityQuadtree(object):
+    '''
+    Leaves of the adaptive calculation: power density in W/mm^2, positions in m
+    '''
+    def __init__(self, leaves, number_of_evaluations):
+        self.__leaves = leaves
+        self.__number_of_evaluations = number_of_evaluations
+
+    def get_leaves(self):
+        return self.__leaves
+
+    def get_number_of_cells(self):
+        return len(self.__leaves)
+
+    def get_number_of_evaluations(self):
+        return self.__number_of_evaluations
+
+    def get_maximum_depth(self):
+        return max([leaf.depth for leaf in self.__leaves])
+
+    def get_total_power(self):
+        return sum([leaf.get_power() for leaf in self.__leaves])
+
+    def get_error_estimate(self):
+        return sum([leaf.get_error_estimate() for leaf in self.__leaves])
+
+    def get_peak_power_density(self):
+        return max([numpy.max(leaf.power_density) for leaf in self.__leaves])
+
+    def resample(self, h, v, conserve_power=True):
+        '''
+        Power density on the regular grid h x v [h, v], linearly interpolated in the leaves. If conserve_power, the
+        power density is scaled to give the total power of the quadtree with SRWLightSource.get_total_power_from_power_density
+        '''
+        power_density = numpy.zeros((len(h), len(v)))
+
+        for leaf in self.__leaves:
+            h_indexes = numpy.where(numpy.logical_and(h >= leaf.h_min, h <= leaf.h_max))[0]
+            v_indexes = numpy.where(numpy.logical_and(v >= leaf.v_min, v <= leaf.v_max))[0]
+
+            if len(h_indexes) > 0 and len(v_indexes) > 0:
+                interpolator = RegularGridInterpolator((leaf.h, leaf.v), leaf.power_density, bounds_error=False, fill_value=None)
+                h_mesh, v_mesh = numpy.meshgrid(h[h_indexes], v[v_indexes], indexing="ij")
+
+                power_density[numpy.ix_(h_indexes, v_indexes)] = interpolator((h_mesh, v_mesh))
+
+        if conserve_power:
+            grid_power = get_grid_power(h, v, power_density)
+
+            if grid_power > 0.0: power_density *= self.get_total_power()/grid_power
+
+        return power_density
+
+    def get_info(self, uniform_points=None):
+        text = "Adaptive power density: " + str(self.get_number_of_cells()) + " cells, maximum depth " + str(self.get_maximum_depth()) + ", " + \
+               str(self.get_number_of_evaluations()) + " points calculated"
+        if not uniform_points is None:
+            text += " (uniform mesh with the finest resolution: " + str(uniform_points) + " points)"
+        text += "\nTotal power: " + "{:.6e}".format(self.get_total_power()) + " W, Richardson error estimate: " + "{:.3e}".format(self.get_error_estimate()) + " W"
+
+        return text
+
+def get_grid_power(h, v, power_density):
+    # as SRWLightSource.get_total_power_from_power_density
+    return numpy.sum(power_density)*numpy.abs(h[1] - h[0])*numpy.abs(v[1] - v[0])*1e6
+
+def calculate_adaptive_power_density(srw_source, h_slit_gap, v_slit_gap, distance, power_density_precision_parameters,
+                                     initial_cells_h=4, initial_cells_v=4, cell_points=5, tolerance=1e-3, gradient_tolerance=0.1,
+                                     maximum_depth=5, max_workers=None, callback=None, h_position=0.0, v_position=0.0, trajectory=None, wait_callback=None):
+    '''
+    Returns an SRWPowerDensityQuadtree: tolerance is relative to the total power, gradient_tolerance to the peak power
+    density. callback(depth, number_of_cells, total_power, error_estimate) is called after each refinement level. All
+    the cells are calculated on the electron trajectory (see srw_trajectory, calculated by SRW if None). wait_callback
+    is called while waiting for the workers (see srw_engine.map_in_pool).
+    '''
+    cell_points = max(cell_points + (cell_points + 1) % 2, MINIMUM_CELL_POINTS) # odd, to integrate on every other point
+
+    # the initial cells span (cell_points - 1)*2^maximum_depth lattice steps: the cells of every level have their nodes on the lattice
+    cell_span = (cell_points - 1)*2**maximum_depth
+
+    lattice = SRWPowerDensityLattice(h_position - 0.5*h_slit_gap, h_slit_gap/(initial_cells_h*cell_span), initial_cells_h*cell_span,
+                                     v_position - 0.5*v_slit_gap, v_slit_gap/(initial_cells_v*cell_span), initial_cells_v*cell_span)
+
+    cells = [SRWPowerDensityCell(lattice, i*cell_span, (i + 1)*cell_span, j*cell_span, (j + 1)*cell_span) for j in range(initial_cells_v) for i in range(initial_cells_h)]
+    leaves = []
+
+    total_area = h_slit_gap*v_slit_gap
+    number_of_evaluations = 0
+    depth = 0
+
+    while len(cells) > 0:
+        number_of_evaluations += _calculate_cells(srw_source, lattice, cells, cell_points, distance, power_density_precision_parameters, max_workers, trajectory, wait_callback)
+
+        leaves.extend(cells)
+
+        total_power = sum([leaf.get_power() for leaf in leaves])
+        peak        = max([numpy.max(leaf.power_density) for leaf in leaves])
+
+        if not callback is None: callback(depth, len(leaves), total_power, sum([leaf.get_error_estimate() for leaf in leaves]))
+
+        if depth == maximum_depth: break
+
+        refined_cells = [cell for cell in cells if cell.get_error_estimate() > tolerance*abs(total_power)*cell.get_area()/total_area or
+                                                   cell.get_maximum_variation() > gradient_tolerance*peak]
+
+        for cell in refined_cells: leaves.remove(cell)
+
+        cells = [child for cell in refined_cells for child in cell.subdivide()]
+        depth += 1
+
+    return SRWPowerDensityQuadtree(leaves, number_of_evaluations)
+
+def get_uniform_points(quadtree, h_slit_gap, v_slit_gap, cell_points):
+    '''
+    Number of points of a uniform mesh with the resolution of the finest cells
+    '''
+    finest = [leaf for leaf in quadtree.get_leaves() if leaf.depth == quadtree.get_maximum_depth()][0]
+
+    return int(round(h_slit_gap/(finest.h_max - finest.h_min)*(cell_points - 1) + 1)*round(v_slit_gap/(finest.v_max - finest.v_min)*(cell_points - 1) + 1))
+
+# calculates the missing nodes of the cells, returning the number of points calculated
+def _calculate_cells(srw_source, lattice, cells, cell_points, distance, power_density_precision_parameters, max_workers, trajectory=None, wait_callback=None):
+    meshes = lattice.get_missing_meshes(cells, cell_points)
+    mesh_ranges = [(lattice.get_h(i_indexes[[0, -1]]), len(i_indexes), lattice.get_v(j_indexes[[0, -1]]), len(j_indexes)) for i_indexes, j_indexes in meshes]
+
+    if max_workers == 1 or len(meshes) <= 1:
+        results = []
+
+        for h_range, h_points, v_range, v_points in mesh_ranges:
+            if not wait_callback is None: wait_callback()
+
+            results.append(_calculate_mesh(srw_source, h_range, h_points, v_range, v_points, distance, power_density_precision_parameters, False, trajectory))
+    else:
+        profiler = SRWProfiler.Instance()
+
+        results = srw_engine.map_in_pool(_calculate_mesh,
+                                         [srw_source]*len(meshes),
+                                         *zip(*mesh_ranges),
+                                         [distance]*len(meshes),
+                                         [power_density_precision_parameters]*len(meshes),
+                                         [profiler.is_enabled()]*len(meshes),
+                                         [trajectory]*len(meshes),
+                                         max_workers=max_workers,
+                                         wait_callback=wait_callback)
+
+        for _, events in results: profiler.add_events(events)
+
+    for (i_indexes, j_indexes), (power_density, _) in zip(meshes, results): lattice.set_power_density(i_indexes, j_indexes, power_density)
+    for cell in cells: cell.set_power_density(cell_points)
+
+    return sum([len(i_indexes)*len(j_indexes) for i_indexes, j_indexes in meshes])
+
+# runs in the worker process
+def _calculate_mesh(srw_source, h_range, h_points, v_range, v_points, distance, power_density_precision_parameters, profile, trajectory=None):
+    profiler = SRWProfiler.Instance()
+    profiler.set_enabled(profile)
+
+    with profiler.stage("Power Density Cell", "engine"):
+        _, _, power_density = srw_trajectory.get_power_density(srw_source,
+                                                               source_wavefront_parameters=WavefrontParameters(photon_energy_min=0.0,
+                                                                                                               photon_energy_max=0.0,
+                                                                                                               photon_energy_points=1,
+                                                                                                               h_slit_gap=h_range[1] - h_range[0],
+                                                                                                               v_slit_gap=v_range[1] - v_range[0],
+                                                                                                               h_slit_points=h_points,
+                                                                                                               v_slit_points=v_points,
+                                                                                                               h_position=0.5*(h_range[0] + h_range[1]),
+                                                                                                               v_position=0.5*(v_range[0] + v_range[1]),
+                                                                                                               distance=distance),
+                                                               power_density_precision_parameters=power_density_precision_parameters,
+                                                               trajectory=trajectory)
+
+    return power_density, profiler.pop_events()
+
+def _get_regular_runs(indexes, step, last):
+    '''
+    Splits the sorted lattice indexes in runs of constant step: a single index is completed with its neighbour at
+    step (within 0, last), as SRW needs 2 points per side at least
+    '''
+    runs = []
+    start = 0
+
+    while start < len(indexes):
+        stop = start + 1
+
+        if stop < len(indexes):
+            run_step = indexes[stop] - indexes[start]
+
+            while stop < len(indexes) and indexes[stop] - indexes[stop - 1] == run_step: stop += 1
+
+        run = indexes[start:stop]
+
+        if len(run) == 1: run = [run[0], run[0] + step] if run[0] + step <= last else [run[0] - step, run[0]]
+
+        runs.append(run)
+        start = stop
+
+    return runs
+
+def _integrate(h, v, power_density): # W, with h, v in m and the power density in W/mm^2
+    return trapezoid(trapezoid(power_density, v, axis=1), h)*1e6
@@ -0,0 +1,144 @@
+import copy
+from array import array
+
+import numpy
+
+from wofrysrw.propagator.wavefront2D.srw_wavefront import SRWWavefront, PolarizationComponent, FluxCalculationParameters, CalculationType, TypeOfDependence
+
+#########################################################################################
+#
+# PRECISION OF THE WAVEFRONT DATA: SRW stores the electric field in single precision
+# (complex64) and calculates the intensity in single precision (float32 output only), in
+# SINGLE mode intensities and phases stay float32 through tickets and accumulation.
+#
+#########################################################################################
+
+class SRWPrecision:
+    DOUBLE = 0
+    SINGLE = 1
+
+    @classmethod
+    def tuple(cls):
+        return ["Double (float64)", "Single (float32)"]
+
+# precision of the data extracted in this process when not given explicitly: double, unless changed by the
+# preference of the GUI (see the SRW Tools menu); calculations in other processes receive it as a parameter
+_precision = SRWPrecision.DOUBLE
+
+def get_precision():
+    return _precision
+
+def set_precision(precision):
+    global _precision
+
+    _precision = precision
+
+# default tolerance of the relative error of the single precision pipeline (see get_relative_error)
+ACCURACY_TOLERANCE = 1e-3
+
+def get_float_type(precision=None):
+    if precision is None: precision = get_precision()
+
+    return numpy.float32 if precision == SRWPrecision.SINGLE else numpy.float64
+
+def get_intensity(wavefront, multi_electron=True, polarization_component_to_be_extracted=PolarizationComponent.TOTAL, type_of_dependence=TypeOfDependence.VS_XY, precision=None, distribution=None):
+    '''
+    As SRWWavefront.get_intensity, with the intensity vs. X,Y calculated and stored in the requested precision. If
+    distribution [energy, horizontal, vertical] is given (e.g. the data of an SRWSliceStore), each energy slice is
+    written in it as soon as it is calculated.
+    '''
+    if type_of_dependence != TypeOfDependence.VS_XY:
+        return wavefront.get_intensity(multi_electron=multi_electron, polarization_component_to_be_extracted=polarization_component_to_be_extracted, type_of_dependence=type_of_dependence)
+
+    flux_calculation_parameters = FluxCalculationParameters(calculation_type=CalculationType.MULTI_ELECTRON_INTENSITY if multi_electron else CalculationType.SINGLE_ELECTRON_INTENSITY,
+                                                            polarization_component_to_be_extracted=polarization_component_to_be_extracted,
+                                                            type_of_dependence=TypeOfDependence.VS_XY)
+
+    return _get_2D_distribution(wavefront, 'f', flux_calculation_parameters, get_float_type(precision), distribution)
+
+def get_phase(wavefront, polarization_component_to_be_extracted=PolarizationComponent.TOTAL, precision=None, distribution=None):
+    '''
+    As SRWWavefront.get_phase, with the phase array in the requested precision
+    '''
+    flux_calculation_parameters = FluxCalculationParameters(calculation_type=CalculationType.SINGLE_ELECTRON_PHASE,
+                                                            polarization_component_to_be_extracted=polarization_component_to_be_extracted,
+                                                            type_of_dependence=TypeOfDependence.VS_XY)
+
+    return _get_2D_distribution(wavefront, 'd', flux_calculation_parameters, get_float_type(precision), distribution)
+
+def get_intensity_slices(wavefront, multi_electron=True, polarization_component_to_be_extracted=PolarizationComponent.TOTAL, precision=None):
+    '''
+    The intensity vs. X,Y of each photon energy, in the requested precision, as (photon energy, intensity [horizontal,
+    vertical]): one energy slice in memory at a time
+    '''
+    flux_calculation_parameters = FluxCalculationParameters(calculation_type=CalculationType.MULTI_ELECTRON_INTENSITY if multi_electron else CalculationType.SINGLE_ELECTRON_INTENSITY,
+                                                            polarization_component_to_be_extracted=polarization_component_to_be_extracted,
+                                                            type_of_dependence=TypeOfDependence.VS_XY)
+
+    return _get_2D_slices(wavefront, 'f', flux_calculation_parameters, get_float_type(precision))
+
+# same layout of SRWWavefront.get_2D_intensity_distribution: [energy, horizontal, vertical]
+def _get_2D_distribution(wavefront, type, flux_calculation_parameters, float_type, distribution=None):
+    mesh = wavefront.mesh
+
+    h_array = numpy.linspace(mesh.xStart, mesh.xFin, mesh.nx)
+    v_array = numpy.linspace(mesh.yStart, mesh.yFin, mesh.ny)
+    e_array = numpy.linspace(mesh.eStart, mesh.eFin, mesh.ne)
+
+    if distribution is None: distribution = numpy.zeros((e_array.size, h_array.size, v_array.size), dtype=float_type)
+    elif distribution.shape != (e_array.size, h_array.size, v_array.size): raise ValueError("Distribution with a shape different from the wavefront mesh")
+
+    for ie, (_, distribution_slice) in enumerate(_get_2D_slices(wavefront, type, flux_calculation_parameters, float_type)):
+        distribution[ie, :, :] = distribution_slice
+
+    return e_array, h_array, v_array, distribution
+
+def _get_2D_slices(wavefront, type, flux_calculation_parameters, float_type):
+    mesh = copy.deepcopy(wavefront.mesh)
+
+    e_array = numpy.linspace(mesh.eStart, mesh.eFin, mesh.ne)
+
+    total_length = mesh.nx*mesh.ny
+
+    for ie in range(e_array.size):
+        output_array = array(type, [0]*total_length)
+
+        flux_calculation_parameters._fixed_input_photon_energy_or_time = e_array[ie]
+
+        SRWWavefront.get_intensity_from_electric_field(output_array, wavefront, flux_calculation_parameters)
+
+        output_array = numpy.frombuffer(output_array, dtype=type)[:total_length]
+
+        distribution_slice = numpy.zeros((mesh.nx, mesh.ny), dtype=float_type)
+        distribution_slice.T.flat[:output_array.size] = output_array
+
+        yield e_array[ie], distribution_slice
+
+def get_relative_error(wavefront, multi_electron=False, number_of_wavefronts=100):
+    '''
+    Relative error of the single precision pipeline, with respect to the double precision one, on the same wavefront:
+    intensity extraction, projections and integrated intensity of the plots, average of number_of_wavefronts
+    accumulated intensities (as in the multi-electron calculations). Returns the L2 norms of the differences of the
+    distribution, of the projections and of the average, and the error of the integrated intensity.
+    '''
+    single = _run_pipeline(wavefront, multi_electron, number_of_wavefronts, SRWPrecision.SINGLE)
+    double = _run_pipeline(wavefront, multi_electron, number_of_wavefronts, SRWPrecision.DOUBLE)
+
+    return tuple(_get_relative_error(result_single, result_double) for result_single, result_double in zip(single, double))
+
+# distribution, projections and integrated intensity as in SRWPlot.get_ticket_2D, average as in SRWIntensityAccumulator
+def _run_pipeline(wavefront, multi_electron, number_of_wavefronts, precision):
+    _, _, _, intensity = get_intensity(wavefront, multi_electron=multi_electron, precision=precision)
+
+    projections = numpy.concatenate((intensity.sum(axis=2).ravel(), intensity.sum(axis=1).ravel()))
+    total       = numpy.sum(intensity)
+
+    accumulated = numpy.array(intensity)
+    for _ in range(number_of_wavefronts - 1): accumulated += intensity
+
+    return intensity, projections, accumulated/float(number_of_wavefronts), total
+
+def _get_relative_error(result_single, result_double):
+    norm = numpy.linalg.norm(result_double)
+
+    return 0.0 if norm == 0.0 else float(numpy.linalg.norm(numpy.asarray(result_single, dtype=numpy.float64) - result_double)/norm)
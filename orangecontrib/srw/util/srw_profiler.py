@@ -0,0 +1,154 @@
+import os, sys, time, json, threading, functools
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+#########################################################################################
+#
+# PROFILING OF THE PROPAGATION CHAIN: wall time, CPU time and memory of each stage, as
+# "complete" events of the Chrome Trace Event format (chrome://tracing, Perfetto)
+#
+#########################################################################################
+
+def get_rss():
+    try:
+        with open("/proc/self/statm") as statm: return int(statm.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+def get_peak_rss():
+    if resource is None: return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak_rss if sys.platform == "darwin" else peak_rss*1024 # bytes on macOS, kB on Linux
+
+def _to_MB(value):
+    return None if value is None else round(value/1024**2, 1)
+
+class SRWProfiler(object):
+
+    @classmethod
+    def Instance(cls):
+        if not "_instance" in cls.__dict__: cls._instance = cls()
+
+        return cls._instance
+
+    def __init__(self):
+        self.__enabled = False
+        self.__events = []
+        self.__lock = threading.Lock()
+
+    def is_enabled(self):
+        return self.__enabled
+
+    def set_enabled(self, enabled=True):
+        self.__enabled = enabled
+
+    # the yielded dictionary can be filled with further arguments of the event (e.g. the mesh after the stage)
+    @contextmanager
+    def stage(self, name, category="srw", **arguments):
+        if not self.__enabled:
+            yield arguments
+        else:
+            start = time.time()
+            start_cpu_time = time.process_time()
+
+            try:
+                yield arguments
+            finally:
+                self.add_event(name, category, start, time.time() - start, time.process_time() - start_cpu_time, **arguments)
+
+    def add_event(self, name, category, start, duration, cpu_time, **arguments):
+        arguments["cpu_time_ms"] = round(cpu_time*1e3, 3)
+        arguments["rss_MB"] = _to_MB(get_rss())
+        arguments["peak_rss_MB"] = _to_MB(get_peak_rss())
+
+        with self.__lock:
+            self.__events.append({"name" : name,
+                                  "cat"  : category,
+                                  "ph"   : "X",
+                                  "ts"   : start*1e6,
+                                  "dur"  : duration*1e6,
+                                  "pid"  : os.getpid(),
+                                  "tid"  : threading.get_ident(),
+                                  "args" : arguments})
+
+    # events recorded in another process (workers)
+    def add_events(self, events):
+        with self.__lock:
+            self.__events.extend(events)
+
+    def get_events(self):
+        with self.__lock:
+            return list(self.__events)
+
+    def pop_events(self):
+        with self.__lock:
+            events, self.__events = self.__events, []
+
+        return events
+
+    def clear(self):
+        with self.__lock:
+            self.__events = []
+
+    def to_chrome_trace(self):
+        events = self.get_events()
+
+        metadata = [{"name" : "process_name", "ph" : "M", "pid" : pid, "args" : {"name" : "OASYS" if pid == os.getpid() else "SRW Worker " + str(pid)}}
+                    for pid in sorted(set([event["pid"] for event in events]))]
+
+        return {"traceEvents" : metadata + sorted(events, key=lambda event: event["ts"]), "displayTimeUnit" : "ms"}
+
+    def save(self, file_name):
+        with open(file_name, "w") as file:
+            json.dump(self.to_chrome_trace(), file, indent=1)
+
+    def get_summary_text(self):
+        summary = {}
+
+        for event in self.get_events():
+            count, wall_time, cpu_time, peak_rss = summary.get(event["name"], (0, 0.0, 0.0, 0.0))
+
+            summary[event["name"]] = (count + 1,
+                                      wall_time + event["dur"]*1e-3,
+                                      cpu_time + event["args"].get("cpu_time_ms", 0.0),
+                                      max(peak_rss, event["args"].get("peak_rss_MB") or 0.0))
+
+        text = "Stage".ljust(60) + "Calls".rjust(8) + "Wall [ms]".rjust(14) + "CPU [ms]".rjust(14) + "Peak RSS [MB]".rjust(16) + "\n"
+
+        for name, (count, wall_time, cpu_time, peak_rss) in sorted(summary.items(), key=lambda item: -item[1][1]):
+            text += name[:59].ljust(60) + str(count).rjust(8) + str(round(wall_time, 1)).rjust(14) + str(round(cpu_time, 1)).rjust(14) + str(peak_rss).rjust(16) + "\n"
+
+        return text
+
+def profiled(stage_name, category="widget"):
+    '''
+    Decorator of widget methods: each run is recorded as a stage named after the widget. Overrides decorated
+    with the same stage name and calling super() are recorded once.
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = SRWProfiler.Instance()
+
+            running_stages = self.__dict__.setdefault("_profiled_running_stages", set())
+
+            if not profiler.is_enabled() or stage_name in running_stages:
+                return method(self, *args, **kwargs)
+            else:
+                running_stages.add(stage_name)
+
+                try:
+                    with profiler.stage((self.windowTitle() if hasattr(self, "windowTitle") else type(self).__name__) + ": " + stage_name, category):
+                        return method(self, *args, **kwargs)
+                finally:
+                    running_stages.discard(stage_name)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,129 @@
+import numpy
+from contextlib import contextmanager
+
+from oasys.util.oasys_util import get_average
+
+from wofrysrw.propagator.wavefront2D.srw_wavefront import SRWWavefront
+
+from orangecontrib.srw.util.srw_util import SRWPlot
+from orangecontrib.srw.util import srw_precision
+
+#########################################################################################
+#
+# SENSITIVITY ANALYSIS: central finite differences of the beam statistics at the final
+# screen, with respect to the parameters of an optical element. The variants are
+# propagated as a parallel scan (SRWScanData): for each parameter the values
+# nominal - step and nominal + step, followed by the nominal one.
+#
+#########################################################################################
+
+NOMINAL = "Nominal"
+
+# options of the element switched on by setting one of the variables (see set_scanned_variable)
+SCANNED_VARIABLES_OPTIONS = ["has_displacement"]
+
+STATISTICS = [
+    ["fwhm_h",     "FWHM H",            "μm"],
+    ["fwhm_v",     "FWHM V",            "μm"],
+    ["sigma_h",    "Sigma H",           "μm"],
+    ["sigma_v",    "Sigma V",           "μm"],
+    ["centroid_h", "Centroid H",        "μm"],
+    ["centroid_v", "Centroid V",        "μm"],
+    ["peak",       "Peak Intensity",    "ph/s/.1%bw/mm²"],
+]
+
+def get_sensitivity_scanning_data_list(sensitivity_variables, nominal_values):
+    '''
+    Scanning data of the variants, in propagation order: sensitivity_variables is a list of
+    (variable name, display name, unit, step), nominal_values the values of the variables in the element
+    '''
+    scanning_data_list = []
+
+    for (variable_name, variable_display_name, variable_um, step), nominal_value in zip(sensitivity_variables, nominal_values):
+        scanning_data_list.append(SRWWavefront.ScanningData(variable_name, nominal_value - step, variable_display_name, variable_um))
+        scanning_data_list.append(SRWWavefront.ScanningData(variable_name, nominal_value + step, variable_display_name, variable_um))
+
+    scanning_data_list.append(SRWWavefront.ScanningData(None, None, NOMINAL, ""))
+
+    return scanning_data_list
+
+@contextmanager
+def nominal_values_restored(element, variable_names):
+    '''
+    Restores, on exit, the nominal values of the variables perturbed in the element and of the options set by them
+    '''
+    nominal_values = {variable_name : getattr(element, variable_name) for variable_name in list(variable_names) + SCANNED_VARIABLES_OPTIONS if hasattr(element, variable_name)}
+
+    try:
+        yield nominal_values
+    finally:
+        for variable_name, nominal_value in nominal_values.items(): setattr(element, variable_name, nominal_value)
+
+def is_sensitivity_analysis(wavefronts):
+    if len(wavefronts) < 3 or len(wavefronts) % 2 == 0: return False
+
+    scanning_data = wavefronts[-1].scanned_variable_data
+
+    return not scanning_data is None and scanning_data.get_scanned_variable_name() is None and scanning_data.get_scanned_variable_display_name() == NOMINAL
+
+def get_beam_statistics(wavefront, multi_electron=False):
+    e, h, v, i = srw_precision.get_intensity(wavefront, multi_electron=multi_electron)
+
+    if len(e) <= 1:
+        ticket = SRWPlot.get_ticket_2D(h*1e6, v*1e6, i[int(e.size/2)])
+    else:
+        delta_e = e[1] - e[0]
+        for j in range(len(e)): i[j, :, :] *= delta_e / (e[j] * 1e-3) # change to fixed bw for integration
+        ticket = SRWPlot.get_ticket_2D(h*1e6, v*1e6, numpy.sum(i, axis=0), is_multi_energy=True)
+
+    return {"fwhm_h"     : ticket["fwhm_h"],
+            "fwhm_v"     : ticket["fwhm_v"],
+            "sigma_h"    : ticket["sigma_h"],
+            "sigma_v"    : ticket["sigma_v"],
+            "centroid_h" : get_average(ticket["histogram_h"], ticket["bin_h"]),
+            "centroid_v" : get_average(ticket["histogram_v"], ticket["bin_v"]),
+            "peak"       : numpy.max(ticket["histogram"]),
+            "flux"       : ticket["total"]}
+
+def get_jacobian(wavefronts, multi_electron=False):
+    '''
+    Jacobian of the beam statistics of the variants of a sensitivity analysis: returns the parameters (name,
+    unit, step), the statistics of the nominal wavefront and the matrix [statistic, parameter]
+    '''
+    statistics = [get_beam_statistics(wavefront, multi_electron) for wavefront in wavefronts]
+
+    parameters = []
+    jacobian = numpy.full((len(STATISTICS), (len(wavefronts) - 1)//2), numpy.nan)
+
+    for index in range(jacobian.shape[1]):
+        minus = wavefronts[2*index].scanned_variable_data
+        plus  = wavefronts[2*index + 1].scanned_variable_data
+
+        delta = float(plus.get_scanned_variable_value()) - float(minus.get_scanned_variable_value())
+
+        parameters.append((plus.get_scanned_variable_display_name(), plus.get_scanned_variable_um(), 0.5*delta))
+
+        for statistic_index, (statistic, _, _) in enumerate(STATISTICS):
+            value_minus = statistics[2*index][statistic]
+            value_plus  = statistics[2*index + 1][statistic]
+
+            if not (value_minus is None or value_plus is None or delta == 0.0):
+                jacobian[statistic_index, index] = (value_plus - value_minus)/delta
+
+    return parameters, statistics[-1], jacobian
+
+def get_jacobian_text(parameters, nominal_statistics, jacobian):
+    text = "Nominal Values\n\n"
+
+    for statistic, statistic_display_name, statistic_um in STATISTICS:
+        value = nominal_statistics[statistic]
+
+        text += (statistic_display_name + " [" + statistic_um + "]").ljust(40) + ("n.a." if value is None else "{:.6e}".format(value)).rjust(16) + "\n"
+
+    for index, (parameter_display_name, parameter_um, step) in enumerate(parameters):
+        text += "\nd/d(" + parameter_display_name + ") [per " + (parameter_um if parameter_um != "" else "unit") + "], step = " + "{:.3e}".format(step) + "\n\n"
+
+        for statistic_index, (_, statistic_display_name, statistic_um) in enumerate(STATISTICS):
+            text += (statistic_display_name + " [" + statistic_um + "]").ljust(40) + "{:.6e}".format(jacobian[statistic_index, index]).rjust(16) + "\n"
+
+    return text
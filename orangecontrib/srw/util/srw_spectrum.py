@@ -0,0 +1,198 @@
+import numpy, array
+import scipy.constants as codata
+
+from wofrysrw.propagator.wavefront2D.srw_wavefront import SRWWavefront, WavefrontParameters, FluxCalculationParameters, CalculationType, TypeOfDependence
+from wofrysrw.storage_ring.light_sources.srw_undulator_light_source import SRWUndulatorLightSource
+
+from orangecontrib.srw.util import srw_engine, srw_trajectory
+from orangecontrib.srw.util.srw_profiler import SRWProfiler
+
+#########################################################################################
+#
+# SPECTRUM IN ENERGY CHUNKS: SRW calculates each photon energy of a spectrum
+# independently, so the energy range can be split in contiguous chunks of the same grid,
+# calculated in the process pool and reassembled in energy order. The power is
+# calculated on the reassembled spectrum, with the step of the whole grid.
+#
+#########################################################################################
+
+MINIMUM_POINTS_PER_CHUNK = 2
+NODE_TOLERANCE = 1e-9 # relative to the mesh step
+
+class SRWSpectrumChunk(object):
+    '''
+    Indexes [start, stop) of the energy grid, with the wavefront parameters of the slit flux and of the on-axis flux
+    restricted to them
+    '''
+    def __init__(self, start, stop, flux_wavefront_parameters, on_axis_wavefront_parameters):
+        self.start = start
+        self.stop = stop
+        self.flux_wavefront_parameters = flux_wavefront_parameters
+        self.on_axis_wavefront_parameters = on_axis_wavefront_parameters
+
+def get_energy_grid(wavefront_parameters):
+    return numpy.linspace(wavefront_parameters._photon_energy_min, wavefront_parameters._photon_energy_max, wavefront_parameters._photon_energy_points)
+
+def get_spectrum_chunks(flux_wavefront_parameters, on_axis_wavefront_parameters, points_per_chunk):
+    energies = get_energy_grid(flux_wavefront_parameters)
+
+    points_per_chunk = max(points_per_chunk, MINIMUM_POINTS_PER_CHUNK)
+    boundaries = list(range(0, len(energies), points_per_chunk)) + [len(energies)]
+
+    # a last chunk too short is merged with the previous one
+    if len(boundaries) > 2 and boundaries[-1] - boundaries[-2] < MINIMUM_POINTS_PER_CHUNK: del boundaries[-2]
+
+    return [SRWSpectrumChunk(start, stop,
+                             _get_chunk_wavefront_parameters(flux_wavefront_parameters, energies, start, stop),
+                             _get_chunk_wavefront_parameters(on_axis_wavefront_parameters, energies, start, stop))
+            for start, stop in zip(boundaries[:-1], boundaries[1:])]
+
+def calculate_flux(srw_source, flux_wavefront_parameters, on_axis_wavefront_parameters, polarization_component_to_be_extracted, flux_precision_parameters=None, trajectory=None):
+    '''
+    e, flux through the slit (multi-electron) and on-axis flux density (single electron): the electric field is
+    calculated once, when the on-axis point is a node of the slit mesh. The undulator flux doesn't need it, nor
+    the electron trajectory (see srw_trajectory, calculated by SRW if None).
+    '''
+    if isinstance(srw_source, SRWUndulatorLightSource):
+        e, i = srw_source.get_undulator_flux(source_wavefront_parameters=flux_wavefront_parameters,
+                                             flux_precision_parameters=flux_precision_parameters)
+
+        srw_wavefront = srw_trajectory.get_SRW_Wavefront(srw_source, on_axis_wavefront_parameters, trajectory)
+        _, on_axis_i  = srw_wavefront.get_flux(multi_electron=False, polarization_component_to_be_extracted=polarization_component_to_be_extracted)
+    else:
+        srw_wavefront = srw_trajectory.get_SRW_Wavefront(srw_source, flux_wavefront_parameters, trajectory)
+
+        if is_on_axis_node(srw_wavefront, flux_wavefront_parameters):
+            on_axis_i = get_on_axis_intensity(srw_wavefront, flux_wavefront_parameters, polarization_component_to_be_extracted)
+        else:
+            _, on_axis_i = srw_trajectory.get_SRW_Wavefront(srw_source, on_axis_wavefront_parameters, trajectory).get_flux(multi_electron=False,
+                                                                                                                       polarization_component_to_be_extracted=polarization_component_to_be_extracted)
+
+        e, i = srw_wavefront.get_flux(multi_electron=True, polarization_component_to_be_extracted=polarization_component_to_be_extracted)
+
+    return e, i, on_axis_i
+
+def is_on_axis_node(srw_wavefront, wavefront_parameters):
+    '''
+    True if the on-axis point (the center of the slit) is a node of the mesh SRW calculated the wavefront on
+    '''
+    def is_node(position, start, end, points):
+        if points == 1: return bool(numpy.isclose(position, start, rtol=NODE_TOLERANCE, atol=0.0))
+
+        index = (position - start)/(end - start)*(points - 1)
+
+        return 0 <= round(index) < points and abs(index - round(index)) <= NODE_TOLERANCE
+
+    mesh = srw_wavefront.mesh
+
+    return is_node(wavefront_parameters._h_position, mesh.xStart, mesh.xFin, mesh.nx) and \
+           is_node(wavefront_parameters._v_position, mesh.yStart, mesh.yFin, mesh.ny)
+
+def get_on_axis_intensity(srw_wavefront, wavefront_parameters, polarization_component_to_be_extracted):
+    output_array = array.array('f', [0]*srw_wavefront.mesh.ne)
+
+    SRWWavefront.get_intensity_from_electric_field(output_array, srw_wavefront,
+                                                   FluxCalculationParameters(calculation_type=CalculationType.SINGLE_ELECTRON_INTENSITY,
+                                                                             type_of_dependence=TypeOfDependence.VS_E,
+                                                                             polarization_component_to_be_extracted=polarization_component_to_be_extracted,
+                                                                             fixed_input_photon_energy_or_time=srw_wavefront.mesh.eStart,
+                                                                             fixed_horizontal_position=wavefront_parameters._h_position,
+                                                                             fixed_vertical_position=wavefront_parameters._v_position))
+
+    return numpy.frombuffer(output_array, dtype=numpy.float32)
+
+def get_power(e, i):
+    power = i * 1e3 * (e[1]-e[0]) * codata.e
+
+    return power, numpy.cumsum(power)
+
+class SRWSpectrumAssembler(object):
+    '''
+    The spectrum being reassembled from the chunks: the partial spectrum is the contiguous part calculated from the
+    first energy
+    '''
+    def __init__(self, energies):
+        self.e = energies
+        self.flux = numpy.zeros(len(energies))
+        self.on_axis_flux = numpy.zeros(len(energies))
+        self.__completed = numpy.zeros(len(energies), dtype=bool)
+
+    def add(self, chunk, flux, on_axis_flux):
+        self.flux[chunk.start:chunk.stop] = flux
+        self.on_axis_flux[chunk.start:chunk.stop] = on_axis_flux
+        self.__completed[chunk.start:chunk.stop] = True
+
+    def get_number_of_contiguous_points(self):
+        return len(self.e) if numpy.all(self.__completed) else int(numpy.argmin(self.__completed))
+
+    def is_completed(self):
+        return bool(numpy.all(self.__completed))
+
+    def get_spectrum(self, number_of_points=None):
+        '''
+        e, flux, on-axis flux, power and cumulated power of the first number_of_points energies (all if None)
+        '''
+        if number_of_points is None: number_of_points = len(self.e)
+
+        power, cumulated_power = get_power(self.e, self.flux[:number_of_points]) if len(self.e) > 1 else (self.flux[:number_of_points]*0.0, self.flux[:number_of_points]*0.0)
+
+        return self.e[:number_of_points], self.flux[:number_of_points], self.on_axis_flux[:number_of_points], power, cumulated_power
+
+def run_spectrum_chunks(srw_source, energies, chunks, polarization_component_to_be_extracted, flux_precision_parameters=None, max_workers=None, callback=None, trajectory=None, wait_callback=None):
+    '''
+    Calculates the chunks of the energy grid, returning the SRWSpectrumAssembler of the whole spectrum: with
+    max_workers=1 in the current process, otherwise in the process pool. callback(number_of_completed_chunks,
+    assembler) is called after each chunk, in order of completion, wait_callback while waiting for the workers (see
+    srw_engine.map_in_pool).
+    '''
+    assembler = SRWSpectrumAssembler(energies)
+
+    if max_workers == 1 or len(chunks) == 1:
+        for index, chunk in enumerate(chunks):
+            if not wait_callback is None: wait_callback()
+
+            _, flux, on_axis_flux = calculate_flux(srw_source, chunk.flux_wavefront_parameters, chunk.on_axis_wavefront_parameters,
+                                                   polarization_component_to_be_extracted, flux_precision_parameters, trajectory)
+            assembler.add(chunk, flux, on_axis_flux)
+
+            if not callback is None: callback(index + 1, assembler)
+    else:
+        profiler = SRWProfiler.Instance()
+
+        with srw_engine.process_pool(max_workers) as pool:
+            futures = {pool.submit(_run_spectrum_chunk, srw_source, chunk, polarization_component_to_be_extracted, flux_precision_parameters, profiler.is_enabled(), trajectory): chunk for chunk in chunks}
+
+            for index, future in enumerate(srw_engine.as_completed(futures, wait_callback)):
+                flux, on_axis_flux, events = future.result()
+
+                profiler.add_events(events)
+                assembler.add(futures[future], flux, on_axis_flux)
+
+                if not callback is None: callback(index + 1, assembler)
+
+    return assembler
+
+# runs in the worker process
+def _run_spectrum_chunk(srw_source, chunk, polarization_component_to_be_extracted, flux_precision_parameters, profile, trajectory=None):
+    profiler = SRWProfiler.Instance()
+    profiler.set_enabled(profile)
+
+    with profiler.stage("Spectrum Chunk", "engine"):
+        _, flux, on_axis_flux = calculate_flux(srw_source, chunk.flux_wavefront_parameters, chunk.on_axis_wavefront_parameters,
+                                               polarization_component_to_be_extracted, flux_precision_parameters, trajectory)
+
+    return flux, on_axis_flux, profiler.pop_events()
+
+def _get_chunk_wavefront_parameters(wavefront_parameters, energies, start, stop):
+    return WavefrontParameters(photon_energy_min=energies[start],
+                               photon_energy_max=energies[stop - 1],
+                               photon_energy_points=stop - start,
+                               h_slit_gap=wavefront_parameters._h_slit_gap,
+                               v_slit_gap=wavefront_parameters._v_slit_gap,
+                               h_slit_points=wavefront_parameters._h_slit_points,
+                               v_slit_points=wavefront_parameters._v_slit_points,
+                               h_position=wavefront_parameters._h_position,
+                               v_position=wavefront_parameters._v_position,
+                               distance=wavefront_parameters._distance,
+                               electric_field_units=wavefront_parameters._electric_field_units,
+                               wavefront_precision_parameters=wavefront_parameters._wavefront_precision_parameters)
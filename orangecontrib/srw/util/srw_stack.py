@@ -0,0 +1,67 @@
+import os, tempfile
+
+import numpy
+
+#########################################################################################
+#
+# OUT-OF-CORE 3D STACKS: distributions [energy, horizontal, vertical] in memory-mapped
+# float32 files. Each energy slice is a contiguous chunk of the file, written as soon as
+# it is calculated: the operating system keeps in memory only the pages of the slices
+# being written or read, so the plots access the stack lazily, one slice at a time.
+#
+#########################################################################################
+
+class SRWSliceStore(object):
+
+    def __init__(self, shape, directory=None, dtype=numpy.float32):
+        if directory == "": directory = None
+        if not directory is None: os.makedirs(directory, exist_ok=True)
+
+        file_descriptor, self.__file_name = tempfile.mkstemp(prefix="srw-stack-", suffix=".dat", dir=directory)
+        os.close(file_descriptor)
+
+        self.__data = numpy.memmap(self.__file_name, dtype=dtype, mode="w+", shape=tuple(shape))
+
+    def get_file_name(self):
+        return self.__file_name
+
+    def get_data(self):
+        return self.__data
+
+    def get_shape(self):
+        return self.__data.shape
+
+    def get_slice_size(self):
+        return self.__data[0].nbytes
+
+    def set_slice(self, index, distribution):
+        self.__data[index, :, :] = distribution
+
+    def get_slice(self, index):
+        return self.__data[index, :, :]
+
+    def get_sum_over_energy(self, dtype=numpy.float64):
+        total = numpy.zeros(self.__data.shape[1:], dtype=dtype)
+
+        for index in range(self.__data.shape[0]): total += self.__data[index, :, :]
+
+        return total
+
+    def flush(self):
+        if not self.__data is None: self.__data.flush()
+
+    def close(self):
+        # views on the data (e.g. in the plots) keep the mapping alive: the file is removed only from the directory
+        if not self.__data is None:
+            self.__data = None
+
+            try:
+                os.remove(self.__file_name)
+            except OSError:
+                pass
+
+def is_slice_store_data(data):
+    return isinstance(data, numpy.memmap)
+
+def get_stack_size(shape, dtype=numpy.float32):
+    return int(numpy.prod(shape))*numpy.dtype(dtype).itemsize
@@ -0,0 +1,260 @@
+import numpy, copy
+
+from wofrysrw.storage_ring.light_sources.srw_bending_magnet_light_source import SRWBendingMagnetLightSource
+from wofrysrw.storage_ring.light_sources.srw_undulator_light_source import SRWUndulatorLightSource
+
+from orangecontrib.srw.util import srw_engine
+
+#########################################################################################
+#
+# MIRROR SYMMETRIES: with the electron beam on axis, the magnet centered and the screen
+# centered, the plane of the orbit is an exact mirror plane of the source (for a vertical
+# field: y -> -y). For a planar undulator the other plane is a mirror plane of intensity
+# and power density to the precision of the calculation (the mirrored trajectory is the
+# same, shifted by half a period). Only the irreducible half or quadrant of the mesh (the
+# nodes >= 0 of the mirrored axes) is calculated and the result is unfolded on the whole
+# mesh. The electric field is unfolded with the parities of the reflection: the component
+# normal to the mirror plane is odd, the other one even.
+#
+# Multi-electron intensities are convolutions with the electron beam: the reduced mesh is
+# extended across the axis by a margin of some projected beam sizes, removed after the
+# calculation.
+#
+#########################################################################################
+
+class SRWSymmetry:
+    NONE       = 0
+    AUTOMATIC  = 1
+    HORIZONTAL = 2
+    VERTICAL   = 3
+    BOTH       = 4
+
+    @classmethod
+    def tuple(cls):
+        return ["None", "Auto-detect", "Mirror X (left/right half)", "Mirror Y (top/bottom half)", "Mirror X and Y (quadrant)"]
+
+MINIMUM_POINTS = 3
+MARGIN_SIGMAS = 5
+VERIFICATION_TOLERANCE = 1e-3
+
+def get_mirrors(symmetry, srw_source, wavefront_parameters, electric_field=False):
+    '''
+    Mirrors (horizontal, vertical) to use for the calculation: the detected ones, or the selected ones if the mesh allows
+    them (a ValueError otherwise)
+    '''
+    if symmetry == SRWSymmetry.NONE: return False, False
+    elif symmetry == SRWSymmetry.AUTOMATIC:
+        mirror_h, mirror_v = detect_mirrors(srw_source, electric_field)
+
+        return mirror_h and _is_mirror_axis(wavefront_parameters._h_slit_gap, wavefront_parameters._h_slit_points, wavefront_parameters._h_position) and is_mesh_fixed(wavefront_parameters), \
+               mirror_v and _is_mirror_axis(wavefront_parameters._v_slit_gap, wavefront_parameters._v_slit_points, wavefront_parameters._v_position) and is_mesh_fixed(wavefront_parameters)
+    else:
+        mirror_h = symmetry in (SRWSymmetry.HORIZONTAL, SRWSymmetry.BOTH)
+        mirror_v = symmetry in (SRWSymmetry.VERTICAL, SRWSymmetry.BOTH)
+
+        if not is_mesh_fixed(wavefront_parameters):
+            raise ValueError("Symmetry: the mesh can't be adjusted by SRW (sampling factor for adjusting nx/ny must be 0)")
+        if mirror_h and not _is_mirror_axis(wavefront_parameters._h_slit_gap, wavefront_parameters._h_slit_points, wavefront_parameters._h_position):
+            raise ValueError("Symmetry: mirror X needs a slit centered in 0, with at least " + str(MINIMUM_POINTS) + " H points")
+        if mirror_v and not _is_mirror_axis(wavefront_parameters._v_slit_gap, wavefront_parameters._v_slit_points, wavefront_parameters._v_position):
+            raise ValueError("Symmetry: mirror Y needs a slit centered in 0, with at least " + str(MINIMUM_POINTS) + " V points")
+
+        return mirror_h, mirror_v
+
+def detect_mirrors(srw_source, electric_field=False):
+    '''
+    Mirror planes (x=0, y=0) of the source: with electric_field only the exact ones (the plane of the orbit)
+    '''
+    electron_beam = srw_source.get_electron_beam()
+    magnetic_structure = srw_source._magnetic_structure
+
+    centered_h = electron_beam._moment_x == 0.0 and electron_beam._moment_xp == 0.0 and magnetic_structure.horizontal_central_position == 0.0
+    centered_v = electron_beam._moment_y == 0.0 and electron_beam._moment_yp == 0.0 and magnetic_structure.vertical_central_position == 0.0
+
+    if isinstance(srw_source, SRWBendingMagnetLightSource): # vertical field: horizontal orbit
+        return False, centered_v
+    elif isinstance(srw_source, SRWUndulatorLightSource):
+        if magnetic_structure._K_horizontal == 0.0: # vertical field: horizontal orbit
+            return centered_h and not electric_field, centered_v
+        elif magnetic_structure._K_vertical == 0.0: # horizontal field: vertical orbit
+            return centered_h, centered_v and not electric_field
+
+    return False, False
+
+def is_mesh_fixed(wavefront_parameters):
+    wavefront_precision_parameters = getattr(wavefront_parameters, "_wavefront_precision_parameters", None)
+
+    return wavefront_precision_parameters is None or wavefront_precision_parameters._sampling_factor_for_adjusting_nx_ny <= 0.0
+
+def get_multi_electron_margins(electron_beam, distance):
+    '''
+    Horizontal and vertical margins [m] of the reduced mesh for the multi-electron calculations: some projected rms
+    sizes of the electron beam at the screen
+    '''
+    return MARGIN_SIGMAS*numpy.sqrt(max(electron_beam._moment_xx + 2*distance*electron_beam._moment_xxp + distance**2*electron_beam._moment_xpxp, 0.0)), \
+           MARGIN_SIGMAS*numpy.sqrt(max(electron_beam._moment_yy + 2*distance*electron_beam._moment_yyp + distance**2*electron_beam._moment_ypyp, 0.0))
+
+def get_relative_deviation(unfolded, full):
+    full = numpy.asarray(full)
+    peak = numpy.max(numpy.abs(full))
+
+    return numpy.max(numpy.abs(numpy.asarray(unfolded, dtype=numpy.float64) - full))/peak if peak > 0.0 else 0.0
+
+def get_field_deviation(wavefront, full_wavefront):
+    '''
+    Relative deviation of the electric field (both components) of the unfolded wavefront from the one calculated on the whole mesh
+    '''
+    mesh = full_wavefront.mesh
+
+    return get_relative_deviation(numpy.concatenate((srw_engine.get_field(wavefront.arEx, mesh.ne, mesh.nx, mesh.ny), srw_engine.get_field(wavefront.arEy, mesh.ne, mesh.nx, mesh.ny))),
+                                  numpy.concatenate((srw_engine.get_field(full_wavefront.arEx, mesh.ne, mesh.nx, mesh.ny), srw_engine.get_field(full_wavefront.arEy, mesh.ne, mesh.nx, mesh.ny))))
+
+class _SRWMirrorAxis(object):
+    '''
+    Nodes start, ..., points - 1 of a centered mesh: the nodes >= 0 (from index center), with margin nodes before them
+    '''
+    def __init__(self, gap, points, mirror, margin=0.0):
+        self.gap = gap
+        self.points = int(points)
+        self.mirror = mirror
+
+        if mirror:
+            step = gap/(self.points - 1)
+
+            self.center = self.points//2
+            self.margin_points = min(int(numpy.ceil(margin/step)) if margin > 0.0 else 0, self.center)
+        else:
+            self.center = 0
+            self.margin_points = 0
+
+        self.start = self.center - self.margin_points
+
+    def get_reduced_points(self):
+        return self.points - self.start
+
+    def get_reduced_range(self):
+        '''
+        gap and position of the reduced mesh
+        '''
+        if not self.mirror: return self.gap, 0.0
+
+        step = self.gap/(self.points - 1)
+        minimum = -0.5*self.gap + self.start*step
+
+        return 0.5*self.gap - minimum, 0.5*(minimum + 0.5*self.gap)
+
+    def get_irreducible_range(self):
+        '''
+        gap and position of the region [0, gap/2] (the whole gap if not mirrored)
+        '''
+        return (0.5*self.gap, 0.25*self.gap) if self.mirror else (self.gap, 0.0)
+
+    def get_coordinates(self):
+        return numpy.linspace(-0.5*self.gap, 0.5*self.gap, self.points) if self.points > 1 else numpy.zeros(1)
+
+    def unfold(self, distribution, axis, parity=1):
+        if not self.mirror: return distribution
+
+        half = numpy.take(distribution, numpy.arange(self.margin_points, distribution.shape[axis]), axis=axis)
+        mirrored = numpy.flip(numpy.take(half, numpy.arange(self.points - 2*self.center, half.shape[axis]), axis=axis), axis=axis)
+
+        return numpy.concatenate((mirrored if parity == 1 else -mirrored, half), axis=axis)
+
+class SRWSymmetricMesh(object):
+    '''
+    Reduced mesh of wavefront_parameters for the mirrors, and the unfolding of the results on the whole mesh
+    '''
+    def __init__(self, wavefront_parameters, mirror_h, mirror_v, h_margin=0.0, v_margin=0.0):
+        self.__wavefront_parameters = wavefront_parameters
+
+        self.__h_axis = _SRWMirrorAxis(wavefront_parameters._h_slit_gap, wavefront_parameters._h_slit_points, mirror_h, h_margin)
+        self.__v_axis = _SRWMirrorAxis(wavefront_parameters._v_slit_gap, wavefront_parameters._v_slit_points, mirror_v, v_margin)
+
+    def get_mirrors(self):
+        return self.__h_axis.mirror, self.__v_axis.mirror
+
+    def get_multiplicity(self):
+        return (2 if self.__h_axis.mirror else 1)*(2 if self.__v_axis.mirror else 1)
+
+    def get_reduced_wavefront_parameters(self):
+        h_slit_gap, h_position = self.__h_axis.get_reduced_range()
+        v_slit_gap, v_position = self.__v_axis.get_reduced_range()
+
+        wavefront_parameters = copy.copy(self.__wavefront_parameters)
+        wavefront_parameters._h_slit_gap    = h_slit_gap
+        wavefront_parameters._h_slit_points = self.__h_axis.get_reduced_points()
+        wavefront_parameters._h_position    = h_position if self.__h_axis.mirror else wavefront_parameters._h_position
+        wavefront_parameters._v_slit_gap    = v_slit_gap
+        wavefront_parameters._v_slit_points = self.__v_axis.get_reduced_points()
+        wavefront_parameters._v_position    = v_position if self.__v_axis.mirror else wavefront_parameters._v_position
+
+        return wavefront_parameters
+
+    def get_irreducible_region(self):
+        '''
+        h gap, h position, v gap, v position of the irreducible half or quadrant of the slit, with no margins
+        '''
+        h_slit_gap, h_position = self.__h_axis.get_irreducible_range()
+        v_slit_gap, v_position = self.__v_axis.get_irreducible_range()
+
+        return h_slit_gap, h_position + (0.0 if self.__h_axis.mirror else self.__wavefront_parameters._h_position), \
+               v_slit_gap, v_position + (0.0 if self.__v_axis.mirror else self.__wavefront_parameters._v_position)
+
+    def get_reduced_coordinates(self):
+        '''
+        h, v of the reduced mesh [m]
+        '''
+        wavefront_parameters = self.get_reduced_wavefront_parameters()
+
+        return tuple([numpy.linspace(position - 0.5*gap, position + 0.5*gap, int(points)) if int(points) > 1 else numpy.array([position])
+                      for gap, points, position in [(wavefront_parameters._h_slit_gap, wavefront_parameters._h_slit_points, wavefront_parameters._h_position),
+                                                    (wavefront_parameters._v_slit_gap, wavefront_parameters._v_slit_points, wavefront_parameters._v_position)]])
+
+    def get_coordinates(self):
+        '''
+        h, v of the whole mesh [m]
+        '''
+        return self.__h_axis.get_coordinates() + (0.0 if self.__h_axis.mirror else self.__wavefront_parameters._h_position), \
+               self.__v_axis.get_coordinates() + (0.0 if self.__v_axis.mirror else self.__wavefront_parameters._v_position)
+
+    def get_reduction(self):
+        return (self.__h_axis.points*self.__v_axis.points)/(self.__h_axis.get_reduced_points()*self.__v_axis.get_reduced_points())
+
+    def get_info(self):
+        mirrors = [name for name, mirror in zip(["X", "Y"], self.get_mirrors()) if mirror]
+
+        return "Symmetry: mirror " + " and ".join(mirrors) + ", " + str(self.__h_axis.get_reduced_points()) + "x" + str(self.__v_axis.get_reduced_points()) + " of " + \
+               str(self.__h_axis.points) + "x" + str(self.__v_axis.points) + " points calculated (" + "{:.2f}".format(self.get_reduction()) + "x less)"
+
+    def unfold(self, distribution, output=None):
+        '''
+        distribution [..., h, v] of the reduced mesh on the whole mesh: with a 3D output (e.g. an out-of-core stack), the
+        slices are unfolded in it one by one
+        '''
+        if output is None:
+            return self.__v_axis.unfold(self.__h_axis.unfold(numpy.asarray(distribution), axis=-2), axis=-1)
+        else:
+            for index in range(distribution.shape[0]): output[index] = self.unfold(distribution[index])
+
+            return output
+
+    def unfold_wavefront(self, wavefront):
+        '''
+        SRWWavefront of the whole mesh from the one of the reduced mesh: SRW stores the field as [ny][nx][ne][Re, Im]
+        '''
+        mesh = wavefront.mesh
+
+        field_x = srw_engine.get_field(wavefront.arEx, mesh.ne, mesh.nx, mesh.ny)
+        field_y = srw_engine.get_field(wavefront.arEy, mesh.ne, mesh.nx, mesh.ny)
+
+        # reflection x -> -x: Ex odd, Ey even. Reflection y -> -y: Ex even, Ey odd
+        field_x = self.__v_axis.unfold(self.__h_axis.unfold(field_x, axis=1, parity=-1), axis=0, parity=1)
+        field_y = self.__v_axis.unfold(self.__h_axis.unfold(field_y, axis=1, parity=1), axis=0, parity=-1)
+
+        h, v = self.get_coordinates()
+
+        # the statistical moments of the reduced mesh are not the ones of the whole mesh: they are left to SRW
+        return srw_engine.create_wavefront(wavefront, field_x, field_y, mesh.eStart, mesh.eFin, h[0], h[-1], v[0], v[-1])
+
+def _is_mirror_axis(gap, points, position):
+    return position == 0.0 and gap > 0.0 and int(points) >= MINIMUM_POINTS
@@ -0,0 +1,355 @@
+import copy, threading, weakref
+from collections import OrderedDict
+
+import numpy
+from scipy.integrate import cumulative_trapezoid
+
+from wofrysrw.util.srw import srwl, array, SRWLPrtTrj
+from wofrysrw.storage_ring.srw_light_source import SRWLightSource, PowerDensityPrecisionParameters
+from wofrysrw.propagator.wavefront2D.srw_wavefront import SRWWavefront, WavefrontParameters
+
+from orangecontrib.srw.util.srw_cache import get_fingerprint
+
+#########################################################################################
+#
+# ELECTRON TRAJECTORY CACHE: SRW calculates the trajectory of the electron through the
+# magnetic structure before each radiation integral. The trajectory is calculated once,
+# on the longitudinal range SRW would use, and kept in memory keyed by magnetic field,
+# electron energy, initial conditions and integration settings: the source, spectrum,
+# radiation and power density calculations of a session share it.
+#
+# With linear corrections, an electron whose initial conditions are a small offset from
+# a cached trajectory (e.g. a macro-electron) reuses it, corrected to first order in
+# the offsets: the field is assumed transversely uniform across the offsets.
+#
+# The cache is opt-in: the callers decide (e.g. from the SRW Tools menu) whether to use
+# it and the linear corrections, this module has no settings of its own.
+#
+#########################################################################################
+
+TRAJECTORY_ARRAYS = ["arX", "arXp", "arY", "arYp", "arZ", "arZp", "arBx", "arBy", "arBz"]
+
+class SRWTrajectoryParameters(object):
+    '''
+    Integration settings of the trajectory: the longitudinal range of the radiation integral is effective if
+    start < end, otherwise it is the range of the magnetic field (extended to the initial position of the electron)
+    '''
+    def __init__(self, number_of_points=50000, start_longitudinal_position=0.0, end_longitudinal_position=0.0):
+        self.number_of_points = int(number_of_points)
+        self.start_longitudinal_position = start_longitudinal_position
+        self.end_longitudinal_position = end_longitudinal_position
+
+    @classmethod
+    def from_wavefront_parameters(cls, wavefront_parameters=WavefrontParameters()):
+        wavefront_precision_parameters = wavefront_parameters._wavefront_precision_parameters
+
+        return SRWTrajectoryParameters(wavefront_precision_parameters._number_of_points_for_trajectory_calculation,
+                                       wavefront_precision_parameters._start_integration_longitudinal_position,
+                                       wavefront_precision_parameters._end_integration_longitudinal_position)
+
+    @classmethod
+    def from_power_density_precision_parameters(cls, power_density_precision_parameters=PowerDensityPrecisionParameters()):
+        return SRWTrajectoryParameters(power_density_precision_parameters._number_of_points_for_trajectory_calculation,
+                                       power_density_precision_parameters._initial_longitudinal_position,
+                                       power_density_precision_parameters._final_longitudinal_position)
+
+    def has_integration_limits(self):
+        return self.end_longitudinal_position > self.start_longitudinal_position
+
+class SRWTrajectoryCache(object):
+    DEFAULT_MAXIMUM_ENTRIES = 16
+
+    # offsets from a cached trajectory within which the linear corrections are applied
+    MAXIMUM_POSITION_OFFSET = 1e-5 # m
+    MAXIMUM_ANGLE_OFFSET    = 1e-5 # rad
+    MAXIMUM_ENERGY_OFFSET   = 1e-2 # relative
+
+    @classmethod
+    def Instance(cls):
+        if not "_instance" in cls.__dict__: cls._instance = cls()
+
+        return cls._instance
+
+    def __init__(self, maximum_entries=DEFAULT_MAXIMUM_ENTRIES):
+        self.__maximum_entries = maximum_entries
+        self.__entries = OrderedDict()
+        self.__field_fingerprints = weakref.WeakKeyDictionary()
+        self.__lock = threading.RLock()
+
+        self.hits = 0
+        self.corrections = 0
+        self.misses = 0
+
+    def get_key(self, srw_source, trajectory_parameters):
+        '''
+        (hash of magnetic field, initial longitudinal position and integration settings, initial conditions x, x',
+        y, y', gamma): trajectories with the same hash can be corrected into each other
+        '''
+        particle = get_particle(srw_source)
+
+        return (get_fingerprint(self.get_field_fingerprint(srw_source), particle.z, vars(trajectory_parameters)),
+                (particle.x, particle.xp, particle.y, particle.yp, particle.gamma))
+
+    def get_field_fingerprint(self, srw_source):
+        '''
+        The hash of the magnetic field, calculated once for each source: the magnetic structure of a source is not
+        changed once built
+        '''
+        with self.__lock:
+            field_fingerprint = self.__field_fingerprints.get(srw_source)
+
+            if field_fingerprint is None:
+                field_fingerprint = get_fingerprint(srw_source.get_magnetic_structure().get_SRWLMagFldC())
+
+                self.__field_fingerprints[srw_source] = field_fingerprint
+
+        return field_fingerprint
+
+    def get(self, key, linear_corrections=False):
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+
+                return self.__entries[key]
+
+            reference_key = self.__get_reference_key(key) if linear_corrections else None
+
+            if reference_key is None:
+                self.misses += 1
+
+                return None
+
+            self.__entries.move_to_end(reference_key)
+            self.corrections += 1
+
+            reference_trajectory = self.__entries[reference_key]
+
+        return get_corrected_trajectory(reference_trajectory, *key[1])
+
+    def put(self, key, trajectory):
+        with self.__lock:
+            self.__entries[key] = trajectory
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.__maximum_entries: self.__entries.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.corrections = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    # the closest cached trajectory within the maximum offsets
+    def __get_reference_key(self, key):
+        structure_key, (x, xp, y, yp, gamma) = key
+
+        reference_key = None
+        minimum_offset = 1.0
+
+        for cached_key in self.__entries.keys():
+            if cached_key[0] != structure_key: continue
+
+            x_0, xp_0, y_0, yp_0, gamma_0 = cached_key[1]
+
+            offset = max(abs(x - x_0)/self.MAXIMUM_POSITION_OFFSET,
+                         abs(y - y_0)/self.MAXIMUM_POSITION_OFFSET,
+                         abs(xp - xp_0)/self.MAXIMUM_ANGLE_OFFSET,
+                         abs(yp - yp_0)/self.MAXIMUM_ANGLE_OFFSET,
+                         abs(gamma/gamma_0 - 1)/self.MAXIMUM_ENERGY_OFFSET)
+
+            if offset <= minimum_offset:
+                reference_key = cached_key
+                minimum_offset = offset
+
+        return reference_key
+
+#########################################################################################
+
+def is_trajectory_supported(srw_source):
+    '''
+    True for the sources whose radiation is calculated by SRWLightSource from the magnetic structure (e.g. not the
+    Gaussian source)
+    '''
+    return isinstance(srw_source, SRWLightSource) and \
+           type(srw_source).get_SRW_Wavefront is SRWLightSource.get_SRW_Wavefront and \
+           type(srw_source).get_power_density is SRWLightSource.get_power_density
+
+def get_trajectory(srw_source, trajectory_parameters, linear_corrections=False, calculate=None):
+    '''
+    The trajectory from the cache, calculated and cached if missing, by calculate(srw_source, trajectory_parameters)
+    (calculate_trajectory in the current process if None): None if the source is not supported
+    '''
+    if not is_trajectory_supported(srw_source): return None
+
+    trajectory_cache = SRWTrajectoryCache.Instance()
+
+    key = trajectory_cache.get_key(srw_source, trajectory_parameters)
+    trajectory = trajectory_cache.get(key, linear_corrections=linear_corrections)
+
+    if trajectory is None:
+        trajectory = calculate_trajectory(srw_source, trajectory_parameters) if calculate is None else calculate(srw_source, trajectory_parameters)
+
+        trajectory_cache.put(key, trajectory)
+
+    return trajectory
+
+def get_cached_trajectory(srw_source, trajectory_parameters, linear_corrections=False):
+    '''
+    The trajectory from the cache, never calculated: None if missing (or beyond the limits of the linear corrections)
+    '''
+    if not is_trajectory_supported(srw_source): return None
+
+    trajectory_cache = SRWTrajectoryCache.Instance()
+
+    return trajectory_cache.get(trajectory_cache.get_key(srw_source, trajectory_parameters), linear_corrections=linear_corrections)
+
+def get_particle(srw_source):
+    return srw_source.get_electron_beam().to_SRWLPartBeam().partStatMom1
+
+def calculate_trajectory(srw_source, trajectory_parameters, progress_callback=None):
+    if not progress_callback is None: progress_callback(0, "Calculating Electron Trajectory")
+
+    particle = get_particle(srw_source)
+
+    trajectory = SRWLPrtTrj()
+    trajectory.partInitCond = particle
+    trajectory.allocate(trajectory_parameters.number_of_points, True)
+
+    if trajectory_parameters.has_integration_limits(): # ct = 0 at the initial position, as SRW does
+        trajectory.ctStart = trajectory_parameters.start_longitudinal_position - particle.z
+        trajectory.ctEnd   = trajectory_parameters.end_longitudinal_position - particle.z
+
+        srwl.CalcPartTraj(trajectory, srw_source.get_magnetic_structure().get_SRWLMagFldC(), [1])
+    else:
+        # with ctStart = ctEnd SRW takes the range of the field: the range of ct is recovered by integrating dct = dz/z'
+        trajectory.ctStart = 0.0
+        trajectory.ctEnd   = 0.0
+
+        srwl.CalcPartTraj(trajectory, srw_source.get_magnetic_structure().get_SRWLMagFldC(), [1])
+
+        z  = numpy.frombuffer(trajectory.arZ, dtype=numpy.float64)
+        ct = cumulative_trapezoid(1/numpy.frombuffer(trajectory.arZp, dtype=numpy.float64), z, initial=0.0)
+
+        trajectory.ctStart = -float(numpy.interp(particle.z, z, ct))
+        trajectory.ctEnd   = trajectory.ctStart + float(ct[-1])
+
+    return trajectory
+
+def get_corrected_trajectory(reference_trajectory, x, xp, y, yp, gamma):
+    '''
+    The reference trajectory for the initial conditions x, x', y, y', gamma (same initial longitudinal position), to
+    first order in the offsets: the deflection is scaled by the ratio of the momenta and shifted by the angle offset,
+    positions and longitudinal velocity follow by integration over ct. The field seen by the electron is unchanged.
+    '''
+    reference_particle = reference_trajectory.partInitCond
+
+    ct = numpy.linspace(reference_trajectory.ctStart, reference_trajectory.ctEnd, reference_trajectory.np)
+
+    reference_arrays = {name : numpy.frombuffer(getattr(reference_trajectory, name), dtype=numpy.float64) for name in TRAJECTORY_ARRAYS}
+
+    reference_beta = _get_beta(reference_particle.gamma)
+    beta           = _get_beta(gamma)
+    momentum_ratio = (reference_particle.gamma*reference_beta)/(gamma*beta)
+
+    arXp = xp + momentum_ratio*(reference_arrays["arXp"] - reference_particle.xp)
+    arYp = yp + momentum_ratio*(reference_arrays["arYp"] - reference_particle.yp)
+    arZp = reference_arrays["arZp"] + beta/numpy.sqrt(1 + arXp**2 + arYp**2) - \
+                                      reference_beta/numpy.sqrt(1 + reference_arrays["arXp"]**2 + reference_arrays["arYp"]**2)
+
+    # the reference arrays are corrected by the integral of the differences, so no offset is no correction
+    arZ = reference_arrays["arZ"] + cumulative_trapezoid(arZp - reference_arrays["arZp"], ct, initial=0.0)
+    arX = reference_arrays["arX"] + (x - reference_particle.x) + cumulative_trapezoid(arXp*arZp - reference_arrays["arXp"]*reference_arrays["arZp"], ct, initial=0.0)
+    arY = reference_arrays["arY"] + (y - reference_particle.y) + cumulative_trapezoid(arYp*arZp - reference_arrays["arYp"]*reference_arrays["arZp"], ct, initial=0.0)
+
+    particle = copy.copy(reference_particle)
+    particle.x     = x
+    particle.xp    = xp
+    particle.y     = y
+    particle.yp    = yp
+    particle.gamma = gamma
+
+    trajectory = SRWLPrtTrj()
+    trajectory.partInitCond = particle
+    trajectory.np      = reference_trajectory.np
+    trajectory.ctStart = reference_trajectory.ctStart
+    trajectory.ctEnd   = reference_trajectory.ctEnd
+
+    for name, values in zip(TRAJECTORY_ARRAYS, [arX, arXp, arY, arYp, arZ, arZp]): setattr(trajectory, name, array('d', values))
+    for name in ["arBx", "arBy", "arBz"]: setattr(trajectory, name, array('d', reference_arrays[name]))
+
+    return trajectory
+
+def _get_beta(gamma):
+    return numpy.sqrt(1 - 1/gamma**2)
+
+#########################################################################################
+#
+# SOURCE CALCULATIONS ON A GIVEN TRAJECTORY: as SRWLightSource, with the trajectory (an
+# SRWLPrtTrj) passed to SRW instead of being calculated again. None is SRWLightSource.
+# The results agree with SRWLightSource to the single precision of the electric field
+# (see test_srw_trajectory): keep them so when wofrysrw changes.
+#
+#########################################################################################
+
+def get_SRW_Wavefront(srw_source, source_wavefront_parameters=WavefrontParameters(), trajectory=None):
+    if trajectory is None: return srw_source.get_SRW_Wavefront(source_wavefront_parameters=source_wavefront_parameters)
+
+    set_source_wavefront_parameters(srw_source, source_wavefront_parameters)
+
+    mesh = source_wavefront_parameters.to_SRWRadMesh()
+
+    wfr = SRWWavefront()
+    wfr.allocate(mesh.ne, mesh.nx, mesh.ny)
+    wfr.mesh = mesh
+    wfr.partBeam = srw_source.get_electron_beam().to_SRWLPartBeam()
+    wfr.unitElFld = source_wavefront_parameters._electric_field_units
+
+    srwl.CalcElecFieldSR(wfr,
+                         trajectory,
+                         srw_source.get_magnetic_structure().get_SRWLMagFldC(),
+                         source_wavefront_parameters._wavefront_precision_parameters.to_SRW_array())
+
+    return wfr
+
+# the only access to the private attribute of SRWLightSource (wofrysrw has no setter)
+SOURCE_WAVEFRONT_PARAMETERS_ATTRIBUTE = "_SRWLightSource__source_wavefront_parameters"
+
+def set_source_wavefront_parameters(srw_source, source_wavefront_parameters):
+    '''
+    Records the wavefront parameters as SRWLightSource.get_SRW_Wavefront does, for get_source_wavefront_parameters
+    (python code, info, renderer): raises an AttributeError if SRWLightSource no longer keeps them there
+    '''
+    if not hasattr(srw_source, SOURCE_WAVEFRONT_PARAMETERS_ATTRIBUTE):
+        raise AttributeError("SRWLightSource has no attribute " + SOURCE_WAVEFRONT_PARAMETERS_ATTRIBUTE + ": the wofrysrw version is not supported")
+
+    setattr(srw_source, SOURCE_WAVEFRONT_PARAMETERS_ATTRIBUTE, source_wavefront_parameters)
+
+    if not srw_source.get_source_wavefront_parameters() is source_wavefront_parameters:
+        raise AttributeError("SRWLightSource.get_source_wavefront_parameters doesn't read " + SOURCE_WAVEFRONT_PARAMETERS_ATTRIBUTE + ": the wofrysrw version is not supported")
+
+def get_power_density(srw_source, source_wavefront_parameters=WavefrontParameters(), power_density_precision_parameters=PowerDensityPrecisionParameters(), trajectory=None):
+    if trajectory is None: return srw_source.get_power_density(source_wavefront_parameters=source_wavefront_parameters,
+                                                               power_density_precision_parameters=power_density_precision_parameters)
+
+    stkP = source_wavefront_parameters.to_SRWLStokes()
+
+    srwl.CalcPowDenSR(stkP,
+                      srw_source.get_electron_beam().to_SRWLPartBeam(),
+                      trajectory,
+                      srw_source.get_magnetic_structure().get_SRWLMagFldC(),
+                      power_density_precision_parameters.to_SRW_array())
+
+    # as SRWLightSource: [horizontal, vertical], the inmost loop of arS is vs. horizontal
+    hArray = stkP.mesh.xStart + numpy.arange(stkP.mesh.nx)*(stkP.mesh.xFin - stkP.mesh.xStart)/(stkP.mesh.nx - 1)
+    vArray = stkP.mesh.yStart + numpy.arange(stkP.mesh.ny)*(stkP.mesh.yFin - stkP.mesh.yStart)/(stkP.mesh.ny - 1)
+    powerArray = numpy.array(stkP.arS[:stkP.mesh.nx*stkP.mesh.ny], dtype=numpy.float64).reshape((stkP.mesh.ny, stkP.mesh.nx)).T
+
+    return (hArray, vArray, powerArray)
@@ -1,7 +1,7 @@
 import os, numpy
 from numpy import nan
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QSettings
 from PyQt5.QtGui import QPalette, QColor, QFont, QPixmap
 from PyQt5.QtWidgets import QMessageBox, QDialogButtonBox, QDialog, QLabel, QSizePolicy
 
@@ -26,7 +26,11 @@ from wofrysrw.propagator.propagators2D.srw_fresnel_native import FresnelSRWNativ
 from wofrysrw.propagator.propagators2D.srw_fresnel_wofry import FresnelSRWWofry
 from wofrysrw.beamline.optical_elements.srw_optical_element import SRWOpticalElementDisplacement
 
-from orangecontrib.srw.util.srw_objects import SRWData
+from orangecontrib.srw.util.srw_objects import SRWData, SRWScanData, SRWPersistentBeamline
+from orangecontrib.srw.util.srw_cache import SRWPropagationCache, SRWCheckpointStore, get_fingerprint, get_wavefront_fingerprint
+from orangecontrib.srw.util import srw_engine, srw_estimator, srw_precision, srw_sensitivity, srw_autotune
+from orangecontrib.srw.util.srw_util import showConfirmMessage
+from orangecontrib.srw.util.srw_profiler import profiled
 from orangecontrib.srw.widgets.gui.ow_srw_wavefront_viewer import SRWWavefrontViewer
 from wofrysrw.beamline.optical_elements.srw_optical_element import Orientation
 
@@ -127,6 +131,17 @@ class OWSRWOpticalElement(SRWWavefrontViewer, WidgetDecorator):
     rotation_x = Setting(0.0)
     rotation_y = Setting(0.0)
 
+    use_propagation_cache = Setting(1)
+
+    split_energy_slices = Setting(0)
+    energy_slices_workers = Setting(os.cpu_count() or 1)
+
+    autotune_tolerance = Setting(0.01)
+    autotune_max_steps = Setting(5)
+    autotune_memory = Setting({})
+
+    AUTOTUNE_INITIAL_RESOLUTION_FACTOR = 0.25 # coarser than the nominal resolution, the tuned factor can be < 1
+
     input_srw_data = None
 
     has_orientation_angles=True
@@ -151,6 +166,15 @@ class OWSRWOpticalElement(SRWWavefrontViewer, WidgetDecorator):
         self.has_oe_wavefront_propagation_parameters_tab = has_oe_wavefront_propagation_parameters_tab
         self.has_displacement_tab=has_displacement_tab
 
+        gui.checkBox(self.general_options_box, self, 'use_propagation_cache', 'Cache Propagation Results')
+        gui.checkBox(self.general_options_box, self, 'split_energy_slices', 'Propagate Energy Slices in Parallel', callback=self.set_SplitEnergySlices,
+                     tooltip="Multi-energy wavefronts: each photon energy is propagated by an independent process\n(the slices must be propagated on the same mesh, e.g. without automatic resizing)")
+
+        self.box_energy_slices_workers = oasysgui.widgetBox(self.general_options_box, "", addSpace=False, orientation="vertical")
+
+        oasysgui.lineEdit(self.box_energy_slices_workers, self, "energy_slices_workers", "Number of Workers", labelWidth=250, valueType=int, orientation="horizontal")
+
+        self.set_SplitEnergySlices()
 
         self.runaction = widget.OWAction("Propagate Wavefront", self)
         self.runaction.triggered.connect(self.propagate_wavefront)
@@ -222,6 +246,7 @@ class OWSRWOpticalElement(SRWWavefrontViewer, WidgetDecorator):
         if self.has_p: self.tab_drift_before = oasysgui.createTabPage(self.tabs_prop_setting, "Drift Space Before")
         if self.has_oe_wavefront_propagation_parameters_tab: self.tab_oe = oasysgui.createTabPage(self.tabs_prop_setting, "Optical Element")
         if self.has_q: self.tab_drift = oasysgui.createTabPage(self.tabs_prop_setting, "Drift Space After")
+        self.tab_autotune = oasysgui.createTabPage(self.tabs_prop_setting, "Auto-tune")
 
         if self.has_p: self.set_p()
         if self.has_q: self.set_q()
@@ -354,6 +379,19 @@ class OWSRWOpticalElement(SRWWavefrontViewer, WidgetDecorator):
             oasysgui.lineEdit(drift_optional_box, self, "drift_after_orientation_of_the_horizontal_base_vector_x"    , "Orientation of the Horizontal Base vector of the\nOutput Frame in the Incident Beam Frame: X", labelWidth=290, valueType=float, orientation="horizontal")
             oasysgui.lineEdit(drift_optional_box, self, "drift_after_orientation_of_the_horizontal_base_vector_y"    , "Orientation of the Horizontal Base vector of the\nOutput Frame in the Incident Beam Frame: Y", labelWidth=290, valueType=float, orientation="horizontal")
 
+        # AUTO-TUNE
+
+        autotune_box = oasysgui.widgetBox(self.tab_autotune, "Resolution Auto-tune", addSpace=False, orientation="vertical")
+
+        gui.label(autotune_box, self, "The H and V resolution modification factors at resizing are\n" +
+                                      "doubled, starting from a coarse value, until FWHM, sigma and flux\n" +
+                                      "of the output wavefront converge within the tolerance")
+
+        oasysgui.lineEdit(autotune_box, self, "autotune_tolerance", "Relative Tolerance", labelWidth=300, valueType=float, orientation="horizontal")
+        oasysgui.lineEdit(autotune_box, self, "autotune_max_steps", "Max Number of Doublings", labelWidth=300, valueType=int, orientation="horizontal")
+
+        gui.button(autotune_box, self, "Auto-tune Resolution", callback=self.autotune_resolution, height=35)
+
         #DISPLACEMENTS
 
         if self.has_displacement_tab:
@@ -427,6 +465,9 @@ class OWSRWOpticalElement(SRWWavefrontViewer, WidgetDecorator):
             usage_box.layout().addWidget(bbox)
 
 
+    def set_SplitEnergySlices(self):
+        self.box_energy_slices_workers.setVisible(self.split_energy_slices == 1)
+
     def show_propagator_info(self):
         try:
             dialog = OWSRWOpticalElement.PropagatorInfoDialog(parent=self)
@@ -472,40 +513,55 @@ class OWSRWOpticalElement(SRWWavefrontViewer, WidgetDecorator):
     def propagate_new_wavefront(self, trigger):
         try:
             if trigger and trigger.new_object == True:
-                if trigger.has_additional_parameter("variable_name"):
+                if trigger.has_additional_parameter("sensitivity_variables"):
+                    self.propagate_wavefront_sensitivity(trigger.get_additional_parameter("sensitivity_variables"),
+                                                         trigger.get_additional_parameter("number_of_workers"))
+                elif trigger.has_additional_parameter("variable_name"):
                     if self.input_srw_data is None: raise Exception("No Input Data")
 
                     variable_name = trigger.get_additional_parameter("variable_name").strip()
                     variable_display_name = trigger.get_additional_parameter("variable_display_name").strip()
-                    variable_value = trigger.get_additional_parameter("variable_value")
                     variable_um = trigger.get_additional_parameter("variable_um")
 
-                    def check_options(variable_name):
-                        if variable_name in ["shift_x",
-                                             "rotation_x",
-                                             "shift_y",
-                                             "rotation_y"]:
-                            self.has_displacement = 1
-                            self.set_displacement()
-
-                    if "," in variable_name:
-                        variable_names = variable_name.split(",")
-
-                        for variable_name in variable_names:
-                            setattr(self, variable_name.strip(), variable_value)
-                            check_options(variable_name)
+                    if trigger.has_additional_parameter("variable_values"): # parallel scan
+                        self.propagate_wavefront_scan(variable_name,
+                                                      variable_display_name,
+                                                      trigger.get_additional_parameter("variable_values"),
+                                                      variable_um,
+                                                      trigger.get_additional_parameter("number_of_workers"))
                     else:
-                        setattr(self, variable_name, variable_value)
-                        check_options(variable_name)
+                        variable_value = trigger.get_additional_parameter("variable_value")
+
+                        self.set_scanned_variable(variable_name, variable_value)
 
-                    self.input_srw_data.get_srw_wavefront().setScanningData(SRWWavefront.ScanningData(variable_name, variable_value, variable_display_name, variable_um))
-                    self.propagate_wavefront()
+                        self.input_srw_data.get_srw_wavefront().setScanningData(SRWWavefront.ScanningData(variable_name, variable_value, variable_display_name, variable_um))
+                        self.propagate_wavefront()
 
         except Exception as exception:
             QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
 
             if self.IS_DEVELOP: raise exception
 
+    def set_scanned_variable(self, variable_name, variable_value):
+        def check_options(variable_name):
+            if variable_name in ["shift_x",
+                                 "rotation_x",
+                                 "shift_y",
+                                 "rotation_y"]:
+                self.has_displacement = 1
+                self.set_displacement()
+
+        if "," in variable_name:
+            variable_names = variable_name.split(",")
+
+            for variable_name in variable_names:
+                setattr(self, variable_name.strip(), variable_value)
+                check_options(variable_name)
+        else:
+            setattr(self, variable_name, variable_value)
+            check_options(variable_name)
+
+    @profiled("Propagation")
     def propagate_wavefront(self):
         try:
             self.progressBarInit()
@@ -516,51 +572,46 @@ class OWSRWOpticalElement(SRWWavefrontViewer, WidgetDecorator):
 
             # propagation to o.e.
 
-            propagator = PropagationManager.Instance()
-            propagation_mode = propagator.get_propagation_mode(SRW_APPLICATION)
-
-            handler_name = FresnelSRWNative.HANDLER_NAME if propagation_mode == SRWPropagationMode.STEP_BY_STEP  or \
-                                                            propagation_mode == SRWPropagationMode.WHOLE_BEAMLINE else \
-                           FresnelSRWWofry.HANDLER_NAME
+            propagation_mode = srw_engine.get_propagation_mode()
+            handler_name = srw_engine.get_handler_name(propagation_mode)
 
             input_wavefront = self.input_srw_data.get_srw_wavefront()
-            srw_beamline = self.input_srw_data.get_srw_beamline().duplicate()
-            working_srw_beamline = self.input_srw_data.get_working_srw_beamline().duplicate()
 
-            optical_element = self.get_optical_element()
-            optical_element.name = self.oe_name if not self.oe_name is None else self.windowTitle()
+            beamline_element = self.get_beamline_element()
 
-            if self.has_displacement==1:
-                optical_element.displacement = SRWOpticalElementDisplacement(shift_x=self.shift_x,
-                                                                             shift_y=self.shift_y,
-                                                                             rotation_x=numpy.radians(-self.rotation_x),
-                                                                             rotation_y=numpy.radians(-self.rotation_y))
+            wavefront_propagation_parameters = SRWPersistentBeamline.ParametersRecorder()
 
-            beamline_element = BeamlineElement(optical_element=optical_element,
-                                               coordinates=ElementCoordinates(p=self.p,
-                                                                              q=self.q,
-                                                                              angle_radial=numpy.radians(self.angle_radial),
-                                                                              angle_azimuthal=numpy.radians(self.angle_azimuthal)))
+            self.progressBarSet(20)
 
-            srw_beamline.append_beamline_element(beamline_element)
-            working_srw_beamline.append_beamline_element(beamline_element)
+            if isinstance(self.input_srw_data, SRWScanData):
+                self.set_additional_parameters(beamline_element, None, wavefront_propagation_parameters)
 
-            self.progressBarSet(20)
+                input_srw_data_list = self.input_srw_data.get_srw_data_list()
 
-            if propagation_mode == SRWPropagationMode.WHOLE_BEAMLINE:
-                self.set_additional_parameters(beamline_element, None, srw_beamline)
-                self.set_additional_parameters(beamline_element, None, working_srw_beamline)
+                output_srw_data = self.propagate_scan(input_srw_data_list,
+                                                      [beamline_element]*len(input_srw_data_list),
+                                                      [wavefront_propagation_parameters]*len(input_srw_data_list),
+                                                      [input_srw_data.get_srw_wavefront().scanned_variable_data for input_srw_data in input_srw_data_list],
+                                                      self.input_srw_data.get_number_of_workers())
+                output_wavefront = output_srw_data.get_srw_wavefront()
+            elif propagation_mode == SRWPropagationMode.WHOLE_BEAMLINE:
+                self.set_additional_parameters(beamline_element, None, wavefront_propagation_parameters)
 
-                if hasattr(self, "is_final_screen") and self.is_final_screen == 1:
-                    propagation_parameters = PropagationParameters(wavefront=input_wavefront.duplicate(),
-                                                                   propagation_elements = None)
+                srw_beamline = self.input_srw_data.get_persistent_srw_beamline().append(beamline_element, wavefront_propagation_parameters)
+                working_srw_beamline = self.input_srw_data.get_persistent_working_srw_beamline().append(beamline_element, wavefront_propagation_parameters)
 
-                    propagation_parameters.set_additional_parameters("working_beamline", working_srw_beamline)
+                self.check_memory_budget(input_wavefront, [(node.get_beamline_element(), node.get_wavefront_propagation_parameters()) for node in working_srw_beamline.get_nodes()])
 
+                if hasattr(self, "is_final_screen") and self.is_final_screen == 1:
                     self.setStatusMessage("Begin Propagation")
 
-                    output_wavefront = propagator.do_propagation(propagation_parameters=propagation_parameters,
-                                                                 handler_name=handler_name)
+                    if self.use_propagation_cache == 1 and len(working_srw_beamline.get_nodes()) == working_srw_beamline.get_beamline_elements_number():
+                        output_wavefront = self.propagate_from_checkpoints(input_wavefront, working_srw_beamline)
+                    else:
+                        output_wavefront = self.run_propagation_job(srw_engine.SRWEngineJob(srw_beamline=working_srw_beamline,
+                                                                                            source_wavefront=input_wavefront,
+                                                                                            propagation_mode=propagation_mode)).wavefront
+
                     self.setStatusMessage("Propagation Completed")
 
                     output_srw_data = SRWData(srw_beamline=srw_beamline,
@@ -571,46 +622,221 @@ class OWSRWOpticalElement(SRWWavefrontViewer, WidgetDecorator):
 
                     output_srw_data = SRWData(srw_beamline=srw_beamline,
                                               srw_wavefront=input_wavefront)
+                    output_srw_data.set_working_srw_beamline(working_srw_beamline)
             else:
-                propagation_elements = PropagationElements()
-                propagation_elements.add_beamline_element(beamline_element)
+                self.set_additional_parameters(beamline_element, None, wavefront_propagation_parameters)
 
-                propagation_parameters = PropagationParameters(wavefront=input_wavefront.duplicate(),
-                                                               propagation_elements = propagation_elements)
+                srw_beamline = self.input_srw_data.get_persistent_srw_beamline().append(beamline_element, wavefront_propagation_parameters)
 
-                self.set_additional_parameters(beamline_element, propagation_parameters, srw_beamline)
+                cache_key = self.get_propagation_cache_key(handler_name, input_wavefront, beamline_element, wavefront_propagation_parameters)
+                output_wavefront = self.get_cached_propagation(cache_key)
 
-                self.setStatusMessage("Begin Propagation")
+                if output_wavefront is None:
+                    self.check_memory_budget(input_wavefront, [(beamline_element, wavefront_propagation_parameters)])
 
-                output_wavefront = propagator.do_propagation(propagation_parameters=propagation_parameters,
-                                                             handler_name=handler_name)
+                    self.setStatusMessage("Begin Propagation")
+
+                    output_wavefront = self.run_propagation_job(srw_engine.get_element_propagation_job(self.input_srw_data,
+                                                                                                       beamline_element,
+                                                                                                       wavefront_propagation_parameters,
+                                                                                                       propagation_mode)).wavefront
 
-                self.setStatusMessage("Propagation Completed")
+                    self.setStatusMessage("Propagation Completed")
+
+                    self.cache_propagation(cache_key, output_wavefront)
 
                 output_srw_data = SRWData(srw_beamline=srw_beamline,
                                           srw_wavefront=output_wavefront)
 
-            self.progressBarSet(50)
-
-            if not output_wavefront is None:
+            if not output_wavefront is None and not isinstance(output_srw_data, SRWScanData):
                 output_wavefront.setScanningData(self.input_srw_data.get_srw_wavefront().scanned_variable_data)
 
-                self.output_wavefront = output_wavefront
-                self.initializeTabs()
+            self.send_output(output_srw_data, output_wavefront)
+
+        except srw_engine.SRWEngineCancelled:
+            self.setStatusMessage("Propagation Cancelled")
+            self.progressBarFinished()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e.args[0]), QMessageBox.Ok)
+
+            self.setStatusMessage("")
+            self.progressBarFinished()
+
+            if self.IS_DEVELOP: raise e
+
+    @profiled("Scan Propagation")
+    def propagate_wavefront_scan(self, variable_name, variable_display_name, variable_values, variable_um, number_of_workers):
+        try:
+            self.progressBarInit()
+
+            beamline_elements = []
+            wavefront_propagation_parameters = []
+            scanning_data_list = []
 
-                tickets = []
+            for variable_value in variable_values:
+                self.set_scanned_variable(variable_name, variable_value)
+                self.check_data()
 
-                self.run_calculation_for_plots(tickets=tickets, progress_bar_value=50)
+                beamline_element = self.get_beamline_element()
+                element_wavefront_propagation_parameters = SRWPersistentBeamline.ParametersRecorder()
 
-                self.plot_results(tickets, 80)
+                self.set_additional_parameters(beamline_element, None, element_wavefront_propagation_parameters)
 
+                beamline_elements.append(beamline_element)
+                wavefront_propagation_parameters.append(element_wavefront_propagation_parameters)
+                scanning_data_list.append(SRWWavefront.ScanningData(variable_name, variable_value, variable_display_name, variable_um))
+
+            self.progressBarSet(20)
+
+            output_srw_data = self.propagate_scan([self.input_srw_data]*len(variable_values),
+                                                  beamline_elements,
+                                                  wavefront_propagation_parameters,
+                                                  scanning_data_list,
+                                                  number_of_workers)
+
+            self.send_output(output_srw_data, output_srw_data.get_srw_wavefront())
+
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e.args[0]), QMessageBox.Ok)
+
+            self.setStatusMessage("")
             self.progressBarFinished()
+
+            if self.IS_DEVELOP: raise e
+
+    # each parameter is perturbed by -step and +step around its nominal value, all the variants are propagated as a
+    # parallel scan from the input wavefront of this element, and the nominal values are restored
+    @profiled("Sensitivity Analysis")
+    def propagate_wavefront_sensitivity(self, sensitivity_variables, number_of_workers):
+        try:
+            self.progressBarInit()
+
+            if self.input_srw_data is None: raise Exception("No Input Data")
+
+            for variable_name, variable_display_name, _, _ in sensitivity_variables:
+                if not hasattr(self, variable_name): raise Exception(variable_display_name + " is not a parameter of " + self.windowTitle())
+
+            nominal_values = [getattr(self, variable_name) for variable_name, _, _, _ in sensitivity_variables]
+            scanning_data_list = srw_sensitivity.get_sensitivity_scanning_data_list(sensitivity_variables, nominal_values)
+
+            beamline_elements = []
+            wavefront_propagation_parameters = []
+
+            try:
+                with srw_sensitivity.nominal_values_restored(self, [variable_name for variable_name, _, _, _ in sensitivity_variables]):
+                    for scanning_data in scanning_data_list:
+                        for (variable_name, _, _, _), nominal_value in zip(sensitivity_variables, nominal_values):
+                            self.set_scanned_variable(variable_name, scanning_data.get_scanned_variable_value() if variable_name == scanning_data.get_scanned_variable_name() else nominal_value)
+
+                        self.check_data()
+
+                        beamline_element = self.get_beamline_element()
+                        element_wavefront_propagation_parameters = SRWPersistentBeamline.ParametersRecorder()
+
+                        self.set_additional_parameters(beamline_element, None, element_wavefront_propagation_parameters)
+
+                        beamline_elements.append(beamline_element)
+                        wavefront_propagation_parameters.append(element_wavefront_propagation_parameters)
+            finally:
+                if self.has_displacement_tab: self.set_displacement()
+
+            self.progressBarSet(20)
+
+            output_srw_data = self.propagate_scan([self.input_srw_data]*len(scanning_data_list),
+                                                  beamline_elements,
+                                                  wavefront_propagation_parameters,
+                                                  scanning_data_list,
+                                                  number_of_workers)
+
+            self.send_output(output_srw_data, output_srw_data.get_srw_wavefront())
+
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e.args[0]), QMessageBox.Ok)
+
             self.setStatusMessage("")
+            self.progressBarFinished()
+
+            if self.IS_DEVELOP: raise e
+
+    #################################
+    # the same resolution factor is given to the H and V resolution modification factors of all the propagation steps
+    # of this element, the tuned factor is remembered for the input wavefront, the element configuration (with the
+    # resolution factors neutralized) and the tolerance: the same configuration is not tuned twice
+    #################################
+
+    @profiled("Resolution Auto-tune")
+    def autotune_resolution(self):
+        try:
+            self.progressBarInit()
+
+            if self.input_srw_data is None: raise Exception("No Input Data")
+            if isinstance(self.input_srw_data, SRWScanData): raise Exception("Auto-tune is not available for the results of a parallel scan")
 
-            self.send("SRWData", output_srw_data)
+            self.check_data()
+
+            congruence.checkStrictlyPositiveNumber(self.autotune_tolerance, "Auto-tune Relative Tolerance")
+            congruence.checkStrictlyPositiveNumber(self.autotune_max_steps, "Auto-tune Max Number of Doublings")
+
+            propagation_mode = srw_engine.get_propagation_mode()
+            input_wavefront = self.input_srw_data.get_srw_wavefront()
+
+            def get_propagation_job():
+                beamline_element = self.get_beamline_element()
+                wavefront_propagation_parameters = SRWPersistentBeamline.ParametersRecorder()
+
+                self.set_additional_parameters(beamline_element, None, wavefront_propagation_parameters)
+
+                return srw_engine.get_element_propagation_job(self.input_srw_data, beamline_element, wavefront_propagation_parameters, propagation_mode)
+
+            initial_resolution_factors = self.get_resolution_factors()
+
+            try:
+                self.set_resolution_factors(1.0)
+
+                configuration_key = get_fingerprint(get_wavefront_fingerprint(input_wavefront), get_propagation_job().srw_beamline, propagation_mode, self.autotune_tolerance)
+            finally:
+                self.set_resolution_factors(initial_resolution_factors)
 
-            self.send("Trigger", TriggerIn(new_object=True))
+            if configuration_key in self.autotune_memory:
+                tuned_resolution_factor = self.autotune_memory[configuration_key]
 
+                self.writeStdOut("Auto-tune: configuration already tuned, resolution factor = " + "{:.4g}".format(tuned_resolution_factor) + "\n")
+            else:
+                def propagate(resolution_factor):
+                    self.set_resolution_factors(resolution_factor)
+
+                    job = get_propagation_job()
+
+                    self.check_memory_budget(input_wavefront, [(node.get_beamline_element(), node.get_wavefront_propagation_parameters()) for node in job.srw_beamline.get_nodes()])
+
+                    return self.run_propagation_job(job).wavefront
+
+                try:
+                    result = srw_autotune.autotune(propagate,
+                                                   parameter_name="Resolution Factor",
+                                                   initial_value=self.AUTOTUNE_INITIAL_RESOLUTION_FACTOR,
+                                                   tolerance=self.autotune_tolerance,
+                                                   max_steps=self.autotune_max_steps,
+                                                   status_callback=self.setStatusMessage)
+                finally:
+                    self.set_resolution_factors(initial_resolution_factors)
+
+                self.writeStdOut(result.get_report_text() + "\n")
+
+                if not result.is_converged(): raise Exception("Resolution not converged within " + str(self.autotune_max_steps) + " doublings: increase their number or the tolerance")
+
+                tuned_resolution_factor = result.tuned_value
+
+                self.autotune_memory[configuration_key] = tuned_resolution_factor
+
+            self.setStatusMessage("")
+            self.progressBarFinished()
+
+            if showConfirmMessage("Cheapest resolution modification factor meeting the tolerance: " + "{:.4g}".format(tuned_resolution_factor), "Apply it?", self):
+                self.set_resolution_factors(tuned_resolution_factor)
+        except srw_engine.SRWEngineCancelled:
+            self.setStatusMessage("Auto-tune Cancelled")
+            self.progressBarFinished()
         except Exception as e:
             QMessageBox.critical(self, "Error", str(e.args[0]), QMessageBox.Ok)
 
@@ -619,6 +845,188 @@ class OWSRWOpticalElement(SRWWavefrontViewer, WidgetDecorator):
 
             if self.IS_DEVELOP: raise e
 
+    # prefixes of the settings of the propagation steps of this element, as in set_additional_parameters
+    def get_resolution_factor_prefixes(self):
+        prefixes = []
+
+        if self.p != 0: prefixes.append("drift_before")
+        if self.has_oe_wavefront_propagation_parameters_tab: prefixes.append("oe")
+        if self.q != 0: prefixes.append("drift")
+
+        return prefixes
+
+    def get_resolution_factors(self):
+        return [(getattr(self, prefix + "_horizontal_resolution_modification_factor_at_resizing"),
+                 getattr(self, prefix + "_vertical_resolution_modification_factor_at_resizing")) for prefix in self.get_resolution_factor_prefixes()]
+
+    def set_resolution_factors(self, resolution_factors):
+        prefixes = self.get_resolution_factor_prefixes()
+
+        if not isinstance(resolution_factors, list): resolution_factors = [(resolution_factors, resolution_factors)]*len(prefixes)
+
+        for prefix, (horizontal_resolution_factor, vertical_resolution_factor) in zip(prefixes, resolution_factors):
+            setattr(self, prefix + "_horizontal_resolution_modification_factor_at_resizing", horizontal_resolution_factor)
+            setattr(self, prefix + "_vertical_resolution_modification_factor_at_resizing", vertical_resolution_factor)
+
+    # every scan value is propagated through this element by an independent job, the results are collected in scan order:
+    # in whole beamline mode each job starts from the source, through the elements of the working beamline
+    def propagate_scan(self, input_srw_data_list, beamline_elements, wavefront_propagation_parameters, scanning_data_list, number_of_workers):
+        propagation_mode = srw_engine.get_propagation_mode()
+
+        jobs = [srw_engine.get_element_propagation_job(input_srw_data, beamline_element, element_wavefront_propagation_parameters, propagation_mode)
+                for input_srw_data, beamline_element, element_wavefront_propagation_parameters in zip(input_srw_data_list, beamline_elements, wavefront_propagation_parameters)]
+
+        self.check_memory_budget(jobs[-1].source_wavefront, [(node.get_beamline_element(), node.get_wavefront_propagation_parameters()) for node in jobs[-1].srw_beamline.get_nodes()], min(len(jobs), number_of_workers))
+
+        self.setStatusMessage("Propagating " + str(len(jobs)) + " scan values with " + str(number_of_workers) + " workers")
+
+        def job_completed(index, result):
+            self.progressBarSet(20 + 30*(index + 1)/len(jobs))
+
+        results = self.run_in_pool(srw_engine.run_jobs, jobs, max_workers=number_of_workers, callback=job_completed)
+
+        output_srw_data_list = []
+
+        for input_srw_data, beamline_element, element_wavefront_propagation_parameters, scanning_data, result in zip(input_srw_data_list, beamline_elements, wavefront_propagation_parameters, scanning_data_list, results):
+            result.wavefront.setScanningData(scanning_data)
+
+            output_srw_data = SRWData(srw_beamline=input_srw_data.get_persistent_srw_beamline().append(beamline_element, element_wavefront_propagation_parameters),
+                                      srw_wavefront=result.wavefront)
+            output_srw_data.reset_working_srw_beamline()
+
+            output_srw_data_list.append(output_srw_data)
+
+        self.setStatusMessage("Propagation Completed")
+
+        return SRWScanData(output_srw_data_list, number_of_workers)
+
+    def send_output(self, output_srw_data, output_wavefront):
+        self.progressBarSet(50)
+
+        if not output_wavefront is None:
+            self.check_precision_accuracy(output_wavefront)
+
+            self.output_wavefront = output_wavefront
+            self.initializeTabs()
+
+            tickets = []
+
+            self.run_calculation_for_plots(tickets=tickets, progress_bar_value=50)
+
+            self.plot_results(tickets, 80)
+
+        self.progressBarFinished()
+        self.setStatusMessage("")
+
+        self.send("SRWData", output_srw_data)
+
+        self.send("Trigger", TriggerIn(new_object=True))
+
+    def get_beamline_element(self):
+        optical_element = self.get_optical_element()
+        optical_element.name = self.oe_name if not self.oe_name is None else self.windowTitle()
+
+        if self.has_displacement==1:
+            optical_element.displacement = SRWOpticalElementDisplacement(shift_x=self.shift_x,
+                                                                         shift_y=self.shift_y,
+                                                                         rotation_x=numpy.radians(-self.rotation_x),
+                                                                         rotation_y=numpy.radians(-self.rotation_y))
+
+        return BeamlineElement(optical_element=optical_element,
+                               coordinates=ElementCoordinates(p=self.p,
+                                                              q=self.q,
+                                                              angle_radial=numpy.radians(self.angle_radial),
+                                                              angle_azimuthal=numpy.radians(self.angle_azimuthal)))
+
+    # pre-flight estimate of the meshes produced by the propagation: a propagation exceeding the memory budget is
+    # refused or has to be confirmed, according to the SRW Tools menu settings
+    def check_memory_budget(self, input_wavefront, beamline_elements, concurrent_propagations=1):
+        estimates = srw_estimator.estimate_propagation(input_wavefront, beamline_elements)
+
+        peak_memory = srw_estimator.get_peak_memory(input_wavefront, estimates)*concurrent_propagations
+        memory_budget = QSettings().value("srw/memory-budget", srw_estimator.get_default_memory_budget()//1024**2, int)*1024**2 # MB
+
+        if peak_memory > memory_budget:
+            message = "Estimated memory for the propagation (" + str(round(peak_memory/1024**3, 2)) + " GB" + \
+                      ("" if concurrent_propagations == 1 else ", " + str(concurrent_propagations) + " concurrent propagations") + \
+                      ") exceeds the memory budget (" + str(round(memory_budget/1024**3, 2)) + " GB)"
+
+            self.writeStdOut(message + "\n\n" + srw_estimator.get_report_text(input_wavefront, estimates) + "\n")
+
+            if QSettings().value("srw/memory-budget-action", 0, int) == 1:
+                raise Exception(message + ": propagation refused")
+            elif not showConfirmMessage(message, "Continue anyway?", self):
+                raise Exception(message + ": propagation aborted")
+
+    def get_memory_estimate_report(self):
+        if self.input_srw_data is None: raise Exception("No Input Data")
+
+        beamline_element = self.get_beamline_element()
+        wavefront_propagation_parameters = SRWPersistentBeamline.ParametersRecorder()
+
+        self.set_additional_parameters(beamline_element, None, wavefront_propagation_parameters)
+
+        if srw_engine.get_propagation_mode() == SRWPropagationMode.WHOLE_BEAMLINE:
+            beamline_elements = [(node.get_beamline_element(), node.get_wavefront_propagation_parameters()) for node in self.input_srw_data.get_persistent_working_srw_beamline().get_nodes()]
+        else:
+            beamline_elements = []
+
+        beamline_elements.append((beamline_element, wavefront_propagation_parameters))
+
+        input_wavefront = self.input_srw_data.get_srw_wavefront()
+
+        return srw_estimator.get_report_text(input_wavefront, srw_estimator.estimate_propagation(input_wavefront, beamline_elements))
+
+    def get_propagation_cache_key(self, handler_name, input_wavefront, *parameters):
+        if self.use_propagation_cache == 1:
+            return SRWPropagationCache.Instance().get_key(input_wavefront, handler_name, *parameters)
+        else:
+            return None
+
+    def get_cached_propagation(self, cache_key):
+        if cache_key is None: return None
+
+        cached_wavefront = SRWPropagationCache.Instance().get(cache_key)
+
+        if not cached_wavefront is None: self.setStatusMessage("Propagation retrieved from Cache")
+
+        return cached_wavefront
+
+    def cache_propagation(self, cache_key, output_wavefront):
+        if not cache_key is None:
+            propagation_cache = SRWPropagationCache.Instance()
+            propagation_cache.set_memory_budget(QSettings().value("srw/propagation-cache-size", 2048, int)*1024**2) # MB
+            propagation_cache.put(cache_key, output_wavefront)
+
+    def propagate_from_checkpoints(self, source_wavefront, working_srw_beamline):
+        checkpoint_store = SRWCheckpointStore.Instance()
+        checkpoint_store.set_memory_budget(QSettings().value("srw/checkpoint-store-size", 4096, int)*1024**2) # MB
+
+        return srw_engine.propagate_from_checkpoints(source_wavefront,
+                                                     working_srw_beamline,
+                                                     checkpoint_store=checkpoint_store,
+                                                     status_callback=self.setStatusMessage,
+                                                     job_runner=self.run_propagation_job)
+
+    def run_propagation_job(self, job):
+        if self.split_energy_slices == 1 and not job.keep_intermediate_wavefronts and \
+                not job.source_wavefront is None and job.source_wavefront.mesh.ne > 1:
+            return self.run_energy_sliced_propagation_job(job)
+        else:
+            return self.run_in_worker(srw_engine.run_job, job)
+
+    def run_energy_sliced_propagation_job(self, job):
+        congruence.checkStrictlyPositiveNumber(self.energy_slices_workers, "Number of Workers")
+
+        number_of_slices = job.source_wavefront.mesh.ne
+
+        self.setStatusMessage("Propagating " + str(number_of_slices) + " energy slices with " + str(self.energy_slices_workers) + " workers")
+
+        def slice_completed(index, result):
+            self.progressBarSet(20 + 30*(index + 1)/number_of_slices)
+
+        return self.run_in_pool(srw_engine.run_energy_sliced_job, job, max_workers=self.energy_slices_workers, callback=slice_completed)
+
     def set_additional_parameters(self, beamline_element, propagation_parameters=None, beamline=None):
         from wofrysrw.beamline.srw_beamline import Where
 
@@ -760,35 +1168,36 @@ class OWSRWOpticalElement(SRWWavefrontViewer, WidgetDecorator):
             if self.is_automatic_run:
                 self.propagate_wavefront()
 
+    @profiled("Calculation for Plots")
     def run_calculation_for_plots(self, tickets, progress_bar_value):
         if self.view_type==2:
-            e, h, v, i = self.output_wavefront.get_intensity(multi_electron=False, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
+            e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=False, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
 
             SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
             self.progressBarSet(progress_bar_value)
 
-            e, h, v, i = self.output_wavefront.get_intensity(multi_electron=False, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
+            e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=False, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
 
             SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
-            e, h, v, p = self.output_wavefront.get_phase(polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
+            e, h, v, p = srw_precision.get_phase(self.output_wavefront, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
 
             SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, p, tickets, int_phase=1)
 
-            e, h, v, p = self.output_wavefront.get_phase(polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
+            e, h, v, p = srw_precision.get_phase(self.output_wavefront, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
 
             SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, p, tickets, int_phase=1)
 
             self.progressBarSet(progress_bar_value + 10)
         elif self.view_type==1:
-            e, h, v, i = self.output_wavefront.get_intensity(multi_electron=False)
+            e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=False)
 
             SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
             self.progressBarSet(progress_bar_value)
 
-            e, h, v, p = self.output_wavefront.get_phase()
+            e, h, v, p = srw_precision.get_phase(self.output_wavefront)
 
             SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, p, tickets, int_phase=1)
 
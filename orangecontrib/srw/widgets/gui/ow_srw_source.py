@@ -1,6 +1,6 @@
 __author__ = 'labx'
 
-import sys, numpy
+import os, sys, time, numpy
 
 from PyQt5.QtGui import QPalette, QColor, QFont
 from PyQt5.QtWidgets import QMessageBox
@@ -20,9 +20,12 @@ from syned.beamline.shape import Rectangle
 
 from wofrysrw.propagator.wavefront2D.srw_wavefront import WavefrontParameters, WavefrontPrecisionParameters, PolarizationComponent
 from wofrysrw.storage_ring.srw_electron_beam import SRWElectronBeam
-from wofrysrw.beamline.srw_beamline import SRWBeamline
 
-from orangecontrib.srw.util.srw_objects import SRWData
+from orangecontrib.srw.util.srw_objects import SRWData, SRWPersistentBeamline, SRWMacroElectrons, create_srw_beamline
+from orangecontrib.srw.util import srw_engine, srw_precision, srw_autotune, srw_multi_electron, srw_symmetry
+from orangecontrib.srw.util.srw_cache import get_fingerprint
+from orangecontrib.srw.util.srw_util import showConfirmMessage
+from orangecontrib.srw.util.srw_profiler import profiled
 from orangecontrib.srw.widgets.gui.ow_srw_wavefront_viewer import SRWWavefrontViewer
 
 class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
@@ -80,6 +83,15 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
     type_of_properties = Setting(1)
     type_of_initialization = Setting(0)
 
+    sampling_method = Setting(0)
+    number_of_macro_electrons = Setting(1)
+    macro_electrons_seed = Setting(0)
+    macro_electrons_workers = Setting(os.cpu_count() or 1)
+
+    __seed_sequence = None
+    __sequence_index = 0
+    __sequence_seed = None
+
     wf_energy_type = Setting(0)
     wf_photon_energy = Setting(8000.0)
     wf_photon_energy_to=Setting(8100.0)
@@ -101,6 +113,15 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
     wf_use_terminating_terms = Setting(1)
     wf_sampling_factor_for_adjusting_nx_ny = Setting(0.0)
 
+    autotune_tolerance = Setting(0.01)
+    autotune_max_steps = Setting(5)
+    autotune_memory = Setting({})
+
+    wf_symmetry = Setting(srw_symmetry.SRWSymmetry.NONE)
+    wf_symmetry_verification = Setting(0)
+
+    AUTOTUNE_INITIAL_SAMPLING_FACTOR = 0.25
+
     TABS_AREA_HEIGHT = 618
     CONTROL_AREA_WIDTH = 405
 
@@ -208,6 +229,7 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
 
         self.left_box_3_1 = oasysgui.widgetBox(tab_traj, "", addSpace=False, orientation="vertical", height=160)
         self.left_box_3_2 = oasysgui.widgetBox(tab_traj, "", addSpace=False, orientation="vertical", height=160)
+        self.left_box_3_3 = oasysgui.widgetBox(tab_traj, "", addSpace=False, orientation="vertical", height=160)
 
         oasysgui.lineEdit(self.left_box_3_1, self, "moment_x", "x\u2080 [m]", labelWidth=200, valueType=float, orientation="horizontal")
         oasysgui.lineEdit(self.left_box_3_1, self, "moment_y", "y\u2080 [m]", labelWidth=200, valueType=float, orientation="horizontal")
@@ -221,6 +243,19 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
         oasysgui.lineEdit(self.left_box_3_1, self, "moment_xp", "x'\u2080 [rad]", labelWidth=200, valueType=float, orientation="horizontal")
         oasysgui.lineEdit(self.left_box_3_1, self, "moment_yp", "y'\u2080 [rad]", labelWidth=200, valueType=float, orientation="horizontal")
 
+        gui.separator(self.left_box_3_3)
+
+        gui.comboBox(self.left_box_3_3, self, "sampling_method", label="Sampling", labelWidth=140,
+                     items=srw_multi_electron.SamplingMethod.tuple(),
+                     sendSelectedValue=False, orientation="horizontal",
+                     tooltip="Quasi-random: the electrons are consecutive points of a low-discrepancy sequence, across the runs of a loop")
+        oasysgui.lineEdit(self.left_box_3_3, self, "number_of_macro_electrons", "Macro-Electrons per Run", labelWidth=260, valueType=int, orientation="horizontal",
+                          tooltip="More than 1: a batch of macro-electrons is propagated and accumulated by the Accumulation Point")
+        oasysgui.lineEdit(self.left_box_3_3, self, "macro_electrons_seed", "Random Seed", labelWidth=260, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(self.left_box_3_3, self, "macro_electrons_workers", "Number of Workers", labelWidth=260, valueType=int, orientation="horizontal")
+
+        gui.button(self.left_box_3_3, self, "Restart Random Sequences", callback=self.reset_seed_sequence)
+
         self.set_TypeOfInitialization()
 
         self.tab_plots = oasysgui.createTabPage(self.tabs_setting, "Wavefront Setting")
@@ -265,6 +300,40 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
 
         oasysgui.lineEdit(pre_box, self, "wf_sampling_factor_for_adjusting_nx_ny", "Sampling factor for adjusting nx/ny\n(effective if > 0)", labelWidth=260, valueType=float, orientation="horizontal")
 
+        # AUTO-TUNE -------------------------------------------
+
+        tab_aut = oasysgui.createTabPage(self.tabs_plots_setting, "Auto-tune")
+
+        aut_box = oasysgui.widgetBox(tab_aut, "Sampling Auto-tune", addSpace=False, orientation="vertical")
+
+        gui.label(aut_box, self, "The sampling factor for adjusting nx/ny is doubled, starting from\n" +
+                                 "a coarse value, until FWHM, sigma and flux of the wavefront\n" +
+                                 "converge within the tolerance")
+
+        oasysgui.lineEdit(aut_box, self, "autotune_tolerance", "Relative Tolerance", labelWidth=260, valueType=float, orientation="horizontal")
+        oasysgui.lineEdit(aut_box, self, "autotune_max_steps", "Max Number of Doublings", labelWidth=260, valueType=int, orientation="horizontal")
+
+        gui.button(aut_box, self, "Auto-tune Sampling", callback=self.autotune_sampling, height=35)
+
+        # SYMMETRY -------------------------------------------
+
+        if self.is_symmetry_supported():
+            tab_sym = oasysgui.createTabPage(self.tabs_plots_setting, "Symmetry")
+
+            sym_box = oasysgui.widgetBox(tab_sym, "Mirror Symmetry", addSpace=False, orientation="vertical")
+
+            gui.label(sym_box, self, "Only the irreducible half or quadrant of the wavefront is calculated,\n" +
+                                     "and unfolded with the parities of the electric field.\n" +
+                                     "Auto-detect: electron beam, magnet and slit on axis (orbit plane)")
+
+            gui.comboBox(sym_box, self, "wf_symmetry", label="Symmetry",
+                         items=srw_symmetry.SRWSymmetry.tuple(), labelWidth=120,
+                         sendSelectedValue=False, orientation="horizontal")
+
+            gui.comboBox(sym_box, self, "wf_symmetry_verification", label="Compare with the Full Calculation",
+                         items=["No", "Yes"], labelWidth=260,
+                         sendSelectedValue=False, orientation="horizontal")
+
         gui.rubber(self.controlArea)
 
     def get_calculation_method_items(self):
@@ -277,7 +346,8 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
 
     def set_TypeOfInitialization(self):
         self.left_box_3_1.setVisible(self.type_of_initialization==1)
-        self.left_box_3_2.setVisible(self.type_of_initialization!=1)
+        self.left_box_3_2.setVisible(self.type_of_initialization==0)
+        self.left_box_3_3.setVisible(self.type_of_initialization==2)
 
     def build_wf_photon_energy_box(self, box):
         gui.comboBox(box, self, "wf_energy_type", label="Energy Setting",
@@ -299,6 +369,7 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
         self.energy_type_box_1.setVisible(self.wf_energy_type==0)
         self.energy_type_box_2.setVisible(self.wf_energy_type==1)
 
+    @profiled("Source Calculation")
     def runSRWSource(self):
         self.setStatusMessage("")
         self.progressBarInit()
@@ -306,8 +377,16 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
         try:
             self.checkFields()
 
-            srw_source = self.get_srw_source(self.get_electron_beam())
-            srw_source.name = self.source_name if not self.source_name is None else self.windowTitle(),
+            if self.is_multi_electron_batch():
+                light_sources = [self.get_srw_source(self.get_electron_beam(random_generator, verbose=False))
+                                 for random_generator in srw_multi_electron.get_random_generators(self.get_seed_sequence(), self.number_of_macro_electrons)]
+
+                for light_source in light_sources: light_source.name = self.source_name if not self.source_name is None else self.windowTitle(),
+
+                srw_source = light_sources[0] # the wavefront of the first macro-electron is calculated and shown here
+            else:
+                srw_source = self.get_srw_source(self.get_electron_beam())
+                srw_source.name = self.source_name if not self.source_name is None else self.windowTitle(),
 
             self.progressBarSet(10)
 
@@ -321,9 +400,10 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
 
             self.setStatusMessage("")
 
-            beamline = SRWBeamline(light_source=srw_source)
+            beamline = create_srw_beamline(srw_source)
             self.output_wavefront = self.calculate_wavefront_propagation(srw_source)
 
+            self.check_precision_accuracy(self.output_wavefront)
 
             if self.is_do_plots():
                 self.setStatusMessage("Plotting Results")
@@ -336,8 +416,20 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
 
             self.setStatusMessage("")
 
+            coherent_modes = self.get_coherent_modes(srw_source, self.output_wavefront)
+
+            if self.is_multi_electron_batch():
+                beamline = SRWPersistentBeamline(beamline, macro_electrons=SRWMacroElectrons(light_sources=light_sources,
+                                                                                             source_wavefront_parameters=self.get_wavefront_parameters(srw_source),
+                                                                                             number_of_workers=self.macro_electrons_workers,
+                                                                                             seed=self.macro_electrons_seed))
+            elif not coherent_modes is None:
+                beamline = SRWPersistentBeamline(beamline, coherent_modes=coherent_modes)
+
             self.send("SRWData", SRWData(srw_beamline=beamline, srw_wavefront=self.output_wavefront))
 
+        except srw_engine.SRWEngineCancelled:
+            self.setStatusMessage("Calculation Cancelled")
         except Exception as exception:
             QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
 
@@ -349,10 +441,107 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
         if trigger and trigger.new_object == True:
             self.runSRWSource()
 
-    def get_electron_beam(self):
+    #################################
+    # the tuned sampling factor is remembered for the configuration of source and wavefront (with the sampling factor
+    # neutralized) and the tolerance: the same configuration is not tuned twice
+    #################################
+
+    @profiled("Sampling Auto-tune")
+    def autotune_sampling(self):
+        self.setStatusMessage("")
+        self.progressBarInit()
+
+        try:
+            self.checkFields()
+
+            congruence.checkStrictlyPositiveNumber(self.autotune_tolerance, "Auto-tune Relative Tolerance")
+            congruence.checkStrictlyPositiveNumber(self.autotune_max_steps, "Auto-tune Max Number of Doublings")
+
+            srw_source = self.get_srw_source(self.get_electron_beam())
+
+            configuration_key = get_fingerprint(srw_source, self.get_wavefront_parameters(srw_source, 0.0), self.autotune_tolerance)
+
+            if configuration_key in self.autotune_memory:
+                tuned_sampling_factor = self.autotune_memory[configuration_key]
+
+                self.writeStdOut("Auto-tune: configuration already tuned, sampling factor = " + "{:.4g}".format(tuned_sampling_factor) + "\n")
+            else:
+                def calculate(sampling_factor):
+                    wavefront_parameters = self.get_wavefront_parameters(srw_source, sampling_factor)
+
+                    return self.run_in_worker(srw_engine.calculate_source_wavefront, srw_source, wavefront_parameters, self.get_trajectory(srw_source, wavefront_parameters))
+
+                result = srw_autotune.autotune(calculate,
+                                               parameter_name="Sampling Factor",
+                                               initial_value=self.AUTOTUNE_INITIAL_SAMPLING_FACTOR,
+                                               tolerance=self.autotune_tolerance,
+                                               max_steps=self.autotune_max_steps,
+                                               status_callback=self.setStatusMessage)
+
+                self.writeStdOut(result.get_report_text() + "\n")
+
+                if not result.is_converged(): raise Exception("Sampling not converged within " + str(self.autotune_max_steps) + " doublings: increase their number or the tolerance")
+
+                tuned_sampling_factor = result.tuned_value
+
+                self.autotune_memory[configuration_key] = tuned_sampling_factor
+
+            self.setStatusMessage("")
+
+            if showConfirmMessage("Cheapest sampling factor for adjusting nx/ny meeting the tolerance: " + "{:.4g}".format(tuned_sampling_factor), "Apply it?", self):
+                self.wf_sampling_factor_for_adjusting_nx_ny = tuned_sampling_factor
+        except srw_engine.SRWEngineCancelled:
+            self.setStatusMessage("Auto-tune Cancelled")
+        except Exception as exception:
+            QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
+
+            self.setStatusMessage("")
+
+            if self.IS_DEVELOP: raise exception
+
+        self.progressBarFinished()
+
+    #################################
+    # batched multi-electron Monte Carlo: each macro-electron of a run is sampled from its own random stream, spawned
+    # from the seed, so runs are reproducible and independent of the order of calculation
+    #################################
+
+    def is_multi_electron_batch(self):
+        return self.type_of_initialization == 2 and self.number_of_macro_electrons > 1
+
+    def get_seed_sequence(self):
+        if self.__seed_sequence is None or self.__seed_sequence.entropy != self.macro_electrons_seed:
+            self.__seed_sequence = numpy.random.SeedSequence(self.macro_electrons_seed)
+
+        return self.__seed_sequence
+
+    def reset_seed_sequence(self):
+        self.__seed_sequence = None
+        self.__sequence_index = 0
+
+    # next point of the quasi-random sequence: the index steps through the sequence across the runs
+    def get_next_quasi_random_normals(self):
+        if self.__sequence_seed != self.macro_electrons_seed:
+            self.__sequence_seed = self.macro_electrons_seed
+            self.__sequence_index = 0
+
+        normals = srw_multi_electron.get_quasi_random_normals(self.sampling_method, self.macro_electrons_seed, self.__sequence_index)[0]
+
+        self.__sequence_index += 1
+
+        return normals
+
+    def get_electron_beam(self, random_generator=numpy.random, verbose=True):
+        if self.type_of_initialization == 2 and self.sampling_method != srw_multi_electron.SamplingMethod.PSEUDO_RANDOM:
+            normals = self.get_next_quasi_random_normals() # energy, x, x', y, y'
+        else:
+            normals = None
+
         if self.type_of_initialization == 2:
-            electron_beam = SRWElectronBeam(energy_in_GeV=numpy.random.normal(self.electron_energy_in_GeV,
-                                                                              self.electron_energy_spread*self.electron_energy_in_GeV),
+            if normals is None: energy_in_GeV = random_generator.normal(self.electron_energy_in_GeV, self.electron_energy_spread*self.electron_energy_in_GeV)
+            else:               energy_in_GeV = self.electron_energy_in_GeV*(1 + self.electron_energy_spread*normals[0])
+
+            electron_beam = SRWElectronBeam(energy_in_GeV=energy_in_GeV,
                                             energy_spread=self.electron_energy_spread,
                                             current=self.ring_current)
         else:
@@ -415,12 +604,21 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
             self.moment_z = self.get_default_initial_z()
             self.moment_xp = 0.0
             self.moment_yp = 0.0
-        elif self.type_of_initialization == 2: # sampled
-            self.moment_x = numpy.random.normal(0.0, self.electron_beam_size_h)
-            self.moment_y = numpy.random.normal(0.0, self.electron_beam_size_v)
+        elif self.type_of_initialization == 2 and normals is None: # sampled
+            self.moment_x = random_generator.normal(0.0, self.electron_beam_size_h)
+            self.moment_y = random_generator.normal(0.0, self.electron_beam_size_v)
+            self.moment_z = self.get_default_initial_z()
+            self.moment_xp = random_generator.normal(0.0, self.electron_beam_divergence_h)
+            self.moment_yp = random_generator.normal(0.0, self.electron_beam_divergence_v)
+        elif self.type_of_initialization == 2: # sampled, quasi-random with the correlations of the second moments
+            moment_x, moment_xp = srw_multi_electron.get_correlated_sample(normals[1], normals[2], electron_beam._moment_xx, electron_beam._moment_xxp, electron_beam._moment_xpxp)
+            moment_y, moment_yp = srw_multi_electron.get_correlated_sample(normals[3], normals[4], electron_beam._moment_yy, electron_beam._moment_yyp, electron_beam._moment_ypyp)
+
+            self.moment_x = float(moment_x)
+            self.moment_y = float(moment_y)
             self.moment_z = self.get_default_initial_z()
-            self.moment_xp = numpy.random.normal(0.0, self.electron_beam_divergence_h)
-            self.moment_yp = numpy.random.normal(0.0, self.electron_beam_divergence_v)
+            self.moment_xp = float(moment_xp)
+            self.moment_yp = float(moment_yp)
 
         electron_beam._moment_x = self.moment_x
         electron_beam._moment_y = self.moment_y
@@ -428,13 +626,14 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
         electron_beam._moment_xp = self.moment_xp
         electron_beam._moment_yp = self.moment_yp
 
-        print("\n", "Electron Trajectory Initialization:")
-        print("X0: ", electron_beam._moment_x)
-        print("Y0: ", electron_beam._moment_y)
-        print("Z0: ", electron_beam._moment_z)
-        print("XP0: ", electron_beam._moment_xp)
-        print("YP0: ", electron_beam._moment_yp)
-        print("E0: ", electron_beam._energy_in_GeV, "\n")
+        if verbose:
+            print("\n", "Electron Trajectory Initialization:")
+            print("X0: ", electron_beam._moment_x)
+            print("Y0: ", electron_beam._moment_y)
+            print("Z0: ", electron_beam._moment_z)
+            print("XP0: ", electron_beam._moment_xp)
+            print("YP0: ", electron_beam._moment_yp)
+            print("E0: ", electron_beam._energy_in_GeV, "\n")
 
         return electron_beam
 
@@ -469,6 +668,9 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
         self.checkLightSourceSpecificFields()
 
         if self.type_of_initialization == 2:
+            congruence.checkStrictlyPositiveNumber(self.number_of_macro_electrons, "Macro-Electrons per Run")
+            congruence.checkPositiveNumber(self.macro_electrons_seed, "Random Seed")
+            congruence.checkStrictlyPositiveNumber(self.macro_electrons_workers, "Number of Workers")
             congruence.checkNumber(self.moment_x   , "x0")
             congruence.checkNumber(self.moment_xp , "xp0")
             congruence.checkNumber(self.moment_y   , "y0")
@@ -502,58 +704,59 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
             self.wf_photon_energy_points = congruence.checkStrictlyPositiveNumber(self.wf_photon_energy_points, "Nr. Energy Values")
             congruence.checkGreaterThan(self.wf_photon_energy_to, self.wf_photon_energy, "Photon Energy To", "Photon Energy From")
 
+    @profiled("Calculation for Plots")
     def run_calculation_for_plots(self, tickets, progress_bar_value):
         if not self.output_wavefront is None:
             if self.view_type == 1:
-                e, h, v, i = self.output_wavefront.get_intensity(multi_electron=False)
+                e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=False)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
                 self.progressBarSet(progress_bar_value)
 
-                e, h, v, p = self.output_wavefront.get_phase()
+                e, h, v, p = srw_precision.get_phase(self.output_wavefront)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, p, tickets, int_phase=1)
 
                 self.progressBarSet(progress_bar_value + 10)
 
-                e, h, v, i = self.output_wavefront.get_intensity(multi_electron=True)
+                e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=True)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
                 self.progressBarSet(progress_bar_value + 20)
             elif self.view_type == 2:
-                e, h, v, i = self.output_wavefront.get_intensity(multi_electron=False, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
+                e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=False, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
                 self.progressBarSet(progress_bar_value)
 
-                e, h, v, i = self.output_wavefront.get_intensity(multi_electron=False, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
+                e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=False, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
                 #--
 
-                e, h, v, p = self.output_wavefront.get_phase(polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
+                e, h, v, p = srw_precision.get_phase(self.output_wavefront, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, p, tickets, int_phase=1)
 
                 self.progressBarSet(progress_bar_value + 10)
 
-                e, h, v, p = self.output_wavefront.get_phase(polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
+                e, h, v, p = srw_precision.get_phase(self.output_wavefront, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, p, tickets, int_phase=1)
 
                 #--
 
-                e, h, v, i = self.output_wavefront.get_intensity(multi_electron=True, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
+                e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=True, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
                 self.progressBarSet(progress_bar_value + 20)
 
-                e, h, v, i = self.output_wavefront.get_intensity(multi_electron=True, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
+                e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=True, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
@@ -562,27 +765,87 @@ class OWSRWSource(SRWWavefrontViewer, WidgetDecorator):
         return self.wf_sr_method
 
     def calculate_wavefront_propagation(self, srw_source):
+        wavefront_parameters = self.get_wavefront_parameters(srw_source)
+
+        mirrors = srw_symmetry.get_mirrors(self.wf_symmetry if self.is_symmetry_supported() else srw_symmetry.SRWSymmetry.NONE,
+                                           srw_source, wavefront_parameters, electric_field=True)
+
+        if not any(mirrors): return self.calculate_source_wavefront(srw_source, wavefront_parameters, self.get_source_input_files())
+
+        symmetric_mesh = srw_symmetry.SRWSymmetricMesh(wavefront_parameters, *mirrors)
+
+        self.writeStdOut(symmetric_mesh.get_info() + "\n")
+
+        start_time = time.time()
+        wavefront = symmetric_mesh.unfold_wavefront(self.calculate_source_wavefront(srw_source, symmetric_mesh.get_reduced_wavefront_parameters(), self.get_source_input_files()))
+        symmetric_time = time.time() - start_time
+
+        if self.wf_symmetry_verification == 1: self.check_symmetry_accuracy(srw_source, wavefront_parameters, wavefront, symmetric_time)
+
+        return wavefront
+
+    # sources whose wavefront can be calculated on the irreducible part of the mesh only (see srw_symmetry)
+    def is_symmetry_supported(self):
+        return False
+
+    # the full wavefront is calculated out of the source wavefront cache
+    def check_symmetry_accuracy(self, srw_source, wavefront_parameters, wavefront, symmetric_time):
+        self.setStatusMessage("Running SRW: full calculation, for verification")
+
+        start_time = time.time()
+        full_wavefront = self.run_in_worker(srw_engine.calculate_source_wavefront, srw_source, wavefront_parameters, self.get_trajectory(srw_source, wavefront_parameters))
+        full_time = time.time() - start_time
+
+        self.setStatusMessage("")
+
+        field_deviation = srw_symmetry.get_field_deviation(wavefront, full_wavefront)
+        intensity_deviation = srw_symmetry.get_relative_deviation(srw_precision.get_intensity(wavefront, multi_electron=False)[3],
+                                                                  srw_precision.get_intensity(full_wavefront, multi_electron=False)[3])
+
+        message = "Symmetry, relative deviation vs. Full Calculation: electric field " + "{:.2e}".format(field_deviation) + ", intensity SE " + "{:.2e}".format(intensity_deviation) + \
+                  " (calculation time " + "{:.2f}".format(symmetric_time) + " s vs. " + "{:.2f}".format(full_time) + " s)"
+
+        self.writeStdOut(message + "\n")
+
+        if max(field_deviation, intensity_deviation) > srw_symmetry.VERIFICATION_TOLERANCE:
+            QMessageBox.warning(self, "Warning", message + "\n\nThe configuration is not symmetric enough: consider no Symmetry", QMessageBox.Ok)
+
+    # the batch of coherent modes of the source (an SRWCoherentModes), built from the single electron wavefront:
+    # None if the source sends the single electron wavefront only
+    def get_coherent_modes(self, srw_source, wavefront):
+        return None
+
+    # files read by the source, their content is part of the key of the source wavefront cache
+    def get_source_input_files(self):
+        return []
+
+    # a beam sampled from the phase space is a new electron at each run
+    def is_source_wavefront_cacheable(self):
+        return self.type_of_initialization != 2
+
+    def get_wavefront_parameters(self, srw_source, sampling_factor_for_adjusting_nx_ny=None):
         photon_energy_min, photon_energy_max,  photon_energy_points = self.get_photon_energy_for_wavefront_propagation(srw_source)
 
-        wf_parameters = WavefrontParameters(photon_energy_min = photon_energy_min,
-                                            photon_energy_max = photon_energy_max,
-                                            photon_energy_points=photon_energy_points,
-                                            h_slit_gap = self.wf_h_slit_gap,
-                                            v_slit_gap = self.wf_v_slit_gap,
-                                            h_slit_points=self.wf_h_slit_points,
-                                            v_slit_points=self.wf_v_slit_points,
-                                            h_position=self.wf_h_slit_c,
-                                            v_position=self.wf_v_slit_c,
-                                            distance = self.wf_distance,
-                                            electric_field_units = self.wf_units,
-                                            wavefront_precision_parameters=WavefrontPrecisionParameters(sr_method=0 if self.wf_sr_method == 0 else self.get_automatic_sr_method(),
-                                                                                                        relative_precision=self.wf_relative_precision,
-                                                                                                        start_integration_longitudinal_position=self.wf_start_integration_longitudinal_position,
-                                                                                                        end_integration_longitudinal_position=self.wf_end_integration_longitudinal_position,
-                                                                                                        number_of_points_for_trajectory_calculation=self.wf_number_of_points_for_trajectory_calculation,
-                                                                                                        use_terminating_terms=self.wf_use_terminating_terms,
-                                                                                                        sampling_factor_for_adjusting_nx_ny=self.wf_sampling_factor_for_adjusting_nx_ny))
-        return srw_source.get_SRW_Wavefront(source_wavefront_parameters=wf_parameters)
+        if sampling_factor_for_adjusting_nx_ny is None: sampling_factor_for_adjusting_nx_ny = self.wf_sampling_factor_for_adjusting_nx_ny
+
+        return WavefrontParameters(photon_energy_min = photon_energy_min,
+                                   photon_energy_max = photon_energy_max,
+                                   photon_energy_points=photon_energy_points,
+                                   h_slit_gap = self.wf_h_slit_gap,
+                                   v_slit_gap = self.wf_v_slit_gap,
+                                   h_slit_points=self.wf_h_slit_points,
+                                   v_slit_points=self.wf_v_slit_points,
+                                   h_position=self.wf_h_slit_c,
+                                   v_position=self.wf_v_slit_c,
+                                   distance = self.wf_distance,
+                                   electric_field_units = self.wf_units,
+                                   wavefront_precision_parameters=WavefrontPrecisionParameters(sr_method=0 if self.wf_sr_method == 0 else self.get_automatic_sr_method(),
+                                                                                               relative_precision=self.wf_relative_precision,
+                                                                                               start_integration_longitudinal_position=self.wf_start_integration_longitudinal_position,
+                                                                                               end_integration_longitudinal_position=self.wf_end_integration_longitudinal_position,
+                                                                                               number_of_points_for_trajectory_calculation=self.wf_number_of_points_for_trajectory_calculation,
+                                                                                               use_terminating_terms=self.wf_use_terminating_terms,
+                                                                                               sampling_factor_for_adjusting_nx_ny=sampling_factor_for_adjusting_nx_ny))
 
     def get_photon_energy_for_wavefront_propagation(self, srw_source):
         if self.wf_energy_type == 0:
@@ -25,26 +25,19 @@ from wofrysrw.propagator.propagators2D.srw_fresnel_wofry import FresnelSRWWofry
 from wofrysrw.propagator.propagators2D.srw_propagation_mode import SRWPropagationMode
 
 from orangecontrib.srw.util.srw_util import SRWPlot
+from orangecontrib.srw.util import srw_engine, srw_precision, srw_stack, srw_trajectory
+from orangecontrib.srw.util.srw_cache import SRWSourceWavefrontDiskCache
+from orangecontrib.srw.util.srw_profiler import profiled
 from orangecontrib.srw.widgets.gui.ow_srw_widget import SRWWidget
 
 
 def initialize_propagator_2D():
-    propagation_manager = PropagationManager.Instance()
+    propagation_mode = QSettings().value("output/srw-default-propagation-mode", 1, int)
 
-    if not propagation_manager.is_initialized(SRW_APPLICATION):
-        if not propagation_manager.has_propagator(FresnelSRWNative.HANDLER_NAME, WavefrontDimension.TWO): propagation_manager.add_propagator(FresnelSRWNative())
-        if not propagation_manager.has_propagator(FresnelSRWWofry.HANDLER_NAME, WavefrontDimension.TWO): propagation_manager.add_propagator(FresnelSRWWofry())
+    srw_engine.initialize_propagation_manager(SRWPropagationMode.STEP_BY_STEP_WOFRY if propagation_mode == 0 else
+                                              SRWPropagationMode.WHOLE_BEAMLINE if propagation_mode == 2 else
+                                              SRWPropagationMode.STEP_BY_STEP)
 
-        propagation_mode = QSettings().value("output/srw-default-propagation-mode", 1, int)
-
-        if propagation_mode == 0:
-            propagation_manager.set_propagation_mode(SRW_APPLICATION, SRWPropagationMode.STEP_BY_STEP_WOFRY)
-        elif propagation_mode == 1:
-            propagation_manager.set_propagation_mode(SRW_APPLICATION, SRWPropagationMode.STEP_BY_STEP)
-        elif propagation_mode == 2:
-            propagation_manager.set_propagation_mode(SRW_APPLICATION, SRWPropagationMode.WHOLE_BEAMLINE)
-
-        propagation_manager.set_initialized(True)
 try:
     initialize_propagator_2D()
 except Exception as e:
@@ -271,6 +264,7 @@ class SRWWavefrontViewer(SRWWidget):
             else:
                 tickets.append(SRWPlot.get_ticket_2D(h * 1000, v * 1000, numpy.average(i, axis=0), is_multi_energy=True))
 
+    @profiled("Calculation for Plots")
     def run_calculation_for_plots(self, tickets, progress_bar_value):
         raise NotImplementedError("to be implemented")
 
@@ -331,7 +325,8 @@ class SRWWavefrontViewer(SRWWidget):
         self.plot_canvas[plot_canvas_index].setGraphTitle(title)
         self.plot_canvas[plot_canvas_index].setLabels(["Photon Energy [eV]",ytitle,xtitle])
         self.plot_canvas[plot_canvas_index].setColormap(colormap=colormap)
-        self.plot_canvas[plot_canvas_index].setStack(numpy.array(data_to_plot),
+        # out-of-core stacks are not copied in memory: the slices are read from the file when displayed
+        self.plot_canvas[plot_canvas_index].setStack(data_to_plot if srw_stack.is_slice_store_data(data3D) else numpy.array(data_to_plot),
                                                      calibrations=[dim0_calib, dim1_calib, dim2_calib] )
 
 
@@ -344,6 +339,7 @@ class SRWWavefrontViewer(SRWWidget):
     def is_multi_energy(self):
         return False
 
+    @profiled("Plots")
     def plot_results(self, tickets = [], progressBarValue=80, ignore_range=False):
         if self.is_do_plots():
             if not tickets is None:
@@ -396,6 +392,64 @@ class SRWWavefrontViewer(SRWWidget):
             else:
                 raise Exception("Nothing to Plot")
 
+    # if enabled in the SRW Tools menu, source wavefronts are cached on disk and reused by any workspace and session
+    def calculate_source_wavefront(self, srw_source, source_wavefront_parameters, input_files=[]):
+        if QSettings().value("srw/source-cache-enabled", 0, int) == 1 and self.is_source_wavefront_cacheable():
+            source_cache = SRWSourceWavefrontDiskCache.Instance()
+            source_cache.set_directory(QSettings().value("srw/source-cache-directory", SRWSourceWavefrontDiskCache.DEFAULT_DIRECTORY, str))
+            source_cache.set_size_budget(QSettings().value("srw/source-cache-size", SRWSourceWavefrontDiskCache.DEFAULT_SIZE_BUDGET//1024**2, int)*1024**2) # MB
+
+            cache_key = source_cache.get_key(srw_source, source_wavefront_parameters, input_files)
+            wavefront = source_cache.get(cache_key)
+
+            if wavefront is None:
+                wavefront = self.run_in_worker(srw_engine.calculate_source_wavefront, srw_source, source_wavefront_parameters, self.get_trajectory(srw_source, source_wavefront_parameters))
+
+                try:
+                    source_cache.put(cache_key, wavefront)
+                except Exception as exception:
+                    self.writeStdOut("Source wavefront not cached: " + str(exception) + "\n")
+            else:
+                self.setStatusMessage("Source Wavefront retrieved from Cache")
+
+            return wavefront
+        else:
+            return self.run_in_worker(srw_engine.calculate_source_wavefront, srw_source, source_wavefront_parameters, self.get_trajectory(srw_source, source_wavefront_parameters))
+
+    def is_source_wavefront_cacheable(self):
+        return True
+
+    def get_trajectory(self, srw_source, source_wavefront_parameters):
+        return self.get_cached_trajectory(srw_source,
+                                          srw_trajectory.SRWTrajectoryParameters.from_wavefront_parameters(source_wavefront_parameters),
+                                          calculate=lambda *arguments: self.run_in_worker(srw_trajectory.calculate_trajectory, *arguments))
+
+    # if enabled in the SRW Tools menu, electron trajectories are cached in memory and shared by the source calculations of the session
+    def get_cached_trajectory(self, srw_source, trajectory_parameters, calculate=None):
+        if QSettings().value("srw/trajectory-cache-enabled", 0, int) == 1:
+            return srw_trajectory.get_trajectory(srw_source,
+                                                 trajectory_parameters,
+                                                 linear_corrections=QSettings().value("srw/trajectory-linear-corrections", 0, int) == 1,
+                                                 calculate=calculate)
+        else:
+            return None
+
+    # optional comparison of the single precision intensities, plots and accumulations with the double precision ones
+    def check_precision_accuracy(self, wavefront):
+        if not wavefront is None and \
+                srw_precision.get_precision() == srw_precision.SRWPrecision.SINGLE and \
+                QSettings().value("srw/precision-accuracy-check", 0, int) == 1:
+            distribution_error, projections_error, average_error, total_error = srw_precision.get_relative_error(wavefront)
+
+            message = "Single Precision, relative error vs. Double Precision: " + \
+                      "intensity distribution " + "{:.2e}".format(distribution_error) + ", projections " + "{:.2e}".format(projections_error) + \
+                      ", accumulated intensity " + "{:.2e}".format(average_error) + ", integrated intensity " + "{:.2e}".format(total_error)
+
+            self.writeStdOut(message + "\n")
+
+            if max(distribution_error, projections_error, average_error, total_error) > QSettings().value("srw/precision-accuracy-tolerance", srw_precision.ACCURACY_TOLERANCE, float):
+                QtWidgets.QMessageBox.warning(self, "Warning", message + "\n\nConsider Double Precision (SRW Tools menu)", QtWidgets.QMessageBox.Ok)
+
     def writeStdOut(self, text):
         cursor = self.srw_output.textCursor()
         cursor.movePosition(QtGui.QTextCursor.End)
@@ -1,15 +1,18 @@
 import os
+from contextlib import contextmanager
 
 from oasys.widgets import widget
 
 from orangewidget import gui
 from orangewidget.settings import Setting
 
-from PyQt5.QtWidgets import QApplication
-from PyQt5.QtCore import QRect
+from PyQt5.QtWidgets import QApplication, QPushButton
+from PyQt5.QtCore import QRect, QEventLoop, QTimer
 
 from oasys.widgets.gui import ConfirmDialog
 
+from orangecontrib.srw.util.srw_engine import SRWEngineWorker, SRWEngineCancelled
+
 class SRWWidget(widget.OWWidget):
 
     want_main_area=1
@@ -48,6 +51,87 @@ class SRWWidget(widget.OWWidget):
         if show_automatic_box :
             gui.checkBox(self.general_options_box, self, 'is_automatic_run', 'Automatic Execution')
 
+        # not in the general options, hidden by some widgets
+        cancel_box = gui.widgetBox(self.controlArea, "", orientation="horizontal")
+
+        self.cancel_button = gui.button(cancel_box, self, "Cancel Calculation", callback=self.cancel_calculation)
+        self.cancel_button.setEnabled(False)
+
+        self.__worker = None
+        self.__calculation_running = False
+        self.__cancel_requested = False
+
+    # the GUI keeps processing events during a calculation: the widget doesn't receive new signals and its buttons (but
+    # Cancel) are disabled, so that the calculation can't be started again before it's over
+    @contextmanager
+    def calculation_running(self):
+        if self.__calculation_running: raise RuntimeError("A calculation is already running")
+
+        buttons = [button for button in self.controlArea.findChildren(QPushButton) if button.isEnabled() and not button is self.cancel_button]
+
+        self.__calculation_running = True
+        self.__cancel_requested = False
+
+        for button in buttons: button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.setBlocking(True)
+
+        try:
+            yield
+        finally:
+            self.setBlocking(False)
+            self.cancel_button.setEnabled(False)
+            for button in buttons: button.setEnabled(True)
+
+            self.__calculation_running = False
+
+    # runs function(*args, progress_callback=...) in a child process, keeping the GUI responsive until it's over:
+    # the progress of the calculation is mapped to the progress bar between progress_from and progress_to
+    def run_in_worker(self, function, *args, progress_from=20, progress_to=50):
+        if self.__worker is None: self.__worker = SRWEngineWorker()
+
+        def progress_callback(progress, message):
+            self.progressBarSet(progress_from + (progress_to - progress_from)*progress/100)
+            self.setStatusMessage(message)
+
+        with self.calculation_running():
+            self.__worker.submit(function, *args)
+
+            event_loop = QEventLoop()
+
+            timer = QTimer()
+            timer.timeout.connect(lambda : event_loop.quit() if self.__worker.poll(progress_callback) else None)
+            timer.start(100)
+
+            try:
+                if not self.__worker.poll(progress_callback): event_loop.exec_()
+            finally:
+                timer.stop()
+
+        return self.__worker.get_result()
+
+    # runs function(*args, wait_callback=..., **kwargs), calculating in the process pool of the engine (see
+    # srw_engine.map_in_pool): the GUI processes its events while waiting for the workers, Cancel terminates them
+    def run_in_pool(self, function, *args, **kwargs):
+        def wait_callback():
+            QApplication.processEvents()
+
+            if self.__cancel_requested: raise SRWEngineCancelled()
+
+        with self.calculation_running():
+            return function(*args, wait_callback=wait_callback, **kwargs)
+
+    def cancel_calculation(self):
+        if self.__calculation_running: self.__cancel_requested = True
+
+        if not self.__worker is None and self.__worker.is_running():
+            self.__worker.cancel()
+
+    def onDeleteWidget(self):
+        if not self.__worker is None: self.__worker.shutdown()
+
+        super().onDeleteWidget()
+
     def callResetSettings(self):
         if ConfirmDialog.confirmed(parent=self, message="Confirm Reset of the Fields?"):
             try:
@@ -15,6 +15,7 @@ from syned.widget.widget_decorator import WidgetDecorator
 from wofrysrw.storage_ring.light_sources.srw_3d_light_source import SRW3DLightSource
 from wofrysrw.storage_ring.magnetic_structures.srw_3d_magnetic_structure import SRW3DMagneticStructure
 
+from orangecontrib.srw.util import srw_magnetic_field
 from orangecontrib.srw.widgets.gui.ow_srw_source import OWSRWSource
 
 
@@ -65,23 +66,19 @@ class OWSRW3DLightSource(OWSRWSource):
 
                         z = (data[:, 0] - 0.5 * numpy.max(data[:, 0])) * 0.01
                         B = data[:, 3]
-                        data_out = numpy.zeros((len(z), 3))
-                        data_out[:, 1] = B
-
-                        header = "Bx [T], By [T], Bz [T] on 3D mesh: inmost loop vs X (horizontal transverse position), outmost loop vs Z (longitudinal position)\n"
-                        header += "0.0 #initial X position [m]\n"
-                        header += "0.0 #step of X [m]\n"
-                        header += "1 #number of points vs X\n"
-                        header += "0.0 #initial Y position [m]\n"
-                        header += "0.0 #step of Y [m]\n"
-                        header += "1 #number of points vs Y\n"
-                        header += f"{round(z[0], 6)} #initial Z position [m]\n"
-                        header += f"{round(z[1] - z[0], 6)} #step of Z [m]\n"
-                        header += f"{len(z)} #number of points vs Z\n"
+
+                        # same values written in the file: the field in memory is identical to the one read from it
+                        magnetic_field = srw_magnetic_field.SRWMagneticField3D(bx=numpy.zeros(len(z)),
+                                                                               by=numpy.round(B, 6),
+                                                                               bz=numpy.zeros(len(z)),
+                                                                               x_start=0.0, x_step=0.0, x_points=1,
+                                                                               y_start=0.0, y_step=0.0, y_points=1,
+                                                                               z_start=round(z[0], 6), z_step=round(z[1] - z[0], 6), z_points=len(z))
 
                         file_name = "xoppy_yaup_" + str(id(self)) + ".txt"
 
-                        numpy.savetxt(file_name, data_out, fmt=('%7.6f', '%7.6f', '%7.6f'), header=header, delimiter='	')
+                        magnetic_field.save(file_name, self.comment_character)
+                        srw_magnetic_field.register_magnetic_field(file_name, magnetic_field, self.comment_character)
 
                         self.le_file_name.setText(file_name)
             except Exception as e:
@@ -95,19 +92,22 @@ class OWSRW3DLightSource(OWSRWSource):
 
     def get_default_initial_z(self):
         try:
-            return SRW3DMagneticStructure.get_default_initial_z(self.file_name, self.comment_character)
+            return srw_magnetic_field.get_magnetic_field(self.file_name, self.comment_character).get_default_initial_z()
         except:
             return 0.0
 
     def get_source_length(self):
         try:
-            return SRW3DMagneticStructure.get_source_length(self.file_name, self.comment_character)
+            return srw_magnetic_field.get_magnetic_field(self.file_name, self.comment_character).get_length()
         except:
             return 0.0
 
     def get_srw_source(self, electron_beam):
         return SRW3DLightSource(electron_beam=electron_beam,
-                                magnet_magnetic_structure=SRW3DMagneticStructure(self.file_name, self.comment_character, self.interpolation_method+1))
+                                magnet_magnetic_structure=srw_magnetic_field.SRW3DCachedMagneticStructure(self.file_name, self.comment_character, self.interpolation_method+1))
+
+    def get_source_input_files(self):
+        return [self.file_name]
 
     def print_specific_infos(self, srw_source):
         pass
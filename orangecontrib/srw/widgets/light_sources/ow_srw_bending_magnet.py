@@ -60,6 +60,9 @@ class OWSRWBendingMagnet(OWSRWSource):
     def get_automatic_sr_method(self):
         return 2
 
+    def is_symmetry_supported(self):
+        return True
+
     def get_source_length(self):
         return self.length
 
@@ -1,6 +1,6 @@
 __author__ = 'labx'
 
-import sys
+import os, sys
 from numpy import nan
 
 from PyQt5.QtGui import QPalette, QColor, QFont
@@ -16,11 +16,12 @@ from oasys.util.oasys_util import TriggerIn, TriggerOut
 from syned.widget.widget_decorator import WidgetDecorator
 
 from wofrysrw.propagator.wavefront2D.srw_wavefront import WavefrontParameters, WavefrontPrecisionParameters
-from wofrysrw.beamline.srw_beamline import SRWBeamline
 from wofrysrw.storage_ring.light_sources.srw_gaussian_light_source import SRWGaussianLightSource, Polarization
 
 from orangecontrib.srw.util.srw_util import SRWPlot
-from orangecontrib.srw.util.srw_objects import SRWData
+from orangecontrib.srw.util.srw_objects import SRWData, SRWPersistentBeamline, SRWCoherentModes, create_srw_beamline
+from orangecontrib.srw.util import srw_engine, srw_precision, srw_coherent_modes
+from orangecontrib.srw.util.srw_profiler import profiled
 from orangecontrib.srw.widgets.gui.ow_srw_wavefront_viewer import SRWWavefrontViewer
 
 
@@ -71,6 +72,12 @@ class OWSRWGaussianSource(SRWWavefrontViewer, WidgetDecorator):
 
     wf_sampling_factor_for_adjusting_nx_ny = Setting(0.0)
 
+    use_coherent_modes = Setting(0)
+    horizontal_coherence_length_at_waist = Setting(1e-6)
+    vertical_coherence_length_at_waist = Setting(1e-6)
+    number_of_coherent_modes = Setting(20)
+    coherent_modes_workers = Setting(os.cpu_count() or 1)
+
     TABS_AREA_HEIGHT = 618
     CONTROL_AREA_WIDTH = 405
 
@@ -134,6 +141,22 @@ class OWSRWGaussianSource(SRWWavefrontViewer, WidgetDecorator):
         oasysgui.lineEdit(left_box_1, self, "transverse_gauss_hermite_mode_order_x", "Transverse Gauss-Hermite mode order x", labelWidth=260, valueType=int, orientation="horizontal")
         oasysgui.lineEdit(left_box_1, self, "transverse_gauss_hermite_mode_order_y", "Transverse Gauss-Hermite mode order y", labelWidth=260, valueType=int, orientation="horizontal")
 
+        left_box_2 = oasysgui.widgetBox(self.tab_source, "Coherent Modes (Gaussian Schell-Model)", addSpace=True, orientation="vertical")
+
+        gui.comboBox(left_box_2, self, "use_coherent_modes", label="Send Coherent Modes", labelWidth=260,
+                     items=["No", "Yes"], callback=self.set_CoherentModes,
+                     sendSelectedValue=False, orientation="horizontal",
+                     tooltip="The modes are propagated and their intensities summed by the Accumulation Point")
+
+        self.left_box_2_1 = oasysgui.widgetBox(left_box_2, "", addSpace=False, orientation="vertical")
+
+        oasysgui.lineEdit(self.left_box_2_1, self, "horizontal_coherence_length_at_waist", "\u03bex at waist [m]", labelWidth=260, valueType=float, orientation="horizontal")
+        oasysgui.lineEdit(self.left_box_2_1, self, "vertical_coherence_length_at_waist", "\u03bey at waist [m]", labelWidth=260, valueType=float, orientation="horizontal")
+        oasysgui.lineEdit(self.left_box_2_1, self, "number_of_coherent_modes", "Number of Modes", labelWidth=260, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(self.left_box_2_1, self, "coherent_modes_workers", "Number of Workers", labelWidth=260, valueType=int, orientation="horizontal")
+
+        self.set_CoherentModes()
+
         self.tab_plots = oasysgui.createTabPage(self.tabs_setting, "Wavefront Setting")
 
         self.tabs_plots_setting = oasysgui.tabWidget(self.tab_plots)
@@ -161,7 +184,10 @@ class OWSRWGaussianSource(SRWWavefrontViewer, WidgetDecorator):
 
         gui.rubber(self.controlArea)
 
+    def set_CoherentModes(self):
+        self.left_box_2_1.setVisible(self.use_coherent_modes==1)
 
+    @profiled("Source Calculation")
     def runSRWSource(self):
         self.setStatusMessage("")
         self.progressBarInit()
@@ -182,9 +208,11 @@ class OWSRWGaussianSource(SRWWavefrontViewer, WidgetDecorator):
 
             self.setStatusMessage("")
 
-            beamline = SRWBeamline(light_source=srw_source)
+            beamline = create_srw_beamline(srw_source)
             wavefront = self.calculate_wavefront_propagation(srw_source)
 
+            self.check_precision_accuracy(wavefront)
+
             tickets = []
 
             if self.is_do_plots():
@@ -196,8 +224,13 @@ class OWSRWGaussianSource(SRWWavefrontViewer, WidgetDecorator):
 
             self.setStatusMessage("")
 
+            if self.use_coherent_modes == 1:
+                beamline = SRWPersistentBeamline(beamline, coherent_modes=self.get_coherent_modes(wavefront))
+
             self.send("SRWData", SRWData(srw_beamline=beamline, srw_wavefront=wavefront))
 
+        except srw_engine.SRWEngineCancelled:
+            self.setStatusMessage("Calculation Cancelled")
         except Exception as exception:
             QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
 
@@ -209,6 +242,26 @@ class OWSRWGaussianSource(SRWWavefrontViewer, WidgetDecorator):
         if trigger and trigger.new_object == True:
             self.runSRWSource()
 
+    # the modes of the Gaussian Schell-model source with the size of the Gaussian beam and the given coherence length
+    def get_coherent_modes(self, wavefront):
+        gsm_parameters_h = (self.horizontal_sigma_at_waist, self.horizontal_coherence_length_at_waist)
+        gsm_parameters_v = (self.vertical_sigma_at_waist, self.vertical_coherence_length_at_waist)
+
+        wavefronts, weights, captured_occupation = srw_coherent_modes.get_coherent_modes(wavefront, gsm_parameters_h, gsm_parameters_v,
+                                                                                         self.wf_distance - self.beam_center_at_waist_z,
+                                                                                         self.number_of_coherent_modes)
+
+        coherent_fraction = srw_coherent_modes.get_coherent_fraction(*gsm_parameters_h)*srw_coherent_modes.get_coherent_fraction(*gsm_parameters_v)
+
+        print("\n", "Coherent Modes:")
+        print("Coherent fraction: ", coherent_fraction)
+        print("Occupation of the ", len(wavefronts), " modes: ", captured_occupation, "\n")
+
+        return SRWCoherentModes(wavefronts=wavefronts,
+                                weights=weights,
+                                number_of_workers=self.coherent_modes_workers,
+                                coherent_fraction=coherent_fraction)
+
     def get_srw_source(self):
         return SRWGaussianLightSource(beam_center_at_waist_x=self.beam_center_at_waist_x,
                                       beam_center_at_waist_y=self.beam_center_at_waist_y,
@@ -233,6 +286,15 @@ class OWSRWGaussianSource(SRWWavefrontViewer, WidgetDecorator):
         congruence.checkPositiveNumber(self.transverse_gauss_hermite_mode_order_x, "Transverse Gauss-Hermite mode order x")
         congruence.checkPositiveNumber(self.transverse_gauss_hermite_mode_order_y, "Transverse Gauss-Hermite mode order y")
 
+        if self.use_coherent_modes == 1:
+            congruence.checkStrictlyPositiveNumber(self.horizontal_coherence_length_at_waist, "\u03bex at waist")
+            congruence.checkStrictlyPositiveNumber(self.vertical_coherence_length_at_waist, "\u03bey at waist")
+            congruence.checkStrictlyPositiveNumber(self.number_of_coherent_modes, "Number of Modes")
+            congruence.checkStrictlyPositiveNumber(self.coherent_modes_workers, "Number of Workers")
+
+            if self.transverse_gauss_hermite_mode_order_x != 0 or self.transverse_gauss_hermite_mode_order_y != 0:
+                raise ValueError("Coherent Modes need the fundamental Gauss-Hermite mode (orders x and y = 0)")
+
         # WAVEFRONT
 
         congruence.checkStrictlyPositiveNumber(self.wf_photon_energy, "Wavefront Propagation Photon Energy")
@@ -246,13 +308,13 @@ class OWSRWGaussianSource(SRWWavefrontViewer, WidgetDecorator):
 
     def run_calculation_intensity(self, srw_wavefront, tickets, progress_bar_value=30):
 
-        e, h, v, i = srw_wavefront.get_intensity(multi_electron=False)
+        e, h, v, i = srw_precision.get_intensity(srw_wavefront, multi_electron=False)
 
         SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
         self.progressBarSet(progress_bar_value)
 
-        e, h, v, i = srw_wavefront.get_phase()
+        e, h, v, i = srw_precision.get_phase(srw_wavefront)
 
         SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
@@ -270,7 +332,7 @@ class OWSRWGaussianSource(SRWWavefrontViewer, WidgetDecorator):
                                             electric_field_units=self.wf_units,
                                             wavefront_precision_parameters=WavefrontPrecisionParameters(sampling_factor_for_adjusting_nx_ny=self.wf_sampling_factor_for_adjusting_nx_ny))
 
-        return srw_source.get_SRW_Wavefront(source_wavefront_parameters=wf_parameters)
+        return self.calculate_source_wavefront(srw_source, wf_parameters)
 
     def receive_syned_data(self, data):
         if not data is None: QMessageBox.critical(self, "Error", "Syned data not supported for Gaussian Light Source", QMessageBox.Ok)
@@ -1,10 +1,10 @@
 __author__ = 'labx'
 
-import os, sys, numpy
+import os, sys, time, numpy
 from numpy import nan
 
 from PyQt5.QtGui import QPalette, QColor, QFont
-from PyQt5.QtWidgets import QMessageBox
+from PyQt5.QtWidgets import QMessageBox, QApplication
 from orangewidget import gui
 from orangewidget.settings import Setting
 from oasys.widgets import gui as oasysgui
@@ -21,6 +21,7 @@ from wofrysrw.storage_ring.light_sources.srw_undulator_light_source import SRWUn
 
 from orangecontrib.srw.util.srw_util import SRWPlot
 from orangecontrib.srw.util.srw_objects import SRWData
+from orangecontrib.srw.util import srw_power_density, srw_symmetry, srw_trajectory
 from orangecontrib.srw.widgets.gui.ow_srw_power_density_viewer import SRWPowerDensityViewer
 
 
@@ -71,7 +72,20 @@ class OWSRWPowerDensity(SRWPowerDensityViewer):
     pow_final_longitudinal_position = Setting(0.0) 
     pow_number_of_points_for_trajectory_calculation = Setting(20000)
 
+    pow_adaptive = Setting(0)
+    pow_adaptive_initial_cells_h = Setting(4)
+    pow_adaptive_initial_cells_v = Setting(4)
+    pow_adaptive_cell_points = Setting(5)
+    pow_adaptive_tolerance = Setting(1e-3)
+    pow_adaptive_gradient_tolerance = Setting(0.1)
+    pow_adaptive_maximum_depth = Setting(5)
+    pow_adaptive_workers = Setting(os.cpu_count() or 1)
+
+    pow_symmetry = Setting(srw_symmetry.SRWSymmetry.NONE)
+    pow_symmetry_verification = Setting(0)
+
     calculated_total_power = 0.0
+    power_density_quadtree = None
 
     received_light_source = None
 
@@ -140,8 +154,44 @@ class OWSRWPowerDensity(SRWPowerDensityViewer):
         oasysgui.lineEdit(tab_pow, self, "pow_final_longitudinal_position", "Final longitudinal position [m]", labelWidth=260, valueType=float, orientation="horizontal")
         oasysgui.lineEdit(tab_pow, self, "pow_number_of_points_for_trajectory_calculation", "Number of points for trajectory calculation", labelWidth=260, valueType=int, orientation="horizontal")
 
+        tab_ada = oasysgui.createTabPage(tabs_precision, "Adaptive")
+
+        gui.comboBox(tab_ada, self, "pow_adaptive", label="Adaptive Mesh",
+                     items=["No", "Yes"], labelWidth=260,
+                     sendSelectedValue=False, orientation="horizontal", callback=self.set_Adaptive)
+
+        self.box_adaptive = oasysgui.widgetBox(tab_ada, "", addSpace=False, orientation="vertical")
+
+        oasysgui.lineEdit(self.box_adaptive, self, "pow_adaptive_initial_cells_h", "Initial H Cells", labelWidth=260, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(self.box_adaptive, self, "pow_adaptive_initial_cells_v", "Initial V Cells", labelWidth=260, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(self.box_adaptive, self, "pow_adaptive_cell_points", "Points per Cell side (odd)", labelWidth=260, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(self.box_adaptive, self, "pow_adaptive_tolerance", "Tolerance (relative to total power)", labelWidth=260, valueType=float, orientation="horizontal")
+        oasysgui.lineEdit(self.box_adaptive, self, "pow_adaptive_gradient_tolerance", "Gradient Tolerance (relative to peak)", labelWidth=260, valueType=float, orientation="horizontal")
+        oasysgui.lineEdit(self.box_adaptive, self, "pow_adaptive_maximum_depth", "Maximum Refinement Depth", labelWidth=260, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(self.box_adaptive, self, "pow_adaptive_workers", "Number of Workers", labelWidth=260, valueType=int, orientation="horizontal")
+
+        gui.widgetLabel(self.box_adaptive, "H/V Slit Points: regular grid of the resampled result")
+
+        self.set_Adaptive()
+
+        tab_sym = oasysgui.createTabPage(tabs_precision, "Symmetry")
+
+        gui.comboBox(tab_sym, self, "pow_symmetry", label="Symmetry",
+                     items=srw_symmetry.SRWSymmetry.tuple(), labelWidth=120,
+                     sendSelectedValue=False, orientation="horizontal")
+
+        gui.comboBox(tab_sym, self, "pow_symmetry_verification", label="Compare with the Full Calculation",
+                     items=["No", "Yes"], labelWidth=260,
+                     sendSelectedValue=False, orientation="horizontal")
+
+        gui.widgetLabel(tab_sym, "Auto-detect: electron beam, magnet and slit on axis.\n" +
+                                 "Only the irreducible half or quadrant is calculated")
+
         gui.rubber(self.controlArea)
 
+    def set_Adaptive(self):
+        self.box_adaptive.setVisible(self.pow_adaptive == 1)
+
     def calculateRadiation(self):
         if not self.received_light_source is None:
 
@@ -255,8 +305,25 @@ class OWSRWPowerDensity(SRWPowerDensityViewer):
         congruence.checkStrictlyPositiveNumber(self.pow_precision_factor, "Intensity/Power Density Power - Precision Factor")
         congruence.checkStrictlyPositiveNumber(self.pow_number_of_points_for_trajectory_calculation, "Intensity/Power Density Power - Number of points for trajectory calculation")
 
+        if self.pow_adaptive == 1:
+            congruence.checkStrictlyPositiveNumber(self.pow_adaptive_initial_cells_h, "Initial H Cells")
+            congruence.checkStrictlyPositiveNumber(self.pow_adaptive_initial_cells_v, "Initial V Cells")
+            congruence.checkGreaterOrEqualThan(self.pow_adaptive_cell_points, srw_power_density.MINIMUM_CELL_POINTS, "Points per Cell side", str(srw_power_density.MINIMUM_CELL_POINTS))
+            congruence.checkStrictlyPositiveNumber(self.pow_adaptive_tolerance, "Tolerance")
+            congruence.checkStrictlyPositiveNumber(self.pow_adaptive_gradient_tolerance, "Gradient Tolerance")
+            congruence.checkPositiveNumber(self.pow_adaptive_maximum_depth, "Maximum Refinement Depth")
+            congruence.checkStrictlyPositiveNumber(self.pow_adaptive_workers, "Number of Workers")
+            congruence.checkGreaterThan(self.int_h_slit_points, 1, "H Slit Points", "1")
+            congruence.checkGreaterThan(self.int_v_slit_points, 1, "V Slit Points", "1")
+
 
     def run_calculation_intensity_power(self, srw_source, tickets, progress_bar_value=30):
+        power_density_precision_parameters = PowerDensityPrecisionParameters(precision_factor=self.pow_precision_factor,
+                                                                             computation_method=self.pow_computation_method,
+                                                                             initial_longitudinal_position=self.pow_initial_longitudinal_position,
+                                                                             final_longitudinal_position=self.pow_final_longitudinal_position,
+                                                                             number_of_points_for_trajectory_calculation=self.pow_number_of_points_for_trajectory_calculation)
+
         wf_parameters = WavefrontParameters(photon_energy_min = 0.0,
                                             photon_energy_max = 0.0,
                                             photon_energy_points=1,
@@ -266,14 +333,24 @@ class OWSRWPowerDensity(SRWPowerDensityViewer):
                                             v_slit_points=self.int_v_slit_points,
                                             distance = self.int_distance)
 
-        h, v, p = srw_source.get_power_density(source_wavefront_parameters=wf_parameters,
-                                               power_density_precision_parameters=PowerDensityPrecisionParameters(precision_factor=self.pow_precision_factor,
-                                                                                                                  computation_method=self.pow_computation_method,
-                                                                                                                  initial_longitudinal_position=self.pow_initial_longitudinal_position,
-                                                                                                                  final_longitudinal_position=self.pow_final_longitudinal_position,
-                                                                                                                  number_of_points_for_trajectory_calculation=self.pow_number_of_points_for_trajectory_calculation))
+        mirrors = srw_symmetry.get_mirrors(self.pow_symmetry, srw_source, wf_parameters)
+
+        if any(mirrors) and self.pow_symmetry_verification == 1:
+            self.setStatusMessage("Running SRW: full calculation, for verification")
+
+            start_time = time.time()
+            _, _, p_full, total_power_full = self.calculate_power_density(srw_source, wf_parameters, power_density_precision_parameters, (False, False), progress_bar_value)
+            full_time = time.time() - start_time
+
+            self.setStatusMessage("Running SRW")
 
-        self.calculated_total_power = SRWLightSource.get_total_power_from_power_density(h, v, p)
+            start_time = time.time()
+            h, v, p, self.calculated_total_power = self.calculate_power_density(srw_source, wf_parameters, power_density_precision_parameters, mirrors, progress_bar_value)
+            symmetric_time = time.time() - start_time
+
+            self.check_symmetry_accuracy(p, p_full, self.calculated_total_power, total_power_full, full_time, symmetric_time)
+        else:
+            h, v, p, self.calculated_total_power = self.calculate_power_density(srw_source, wf_parameters, power_density_precision_parameters, mirrors, progress_bar_value)
 
         print("TOTAL POWER: ", self.calculated_total_power, " W")
 
@@ -281,6 +358,112 @@ class OWSRWPowerDensity(SRWPowerDensityViewer):
 
         self.progressBarSet(progress_bar_value + 10)
 
+    #################################
+    # with mirrors, only the irreducible half or quadrant of the slit is calculated (extended across the axis by a
+    # margin of some beam sizes, for the convolution with the electron beam) and unfolded on the whole slit
+    #################################
+
+    def calculate_power_density(self, srw_source, wf_parameters, power_density_precision_parameters, mirrors, progress_bar_value):
+        trajectory = self.get_cached_trajectory(srw_source, srw_trajectory.SRWTrajectoryParameters.from_power_density_precision_parameters(power_density_precision_parameters))
+
+        if self.pow_adaptive == 1:
+            return self.run_calculation_adaptive_power_density(srw_source, power_density_precision_parameters, progress_bar_value, mirrors, trajectory)
+        elif any(mirrors):
+            symmetric_mesh = srw_symmetry.SRWSymmetricMesh(wf_parameters, *mirrors, *srw_symmetry.get_multi_electron_margins(srw_source.get_electron_beam(), self.int_distance))
+
+            print(symmetric_mesh.get_info())
+
+            _, _, p = srw_trajectory.get_power_density(srw_source,
+                                                       source_wavefront_parameters=symmetric_mesh.get_reduced_wavefront_parameters(),
+                                                       power_density_precision_parameters=power_density_precision_parameters,
+                                                       trajectory=trajectory)
+
+            h, v = symmetric_mesh.get_coordinates()
+            p = symmetric_mesh.unfold(p)
+        else:
+            h, v, p = srw_trajectory.get_power_density(srw_source,
+                                                       source_wavefront_parameters=wf_parameters,
+                                                       power_density_precision_parameters=power_density_precision_parameters,
+                                                       trajectory=trajectory)
+
+        return h, v, p, SRWLightSource.get_total_power_from_power_density(h, v, p)
+
+    def check_symmetry_accuracy(self, p, p_full, total_power, total_power_full, full_time, symmetric_time):
+        distribution_deviation = srw_symmetry.get_relative_deviation(p, p_full)
+        total_deviation = abs(total_power - total_power_full)/total_power_full if total_power_full > 0.0 else 0.0
+
+        message = "Symmetry, relative deviation vs. Full Calculation: power density " + "{:.2e}".format(distribution_deviation) + \
+                  ", total power " + "{:.2e}".format(total_deviation) + " (calculation time " + "{:.2f}".format(symmetric_time) + " s vs. " + "{:.2f}".format(full_time) + " s)"
+
+        print(message)
+
+        if max(distribution_deviation, total_deviation) > srw_symmetry.VERIFICATION_TOLERANCE:
+            QMessageBox.warning(self, "Warning", message + "\n\nThe configuration is not symmetric enough: consider no Symmetry", QMessageBox.Ok)
+
+    #################################
+    # the power density is refined where needed, and resampled on the regular grid of the slit points: the
+    # total power is the one of the adaptive calculation. With mirrors, the quadtree covers the irreducible region
+    #################################
+
+    def run_calculation_adaptive_power_density(self, srw_source, power_density_precision_parameters, progress_bar_value, mirrors=(False, False), trajectory=None):
+        initial_progress_bar_value = self.progressBarValue
+
+        def level_completed(depth, number_of_cells, total_power, error_estimate):
+            self.setStatusMessage("Running SRW: refinement level " + str(depth) + ", " + str(number_of_cells) + " cells")
+            self.progressBarSet(initial_progress_bar_value + (progress_bar_value - initial_progress_bar_value)*(depth + 1)/(self.pow_adaptive_maximum_depth + 1))
+
+            print("Level", depth, ":", number_of_cells, "cells, total power", total_power, "W, Richardson error estimate", error_estimate, "W")
+
+            QApplication.processEvents()
+
+        mirror_h, mirror_v = mirrors
+
+        symmetric_mesh = srw_symmetry.SRWSymmetricMesh(WavefrontParameters(h_slit_gap=self.int_h_slit_gap,
+                                                                           v_slit_gap=self.int_v_slit_gap,
+                                                                           h_slit_points=self.int_h_slit_points,
+                                                                           v_slit_points=self.int_v_slit_points), mirror_h, mirror_v)
+
+        h_slit_gap, h_position, v_slit_gap, v_position = symmetric_mesh.get_irreducible_region()
+
+        quadtree = self.run_in_pool(srw_power_density.calculate_adaptive_power_density,
+                                    srw_source,
+                                    h_slit_gap=h_slit_gap,
+                                    v_slit_gap=v_slit_gap,
+                                    distance=self.int_distance,
+                                    power_density_precision_parameters=power_density_precision_parameters,
+                                    initial_cells_h=max(1, (self.pow_adaptive_initial_cells_h + 1)//2) if mirror_h else self.pow_adaptive_initial_cells_h,
+                                    initial_cells_v=max(1, (self.pow_adaptive_initial_cells_v + 1)//2) if mirror_v else self.pow_adaptive_initial_cells_v,
+                                    cell_points=self.pow_adaptive_cell_points,
+                                    tolerance=self.pow_adaptive_tolerance,
+                                    gradient_tolerance=self.pow_adaptive_gradient_tolerance,
+                                    maximum_depth=self.pow_adaptive_maximum_depth,
+                                    max_workers=self.pow_adaptive_workers,
+                                    callback=level_completed,
+                                    h_position=h_position,
+                                    v_position=v_position,
+                                    trajectory=trajectory)
+
+        print(quadtree.get_info(srw_power_density.get_uniform_points(quadtree, h_slit_gap, v_slit_gap, self.pow_adaptive_cell_points)))
+
+        self.power_density_quadtree = quadtree
+
+        total_power = quadtree.get_total_power()*symmetric_mesh.get_multiplicity()
+
+        if any(mirrors):
+            print(symmetric_mesh.get_info())
+
+            h, v = symmetric_mesh.get_coordinates()
+            p = symmetric_mesh.unfold(quadtree.resample(*symmetric_mesh.get_reduced_coordinates(), conserve_power=False))
+
+            grid_power = srw_power_density.get_grid_power(h, v, p)
+
+            if grid_power > 0.0: p *= total_power/grid_power
+        else:
+            h, v = symmetric_mesh.get_coordinates()
+            p = quadtree.resample(h, v, conserve_power=True)
+
+        return h, v, p, total_power
+
     def getVariablesToPlot(self):
         return [[1, 2]]
 
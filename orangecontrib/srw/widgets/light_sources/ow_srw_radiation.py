@@ -1,11 +1,11 @@
 __author__ = 'labx'
 
-import sys
+import sys, time, numpy
 from numpy import nan
 import scipy.constants as codata
 
 from PyQt5.QtGui import QPalette, QColor, QFont
-from PyQt5.QtWidgets import QMessageBox
+from PyQt5.QtWidgets import QMessageBox, QFileDialog
 from orangewidget import gui
 from orangewidget.settings import Setting
 from oasys.widgets import gui as oasysgui
@@ -23,6 +23,7 @@ from wofrysrw.storage_ring.light_sources.srw_undulator_light_source import SRWUn
 
 from orangecontrib.srw.util.srw_util import SRWPlot
 from orangecontrib.srw.util.srw_objects import SRWData
+from orangecontrib.srw.util import srw_precision, srw_stack, srw_symmetry, srw_trajectory
 from orangecontrib.srw.widgets.gui.ow_srw_power_density_viewer import SRWPowerDensityViewer
 
 class OWSRWRadiation(SRWPowerDensityViewer):
@@ -77,7 +78,14 @@ class OWSRWRadiation(SRWPowerDensityViewer):
     int_use_terminating_terms = Setting(1)
     int_sampling_factor_for_adjusting_nx_ny = Setting(0.0)
 
+    int_symmetry = Setting(srw_symmetry.SRWSymmetry.NONE)
+    int_symmetry_verification = Setting(0)
+
+    int_out_of_core = Setting(0)
+    int_out_of_core_directory = Setting("")
+
     calculated_total_power = 0.0
+    slice_stores = []
 
     received_light_source = None
 
@@ -154,8 +162,43 @@ class OWSRWRadiation(SRWPowerDensityViewer):
 
         oasysgui.lineEdit(tab_prop, self, "int_sampling_factor_for_adjusting_nx_ny", "Sampling factor for adjusting nx/ny", labelWidth=260, valueType=int, orientation="horizontal")
 
+        tab_sym = oasysgui.createTabPage(tabs_precision, "Symmetry")
+
+        gui.comboBox(tab_sym, self, "int_symmetry", label="Symmetry",
+                     items=srw_symmetry.SRWSymmetry.tuple(), labelWidth=120,
+                     sendSelectedValue=False, orientation="horizontal")
+
+        gui.comboBox(tab_sym, self, "int_symmetry_verification", label="Compare with the Full Calculation",
+                     items=["No", "Yes"], labelWidth=260,
+                     sendSelectedValue=False, orientation="horizontal")
+
+        gui.widgetLabel(tab_sym, "Auto-detect: electron beam, magnet and slit on axis.\n" +
+                                 "Only the irreducible half or quadrant is calculated")
+
+        mem_box = oasysgui.widgetBox(tab_convolution, "Memory", addSpace=False, orientation="vertical")
+
+        gui.comboBox(mem_box, self, "int_out_of_core", label="3D Stacks",
+                     items=["In Memory (float64)", "Out-of-core (float32)"], labelWidth=200,
+                     sendSelectedValue=False, orientation="horizontal", callback=self.set_OutOfCore)
+
+        self.box_out_of_core = oasysgui.widgetBox(mem_box, "", addSpace=False, orientation="horizontal")
+
+        self.le_out_of_core_directory = oasysgui.lineEdit(self.box_out_of_core, self, "int_out_of_core_directory", "Directory (empty: temporary)", labelWidth=170, valueType=str, orientation="horizontal")
+
+        gui.button(self.box_out_of_core, self, "...", callback=self.selectOutOfCoreDirectory, width=30)
+
+        self.set_OutOfCore()
+
         gui.rubber(self.controlArea)
 
+    def set_OutOfCore(self):
+        self.box_out_of_core.setVisible(self.int_out_of_core == 1)
+
+    def selectOutOfCoreDirectory(self):
+        directory = QFileDialog.getExistingDirectory(self, "Out-of-core Stacks Directory", self.int_out_of_core_directory)
+
+        if directory: self.le_out_of_core_directory.setText(directory)
+
     def calculateRadiation(self):
         if not self.received_light_source is None:
 
@@ -298,20 +341,67 @@ class OWSRWRadiation(SRWPowerDensityViewer):
                                                                                                         use_terminating_terms=self.int_use_terminating_terms,
                                                                                                         sampling_factor_for_adjusting_nx_ny=self.int_sampling_factor_for_adjusting_nx_ny))
 
-        srw_wavefront = srw_source.get_SRW_Wavefront(source_wavefront_parameters=wf_parameters)
+        mirrors = srw_symmetry.get_mirrors(self.int_symmetry, srw_source, wf_parameters)
 
-        e, h, v, i_se = srw_wavefront.get_intensity(multi_electron=False)
+        trajectory = self.get_cached_trajectory(srw_source, srw_trajectory.SRWTrajectoryParameters.from_wavefront_parameters(wf_parameters))
 
-        tickets.append((i_se, e, h*1e3, v*1e3))
+        if any(mirrors):
+            symmetric_mesh = srw_symmetry.SRWSymmetricMesh(wf_parameters, *mirrors, *srw_symmetry.get_multi_electron_margins(srw_source.get_electron_beam(), self.int_distance))
+
+            print(symmetric_mesh.get_info())
+
+            start_time = time.time()
+            srw_wavefront = srw_trajectory.get_SRW_Wavefront(srw_source, symmetric_mesh.get_reduced_wavefront_parameters(), trajectory)
+            symmetric_time = time.time() - start_time
+        else:
+            symmetric_mesh = None
+            srw_wavefront = srw_trajectory.get_SRW_Wavefront(srw_source, wf_parameters, trajectory)
+
+        self.release_slice_stores()
+
+        if self.int_out_of_core == 1:
+            if symmetric_mesh is None: shape = (srw_wavefront.mesh.ne, srw_wavefront.mesh.nx, srw_wavefront.mesh.ny)
+            else:                      shape = (srw_wavefront.mesh.ne, wf_parameters._h_slit_points, wf_parameters._v_slit_points)
+
+            print("Out-of-core 3D stacks: " + str(round(srw_stack.get_stack_size(shape)/1024**2, 1)) + " MB each, in " + \
+                  (self.int_out_of_core_directory if self.int_out_of_core_directory != "" else "the temporary directory"))
+
+            self.slice_stores = [srw_stack.SRWSliceStore(shape, self.int_out_of_core_directory),
+                                 srw_stack.SRWSliceStore(shape, self.int_out_of_core_directory)]
 
-        e, h, v, i_me = srw_wavefront.get_intensity(multi_electron=True)
+            e, h, v, i_se = self.get_intensity_out_of_core(srw_wavefront, symmetric_mesh, False, self.slice_stores[0])
+            e, h, v, i_me = self.get_intensity_out_of_core(srw_wavefront, symmetric_mesh, True,  self.slice_stores[1])
 
+            i_me_sum = self.slice_stores[1].get_sum_over_energy()
+        else:
+            e, h, v, i_se = srw_wavefront.get_intensity(multi_electron=False)
+            e, h, v, i_me = srw_wavefront.get_intensity(multi_electron=True)
+
+            if not symmetric_mesh is None:
+                h, v = symmetric_mesh.get_coordinates()
+                i_se = symmetric_mesh.unfold(i_se)
+                i_me = symmetric_mesh.unfold(i_me)
+
+            i_me_sum = i_me.sum(axis=0)
+
+        if not symmetric_mesh is None and self.int_symmetry_verification == 1:
+            self.setStatusMessage("Running SRW: full calculation, for verification")
+
+            start_time = time.time()
+            srw_wavefront_full = srw_trajectory.get_SRW_Wavefront(srw_source, wf_parameters, trajectory)
+            full_time = time.time() - start_time
+
+            self.check_symmetry_accuracy(srw_wavefront_full, i_se, i_me, full_time, symmetric_time)
+
+            self.setStatusMessage("Plotting Results")
+
+        tickets.append((i_se, e, h*1e3, v*1e3))
         tickets.append((i_me, e, h*1e3, v*1e3))
 
         if len(e) > 1: energy_step = e[1]-e[0]
         else:          energy_step = 1.0
 
-        pd = i_me.sum(axis=0)*energy_step*codata.e*1e3
+        pd = i_me_sum*energy_step*codata.e*1e3
 
         self.calculated_total_power = SRWLightSource.get_total_power_from_power_density(h, v, pd)
 
@@ -321,6 +411,53 @@ class OWSRWRadiation(SRWPowerDensityViewer):
 
         self.progressBarSet(progress_bar_value + 10)
 
+    #################################
+    # with mirrors, the intensities of the reduced mesh are unfolded in the stacks one energy slice at a time
+    #################################
+
+    def get_intensity_out_of_core(self, srw_wavefront, symmetric_mesh, multi_electron, slice_store):
+        if symmetric_mesh is None:
+            e, h, v, i = srw_precision.get_intensity(srw_wavefront, multi_electron=multi_electron, precision=srw_precision.SRWPrecision.SINGLE, distribution=slice_store.get_data())
+        else:
+            e = []
+
+            for index, (photon_energy, i_reduced) in enumerate(srw_precision.get_intensity_slices(srw_wavefront, multi_electron=multi_electron, precision=srw_precision.SRWPrecision.SINGLE)):
+                slice_store.set_slice(index, symmetric_mesh.unfold(i_reduced))
+                e.append(photon_energy)
+
+            e = numpy.array(e)
+            h, v = symmetric_mesh.get_coordinates()
+            i = slice_store.get_data()
+
+        slice_store.flush()
+
+        return e, h, v, i
+
+    def check_symmetry_accuracy(self, srw_wavefront_full, i_se, i_me, full_time, symmetric_time):
+        _, _, _, i_se_full = srw_wavefront_full.get_intensity(multi_electron=False)
+        _, _, _, i_me_full = srw_wavefront_full.get_intensity(multi_electron=True)
+
+        se_deviation = srw_symmetry.get_relative_deviation(i_se, i_se_full)
+        me_deviation = srw_symmetry.get_relative_deviation(i_me, i_me_full)
+
+        message = "Symmetry, relative deviation vs. Full Calculation: intensity SE " + "{:.2e}".format(se_deviation) + ", intensity ME " + "{:.2e}".format(me_deviation) + \
+                  " (wavefront calculation time " + "{:.2f}".format(symmetric_time) + " s vs. " + "{:.2f}".format(full_time) + " s)"
+
+        print(message)
+
+        if max(se_deviation, me_deviation) > srw_symmetry.VERIFICATION_TOLERANCE:
+            QMessageBox.warning(self, "Warning", message + "\n\nThe configuration is not symmetric enough: consider no Symmetry", QMessageBox.Ok)
+
+    def release_slice_stores(self):
+        for slice_store in self.slice_stores: slice_store.close()
+
+        self.slice_stores = []
+
+    def onDeleteWidget(self):
+        self.release_slice_stores()
+
+        super().onDeleteWidget()
+
     def getVariablesToPlot(self):
         return [[1, 2], [1, 2], [1, 2]]
 
@@ -1,12 +1,12 @@
 __author__ = 'labx'
 
-import sys, numpy
+import os, sys, numpy
 from numpy import nan
 import scipy.constants as codata
 from copy import deepcopy
 
 from PyQt5.QtGui import QPalette, QColor, QFont
-from PyQt5.QtWidgets import QMessageBox
+from PyQt5.QtWidgets import QMessageBox, QApplication
 from orangewidget import gui
 from orangewidget import widget
 from orangewidget.settings import Setting
@@ -26,6 +26,8 @@ from wofrysrw.storage_ring.light_sources.srw_3d_light_source import SRW3DLightSo
 
 from orangecontrib.srw.util.srw_util import SRWPlot
 from orangecontrib.srw.util.srw_objects import SRWData
+from orangecontrib.srw.util import srw_spectrum, srw_trajectory
+from orangecontrib.srw.util.srw_cache import SRWResultCache
 from orangecontrib.srw.widgets.gui.ow_srw_wavefront_viewer import SRWWavefrontViewer
 
 class OWSRWSpectrum(SRWWavefrontViewer):
@@ -92,6 +94,9 @@ class OWSRWSpectrum(SRWWavefrontViewer):
     spe_longitudinal_integration_precision_parameter = Setting(1.5)
     spe_azimuthal_integration_precision_parameter = Setting(1.5)
 
+    spe_number_of_workers = Setting(os.cpu_count() or 1)
+    spe_points_per_chunk = Setting(500)
+
     calculated_total_power = 0.0
 
     received_light_source = None
@@ -181,6 +186,11 @@ class OWSRWSpectrum(SRWWavefrontViewer):
 
         oasysgui.lineEdit(tab_prop, self, "spe_sampling_factor_for_adjusting_nx_ny", "Sampling factor for adjusting nx/ny", labelWidth=260, valueType=int, orientation="horizontal")
 
+        par_box = oasysgui.widgetBox(self.controlArea, "Parallel Calculation", addSpace=False, orientation="vertical", width=self.CONTROL_AREA_WIDTH-5)
+
+        oasysgui.lineEdit(par_box, self, "spe_number_of_workers", "Number of Workers", labelWidth=260, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(par_box, self, "spe_points_per_chunk", "Energy Points per Chunk", labelWidth=260, valueType=int, orientation="horizontal")
+
         # FLUX  -------------------------------------------
 
         gui.rubber(self.controlArea)
@@ -267,6 +277,12 @@ class OWSRWSpectrum(SRWWavefrontViewer):
                                     electron_beam=electron_beam,
                                     magnet_magnetic_structure=self.received_light_source._magnetic_structure)
 
+    def get_source_input_files(self):
+        if isinstance(self.received_light_source, SRW3DLightSource):
+            return [self.received_light_source._magnetic_structure.file_name]
+        else:
+            return []
+
     def getCalculatedTotalPowerString(self):
         if self.calculated_total_power == 0:
             return ""
@@ -301,6 +317,9 @@ class OWSRWSpectrum(SRWWavefrontViewer):
         congruence.checkStrictlyPositiveNumber(self.spe_number_of_points_for_trajectory_calculation, "Number of points for trajectory calculation")
         congruence.checkPositiveNumber(self.spe_sampling_factor_for_adjusting_nx_ny, "Sampling Factor for adjusting nx/ny")
 
+        congruence.checkStrictlyPositiveNumber(self.spe_number_of_workers, "Number of Workers")
+        congruence.checkStrictlyPositiveNumber(self.spe_points_per_chunk, "Energy Points per Chunk")
+
         self.checkFluxSpecificFields()
 
 
@@ -323,59 +342,99 @@ class OWSRWSpectrum(SRWWavefrontViewer):
                                             h_position=self.spe_h_slit_c,
                                             v_position=self.spe_v_slit_c,
                                             distance = self.spe_distance,
-                                            wavefront_precision_parameters=WavefrontPrecisionParameters(sr_method=self.spe_sr_method,
-                                                                                                        relative_precision=self.spe_relative_precision,
-                                                                                                        start_integration_longitudinal_position=self.spe_start_integration_longitudinal_position,
-                                                                                                        end_integration_longitudinal_position=self.spe_end_integration_longitudinal_position,
-                                                                                                        number_of_points_for_trajectory_calculation=self.spe_number_of_points_for_trajectory_calculation,
-                                                                                                        use_terminating_terms=self.spe_use_terminating_terms,
-                                                                                                        sampling_factor_for_adjusting_nx_ny=self.spe_sampling_factor_for_adjusting_nx_ny))
+                                            wavefront_precision_parameters=self.get_wavefront_precision_parameters())
+
+        on_axis_wf_parameters = WavefrontParameters(photon_energy_min = self.spe_photon_energy_min,
+                                                    photon_energy_max = self.spe_photon_energy_max,
+                                                    photon_energy_points=self.spe_photon_energy_points,
+                                                    h_slit_gap = 0.0,
+                                                    v_slit_gap = 0.0,
+                                                    h_slit_points = 1,
+                                                    v_slit_points = 1,
+                                                    h_position=self.spe_h_slit_c,
+                                                    v_position=self.spe_v_slit_c,
+                                                    distance = self.spe_distance,
+                                                    wavefront_precision_parameters=self.get_wavefront_precision_parameters())
 
+        if isinstance(self.received_light_source, SRWUndulatorLightSource):
+            flux_precision_parameters = FluxPrecisionParameters(initial_UR_harmonic=self.spe_initial_UR_harmonic,
+                                                                final_UR_harmonic=self.spe_final_UR_harmonic,
+                                                                longitudinal_integration_precision_parameter=self.spe_longitudinal_integration_precision_parameter,
+                                                                azimuthal_integration_precision_parameter=self.spe_azimuthal_integration_precision_parameter,
+                                                                calculation_type=1)
+        else:
+            flux_precision_parameters = None
 
-        srw_wavefront = srw_source.get_SRW_Wavefront(source_wavefront_parameters=wf_parameters)
+        #################################
+        # spectra are cached in memory: the same source and parameters don't run SRW again. Otherwise the energy
+        # range is split in chunks, calculated in parallel: the contiguous part of the spectrum calculated from
+        # the first energy is plotted as the chunks are completed
+        #################################
+
+        result_cache = SRWResultCache.Instance()
+
+        cache_key = result_cache.get_key(srw_source,
+                                         wf_parameters,
+                                         on_axis_wf_parameters,
+                                         self.spe_polarization_component_to_be_extracted,
+                                         flux_precision_parameters,
+                                         input_files=self.get_source_input_files())
+        spectrum = result_cache.get(cache_key)
+
+        if spectrum is None:
+            chunks = srw_spectrum.get_spectrum_chunks(wf_parameters, on_axis_wf_parameters, self.spe_points_per_chunk)
+            initial_progress_bar_value = self.progressBarValue
+
+            def chunk_completed(number_of_completed_chunks, assembler):
+                number_of_points = assembler.get_number_of_contiguous_points()
+
+                if not assembler.is_completed() and number_of_points > 1:
+                    self.plot_results(self.get_spectrum_tickets(*assembler.get_spectrum(number_of_points)))
+
+                self.setStatusMessage("Running SRW: " + str(number_of_completed_chunks) + " of " + str(len(chunks)) + " energy chunks")
+                self.progressBarSet(initial_progress_bar_value + (progress_bar_value - initial_progress_bar_value)*number_of_completed_chunks/len(chunks))
+
+                QApplication.processEvents()
+
+            assembler = self.run_in_pool(srw_spectrum.run_spectrum_chunks,
+                                         srw_source,
+                                         srw_spectrum.get_energy_grid(wf_parameters),
+                                         chunks,
+                                         polarization_component_to_be_extracted=self.spe_polarization_component_to_be_extracted,
+                                         flux_precision_parameters=flux_precision_parameters,
+                                         max_workers=min(self.spe_number_of_workers, len(chunks)),
+                                         callback=chunk_completed,
+                                         trajectory=self.get_cached_trajectory(srw_source, srw_trajectory.SRWTrajectoryParameters.from_wavefront_parameters(wf_parameters)))
+
+            spectrum = assembler.get_spectrum()
+
+            result_cache.put(cache_key, spectrum)
+        else:
+            self.setStatusMessage("Spectrum retrieved from Cache")
+
+        e, i, on_axis_i, power, cumulated_power = spectrum
 
-        if isinstance(self.received_light_source, SRWBendingMagnetLightSource) or isinstance(self.received_light_source, SRW3DLightSource):
-            e, i = srw_wavefront.get_flux(multi_electron=True, polarization_component_to_be_extracted=self.spe_polarization_component_to_be_extracted)
-        elif isinstance(self.received_light_source, SRWUndulatorLightSource):
-            e, i = srw_source.get_undulator_flux(source_wavefront_parameters=wf_parameters,
-                                                 flux_precision_parameters=FluxPrecisionParameters(initial_UR_harmonic=self.spe_initial_UR_harmonic,
-                                                                                                   final_UR_harmonic=self.spe_final_UR_harmonic,
-                                                                                                   longitudinal_integration_precision_parameter=self.spe_longitudinal_integration_precision_parameter,
-                                                                                                   azimuthal_integration_precision_parameter=self.spe_azimuthal_integration_precision_parameter,
-                                                                                                   calculation_type=1))
-
-        power = i * 1e3 * (e[1]-e[0]) * codata.e
-        cumulated_power = numpy.cumsum(power)
         self.calculated_total_power = cumulated_power[-1]
 
-        wf_parameters = WavefrontParameters(photon_energy_min = self.spe_photon_energy_min,
-                                            photon_energy_max = self.spe_photon_energy_max,
-                                            photon_energy_points=self.spe_photon_energy_points,
-                                            h_slit_gap = 0.0,
-                                            v_slit_gap = 0.0,
-                                            h_slit_points = 1,
-                                            v_slit_points = 1,
-                                            h_position=self.spe_h_slit_c,
-                                            v_position=self.spe_v_slit_c,
-                                            distance = self.spe_distance,
-                                            wavefront_precision_parameters=WavefrontPrecisionParameters(sr_method=self.spe_sr_method,
-                                                                                                        relative_precision=self.spe_relative_precision,
-                                                                                                        start_integration_longitudinal_position=self.spe_start_integration_longitudinal_position,
-                                                                                                        end_integration_longitudinal_position=self.spe_end_integration_longitudinal_position,
-                                                                                                        number_of_points_for_trajectory_calculation=self.spe_number_of_points_for_trajectory_calculation,
-                                                                                                        use_terminating_terms=self.spe_use_terminating_terms,
-                                                                                                        sampling_factor_for_adjusting_nx_ny=self.spe_sampling_factor_for_adjusting_nx_ny))
-
-        srw_wavefront = srw_source.get_SRW_Wavefront(source_wavefront_parameters=wf_parameters)
-        _, on_axis_i  = srw_wavefront.get_flux(multi_electron=False, polarization_component_to_be_extracted=self.spe_polarization_component_to_be_extracted)
-
-        tickets.append(SRWPlot.get_ticket_1D(e, i))
-        tickets.append(SRWPlot.get_ticket_1D(e, on_axis_i))
-        tickets.append(SRWPlot.get_ticket_1D(e, power))
-        tickets.append(SRWPlot.get_ticket_1D(e, cumulated_power))
+        tickets.extend(self.get_spectrum_tickets(e, i, on_axis_i, power, cumulated_power))
 
         self.progressBarSet(progress_bar_value)
 
+    def get_wavefront_precision_parameters(self):
+        return WavefrontPrecisionParameters(sr_method=self.spe_sr_method,
+                                            relative_precision=self.spe_relative_precision,
+                                            start_integration_longitudinal_position=self.spe_start_integration_longitudinal_position,
+                                            end_integration_longitudinal_position=self.spe_end_integration_longitudinal_position,
+                                            number_of_points_for_trajectory_calculation=self.spe_number_of_points_for_trajectory_calculation,
+                                            use_terminating_terms=self.spe_use_terminating_terms,
+                                            sampling_factor_for_adjusting_nx_ny=self.spe_sampling_factor_for_adjusting_nx_ny)
+
+    def get_spectrum_tickets(self, e, i, on_axis_i, power, cumulated_power):
+        return [SRWPlot.get_ticket_1D(e, i),
+                SRWPlot.get_ticket_1D(e, on_axis_i),
+                SRWPlot.get_ticket_1D(e, power),
+                SRWPlot.get_ticket_1D(e, cumulated_power)]
+
     def create_exchange_data(self, tickets):
         ticket_f = tickets[0]
         ticket_sf = tickets[1]
@@ -500,8 +559,6 @@ class OWSRWSpectrum(SRWWavefrontViewer):
                 QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
 
 
-from PyQt5.QtWidgets import QApplication
-
 if __name__=="__main__":
     a = QApplication(sys.argv)
     ow = OWSRWSpectrum()
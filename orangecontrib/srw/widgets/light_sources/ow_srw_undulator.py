@@ -13,6 +13,8 @@ from syned.storage_ring.magnetic_structures.undulator import Undulator
 from wofrysrw.storage_ring.light_sources.srw_undulator_light_source import SRWUndulatorLightSource
 from wofrysrw.storage_ring.magnetic_structures.srw_undulator import SRWUndulator
 
+from orangecontrib.srw.util.srw_objects import SRWCoherentModes
+from orangecontrib.srw.util import srw_coherent_modes
 from orangecontrib.srw.widgets.gui.ow_srw_source import OWSRWSource
 
 import scipy.constants as codata
@@ -58,6 +60,10 @@ class OWSRWUndulator(OWSRWSource):
     auto_energy = Setting(0.0)
     auto_harmonic_number = Setting(1)
 
+    use_coherent_modes = Setting(0)
+    number_of_coherent_modes = Setting(20)
+    coherent_modes_workers = Setting(os.cpu_count() or 1)
+
     def __init__(self):
         super().__init__()
 
@@ -127,6 +133,28 @@ class OWSRWUndulator(OWSRWSource):
         gui.button(button_box, self, "Set Kh value", callback=self.auto_set_undulator_H)
         gui.button(button_box, self, "Set Both K values", callback=self.auto_set_undulator_B)
 
+        ####################################################################################
+        # Coherent Modes
+
+        tab_modes = oasysgui.createTabPage(self.tabs_setting, "Coherent Modes")
+
+        left_box_1 = oasysgui.widgetBox(tab_modes, "Gaussian Schell-Model", addSpace=False, orientation="vertical")
+
+        gui.comboBox(left_box_1, self, "use_coherent_modes", label="Send Coherent Modes", labelWidth=260,
+                     items=["No", "Yes"], callback=self.set_CoherentModes,
+                     sendSelectedValue=False, orientation="horizontal",
+                     tooltip="The modes are propagated and their intensities summed by the Accumulation Point")
+
+        self.left_box_1_1 = oasysgui.widgetBox(left_box_1, "", addSpace=False, orientation="vertical")
+
+        gui.label(self.left_box_1_1, self, "Modes built from the electron beam emittance and the single\n" +
+                                           "electron wavefront (Trajectory Initialization: Automatic)")
+
+        oasysgui.lineEdit(self.left_box_1_1, self, "number_of_coherent_modes", "Number of Modes", labelWidth=260, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(self.left_box_1_1, self, "coherent_modes_workers", "Number of Workers", labelWidth=260, valueType=int, orientation="horizontal")
+
+        self.set_CoherentModes()
+
         gui.rubber(self.controlArea)
         gui.rubber(self.mainArea)
 
@@ -189,6 +217,9 @@ class OWSRWUndulator(OWSRWSource):
 
         self.set_harmonic_energy()
 
+    def set_CoherentModes(self):
+        self.left_box_1_1.setVisible(self.use_coherent_modes==1)
+
     def set_WFUseHarmonic(self):
         self.use_harmonic_box_1.setVisible(self.wf_energy_type==0)
         self.use_harmonic_box_2.setVisible(self.wf_energy_type==1)
@@ -275,6 +306,28 @@ class OWSRWUndulator(OWSRWSource):
         return SRWUndulatorLightSource(electron_beam=electron_beam,
                                        undulator_magnetic_structure=undulator_magnetic_structure)
 
+    def get_coherent_modes(self, srw_source, wavefront):
+        if self.use_coherent_modes == 0: return None
+
+        distance = self.wf_distance - self.longitudinal_central_position # from the center of the undulator
+
+        gsm_parameters_h, gsm_parameters_v = srw_coherent_modes.get_undulator_gsm_parameters(wavefront, srw_source.get_electron_beam(), distance)
+
+        wavefronts, weights, captured_occupation = srw_coherent_modes.get_coherent_modes(wavefront, gsm_parameters_h, gsm_parameters_v, distance, self.number_of_coherent_modes)
+
+        coherent_fraction = srw_coherent_modes.get_coherent_fraction(*gsm_parameters_h)*srw_coherent_modes.get_coherent_fraction(*gsm_parameters_v)
+
+        print("\n", "Coherent Modes:")
+        print("Source size (H, V) [m]: ", gsm_parameters_h[0], gsm_parameters_v[0])
+        print("Coherence length (H, V) [m]: ", gsm_parameters_h[1], gsm_parameters_v[1])
+        print("Coherent fraction: ", coherent_fraction)
+        print("Occupation of the ", len(wavefronts), " modes: ", captured_occupation, "\n")
+
+        return SRWCoherentModes(wavefronts=wavefronts,
+                                weights=weights,
+                                number_of_workers=self.coherent_modes_workers,
+                                coherent_fraction=coherent_fraction)
+
     def print_specific_infos(self, srw_source):
         print("1st Harmonic Energy", srw_source.get_resonance_energy(), "\n")
 
@@ -287,6 +340,9 @@ class OWSRWUndulator(OWSRWSource):
         elif self.wf_energy_type == 2:
             return self.wf_photon_energy, self.wf_photon_energy_to, self.wf_photon_energy_points
 
+    def is_symmetry_supported(self):
+        return True
+
     def get_source_length(self):
         return self.period_length*self.number_of_periods
 
@@ -301,6 +357,13 @@ class OWSRWUndulator(OWSRWSource):
         congruence.checkStrictlyPositiveNumber(self.period_length, "Period Length")
         congruence.checkStrictlyPositiveNumber(self.number_of_periods, "Number of Periods")
 
+        if self.use_coherent_modes == 1:
+            congruence.checkStrictlyPositiveNumber(self.number_of_coherent_modes, "Number of Modes")
+            congruence.checkStrictlyPositiveNumber(self.coherent_modes_workers, "Number of Workers")
+
+            if self.type_of_initialization != 0: raise ValueError("Coherent Modes need the Automatic Trajectory Initialization")
+            if self.wf_distance <= self.longitudinal_central_position: raise ValueError("Coherent Modes need a Propagation Distance downstream of the undulator center")
+
     def checkWavefrontPhotonEnergy(self):
         if self.wf_energy_type == 0:
             congruence.checkStrictlyPositiveNumber(self.wf_harmonic_number, "Wavefront Propagation Harmonic Number")
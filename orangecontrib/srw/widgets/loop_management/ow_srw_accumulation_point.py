@@ -5,6 +5,7 @@ import numpy
 from numpy import nan
 from scipy.interpolate import RectBivariateSpline
 
+from PyQt5.QtCore import QSettings
 from PyQt5.QtGui import QPalette, QColor, QFont
 from PyQt5.QtWidgets import QMessageBox, QInputDialog
 
@@ -14,7 +15,8 @@ from oasys.widgets import gui as oasysgui
 from oasys.widgets import congruence
 
 from orangecontrib.srw.util.srw_util import SRWPlot
-from orangecontrib.srw.util.srw_objects import SRWData
+from orangecontrib.srw.util.srw_objects import SRWData, SRWScanData
+from orangecontrib.srw.util import srw_engine, srw_precision, srw_multi_electron, srw_coherent_modes
 from orangecontrib.srw.widgets.gui.ow_srw_wavefront_viewer import SRWWavefrontViewer
 
 from matplotlib import cm
@@ -70,6 +72,11 @@ class OWSRWAccumulationPoint(SRWWavefrontViewer):
 
     autosave_file = None
 
+    archive_fields = Setting(0)
+    archive_file_name = Setting("single_electron_fields.hdf5")
+
+    field_archive = None
+
     current_number_of_wavefronts       = 0
     last_number_of_wavefronts  = 0
     total_number_of_wavefronts = 0
@@ -175,6 +182,21 @@ class OWSRWAccumulationPoint(SRWWavefrontViewer):
 
         self.set_autosave()
 
+        archive_box = oasysgui.widgetBox(self.tab_bas, "Single Electron Fields", addSpace=True, orientation="vertical", height=95)
+
+        gui.comboBox(archive_box, self, "archive_fields", label="Archive fields (for mode decomposition)", labelWidth=250,
+                                         items=["No", "Yes"],
+                                         sendSelectedValue=False, orientation="horizontal", callback=self.set_archive_fields)
+
+        self.archive_box_1 = oasysgui.widgetBox(archive_box, "", addSpace=False, orientation="horizontal", height=25)
+        self.archive_box_2 = oasysgui.widgetBox(archive_box, "", addSpace=False, orientation="horizontal", height=25)
+
+        self.le_archive_file_name = oasysgui.lineEdit(self.archive_box_1, self, "archive_file_name", "File Name", labelWidth=70,  valueType=str, orientation="horizontal")
+
+        gui.button(self.archive_box_1, self, "...", callback=self.selectArchiveFile, width=30)
+
+        self.set_archive_fields()
+
         oasysgui.lineEdit(self.tab_bas, self, "last_number_of_wavefronts", "Previous Nr. of Wavefronts", labelWidth=260, valueType=int, orientation="horizontal")
         oasysgui.lineEdit(self.tab_bas, self, "current_number_of_wavefronts", "Current Nr. of Wavefronts", labelWidth=260, valueType=int, orientation="horizontal")
         le = oasysgui.lineEdit(self.tab_bas, self, "total_number_of_wavefronts", "Total Nr. of Wavefronts", labelWidth=260, valueType=int, orientation="horizontal")
@@ -193,6 +215,10 @@ class OWSRWAccumulationPoint(SRWWavefrontViewer):
         self.autosave_box_1.setVisible(self.autosave==1)
         self.autosave_box_2.setVisible(self.autosave==0)
 
+    def set_archive_fields(self):
+        self.archive_box_1.setVisible(self.archive_fields==1)
+        self.archive_box_2.setVisible(self.archive_fields==0)
+
     def replot(self):
         if not self.last_tickets is None:
             self.progressBarInit()
@@ -205,74 +231,175 @@ class OWSRWAccumulationPoint(SRWWavefrontViewer):
 
     def receive_srw_data(self, data):
         if not data is None:
-            if isinstance(data, SRWData):
-                if not data.get_srw_wavefront() is None:
+            if isinstance(data, SRWScanData):
+                for scanned_srw_data in data.get_srw_data_list(): self.receive_srw_data(scanned_srw_data)
+            elif isinstance(data, SRWData):
+                if not data.get_persistent_srw_beamline().get_macro_electrons() is None:
+                    self.accumulate_macro_electrons(data)
+                elif not data.get_persistent_srw_beamline().get_coherent_modes() is None:
+                    self.accumulate_coherent_modes(data)
+                elif not data.get_srw_wavefront() is None:
                     try:
                         self.progressBarInit()
+                        self.progressBarSet(30)
 
-                        self.current_number_of_wavefronts += 1
-                        self.total_number_of_wavefronts = self.last_number_of_wavefronts + self.current_number_of_wavefronts
+                        e, h, v, current_intensity = srw_precision.get_intensity(data.get_srw_wavefront(), multi_electron=False)
 
-                        self.progressBarSet(30)
+                        self.accumulate_intensity(e, h, v, current_intensity)
 
-                        e, h, v, current_intensity = data.get_srw_wavefront().get_intensity(multi_electron=False)
+                        if self.archive_fields == 1: self.archive_wavefront(data.get_srw_wavefront())
 
-                        if self.use_merging_range == 0:
-                            self.progressBarSet(60)
+                        self.progressBarFinished()
 
-                            tickets = []
-                            SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, current_intensity, tickets)
-                        else:
-                            new_h = numpy.linspace(self.merging_range_x_min*1e-6, self.merging_range_x_max*1e-6, self.merging_nr_points_x)
-                            new_v = numpy.linspace(self.merging_range_y_min*1e-6, self.merging_range_y_max*1e-6, self.merging_nr_points_y)
+                    except Exception as e:
+                        QMessageBox.critical(self, "Error", str(e.args[0]), QMessageBox.Ok)
 
-                            new_current_intensity = numpy.zeros((len(e), len(new_h), len(new_v)))
+                        self.setStatusMessage("")
+                        self.progressBarFinished()
 
-                            for index in range(len(e)):
-                                interpolator = RectBivariateSpline(x=h, y=v, z=current_intensity[index, :, :], bbox=[None, None, None, None], kx=2, ky=2, s=0)
+                        if self.IS_DEVELOP: raise e
 
-                                new_current_intensity[index, :, :] = interpolator(new_h, new_v)
+    # the macro-electrons of the batch are propagated through the whole beamline in the process pool, and reduced
+    # into their average intensity, accumulated with the weight of the number of macro-electrons: the GUI stays
+    # responsive and the batch can be cancelled (see run_in_pool)
+    def accumulate_macro_electrons(self, data):
+        try:
+            self.progressBarInit()
 
-                            self.progressBarSet(60)
+            macro_electrons = data.get_persistent_srw_beamline().get_macro_electrons()
 
-                            tickets = []
-                            SRWWavefrontViewer.add_2D_wavefront_plot(e, new_h, new_v, new_current_intensity, tickets)
+            jobs = srw_multi_electron.get_macro_electron_jobs(data.get_persistent_srw_beamline(), srw_engine.get_propagation_mode(),
+                                                              linear_corrections=QSettings().value("srw/trajectory-cache-enabled", 0, int) == 1 and
+                                                                                 QSettings().value("srw/trajectory-linear-corrections", 0, int) == 1)
 
-                        self.rinormalize(tickets[-1])
+            self.setStatusMessage("Propagating " + str(len(jobs)) + " macro-electrons with " + str(macro_electrons.get_number_of_workers()) + " workers")
 
-                        if self.autosave == 1:
-                            if self.autosave_file is None:
-                                self.autosave_file = SRWPlot.PlotXYHdf5File(congruence.checkDir(self.autosave_file_name))
-                            elif self.autosave_file.filename != congruence.checkFileName(self.autosave_file_name):
-                                self.autosave_file.close()
-                                self.autosave_file = SRWPlot.PlotXYHdf5File(congruence.checkDir(self.autosave_file_name))
+            def macro_electron_completed(index, accumulator):
+                self.progressBarSet(60*(index + 1)/len(jobs))
 
-                            self.autosave_file.write_coordinates(tickets[-1])
-                            self.autosave_file.add_plot_xy(tickets[-1])
-                            self.autosave_file.write_additional_data(tickets[-1])
-                            self.autosave_file.add_attribute("number_of_wavefronts", self.total_number_of_wavefronts)
-                            self.autosave_file.flush()
+            def macro_electron_wavefront(index, wavefront):
+                self.archive_wavefront(wavefront)
 
-                        self.plot_results(tickets, progressBarValue=90)
-                        self.last_tickets = tickets
+            accumulator = self.run_in_pool(srw_multi_electron.run_macro_electron_jobs,
+                                           jobs,
+                                           max_workers=macro_electrons.get_number_of_workers(),
+                                           callback=macro_electron_completed,
+                                           wavefront_callback=macro_electron_wavefront if self.archive_fields == 1 else None)
 
-                        self.progressBarFinished()
+            e, h, v, average_intensity = accumulator.get_average_intensity()
 
-                    except Exception as e:
-                        QMessageBox.critical(self, "Error", str(e.args[0]), QMessageBox.Ok)
+            self.accumulate_intensity(e, h, v, average_intensity, accumulator.number_of_electrons)
 
-                        self.setStatusMessage("")
-                        self.progressBarFinished()
+            self.setStatusMessage("")
+            self.progressBarFinished()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e.args[0]), QMessageBox.Ok)
 
-                        if self.IS_DEVELOP: raise e
+            self.setStatusMessage("")
+            self.progressBarFinished()
+
+            if self.IS_DEVELOP: raise e
 
-    def rinormalize(self, ticket):
+    # the coherent modes of the batch are propagated through the whole beamline in the process pool, and reduced
+    # into the sum of their intensities weighted by the occupations: the intensity of the partially coherent beam,
+    # accumulated as a single wavefront
+    def accumulate_coherent_modes(self, data):
+        try:
+            self.progressBarInit()
+
+            coherent_modes = data.get_persistent_srw_beamline().get_coherent_modes()
+
+            jobs = srw_coherent_modes.get_coherent_mode_jobs(data.get_persistent_srw_beamline(), srw_engine.get_propagation_mode())
+
+            self.setStatusMessage("Propagating " + str(len(jobs)) + " coherent modes with " + str(coherent_modes.get_number_of_workers()) + " workers")
+
+            def coherent_mode_completed(index, accumulator):
+                self.progressBarSet(60*(index + 1)/len(jobs))
+
+            accumulator = self.run_in_pool(srw_multi_electron.run_macro_electron_jobs,
+                                           jobs,
+                                           max_workers=coherent_modes.get_number_of_workers(),
+                                           callback=coherent_mode_completed,
+                                           weights=coherent_modes.get_weights())
+
+            e, h, v, average_intensity = accumulator.get_average_intensity()
+
+            self.accumulate_intensity(e, h, v, average_intensity)
+
+            self.setStatusMessage("")
+            self.progressBarFinished()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e.args[0]), QMessageBox.Ok)
+
+            self.setStatusMessage("")
+            self.progressBarFinished()
+
+            if self.IS_DEVELOP: raise e
+
+    def accumulate_intensity(self, e, h, v, current_intensity, number_of_wavefronts=1):
+        self.current_number_of_wavefronts += number_of_wavefronts
+        self.total_number_of_wavefronts = self.last_number_of_wavefronts + self.current_number_of_wavefronts
+
+        if self.use_merging_range == 0:
+            self.progressBarSet(60)
+
+            tickets = []
+            SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, current_intensity, tickets)
+        else:
+            new_h = numpy.linspace(self.merging_range_x_min*1e-6, self.merging_range_x_max*1e-6, self.merging_nr_points_x)
+            new_v = numpy.linspace(self.merging_range_y_min*1e-6, self.merging_range_y_max*1e-6, self.merging_nr_points_y)
+
+            new_current_intensity = numpy.zeros((len(e), len(new_h), len(new_v)), dtype=current_intensity.dtype)
+
+            for index in range(len(e)):
+                interpolator = RectBivariateSpline(x=h, y=v, z=current_intensity[index, :, :], bbox=[None, None, None, None], kx=2, ky=2, s=0)
+
+                new_current_intensity[index, :, :] = interpolator(new_h, new_v)
+
+            self.progressBarSet(60)
+
+            tickets = []
+            SRWWavefrontViewer.add_2D_wavefront_plot(e, new_h, new_v, new_current_intensity, tickets)
+
+        self.rinormalize(tickets[-1], number_of_wavefronts)
+
+        if self.autosave == 1:
+            if self.autosave_file is None:
+                self.autosave_file = SRWPlot.PlotXYHdf5File(congruence.checkDir(self.autosave_file_name))
+            elif self.autosave_file.filename != congruence.checkFileName(self.autosave_file_name):
+                self.autosave_file.close()
+                self.autosave_file = SRWPlot.PlotXYHdf5File(congruence.checkDir(self.autosave_file_name))
+
+            self.autosave_file.write_coordinates(tickets[-1])
+            self.autosave_file.add_plot_xy(tickets[-1])
+            self.autosave_file.write_additional_data(tickets[-1])
+            self.autosave_file.add_attribute("number_of_wavefronts", self.total_number_of_wavefronts)
+            self.autosave_file.flush()
+
+        self.plot_results(tickets, progressBarValue=90)
+        self.last_tickets = tickets
+
+    # the archive is rewritten at the first field after a reset of the accumulation
+    def archive_wavefront(self, wavefront):
+        if self.field_archive is None:
+            self.field_archive = srw_coherent_modes.SRWFieldArchive(congruence.checkDir(self.archive_file_name), mode="w")
+        elif self.field_archive.get_file_name() != congruence.checkFileName(self.archive_file_name):
+            self.field_archive.close()
+            self.field_archive = srw_coherent_modes.SRWFieldArchive(congruence.checkDir(self.archive_file_name), mode="w")
+
+        self.field_archive.append(wavefront)
+        self.field_archive.flush()
+
+    # ticket holds the average of number_of_wavefronts intensities
+    def rinormalize(self, ticket, number_of_wavefronts=1):
         if not self.last_tickets is None:
             if ticket["histogram"].shape != self.last_tickets[-1]["histogram"].shape: raise ValueError("Accumulated Intensity Shape is different from received one")
 
-            ticket["histogram"]   = ((self.last_tickets[-1]["histogram"]   * (self.total_number_of_wavefronts - 1)) + ticket["histogram"])   / self.total_number_of_wavefronts  # average
-            ticket["histogram_h"] = ((self.last_tickets[-1]["histogram_h"] * (self.total_number_of_wavefronts - 1)) + ticket["histogram_h"]) / self.total_number_of_wavefronts  # average
-            ticket["histogram_v"] = ((self.last_tickets[-1]["histogram_v"] * (self.total_number_of_wavefronts - 1)) + ticket["histogram_v"]) / self.total_number_of_wavefronts  # average
+            previous_number_of_wavefronts = self.total_number_of_wavefronts - number_of_wavefronts
+
+            ticket["histogram"]   = ((self.last_tickets[-1]["histogram"]   * previous_number_of_wavefronts) + ticket["histogram"]   * number_of_wavefronts) / self.total_number_of_wavefronts  # average
+            ticket["histogram_h"] = ((self.last_tickets[-1]["histogram_h"] * previous_number_of_wavefronts) + ticket["histogram_h"] * number_of_wavefronts) / self.total_number_of_wavefronts  # average
+            ticket["histogram_v"] = ((self.last_tickets[-1]["histogram_v"] * previous_number_of_wavefronts) + ticket["histogram_v"] * number_of_wavefronts) / self.total_number_of_wavefronts  # average
 
     def reset_accumulation(self):
         try:
@@ -282,6 +409,10 @@ class OWSRWAccumulationPoint(SRWWavefrontViewer):
                 self.autosave_file.close()
                 self.autosave_file = None
 
+            if not self.field_archive is None:
+                self.field_archive.close()
+                self.field_archive = None
+
             self.plot_results([SRWPlot.get_ticket_2D(numpy.array([0, 0.001]),
                                                      numpy.array([0, 0.001]),
                                                      numpy.zeros((2, 2)))], ignore_range=True)
@@ -298,6 +429,10 @@ class OWSRWAccumulationPoint(SRWWavefrontViewer):
         file_name = oasysgui.selectSaveFileFromDialog(self, "Select File", default_file_name="", file_extension_filter="HDF5 Files (*.hdf5 *.h5 *.hdf)")
         self.le_autosave_file_name.setText("" if file_name is None else file_name)
 
+    def selectArchiveFile(self):
+        file_name = oasysgui.selectSaveFileFromDialog(self, "Select File", default_file_name="", file_extension_filter="HDF5 Files (*.hdf5 *.h5 *.hdf)")
+        self.le_archive_file_name.setText("" if file_name is None else file_name)
+
     def getVariablesToPlot(self):
         return [[1, 2]]
 
@@ -0,0 +1,175 @@
+import os
+
+from orangewidget import gui
+from orangewidget.settings import Setting
+from oasys.widgets import widget
+from oasys.widgets import gui as oasysgui
+from oasys.widgets import congruence
+
+from PyQt5.QtGui import QFont, QPalette, QColor
+from PyQt5.QtWidgets import QApplication, QMessageBox
+
+
+from orangecontrib.srw.util.srw_objects import SRWData, SRWPersistentBeamline, SRWCoherentModes, create_srw_beamline
+from orangecontrib.srw.util import srw_coherent_modes
+
+class OWSRWCoherentModeDecomposition(widget.OWWidget):
+    name = "Coherent Mode Decomposition"
+    description = "SRW Tools: Coherent Mode Decomposition of Single Electron Fields"
+    icon = "icons/accumulation.png"
+    maintainer = "Luca Rebuffi"
+    maintainer_email = "lrebuffi(@at@)anl.gov"
+    priority = 5
+    category = "Tools"
+    keywords = ["coherent", "modes", "svd", "decomposition"]
+
+    outputs = [{"name":"SRWData",
+                "type":SRWData,
+                "doc":"SRW Coherent Modes",
+                "id":"data"}]
+
+    want_main_area = 0
+
+    archive_file_name = Setting("single_electron_fields.hdf5")
+
+    number_of_modes = Setting(20)
+    oversampling = Setting(10)
+    power_iterations = Setting(2)
+    chunk_size = Setting(100)
+    seed = Setting(0)
+    number_of_workers = Setting(os.cpu_count() or 1)
+
+    CONTROL_AREA_WIDTH = 600
+
+    def __init__(self):
+        super().__init__()
+
+        self.setFixedWidth(self.CONTROL_AREA_WIDTH + 10)
+        self.setFixedHeight(650)
+
+        self.controlArea.setFixedWidth(self.CONTROL_AREA_WIDTH)
+
+        button = gui.button(self.controlArea, self, "Decompose and Send Modes", callback=self.decompose)
+        font = QFont(button.font())
+        font.setBold(True)
+        button.setFont(font)
+        palette = QPalette(button.palette()) # make a copy of the palette
+        palette.setColor(QPalette.ButtonText, QColor('Dark Blue'))
+        button.setPalette(palette) # assign new palette
+        button.setFixedHeight(45)
+
+        box = oasysgui.widgetBox(self.controlArea, "Single Electron Fields", addSpace=True, orientation="vertical")
+
+        file_box = oasysgui.widgetBox(box, "", addSpace=False, orientation="horizontal")
+
+        self.le_archive_file_name = oasysgui.lineEdit(file_box, self, "archive_file_name", "Archive File (from the Accumulation Point)", labelWidth=250, valueType=str, orientation="horizontal")
+
+        gui.button(file_box, self, "...", callback=self.selectArchiveFile, width=30)
+
+        box = oasysgui.widgetBox(self.controlArea, "Randomized SVD", addSpace=True, orientation="vertical")
+
+        oasysgui.lineEdit(box, self, "number_of_modes", "Number of Modes", labelWidth=400, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(box, self, "oversampling", "Oversampling", labelWidth=400, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(box, self, "power_iterations", "Power Iterations", labelWidth=400, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(box, self, "chunk_size", "Fields per Chunk (memory bound)", labelWidth=400, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(box, self, "seed", "Random Seed", labelWidth=400, valueType=int, orientation="horizontal")
+
+        box = oasysgui.widgetBox(self.controlArea, "Coherent Modes", addSpace=True, orientation="vertical")
+
+        oasysgui.lineEdit(box, self, "number_of_workers", "Number of Workers (propagation of the modes)", labelWidth=400, valueType=int, orientation="horizontal")
+
+        self.text_area = oasysgui.textArea(height=260, width=self.CONTROL_AREA_WIDTH-5, readOnly=True)
+        self.text_area.setText("")
+        self.text_area.setStyleSheet("background-color: white; font-family: Courier, monospace;")
+
+        self.controlArea.layout().addWidget(self.text_area)
+
+        gui.rubber(self.controlArea)
+
+    def selectArchiveFile(self):
+        self.le_archive_file_name.setText(oasysgui.selectFileFromDialog(self, self.archive_file_name, "Select File", file_extension_filter="HDF5 Files (*.hdf5 *.h5 *.hdf)"))
+
+    def checkFields(self):
+        congruence.checkFile(self.archive_file_name)
+        congruence.checkStrictlyPositiveNumber(self.number_of_modes, "Number of Modes")
+        congruence.checkPositiveNumber(self.oversampling, "Oversampling")
+        congruence.checkPositiveNumber(self.power_iterations, "Power Iterations")
+        congruence.checkStrictlyPositiveNumber(self.chunk_size, "Fields per Chunk")
+        congruence.checkPositiveNumber(self.seed, "Random Seed")
+        congruence.checkStrictlyPositiveNumber(self.number_of_workers, "Number of Workers")
+
+    #################################
+    # the modes are sent downstream as a batch of coherent modes, with no beamline element: the elements connected
+    # to this widget are appended to it and the Accumulation Point propagates the modes, as for a coherent mode source
+    #################################
+
+    def decompose(self):
+        self.setStatusMessage("")
+        self.progressBarInit()
+
+        field_archive = None
+
+        try:
+            self.checkFields()
+
+            self.text_area.clear()
+
+            field_archive = srw_coherent_modes.SRWFieldArchive(self.archive_file_name, mode="r")
+
+            number_of_passes = 2 + 2*self.power_iterations
+            passes = []
+
+            def status_callback(step, index, number_of_chunks):
+                if index == 0: passes.append(step)
+
+                self.setStatusMessage(step + ": chunk " + str(index + 1) + " of " + str(number_of_chunks))
+                self.progressBarSet(80*((len(passes) - 1) + (index + 1)/number_of_chunks)/number_of_passes)
+
+                QApplication.processEvents()
+
+            modes, occupations, total_occupation = srw_coherent_modes.get_numerical_coherent_modes(field_archive,
+                                                                                                   number_of_modes=self.number_of_modes,
+                                                                                                   oversampling=self.oversampling,
+                                                                                                   power_iterations=self.power_iterations,
+                                                                                                   chunk_size=self.chunk_size,
+                                                                                                   seed=self.seed,
+                                                                                                   status_callback=status_callback)
+
+            self.setStatusMessage("Building Mode Wavefronts")
+
+            wavefronts, weights = srw_coherent_modes.get_archive_coherent_modes(field_archive, modes, occupations)
+
+            self.text_area.setText("Fields: " + str(field_archive.get_number_of_fields()) + "\n" +
+                                   "Coherent fraction: " + "{:.6f}".format(occupations[0]/total_occupation) + "\n" +
+                                   "Occupation of the " + str(len(wavefronts)) + " modes: " + "{:.6f}".format(sum(occupations)/total_occupation) + "\n\n" +
+                                   srw_coherent_modes.get_occupations_text(occupations, total_occupation))
+
+            self.progressBarSet(90)
+
+            coherent_modes = SRWCoherentModes(wavefronts=wavefronts,
+                                              weights=weights,
+                                              number_of_workers=self.number_of_workers,
+                                              coherent_fraction=occupations[0]/total_occupation)
+
+            self.send("SRWData", SRWData(srw_beamline=SRWPersistentBeamline(create_srw_beamline(), coherent_modes=coherent_modes),
+                                         srw_wavefront=wavefronts[0]))
+
+            self.setStatusMessage("")
+        except Exception as exception:
+            QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
+
+            self.setStatusMessage("")
+
+            if self.IS_DEVELOP: raise exception
+        finally:
+            if not field_archive is None: field_archive.close()
+
+        self.progressBarFinished()
+
+if __name__ == "__main__":
+    import sys
+    a = QApplication(sys.argv)
+    ow = OWSRWCoherentModeDecomposition()
+    ow.show()
+    a.exec_()
+    ow.saveSettings()
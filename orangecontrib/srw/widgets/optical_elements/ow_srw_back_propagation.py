@@ -4,6 +4,8 @@ from syned.beamline.optical_elements.ideal_elements.screen import Screen
 from wofrysrw.beamline.optical_elements.ideal_elements.srw_screen import SRWScreen
 from wofrysrw.propagator.wavefront2D.srw_wavefront import PolarizationComponent
 
+from orangecontrib.srw.util import srw_precision
+from orangecontrib.srw.util.srw_profiler import profiled
 from orangecontrib.srw.widgets.gui.ow_srw_optical_element import OWSRWOpticalElement, SRWWavefrontViewer
 
 class OWSRWBackPropagation(OWSRWOpticalElement):
@@ -29,21 +31,22 @@ class OWSRWBackPropagation(OWSRWOpticalElement):
     def check_data(self):
         super().check_data()
 
+    @profiled("Calculation for Plots")
     def run_calculation_for_plots(self, tickets, progress_bar_value):
         if not self.output_wavefront is None:
             super().run_calculation_for_plots(tickets, progress_bar_value)
 
             if self.view_type == 1:
-                e, h, v, i = self.output_wavefront.get_intensity(multi_electron=True)
+                e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=True)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
             elif self.view_type == 2:
-                e, h, v, i = self.output_wavefront.get_intensity(multi_electron=True, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
+                e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=True, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_HORIZONTAL)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
-                e, h, v, i = self.output_wavefront.get_intensity(multi_electron=True, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
+                e, h, v, i = srw_precision.get_intensity(self.output_wavefront, multi_electron=True, polarization_component_to_be_extracted=PolarizationComponent.LINEAR_VERTICAL)
 
                 SRWWavefrontViewer.add_2D_wavefront_plot(e, h, v, i, tickets)
 
@@ -59,7 +59,8 @@ from oasys.widgets.gui import ConfirmDialog
 from oasys.util.oasys_util import EmittingStream, TTYGrabber
 
 from orangecontrib.srw.util.srw_util import SRWPlot
-from orangecontrib.srw.util.srw_objects import SRWData
+from orangecontrib.srw.util.srw_objects import SRWData, SRWScanData
+from orangecontrib.srw.util import srw_precision
 from orangecontrib.srw.widgets.gui.ow_srw_widget import SRWWidget
 
 from oasys.util.scanning_gui import StatisticalDataCollection, HistogramDataCollection, DoublePlotWidget, write_histo_and_stats_file, write_histo_and_stats_file_hdf5
@@ -333,7 +334,7 @@ class Histogram(SRWWidget):
             polarization_component_to_be_extracted = PolarizationComponent.LINEAR_VERTICAL
 
         if self.multi_electron==0 and self.iterative_mode==2:
-            e, h, v, p = wavefront.get_phase(polarization_component_to_be_extracted=polarization_component_to_be_extracted)
+            e, h, v, p = srw_precision.get_phase(wavefront, polarization_component_to_be_extracted=polarization_component_to_be_extracted)
 
             if len(e) <= 1: ticket2D_Phase = SRWPlot.get_ticket_2D(h, v, p[int(e.size / 2)])
             else:           ticket2D_Phase = SRWPlot.get_ticket_2D(h, v, numpy.average(p, axis=0), is_multi_energy=True)
@@ -358,9 +359,9 @@ class Histogram(SRWWidget):
                 ticket_phase["fwhm_coordinates"] = (ticket_phase["fwhm_coordinates"][0]*TO_UM, ticket_phase["fwhm_coordinates"][1]*TO_UM)
 
 
-        e, h, v, i = wavefront.get_intensity(multi_electron=self.multi_electron==1,
-                                            polarization_component_to_be_extracted=polarization_component_to_be_extracted,
-                                            type_of_dependence=TypeOfDependence.VS_XY)
+        e, h, v, i = srw_precision.get_intensity(wavefront, multi_electron=self.multi_electron==1,
+                                                 polarization_component_to_be_extracted=polarization_component_to_be_extracted,
+                                                 type_of_dependence=TypeOfDependence.VS_XY)
 
         if len(e) <= 1:
             ticket2D_Intensity = SRWPlot.get_ticket_2D(h, v, i[int(e.size/2)])
@@ -561,7 +562,9 @@ class Histogram(SRWWidget):
         return x, title, x_title, y_title, xum
 
     def set_input(self, srw_data):
-        if not srw_data is None:
+        if isinstance(srw_data, SRWScanData):
+            for scanned_srw_data in srw_data.get_srw_data_list(): self.set_input(scanned_srw_data)
+        elif not srw_data is None:
             self.input_srw_data = srw_data
 
             if self.is_automatic_run:
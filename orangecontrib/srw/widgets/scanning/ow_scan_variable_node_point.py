@@ -44,11 +44,13 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
 # POSSIBILITY OF SUCH DAMAGE.                                             #
 # #########################################################################
-import numpy
+import os, numpy
 from orangewidget import gui
 from orangewidget.settings import Setting
+from PyQt5.QtWidgets import QMessageBox
 
 from oasys.widgets import gui as oasysgui
+from oasys.util.oasys_util import TriggerOut
 
 from oasys.widgets.abstract.scanning.abstract_scan_variable_node_point import AbstractScanVariableLoopPoint
 
@@ -88,9 +90,14 @@ class ScanVariableLoopPoint(AbstractScanVariableLoopPoint):
 
     variable_name_id = Setting(8)
 
+    execution_mode = Setting(0)
+    number_of_workers = Setting(os.cpu_count() or 1)
+
     def __init__(self):
         super(ScanVariableLoopPoint, self).__init__()
 
+        self.setFixedHeight(560)
+
     def has_variable_list(self): return True
 
     def create_variable_list_box(self, box):
@@ -98,11 +105,75 @@ class ScanVariableLoopPoint(AbstractScanVariableLoopPoint):
                      items=VARIABLES[:, 1],
                      callback=self.set_VariableName, sendSelectedValue=False, orientation="horizontal")
 
+        gui.comboBox(box, self, "execution_mode", label="Execution", labelWidth=120,
+                     items=["Sequential", "Parallel"],
+                     callback=self.set_ExecutionMode, sendSelectedValue=False, orientation="horizontal")
+
+        self.box_workers = oasysgui.widgetBox(box, "", addSpace=False, orientation="vertical")
+
+        oasysgui.lineEdit(self.box_workers, self, "number_of_workers", "Number of Workers", labelWidth=250, valueType=int, orientation="horizontal")
+
+        self.set_ExecutionMode()
+
+    def set_ExecutionMode(self):
+        self.box_workers.setVisible(self.execution_mode == 1)
+
     def set_VariableName(self):
         self.variable_name = VARIABLES[self.variable_name_id, 0]
         self.variable_display_name = VARIABLES[self.variable_name_id, 1]
         self.variable_um = VARIABLES[self.variable_name_id, 2]
 
+    # the same values of the sequential loop, in the same order
+    def get_variable_values(self):
+        if self.kind_of_loop == 0:
+            self.calculate_step()
+
+            variable_values = [round(self.variable_value_from, 8)]
+            for _ in range(self.number_of_new_objects): variable_values.append(round(variable_values[-1] + self.variable_value_step, 8))
+
+            return variable_values
+        else:
+            return [value for value in self.list_of_values[:self.number_of_new_objects] if not value.strip() == ""]
+
+    #################################
+    # PARALLEL EXECUTION: all the values are sent downstream at once, the optical elements propagate them in a pool
+    # of worker processes and the results reach the Histogram/Accumulation Point as a batch, in scan order
+    #################################
+
+    def startLoop(self):
+        if self.execution_mode == 0:
+            super(ScanVariableLoopPoint, self).startLoop()
+        else:
+            if self.number_of_workers <= 0:
+                QMessageBox.critical(self, "Error", "Number of Workers should be a positive number", QMessageBox.Ok)
+                return
+
+            self.set_VariableName()
+
+            variable_values = self.get_variable_values()
+
+            if len(variable_values) > 0:
+                self.current_new_object = len(variable_values)
+                self.current_variable_value = variable_values[-1]
+                self.start_button.setEnabled(False)
+
+                self.setStatusMessage("Running " + str(len(variable_values)) + " Loops with " + str(self.number_of_workers) + " Workers")
+                self.send("Trigger", TriggerOut(new_object=True, additional_parameters={"variable_name": self.variable_name,
+                                                                                        "variable_display_name": self.variable_display_name,
+                                                                                        "variable_values": variable_values,
+                                                                                        "variable_um": self.variable_um if self.has_variable_um() else "",
+                                                                                        "number_of_workers": self.number_of_workers}))
+
+    def passTrigger(self, trigger):
+        if self.execution_mode == 1 and self.run_loop and self.current_new_object > 0 and trigger and trigger.new_object:
+            self.current_new_object = 0
+            self.current_variable_value = None
+            self.start_button.setEnabled(True)
+            self.setStatusMessage("")
+            self.send("Trigger", TriggerOut(new_object=False))
+        else:
+            super(ScanVariableLoopPoint, self).passTrigger(trigger)
+
 import sys
 from PyQt5.QtWidgets import QApplication
 
@@ -0,0 +1,116 @@
+import os
+
+from orangewidget import gui
+from orangewidget.settings import Setting
+from oasys.widgets import widget
+from oasys.widgets import gui as oasysgui
+
+from PyQt5.QtWidgets import QApplication, QMessageBox, QFileDialog
+from PyQt5.QtCore import QRect
+
+from orangecontrib.srw.util.srw_objects import SRWData, SRWScanData
+from orangecontrib.srw.util import srw_sensitivity
+
+class OWSRWSensitivityAnalysis(widget.OWWidget):
+    name = "Sensitivity Analysis"
+    id = "OWSRWSensitivityAnalysis"
+    description = "Display Data Tools: Jacobian of the beam statistics"
+    icon = "icons/histogram.png"
+    maintainer = "Luca Rebuffi"
+    maintainer_email = "lrebuffi(@at@)anl.gov"
+    priority = 1.1
+    category = "Display Data Tools"
+    keywords = ["sensitivity", "tolerance", "jacobian"]
+
+    inputs = [("SRWData", SRWData, "set_input")]
+
+    CONTROL_AREA_WIDTH = 700
+    CONTROL_AREA_HEIGHT = 650
+
+    want_main_area = 0
+
+    multi_electron = Setting(0)
+
+    input_srw_data = None
+    jacobian_text = None
+
+    def __init__(self):
+        super().__init__()
+
+        geom = QApplication.desktop().availableGeometry()
+        self.setGeometry(QRect(round(geom.width()*0.05),
+                               round(geom.height()*0.05),
+                               round(min(geom.width()*0.98, self.CONTROL_AREA_WIDTH+10)),
+                               round(min(geom.height()*0.95, self.CONTROL_AREA_HEIGHT+10))))
+
+        self.setFixedHeight(self.geometry().height())
+        self.setFixedWidth(self.geometry().width())
+
+        self.controlArea.setFixedWidth(self.CONTROL_AREA_WIDTH)
+
+        button_box = oasysgui.widgetBox(self.controlArea, "", addSpace=False, orientation="horizontal")
+
+        gui.button(button_box, self, "Refresh", callback=self.calculate_jacobian, height=35)
+        gui.button(button_box, self, "Save Jacobian", callback=self.save_jacobian, height=35)
+
+        gui.comboBox(self.controlArea, self, "multi_electron", label="Intensity", labelWidth=400,
+                     items=["Single Electron", "Multi Electron (Convolution)"],
+                     callback=self.calculate_jacobian, sendSelectedValue=False, orientation="horizontal")
+
+        self.text_area = oasysgui.textArea(height=self.CONTROL_AREA_HEIGHT-80, width=self.CONTROL_AREA_WIDTH-5, readOnly=True)
+        self.text_area.setText("")
+        self.text_area.setStyleSheet("background-color: white; font-family: Courier, monospace;")
+
+        self.controlArea.layout().addWidget(self.text_area)
+
+    def set_input(self, srw_data):
+        if not srw_data is None:
+            self.input_srw_data = srw_data
+
+            self.calculate_jacobian()
+
+    def calculate_jacobian(self):
+        if self.input_srw_data is None: return
+
+        try:
+            self.setStatusMessage("")
+            self.text_area.clear()
+            self.jacobian_text = None
+
+            if not isinstance(self.input_srw_data, SRWScanData): raise Exception("Input Data are not the result of a Sensitivity Analysis")
+
+            wavefronts = [srw_data.get_srw_wavefront() for srw_data in self.input_srw_data.get_srw_data_list()]
+
+            if not srw_sensitivity.is_sensitivity_analysis(wavefronts): raise Exception("Input Data are not the result of a Sensitivity Analysis")
+
+            self.setStatusMessage("Calculating Beam Statistics of " + str(len(wavefronts)) + " Variants")
+
+            parameters, nominal_statistics, jacobian = srw_sensitivity.get_jacobian(wavefronts, multi_electron=self.multi_electron==1)
+
+            self.jacobian_text = srw_sensitivity.get_jacobian_text(parameters, nominal_statistics, jacobian)
+            self.text_area.setText(self.jacobian_text)
+
+            self.setStatusMessage("")
+        except Exception as exception:
+            QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
+
+            self.setStatusMessage("")
+
+            if self.IS_DEVELOP: raise exception
+
+    def save_jacobian(self):
+        if self.jacobian_text is None:
+            QMessageBox.critical(self, "Error", "No Jacobian to save", QMessageBox.Ok)
+        else:
+            file_name, _ = QFileDialog.getSaveFileName(self, "Save Jacobian", os.path.join(os.curdir, "jacobian.txt"), "Text Files (*.txt)")
+
+            if file_name:
+                with open(file_name, "w") as file: file.write(self.jacobian_text)
+
+if __name__ == "__main__":
+    import sys
+    a = QApplication(sys.argv)
+    ow = OWSRWSensitivityAnalysis()
+    ow.show()
+    a.exec_()
+    ow.saveSettings()
@@ -0,0 +1,153 @@
+import os
+from orangewidget import gui
+from orangewidget.settings import Setting
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QFont, QPalette, QColor
+from PyQt5.QtWidgets import QMessageBox, QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView
+
+from oasys.widgets import widget
+from oasys.widgets import gui as oasysgui
+from oasys.widgets import congruence
+from oasys.util.oasys_util import TriggerIn, TriggerOut
+
+from orangecontrib.srw.widgets.scanning.ow_scan_variable_node_point import VARIABLES
+
+class SensitivityAnalysisPoint(widget.OWWidget):
+
+    name = "Sensitivity Analysis Point"
+    description = "Tools: Sensitivity Analysis Point"
+    icon = "icons/cycle_variable.png"
+    maintainer = "Luca Rebuffi"
+    maintainer_email = "lrebuffi(@at@)anl.gov"
+    priority = 0.3
+    category = "User Defined"
+    keywords = ["sensitivity", "tolerance", "jacobian"]
+
+    inputs = [("Trigger", TriggerIn, "passTrigger")]
+
+    outputs = [{"name": "Trigger",
+                "type": TriggerOut,
+                "doc": "Trigger",
+                "id": "Trigger"}]
+
+    want_main_area = 0
+
+    selected_variables = Setting([8, 9, 10, 11])
+    variable_steps = Setting([1e-6]*len(VARIABLES))
+
+    number_of_workers = Setting(os.cpu_count() or 1)
+
+    running = False
+
+    def __init__(self):
+        super().__init__()
+
+        self.setFixedWidth(500)
+        self.setFixedHeight(660)
+
+        button_box = oasysgui.widgetBox(self.controlArea, "", addSpace=True, orientation="horizontal")
+
+        self.start_button = gui.button(button_box, self, "Start", callback=self.startSensitivityAnalysis)
+        self.start_button.setFixedHeight(35)
+        font = QFont(self.start_button.font())
+        font.setBold(True)
+        self.start_button.setFont(font)
+        palette = QPalette(self.start_button.palette()) # make a copy of the palette
+        palette.setColor(QPalette.ButtonText, QColor('Dark Blue'))
+        self.start_button.setPalette(palette) # assign new palette
+
+        box = oasysgui.widgetBox(self.controlArea, "Sensitivity Analysis", addSpace=True, orientation="vertical", width=480, height=560)
+
+        gui.label(box, self, "Each checked parameter of the triggered optical element is\n" +
+                             "perturbed by ±step around its nominal value")
+
+        self.table = QTableWidget(len(VARIABLES), 3)
+        self.table.setHorizontalHeaderLabels(["Parameter", "Unit", "Step"])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setSelectionMode(QAbstractItemView.NoSelection)
+
+        variable_steps = self.variable_steps if len(self.variable_steps) == len(VARIABLES) else [1e-6]*len(VARIABLES)
+
+        for index in range(len(VARIABLES)):
+            item = QTableWidgetItem(VARIABLES[index, 1])
+            item.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
+            item.setCheckState(Qt.Checked if index in self.selected_variables else Qt.Unchecked)
+            self.table.setItem(index, 0, item)
+
+            item = QTableWidgetItem(VARIABLES[index, 2])
+            item.setFlags(Qt.ItemIsEnabled)
+            self.table.setItem(index, 1, item)
+
+            self.table.setItem(index, 2, QTableWidgetItem(str(variable_steps[index])))
+
+        box.layout().addWidget(self.table)
+
+        oasysgui.lineEdit(box, self, "number_of_workers", "Number of Workers", labelWidth=250, valueType=int, orientation="horizontal")
+
+        gui.rubber(self.controlArea)
+
+    def get_sensitivity_variables(self):
+        selected_variables = []
+        variable_steps = []
+
+        for index in range(len(VARIABLES)):
+            if self.table.item(index, 0).checkState() == Qt.Checked: selected_variables.append(index)
+
+            try:
+                variable_steps.append(float(self.table.item(index, 2).text()))
+            except ValueError:
+                raise Exception("Step of " + VARIABLES[index, 1] + " is not a number")
+
+        if len(selected_variables) == 0: raise Exception("Check at least one parameter")
+
+        sensitivity_variables = []
+
+        for index in selected_variables:
+            congruence.checkStrictlyPositiveNumber(variable_steps[index], "Step of " + VARIABLES[index, 1])
+
+            sensitivity_variables.append([VARIABLES[index, 0], VARIABLES[index, 1], VARIABLES[index, 2], variable_steps[index]])
+
+        self.selected_variables = selected_variables
+        self.variable_steps = variable_steps
+
+        return sensitivity_variables
+
+    #################################
+    # all the perturbations are sent downstream at once: the optical element propagates them in a pool of worker
+    # processes, starting from its input wavefront, and the Sensitivity Analysis widget calculates the Jacobian
+    #################################
+
+    def startSensitivityAnalysis(self):
+        try:
+            congruence.checkStrictlyPositiveNumber(self.number_of_workers, "Number of Workers")
+
+            sensitivity_variables = self.get_sensitivity_variables()
+
+            self.running = True
+            self.start_button.setEnabled(False)
+
+            self.setStatusMessage("Running " + str(2*len(sensitivity_variables) + 1) + " Variants with " + str(self.number_of_workers) + " Workers")
+            self.send("Trigger", TriggerOut(new_object=True, additional_parameters={"sensitivity_variables": sensitivity_variables,
+                                                                                    "number_of_workers": self.number_of_workers}))
+        except Exception as exception:
+            QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
+
+            if self.IS_DEVELOP: raise exception
+
+    def passTrigger(self, trigger):
+        if self.running and trigger and trigger.new_object:
+            self.running = False
+            self.start_button.setEnabled(True)
+            self.setStatusMessage("")
+            self.send("Trigger", TriggerOut(new_object=False))
+
+import sys
+from PyQt5.QtWidgets import QApplication
+
+if __name__ == "__main__":
+    a = QApplication(sys.argv)
+    ow = SensitivityAnalysisPoint()
+    ow.show()
+    a.exec_()
+    ow.saveSettings()